@@ -1,6 +1,17 @@
+import asyncio
+import os
+import tempfile
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable
+import httpx
 from .models import UnifiedChatResponse, FileUploadResponse, FastGPTFileInfo
+from .http_client import build_async_client, build_timeout
+from .resilience import ResiliencePolicy
+from services.object_storage import UploadTooLargeError
+
+# 上传时每次读取的块大小
+UPLOAD_READ_CHUNK = 1024 * 1024
+
 
 class BaseAgent(ABC):
     """
@@ -9,8 +20,24 @@ class BaseAgent(ABC):
     该类定义了智能体的基本接口，包括请求校验、请求处理和响应格式化三个核心方法。
     子类需实现这些抽象方法，以保证统一的接口规范。
     所有 Agent 必须遵循 FastGPT 的响应格式，返回 UnifiedChatResponse 模型。
+
+    异步接口 aprocess_request / astream_chat 为网关的主调用路径；
+    子类未原生实现时，默认回退到线程池执行同步的 process_request / stream_chat。
     """
 
+    # 环境变量前缀，用于读取连接池配置（如 FASTGPT_HTTP_MAX_CONNECTIONS）
+    http_env_prefix: str = ""
+    # 连接池默认超时（秒），单次请求可覆盖
+    http_timeout: float = 60.0
+
+    @property
+    def metrics_label(self) -> str:
+        """指标中的 agent 标签，如 FastGPTAgent -> fastgpt"""
+        return self.__class__.__name__.replace("Agent", "").lower()
+
+    _http_client: Optional[httpx.AsyncClient] = None
+    _resilience: Optional[ResiliencePolicy] = None
+
     @abstractmethod
     def validate_request(self, request_data: Dict[str, Any]) -> bool:
         """
@@ -63,6 +90,81 @@ class BaseAgent(ABC):
         """
         raise NotImplementedError("This agent does not support streaming chat")
 
+    async def aprocess_request(self, request_data: Dict[str, Any]) -> Any:
+        """
+        异步处理请求并返回原始响应。
+
+        默认实现在线程池中执行同步 process_request，子类应基于 self.http_client 原生实现。
+
+        参数:
+            request_data (Dict[str, Any]): 需要处理的请求数据
+
+        返回:
+            Any: 原始响应数据，与 process_request 一致
+        """
+        return await asyncio.to_thread(self.process_request, request_data)
+
+    async def astream_chat(self, request_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        异步流式对话接口（SSE）。
+
+        默认实现在线程池中逐条迭代同步 stream_chat 的生成器，子类应原生实现。
+
+        参数:
+            request_data (Dict[str, Any]): 请求数据，需包含 detail=false 且 stream=true
+
+        返回:
+            异步迭代器: 逐条产出 SSE 文本数据
+        """
+        generator = await asyncio.to_thread(self.stream_chat, request_data)
+        sentinel = object()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, generator, sentinel)
+                if chunk is sentinel:
+                    break
+                yield chunk
+        finally:
+            # 提前结束（如客户端断开）时关闭同步生成器，释放其上游连接
+            try:
+                generator.close()
+            except Exception:
+                pass
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        当前 Agent 的共享 AsyncClient（连接池、keep-alive、HTTP/2）。
+
+        正常情况下由应用 lifespan 调用 startup() 创建；未启动时惰性创建，便于脚本直接调用。
+        """
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = build_async_client(self.http_env_prefix, self.http_timeout, self.metrics_label)
+        return self._http_client
+
+    @property
+    def resilience(self) -> ResiliencePolicy:
+        """当前 Agent 的上游调用保护策略（舱壁、熔断、重试、对冲），按 http_env_prefix 读取配置"""
+        if self._resilience is None:
+            self._resilience = ResiliencePolicy(self.metrics_label, self.http_env_prefix)
+        return self._resilience
+
+    @property
+    def stream_timeout(self) -> httpx.Timeout:
+        """流式请求超时：保留建连/取连接超时，不限制读超时"""
+        return build_timeout(self.http_env_prefix, None)
+
+    async def startup(self) -> None:
+        """创建共享 HTTP 连接池（应用启动时调用）。"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = build_async_client(self.http_env_prefix, self.http_timeout, self.metrics_label)
+
+    async def shutdown(self) -> None:
+        """关闭共享 HTTP 连接池（应用关闭时调用）。"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
     def upload_file(self, file_path: str) -> str:
         """
         上传文件的默认实现（返回文件可访问 URL/ID）。
@@ -79,6 +181,47 @@ class BaseAgent(ABC):
         """
         raise NotImplementedError("File upload not supported by this agent")
 
+    async def aupload_file(
+        self,
+        read: Callable[[int], Awaitable[bytes]],
+        filename: str,
+        content_type: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ) -> Any:
+        """
+        异步上传文件（上传接口调用此方法）。
+
+        默认实现按块读取并写入临时文件（不在内存中保留整个文件），超过 max_bytes 时立即中止，
+        然后在线程池中调用同步的 upload_file。支持流式上传的子类可重写以直接转发数据。
+
+        参数:
+            read: 异步读取函数（如 UploadFile.read），返回空字节表示结束
+            filename: 原始文件名
+            content_type: 客户端声明的 MIME 类型
+            max_bytes: 大小上限
+
+        异常:
+            UploadTooLargeError: 文件超过 max_bytes
+        """
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"_{os.path.basename(filename)}")
+        try:
+            size = 0
+            with temp_file:
+                while True:
+                    chunk = await read(UPLOAD_READ_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise UploadTooLargeError(max_bytes)
+                    await asyncio.to_thread(temp_file.write, chunk)
+            return await asyncio.to_thread(self.upload_file, temp_file.name)
+        finally:
+            try:
+                os.unlink(temp_file.name)
+            except OSError:
+                pass  # 忽略清理失败
+
     def build_file_info(self, *, file_id: str, file_name: str, size_bytes: int, mime_type: str, created_by: str = "", created_at: Optional[int] = None) -> FastGPTFileInfo:
         """
         构建统一文件信息（用于返回统一响应）。
@@ -1,13 +1,20 @@
 import os
-import json
 from typing import Dict, Any, List, Optional
 from .base import BaseAgent
 from .registry import registry
 from .models import ChatRequest, UnifiedChatResponse, Message, Choice, Usage
+from .sse import sse_wrap, build_delta, build_stop
+from .resilience import UpstreamUnavailableError
 from dotenv import load_dotenv
 from cozepy import Coze, TokenAuth, COZE_CN_BASE_URL, Message as CozeMessage, ChatEventType, ChatStatus, MessageType
 import traceback
 
+try:
+    from cozepy import AsyncCoze, AsyncTokenAuth
+except ImportError:  # 旧版本 cozepy 无异步客户端，异步接口回退到线程池
+    AsyncCoze = None
+    AsyncTokenAuth = None
+
 if os.path.exists('.env'):
     load_dotenv('.env')
 
@@ -25,11 +32,16 @@ else:
 class CozeAgent(BaseAgent):
     """Agent for Coze API."""
 
+    http_env_prefix = "COZE"
+
     def __init__(self):
         # 可在此初始化所需的环境变量或配置
         self.api_token = coze_api_token
         self.base_url = coze_base_url
         self.bot_id = coze_bot_id
+        self._async_coze = None
+        # 构建 _async_coze 时使用的共享 AsyncClient，连接池重建后需要随之重建
+        self._async_coze_client = None
         
         # 验证必要的环境变量（但不抛出异常，让 loader 处理）
         if not self.api_token:
@@ -73,26 +85,86 @@ class CozeAgent(BaseAgent):
             if not coze:
                 raise ValueError("Coze client not initialized. Please check COZE_API_TOKEN.")
             
-            # 获取用户输入
-            query = request_data.get('query', '')
-            user_id = request_data.get('user', 'default_user')
-            conversation_id = request_data.get('conversation_id')
-            stream = request_data.get('stream', False)
-            
-            # 构建消息
-            additional_messages = [CozeMessage.build_user_question_text(query)]
+            kwargs = self._build_chat_kwargs(request_data)
             
             # 根据 stream 参数选择处理方式
-            if stream:
-                return self._handle_stream_response(user_id, additional_messages, conversation_id)
+            if request_data.get('stream', False):
+                return self._handle_stream_response(kwargs["user_id"], kwargs["additional_messages"], kwargs.get("conversation_id"))
             else:
-                return self._handle_blocking_response(user_id, additional_messages, conversation_id)
+                return self._handle_blocking_response(kwargs["user_id"], kwargs["additional_messages"], kwargs.get("conversation_id"))
             
         except Exception as e:
             print(f"Error in process_request: {e}")
             traceback.print_exc()
             return {"error": str(e), "error_type": "process_error"}
 
+    async def aprocess_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        process_request 的异步版本：使用 cozepy 的 AsyncCoze 客户端，不占用线程池。
+        """
+        if self.async_coze is None:
+            return await super().aprocess_request(request_data)
+        if request_data.get('stream', False):
+            # stream+detail 组合保持与同步实现一致的处理
+            return await super().aprocess_request(request_data)
+        kwargs = self._build_chat_kwargs(request_data)
+        try:
+            chat_result = await self.resilience.call(
+                lambda: self.async_coze.chat.create_and_poll(**kwargs),
+                idempotent="conversation_id" not in kwargs
+            )
+            return self._build_blocking_response(chat_result)
+        except UpstreamUnavailableError:
+            raise
+        except Exception as e:
+            print(f"Error in aprocess_request: {e}")
+            traceback.print_exc()
+            return {"error": str(e), "error_type": "api_error"}
+
+    @property
+    def async_coze(self):
+        """
+        惰性创建的 AsyncCoze 客户端（cozepy 不支持异步时为 None）。
+
+        SDK 请求经由共享的 http_client 发出，与其他 Agent 一样复用连接池并记录上游指标；
+        共享连接池被关闭重建后，AsyncCoze 也随之重建。
+        """
+        if AsyncCoze is None or not self.api_token:
+            return None
+        http_client = self.http_client
+        if self._async_coze is None or self._async_coze_client is not http_client:
+            self._async_coze = AsyncCoze(
+                auth=AsyncTokenAuth(self.api_token),
+                base_url=self.base_url,
+                http_client=http_client,
+            )
+            self._async_coze_client = http_client
+        return self._async_coze
+
+    async def shutdown(self) -> None:
+        """关闭共享 HTTP 连接池，并丢弃绑定在其上的 AsyncCoze 客户端。"""
+        self._async_coze = None
+        self._async_coze_client = None
+        await super().shutdown()
+
+    def _build_chat_kwargs(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """组装 chat 接口参数（同步与异步路径共用）"""
+        # 获取用户输入
+        query = request_data.get('query', '')
+        user_id = request_data.get('user', 'default_user')
+        conversation_id = request_data.get('conversation_id')
+        
+        # 构建消息
+        kwargs = {
+            "bot_id": self.bot_id,
+            "user_id": user_id,
+            "additional_messages": [CozeMessage.build_user_question_text(query)]
+        }
+        
+        if conversation_id:
+            kwargs["conversation_id"] = conversation_id
+        return kwargs
+
     def _handle_blocking_response(self, user_id: str, additional_messages: List[CozeMessage], conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """处理非流式响应，基于实际的Coze响应结构优化"""
         try:
@@ -107,121 +179,124 @@ class CozeAgent(BaseAgent):
                 kwargs["conversation_id"] = conversation_id
             
             chat_result = coze.chat.create_and_poll(**kwargs)
+            return self._build_blocking_response(chat_result)
             
-            # 检查聊天状态
-            if not hasattr(chat_result, 'chat') or not chat_result.chat:
-                return {"error": "No chat object in response", "error_type": "response_error"}
+        except Exception as e:
+            print(f"Error in _handle_blocking_response: {e}")
+            traceback.print_exc()
+            return {"error": str(e), "error_type": "api_error"}
+
+    def _build_blocking_response(self, chat_result: Any) -> Dict[str, Any]:
+        """将 create_and_poll 的结果转换为原始响应结构"""
+        # 检查聊天状态
+        if not hasattr(chat_result, 'chat') or not chat_result.chat:
+            return {"error": "No chat object in response", "error_type": "response_error"}
+        
+        chat = chat_result.chat
+        
+        # 检查聊天是否完成
+        if chat.status != ChatStatus.COMPLETED:
+            error_msg = f"Chat not completed. Status: {chat.status}"
+            if chat.last_error:
+                error_msg += f", Error: {chat.last_error}"
+            return {"error": error_msg, "error_type": "chat_status_error"}
+        
+        # 构建基础响应结构
+        response = {
+            "id": chat.id,
+            "conversation_id": chat.conversation_id,
+            "model": "coze",
+            "status": str(chat.status),
+            "created_at": getattr(chat, 'created_at', None),
+            "completed_at": getattr(chat, 'completed_at', None),
+            "choices": [],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0
+            }
+        }
+        
+        # 处理使用量信息
+        if hasattr(chat, 'usage') and chat.usage:
+            usage = chat.usage
+            response["usage"] = {
+                "prompt_tokens": getattr(usage, 'input_count', 0),
+                "completion_tokens": getattr(usage, 'output_count', 0),
+                "total_tokens": getattr(usage, 'token_count', 0)
+            }
+        
+        # 处理消息内容
+        if hasattr(chat_result, 'messages') and chat_result.messages:
+            # 分类处理不同类型的消息
+            answer_content = []
+            follow_up_questions = []
+            verbose_info = []
             
-            chat = chat_result.chat
+            for message in chat_result.messages:
+                if not hasattr(message, 'role') or not hasattr(message, 'type'):
+                    continue
+                
+                # 只处理 assistant 角色的消息
+                if message.role.value == 'assistant':
+                    content = getattr(message, 'content', '')
+                    
+                    if message.type == MessageType.ANSWER:
+                        # 主要回答内容
+                        answer_content.append(content)
+                    elif message.type == MessageType.FOLLOW_UP:
+                        # 跟进问题
+                        follow_up_questions.append(content)
+                    elif message.type == MessageType.VERBOSE:
+                        # 详细信息（通常是系统信息）
+                        verbose_info.append(content)
             
-            # 检查聊天是否完成
-            if chat.status != ChatStatus.COMPLETED:
-                error_msg = f"Chat not completed. Status: {chat.status}"
-                if chat.last_error:
-                    error_msg += f", Error: {chat.last_error}"
-                return {"error": error_msg, "error_type": "chat_status_error"}
+            # 构建最终回答内容
+            final_content = '\n'.join(answer_content) if answer_content else ""
             
-            # 构建基础响应结构
-            response = {
-                "id": chat.id,
-                "conversation_id": chat.conversation_id,
-                "model": "coze",
-                "status": str(chat.status),
-                "created_at": getattr(chat, 'created_at', None),
-                "completed_at": getattr(chat, 'completed_at', None),
-                "choices": [],
-                "usage": {
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0,
-                    "total_tokens": 0
-                }
-            }
+            # 如果没有主要回答，但有其他内容，使用它们
+            if not final_content and (follow_up_questions or verbose_info):
+                final_content = "抱歉，没有收到有效的回答内容。"
             
-            # 处理使用量信息
-            if hasattr(chat, 'usage') and chat.usage:
-                usage = chat.usage
-                response["usage"] = {
-                    "prompt_tokens": getattr(usage, 'input_count', 0),
-                    "completion_tokens": getattr(usage, 'output_count', 0),
-                    "total_tokens": getattr(usage, 'token_count', 0)
-                }
+            # 添加跟进问题（可选）
+            if follow_up_questions:
+                final_content += f"\n\n相关问题推荐：\n" + '\n'.join(f"• {q}" for q in follow_up_questions[:3])
             
-            # 处理消息内容
-            if hasattr(chat_result, 'messages') and chat_result.messages:
-                # 分类处理不同类型的消息
-                answer_content = []
-                follow_up_questions = []
-                verbose_info = []
-                
-                for message in chat_result.messages:
-                    if not hasattr(message, 'role') or not hasattr(message, 'type'):
-                        continue
-                    
-                    # 只处理 assistant 角色的消息
-                    if message.role.value == 'assistant':
-                        content = getattr(message, 'content', '')
-                        
-                        if message.type == MessageType.ANSWER:
-                            # 主要回答内容
-                            answer_content.append(content)
-                        elif message.type == MessageType.FOLLOW_UP:
-                            # 跟进问题
-                            follow_up_questions.append(content)
-                        elif message.type == MessageType.VERBOSE:
-                            # 详细信息（通常是系统信息）
-                            verbose_info.append(content)
-                
-                # 构建最终回答内容
-                final_content = '\n'.join(answer_content) if answer_content else ""
-                
-                # 如果没有主要回答，但有其他内容，使用它们
-                if not final_content and (follow_up_questions or verbose_info):
-                    final_content = "抱歉，没有收到有效的回答内容。"
-                
-                # 添加跟进问题（可选）
-                if follow_up_questions:
-                    final_content += f"\n\n相关问题推荐：\n" + '\n'.join(f"• {q}" for q in follow_up_questions[:3])
-                
-                response["choices"] = [{
-                    "message": {
-                        "role": "assistant",
-                        "content": final_content or "抱歉，没有收到有效响应"
-                    },
-                    "finish_reason": "stop",
-                    "index": 0
-                }]
-                
-                # 添加额外的消息元数据
-                response["metadata"] = {
-                    "answer_count": len(answer_content),
-                    "follow_up_count": len(follow_up_questions),
-                    "verbose_count": len(verbose_info),
-                    "total_messages": len(list(chat_result.messages))
-                }
-                
-            else:
-                # 没有消息的情况
-                response["choices"] = [{
-                    "message": {
-                        "role": "assistant",
-                        "content": "抱歉，没有收到任何响应消息"
-                    },
-                    "finish_reason": "no_content",
-                    "index": 0
-                }]
-                response["metadata"] = {
-                    "answer_count": 0,
-                    "follow_up_count": 0,
-                    "verbose_count": 0,
-                    "total_messages": 0
-                }
-                
-            return response
+            response["choices"] = [{
+                "message": {
+                    "role": "assistant",
+                    "content": final_content or "抱歉，没有收到有效响应"
+                },
+                "finish_reason": "stop",
+                "index": 0
+            }]
             
-        except Exception as e:
-            print(f"Error in _handle_blocking_response: {e}")
-            traceback.print_exc()
-            return {"error": str(e), "error_type": "api_error"}
+            # 添加额外的消息元数据
+            response["metadata"] = {
+                "answer_count": len(answer_content),
+                "follow_up_count": len(follow_up_questions),
+                "verbose_count": len(verbose_info),
+                "total_messages": len(list(chat_result.messages))
+            }
+            
+        else:
+            # 没有消息的情况
+            response["choices"] = [{
+                "message": {
+                    "role": "assistant",
+                    "content": "抱歉，没有收到任何响应消息"
+                },
+                "finish_reason": "no_content",
+                "index": 0
+            }]
+            response["metadata"] = {
+                "answer_count": 0,
+                "follow_up_count": 0,
+                "verbose_count": 0,
+                "total_messages": 0
+            }
+            
+        return response
 
     def stream_chat(self, request_data: Dict[str, Any]):
         """
@@ -230,78 +305,73 @@ class CozeAgent(BaseAgent):
         if not coze:
             raise ValueError("Coze client not initialized. Please check COZE_API_TOKEN.")
 
-        # 获取用户输入
-        query = request_data.get('query', '')
-        user_id = request_data.get('user', 'default_user')
-        conversation_id = request_data.get('conversation_id')
-        
-        # 构建消息
-        additional_messages = [CozeMessage.build_user_question_text(query)]
-        
-        kwargs = {
-            "bot_id": self.bot_id,
-            "user_id": user_id,
-            "additional_messages": additional_messages
-        }
-        
-        if conversation_id:
-            kwargs["conversation_id"] = conversation_id
-
-        def sse_wrap(payload: Dict[str, Any]) -> str:
-            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-
-        def build_delta(content: Optional[str]):
-            return {
-                "id": "",
-                "object": "",
-                "created": 0,
-                "choices": [
-                    {
-                        "delta": {"content": content or ""},
-                        "index": 0,
-                        "finish_reason": None
-                    }
-                ]
-            }
+        kwargs = self._build_chat_kwargs(request_data)
 
         def event_generator():
-            prev = ""
             # 发送初始空片段
             yield sse_wrap(build_delta(""))
 
             try:
                 # 流式处理
                 for event in coze.chat.stream(**kwargs):
-                    if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
-                        if hasattr(event.message, 'content') and event.message.content:
-                            # 过滤掉系统控制信息
-                            content_chunk = event.message.content
-                            if content_chunk and not content_chunk.startswith('{"msg_type":'):
-                                yield sse_wrap(build_delta(content_chunk))
-                                prev += content_chunk
-                        
-                    if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
-                        # 发送结束片段（finish_reason=stop）
-                        done_payload = {
-                            "id": "",
-                            "object": "",
-                            "created": 0,
-                            "choices": [
-                                {
-                                    "delta": {},
-                                    "index": 0,
-                                    "finish_reason": "stop"
-                                }
-                            ]
-                        }
-                        yield sse_wrap(done_payload)
+                    chunk, done = self._convert_stream_event(event)
+                    if chunk:
+                        yield chunk
+                    if done:
                         break
             except Exception as e:
-                err_payload = build_delta(f"[stream error] {e}")
-                yield sse_wrap(err_payload)
+                yield sse_wrap(build_delta(f"[stream error] {e}"))
+
+        return event_generator()
+
+    def astream_chat(self, request_data: Dict[str, Any]):
+        """
+        stream_chat 的异步版本：通过 AsyncCoze 读取事件流并转换为统一 SSE 增量格式。
+        配置校验在调用时立即执行，返回异步生成器。
+        """
+        if not coze:
+            raise ValueError("Coze client not initialized. Please check COZE_API_TOKEN.")
+        if self.async_coze is None:
+            return super().astream_chat(request_data)
+
+        kwargs = self._build_chat_kwargs(request_data)
+        self.resilience.check()
+
+        async def event_generator():
+            # 发送初始空片段
+            yield sse_wrap(build_delta(""))
+
+            try:
+                async with self.resilience.slot():
+                    async for event in self.async_coze.chat.stream(**kwargs):
+                        chunk, done = self._convert_stream_event(event)
+                        if chunk:
+                            yield chunk
+                        if done:
+                            break
+            except Exception as e:
+                yield sse_wrap(build_delta(f"[stream error] {e}"))
 
         return event_generator()
 
+    @staticmethod
+    def _convert_stream_event(event: Any):
+        """
+        将单个 Coze 流式事件转换为统一 SSE 片段。
+
+        返回:
+            (Optional[str], bool): 待输出的片段（无则为 None）与是否已结束
+        """
+        if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+            content_chunk = getattr(event.message, 'content', None)
+            # 过滤掉系统控制信息
+            if content_chunk and not content_chunk.startswith('{"msg_type":'):
+                return sse_wrap(build_delta(content_chunk)), False
+        if event.event == ChatEventType.CONVERSATION_CHAT_COMPLETED:
+            # 发送结束片段（finish_reason=stop）
+            return sse_wrap(build_stop()), True
+        return None, False
+
     def upload_file(self, file_path: str) -> Any:
         """
         将本地临时文件上传到 Coze，并返回统一文件信息 FastGPTFileInfo。
@@ -3,10 +3,12 @@ import httpx
 from dotenv import load_dotenv
 from .base import BaseAgent
 from .registry import registry
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
 import mimetypes
 from .models import ChatRequest, UnifiedChatResponse, Usage, Choice, Message
+from .sse import sse_wrap, build_delta, build_stop
+from .resilience import UpstreamUnavailableError
 
 if os.path.exists('.env'):
     load_dotenv('.env')
@@ -21,9 +23,65 @@ class DifyAPIError(Exception):
         self.message = message
         super().__init__(f"HTTP {status_code}: {message}")
 
+
+class _DifyStreamDecoder:
+    """
+    将 Dify 的 SSE 行（answer 为累计文本）逐行转换为统一的增量片段。
+    同步与异步流共用，保证两条路径输出一致。
+    """
+
+    def __init__(self):
+        self.prev = ""
+        self.done = False
+
+    def feed(self, raw_line: Any) -> List[str]:
+        if not raw_line or self.done:
+            return []
+        # 统一为 str
+        try:
+            line = raw_line.decode('utf-8') if isinstance(raw_line, (bytes, bytearray)) else str(raw_line)
+        except Exception:
+            return []
+        line = line.strip()
+        # 忽略空行与注释行（SSE keepalive）
+        if not line or line.startswith(":"):
+            return []
+
+        if line.startswith("data:"):
+            data_text = line[len("data:"):].strip()
+        else:
+            data_text = line
+
+        # Dify 结束标识
+        if data_text == "[DONE]":
+            self.done = True
+            return [sse_wrap(build_stop())]
+
+        # 解析 JSON，取 answer 累计文本，计算增量
+        try:
+            obj = json.loads(data_text)
+        except Exception:
+            return []
+
+        answer = obj.get("answer") or obj.get("data", {}).get("answer") or ""
+        if not isinstance(answer, str):
+            return []
+
+        if not answer.startswith(self.prev):
+            delta_text = answer
+        else:
+            delta_text = answer[len(self.prev):]
+
+        if not delta_text:
+            return []
+        self.prev = answer
+        return [sse_wrap(build_delta(delta_text))]
+
 class DifyAgent(BaseAgent):
     """Agent for Dify API."""
 
+    http_env_prefix = "DIFY"
+
     def validate_request(self, request_data: Dict[str, Any]) -> bool:
         """
         校验请求数据是否合法，只需保证 user 字段存在且非空。
@@ -74,123 +132,112 @@ class DifyAgent(BaseAgent):
             print(f"Unexpected error from Dify: {e}")
             return {"error": f"Unexpected error from Dify: {e}"}
 
+    async def aprocess_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        process_request 的异步版本，通过共享 AsyncClient 调用 Dify（blocking 模式）。
+        流式请求请使用 astream_chat。
+        """
+        try:
+            response = await self.asend_chat_message(
+                api_key=dify_api_key,
+                user=request_data.get('user', ''),
+                base_url=dify_base_url,
+                query=request_data.get('query', ''),
+                conversation_id=request_data.get('conversation_id', ''),
+                files=request_data.get('files', None)
+            )
+            print("Dify response:", response.text)
+            return response.json()
+        except UpstreamUnavailableError:
+            raise
+        except DifyAPIError as e:
+            print(f"Dify API error: {e.status_code} - {e.message}")
+            return {"error": f"Dify API error: {e.status_code} - {e.message}"}
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error from Dify: {e.response.status_code} - {e.response.text}")
+            return {"error": f"HTTP error from Dify: {e.response.status_code} - {e.response.text}"}
+        except httpx.RequestError as e:
+            print(f"Request error from Dify: {e}")
+            return {"error": f"Request error from Dify: {e}"}
+        except Exception as e:
+            print(f"Unexpected error from Dify: {e}")
+            return {"error": f"Unexpected error from Dify: {e}"}
+
     def stream_chat(self, request_data: Dict[str, Any]):
         """
         将 Dify 的流式响应转换为统一的 SSE 增量格式：
         data: {"id":"","object":"","created":0,"choices":[{"delta":{"content":"..."},"index":0,"finish_reason":null}]}
         """
-        user = request_data.get('user', '')
-        query = request_data.get('query', '')
-        conversation_id = request_data.get('conversation_id', '')
-        files = request_data.get('files', None)
-
-        if not dify_api_key or not dify_base_url:
-            raise ValueError("DIFY_BASE_URL or DIFY_API_KEY not found in environment variables")
-
-        # 先发一个空增量，保持与 FastGPT/OpenAI 风格一致
-        def sse_wrap(payload: Dict[str, Any]) -> str:
-            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-
-        def build_delta(content: Optional[str]):
-            return {
-                "id": "",
-                "object": "",
-                "created": 0,
-                "choices": [
-                    {
-                        "delta": {"content": content or ""},
-                        "index": 0,
-                        "finish_reason": None
-                    }
-                ]
-            }
+        url, headers, data = self._prepare_stream(request_data)
 
         def event_generator():
-            prev = ""
+            decoder = _DifyStreamDecoder()
             # 发送初始空片段
             yield sse_wrap(build_delta(""))
 
-            # 直接在此方法内部管理 httpx.Client，避免返回已关闭的流
-            url = f"{dify_base_url}/chat-messages"
-            headers = {
-                "Authorization": f"Bearer {dify_api_key}",
-                "Content-Type": "application/json",
-                "Accept": "text/event-stream"
-            }
-            data = {
-                "inputs": {},
-                "query": query,
-                "response_mode": "streaming",
-                "conversation_id": conversation_id,
-                "user": user,
-                "files": files
-            }
-
             try:
+                # 直接在此方法内部管理 httpx.Client，避免返回已关闭的流
                 with httpx.Client(timeout=None) as client:
                     with client.stream("POST", url, headers=headers, json=data) as response:
                         response.raise_for_status()
                         for raw_line in response.iter_lines():
-                            if not raw_line:
-                                continue
-                            # 统一为 str
-                            try:
-                                line = raw_line.decode('utf-8') if isinstance(raw_line, (bytes, bytearray)) else str(raw_line)
-                            except Exception:
-                                continue
-                            line = line.strip()
-                            if not line:
-                                continue
-                            # 忽略注释行（SSE keepalive）
-                            if line.startswith(":"):
-                                continue
-
-                            if line.startswith("data:"):
-                                data_text = line[len("data:"):].strip()
-                            else:
-                                data_text = line
-
-                            # Dify 结束标识
-                            if data_text == "[DONE]":
-                                done_payload = {
-                                    "id": "",
-                                    "object": "",
-                                    "created": 0,
-                                    "choices": [
-                                        {
-                                            "delta": {},
-                                            "index": 0,
-                                            "finish_reason": "stop"
-                                        }
-                                    ]
-                                }
-                                yield sse_wrap(done_payload)
+                            for chunk in decoder.feed(raw_line):
+                                yield chunk
+                            if decoder.done:
                                 break
+            except httpx.HTTPError as e:
+                yield sse_wrap(build_delta(f"[stream error] {e}"))
 
-                            # 解析 JSON，取 answer 累计文本，计算增量
-                            try:
-                                obj = json.loads(data_text)
-                            except Exception:
-                                continue
+        return event_generator()
 
-                            answer = obj.get("answer") or obj.get("data", {}).get("answer") or ""
-                            if not isinstance(answer, str):
-                                continue
+    def astream_chat(self, request_data: Dict[str, Any]):
+        """
+        stream_chat 的异步版本：通过共享 AsyncClient 读取 Dify 流并转换为统一 SSE 增量格式。
+        配置校验在调用时立即执行，返回异步生成器。
+        """
+        url, headers, data = self._prepare_stream(request_data)
+        self.resilience.check()
 
-                            if not answer.startswith(prev):
-                                delta_text = answer
-                            else:
-                                delta_text = answer[len(prev):]
+        async def event_generator():
+            decoder = _DifyStreamDecoder()
+            # 发送初始空片段
+            yield sse_wrap(build_delta(""))
 
-                            if delta_text:
-                                yield sse_wrap(build_delta(delta_text))
-                                prev = answer
-            except httpx.HTTPError as e:
-                err_payload = build_delta(f"[stream error] {e}")
-                yield sse_wrap(err_payload)
+            try:
+                async with self.resilience.slot():
+                    async with self.http_client.stream("POST", url, headers=headers, json=data, timeout=self.stream_timeout) as response:
+                        response.raise_for_status()
+                        async for raw_line in response.aiter_lines():
+                            for chunk in decoder.feed(raw_line):
+                                yield chunk
+                            if decoder.done:
+                                break
+            except (httpx.HTTPError, UpstreamUnavailableError) as e:
+                yield sse_wrap(build_delta(f"[stream error] {e}"))
 
         return event_generator()
 
+    def _prepare_stream(self, request_data: Dict[str, Any]):
+        """组装 Dify 流式请求的 url、headers 与请求体"""
+        if not dify_api_key or not dify_base_url:
+            raise ValueError("DIFY_BASE_URL or DIFY_API_KEY not found in environment variables")
+
+        url = f"{dify_base_url}/chat-messages"
+        headers = {
+            "Authorization": f"Bearer {dify_api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        data = {
+            "inputs": {},
+            "query": request_data.get('query', ''),
+            "response_mode": "streaming",
+            "conversation_id": request_data.get('conversation_id', ''),
+            "user": request_data.get('user', ''),
+            "files": request_data.get('files', None)
+        }
+        return url, headers, data
+
     def upload_file(self, file_path: str) -> Any:
         """
         将本地临时文件上传到 Dify，并返回统一文件信息 FastGPTFileInfo。
@@ -320,6 +367,30 @@ class DifyAgent(BaseAgent):
         """
         向 Dify 服务发送聊天消息请求。
         """
+        url, headers, data = self._prepare_chat_message(api_key, user, base_url, query, response_mode, conversation_id, files)
+        with httpx.Client(timeout=60.0) as client:
+            if response_mode == "streaming":
+                return client.stream("POST", url, headers=headers, json=data)
+            else:
+                response = client.post(url, headers=headers, json=data)
+                self._raise_for_dify_error(response)
+                return response
+
+    async def asend_chat_message(self, api_key: str, user: str, base_url: str, query: str, conversation_id: str = "", files: list = None) -> httpx.Response:
+        """
+        向 Dify 服务发送 blocking 模式聊天消息请求（共享连接池）。
+        """
+        url, headers, data = self._prepare_chat_message(api_key, user, base_url, query, "blocking", conversation_id, files)
+        async def send():
+            response = await self.http_client.post(url, headers=headers, json=data)
+            self._raise_for_dify_error(response)
+            return response
+
+        # 无 conversation_id 的请求不依赖会话状态，可安全重试/对冲
+        return await self.resilience.call(send, idempotent=not conversation_id)
+
+    @staticmethod
+    def _prepare_chat_message(api_key: str, user: str, base_url: str, query: str, response_mode: str, conversation_id: str, files: Optional[list]):
         url = f"{base_url}/chat-messages"
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -333,24 +404,22 @@ class DifyAgent(BaseAgent):
             "user": user,
             "files": files
         }
-        with httpx.Client(timeout=60.0) as client:
-            if response_mode == "streaming":
-                return client.stream("POST", url, headers=headers, json=data)
-            else:
-                response = client.post(url, headers=headers, json=data)
-                # 检查HTTP状态码
-                if response.status_code != 200:
-                    error_msg = f"HTTP {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        if "message" in error_data:
-                            error_msg = error_data["message"]
-                        if "code" in error_data:
-                            error_msg = f"{error_data['code']}: {error_data.get('message', 'Unknown error')}"
-                    except:
-                        pass
-                    raise DifyAPIError(response.status_code, error_msg)
-                return response
+        return url, headers, data
+
+    @staticmethod
+    def _raise_for_dify_error(response: httpx.Response) -> None:
+        # 检查HTTP状态码
+        if response.status_code != 200:
+            error_msg = f"HTTP {response.status_code}"
+            try:
+                error_data = response.json()
+                if "message" in error_data:
+                    error_msg = error_data["message"]
+                if "code" in error_data:
+                    error_msg = f"{error_data['code']}: {error_data.get('message', 'Unknown error')}"
+            except:
+                pass
+            raise DifyAPIError(response.status_code, error_msg)
 
     def get_history(self, api_key: str, user: str, base_url: str, conversation_id: str = ""):
         """
@@ -2,14 +2,13 @@ import os
 import httpx
 from dotenv import load_dotenv
 import json
-from typing import List, Dict, Optional, Union, Any
+from typing import Awaitable, Callable, List, Dict, Optional, Union, Any
 import traceback
-import uuid
 import mimetypes
-from datetime import datetime
 from .base import BaseAgent
 from .registry import registry
 from .models import ChatRequest, UnifiedChatResponse, StandardChatResponse, DetailedChatResponse
+from services.object_storage import object_storage
 
 if os.path.exists('.env'):
     load_dotenv('.env')
@@ -18,18 +17,13 @@ fastgpt_api_key = os.getenv("FASTGPT_API_KEY")
 fastgpt_base_url = os.getenv("FASTGPT_BASE_URL")
 fastgpt_app_id = os.getenv("FASTGPT_APP_ID")
 
-# S3 / MinIO 配置（用于文件上传）
-s3_endpoint = os.getenv("S3_ENDPOINT")  # 例如: https://minio.example.com 或 http://127.0.0.1:9000
-s3_access_key = os.getenv("S3_ACCESS_KEY")
-s3_secret_key = os.getenv("S3_SECRET_KEY")
-s3_bucket = os.getenv("S3_BUCKET")
-s3_region = os.getenv("S3_REGION")  # 可选
-s3_key_prefix = os.getenv("S3_KEY_PREFIX", "uploads")  # 可选，默认 uploads
-s3_acl = os.getenv("S3_ACL")  # 可选，例如 public-read（部分 MinIO 可无 ACL，依赖桶策略）
-s3_public_base_url = os.getenv("S3_PUBLIC_BASE_URL")  # 可选，外网访问基准，如 https://cdn.example.com
+# S3 / MinIO 配置（用于文件上传）见 services/object_storage.py
 
 class FastGPTAgent(BaseAgent):
     """Agent for FastGPT API."""
+
+    http_env_prefix = "FASTGPT"
+    http_timeout = 30.0
     
     @staticmethod
     def _is_valid_object_id(value: Optional[str]) -> bool:
@@ -70,7 +64,35 @@ class FastGPTAgent(BaseAgent):
     
     def process_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process the request using FastGPT API."""
-        # 构建消息内容，支持文件上传
+        messages = self._build_messages(request_data)
+        variables = self._build_variables(request_data)
+        # 请求体参数
+        response = self.chat_completions(
+            messages=messages,
+            app_id=request_data.get('app_id'),
+            chat_id=request_data.get('chat_id'),
+            stream=request_data.get('stream', False),
+            detail=request_data.get('detail', False),  # 支持通过请求参数控制 detail
+            variables=variables
+        )
+        
+        return response
+
+    async def aprocess_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Process the request using FastGPT API on the shared AsyncClient."""
+        messages = self._build_messages(request_data)
+        variables = self._build_variables(request_data)
+        return await self.achat_completions(
+            messages=messages,
+            app_id=request_data.get('app_id'),
+            chat_id=request_data.get('chat_id'),
+            stream=request_data.get('stream', False),
+            detail=request_data.get('detail', False),
+            variables=variables
+        )
+
+    def _build_messages(self, request_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """构建消息内容，支持文件上传"""
         message_content = []
         
         # 添加文本内容
@@ -107,31 +129,22 @@ class FastGPTAgent(BaseAgent):
         
         # 如果有多个内容类型，使用复合格式；否则使用简单字符串格式
         if len(message_content) > 1 or (len(message_content) == 1 and message_content[0]["type"] != "text"):
-            messages = [
+            return [
                 {"role": "user", "content": message_content}
             ]
-        else:
-            # 只有文本内容时，保持原有格式
-            messages = [
-                {"role": "user", "content": text_content}
-            ]
-        
-        variables = {}
+        # 只有文本内容时，保持原有格式
+        return [
+            {"role": "user", "content": text_content}
+        ]
+
+    def _build_variables(self, request_data: Dict[str, Any]) -> Dict[str, str]:
+        """从请求中提取 FastGPT 模块变量"""
+        variables: Dict[str, str] = {}
         if 'uid' in request_data and request_data['uid']:
             variables["uid"] = request_data['uid']
         if 'user' in request_data and request_data['user']:
             variables["user"] = request_data['user']
-        # 请求体参数
-        response = self.chat_completions(
-            messages=messages,
-            app_id=request_data.get('app_id'),
-            chat_id=request_data.get('chat_id'),
-            stream=request_data.get('stream', False),
-            detail=request_data.get('detail', False),  # 支持通过请求参数控制 detail
-            variables=variables
-        )
-        
-        return response
+        return variables
     
     def _is_image_file(self, url: str) -> bool:
         """判断URL是否为图片文件"""
@@ -202,6 +215,54 @@ class FastGPTAgent(BaseAgent):
         Returns:
             API响应的JSON数据
         """
+        url, headers, data = self._prepare_completion(
+            messages, app_id, chat_id, stream, detail, response_chat_item_id, variables
+        )
+
+        with httpx.Client(timeout=30.0) as client:
+            response = client.post(url, headers=headers, json=data)
+            print("Raw response status:", response.status_code)
+            print("Raw response text:", response.text)
+            response.raise_for_status()
+            return response.json()
+
+    async def achat_completions(
+        self,
+        messages: List[Dict[str, Union[str, List[Dict[str, Any]]]]],
+        app_id: Optional[str] = None,
+        chat_id: Optional[str] = None,
+        stream: bool = False,
+        detail: bool = False,
+        response_chat_item_id: Optional[str] = None,
+        variables: Optional[Dict[str, str]] = None
+    ) -> Dict:
+        """
+        chat_completions 的异步版本，复用 Agent 级共享连接池。参数与返回值同 chat_completions。
+        """
+        url, headers, data = self._prepare_completion(
+            messages, app_id, chat_id, stream, detail, response_chat_item_id, variables
+        )
+
+        async def send():
+            response = await self.http_client.post(url, headers=headers, json=data)
+            response.raise_for_status()
+            return response
+
+        # 无 chat_id 时不依赖 FastGPT 会话状态，可安全重试/对冲
+        response = await self.resilience.call(send, idempotent=not chat_id)
+        return response.json()
+
+    def _prepare_completion(
+        self,
+        messages: List[Dict[str, Union[str, List[Dict[str, Any]]]]],
+        app_id: Optional[str],
+        chat_id: Optional[str],
+        stream: bool,
+        detail: bool,
+        response_chat_item_id: Optional[str],
+        variables: Optional[Dict[str, str]]
+    ):
+        """校验配置并组装 /v1/chat/completions 的 url、headers 与请求体"""
         if not fastgpt_api_key:
             raise ValueError("FASTGPT_API_KEY not found in environment variables")
 
@@ -235,82 +296,13 @@ class FastGPTAgent(BaseAgent):
         if variables is not None:
             data["variables"] = variables
 
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(url, headers=headers, json=data)
-            print("Raw response status:", response.status_code)
-            print("Raw response text:", response.text)
-            response.raise_for_status()
-            return response.json()
+        return url, headers, data
 
     def stream_chat(self, request_data: Dict[str, Any]):
         """
         以 SSE 形式流式转发 FastGPT 的响应（detail=false, stream=true）。
         """
-        if not fastgpt_api_key:
-            raise ValueError("FASTGPT_API_KEY not found in environment variables")
-
-        used_app_id = request_data.get('app_id') or fastgpt_app_id
-        if not used_app_id:
-            raise ValueError("app_id is required. Please provide it as parameter or set FASTGPT_APP_ID in environment variables")
-        if not self._is_valid_object_id(used_app_id):
-            raise ValueError(f"Invalid app_id format. Expect 24-char hex ObjectId, got: {used_app_id}")
-
-        if not fastgpt_base_url:
-            raise ValueError("FASTGPT_BASE_URL not found in environment variables")
-
-        # 组装消息（与 process_request 保持一致）
-        message_content = []
-        text_content = request_data.get('query', '')
-        if text_content:
-            message_content.append({
-                "type": "text",
-                "text": text_content
-            })
-        files = request_data.get('files', [])
-        if files:
-            for file_url in files:
-                if isinstance(file_url, str):
-                    if self._is_image_file(file_url):
-                        message_content.append({
-                            "type": "image_url",
-                            "image_url": {"url": file_url}
-                        })
-                    else:
-                        file_name = self._extract_filename_from_url(file_url)
-                        message_content.append({
-                            "type": "file_url",
-                            "name": file_name,
-                            "url": file_url
-                        })
-
-        if len(message_content) > 1 or (len(message_content) == 1 and message_content[0]["type"] != "text"):
-            messages = [{"role": "user", "content": message_content}]
-        else:
-            messages = [{"role": "user", "content": text_content}]
-
-        variables: Dict[str, str] = {}
-        if 'uid' in request_data and request_data['uid']:
-            variables["uid"] = request_data['uid']
-        if 'user' in request_data and request_data['user']:
-            variables["user"] = request_data['user']
-
-        url = f"{fastgpt_base_url}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {fastgpt_api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "appId": used_app_id,
-            "stream": True,
-            "detail": False,
-            "messages": messages
-        }
-        if request_data.get('chat_id') is not None:
-            data["chatId"] = request_data.get('chat_id')
-        if request_data.get('variables') is not None:
-            data["variables"] = request_data.get('variables')
-        elif variables:
-            data["variables"] = variables
+        url, headers, data = self._prepare_stream(request_data)
 
         def event_generator():
             with httpx.Client(timeout=None) as client:
@@ -324,6 +316,43 @@ class FastGPTAgent(BaseAgent):
 
         return event_generator()
 
+    def astream_chat(self, request_data: Dict[str, Any]):
+        """
+        stream_chat 的异步版本：通过共享 AsyncClient 流式透传 FastGPT 的 SSE。
+        配置校验在调用时立即执行，返回异步生成器。
+        """
+        url, headers, data = self._prepare_stream(request_data)
+        self.resilience.check()
+
+        async def event_generator():
+            # 整个流期间占用并发名额，并将结果计入熔断统计
+            async with self.resilience.slot():
+                async with self.http_client.stream("POST", url, headers=headers, json=data, timeout=self.stream_timeout) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        # FastGPT 通常已带有 'data: ' 前缀，这里原样透传
+                        yield (line + "\n\n")
+
+        return event_generator()
+
+    def _prepare_stream(self, request_data: Dict[str, Any]):
+        """组装流式请求（与 process_request 保持一致，额外支持透传 variables）"""
+        messages = self._build_messages(request_data)
+        variables = self._build_variables(request_data)
+        if request_data.get('variables') is not None:
+            variables = request_data.get('variables')
+        return self._prepare_completion(
+            messages,
+            request_data.get('app_id'),
+            request_data.get('chat_id'),
+            True,
+            False,
+            None,
+            variables or None
+        )
+
     def upload_file(self, file_path: str) -> Any:
         """
         将本地临时文件上传到 S3/MinIO，并返回统一文件信息 FastGPTFileInfo。
@@ -333,16 +362,7 @@ class FastGPTAgent(BaseAgent):
         - S3_BUCKET
         可选：S3_REGION, S3_KEY_PREFIX, S3_ACL, S3_PUBLIC_BASE_URL
         """
-        if not all([s3_endpoint, s3_access_key, s3_secret_key, s3_bucket]):
-            raise ValueError("Missing S3 configs. Please set S3_ENDPOINT,S3_ACCESS_KEY,S3_SECRET_KEY,S3_BUCKET")
-
-        # 延迟导入 boto3，避免未使用文件上传功能时强依赖
-        try:
-            import boto3  # type: ignore
-        except ImportError as e:
-            raise ImportError("boto3 未安装。请运行: pip install boto3 或将其加入 requirements.txt") from e
-
-        # 提取原始文件名（upload.py 会以 _{filename} 作为后缀创建临时文件）
+        # 提取原始文件名（临时文件以 _{filename} 作为后缀）
         original_name = os.path.basename(file_path)
         if "_" in original_name:
             original_name = original_name.split("_", 1)[1] or original_name
@@ -350,59 +370,18 @@ class FastGPTAgent(BaseAgent):
         # 猜测 MIME
         mime_type = mimetypes.guess_type(original_name)[0] or "application/octet-stream"
         file_size = os.path.getsize(file_path)
-        ext = os.path.splitext(original_name)[1]
-        object_key = f"{s3_key_prefix}/{datetime.now().strftime('%Y/%m/%d')}/{uuid.uuid4().hex}{ext}"
-
-        client = boto3.client(
-            "s3",
-            endpoint_url=s3_endpoint,
-            aws_access_key_id=s3_access_key,
-            aws_secret_access_key=s3_secret_key,
-            region_name=s3_region if s3_region else None
-        )
-
-        extra_args = {"ContentType": mime_type}
-        if s3_acl:
-            extra_args["ACL"] = s3_acl
+        object_key = object_storage.new_object_key(original_name)
 
+        # 复用共享 boto3 客户端（连接池）
         with open(file_path, "rb") as f:
-            client.upload_fileobj(
+            object_storage.client.upload_fileobj(
                 f,
-                s3_bucket,
+                object_storage.bucket,
                 object_key,
-                ExtraArgs=extra_args
+                ExtraArgs=object_storage.extra_args(mime_type)
             )
 
-        # 生成可访问 URL：优先使用 S3_PUBLIC_BASE_URL，其次使用预签名 URL
-        public_url: Optional[str] = None
-        if s3_public_base_url:
-            base = s3_public_base_url.rstrip('/')
-            try:
-                # 支持 {bucket} 占位符、虚拟主机式(bucket.example.com) 与路径式(/bucket/...)
-                from urllib.parse import urlparse
-                parsed = urlparse(base)
-                host_has_bucket = parsed.netloc.startswith(f"{s3_bucket}.") if parsed.netloc else False
-                path = (parsed.path or '').strip('/')
-                path_has_bucket = (path == s3_bucket) or path.startswith(f"{s3_bucket}/")
-
-                if '{bucket}' in base:
-                    base = base.replace('{bucket}', s3_bucket)
-                    public_url = f"{base}/{object_key}"
-                elif host_has_bucket or path_has_bucket:
-                    public_url = f"{base}/{object_key}"
-                else:
-                    public_url = f"{base}/{s3_bucket}/{object_key}"
-            except Exception:
-                public_url = f"{base}/{s3_bucket}/{object_key}"
-        else:
-            try:
-                public_url = client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': s3_bucket, 'Key': object_key},
-                    ExpiresIn=3600
-                )
-            except Exception:
-                public_url = None
+        public_url = object_storage.public_url(object_key)
 
         # 构造统一文件信息；将 id 设为可访问 URL（若有），否则为对象键
         file_info = self.build_file_info(
@@ -415,5 +394,24 @@ class FastGPTAgent(BaseAgent):
 
         return file_info
 
+    async def aupload_file(
+        self,
+        read: Callable[[int], Awaitable[bytes]],
+        filename: str,
+        content_type: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ) -> Any:
+        """
+        边读边传到 S3/MinIO（分片并发上传，不落临时文件），返回统一文件信息 FastGPTFileInfo。
+        """
+        stored = await object_storage.upload_stream(read, filename, content_type, max_bytes)
+        return self.build_file_info(
+            file_id=stored.url or stored.object_key,
+            file_name=filename,
+            size_bytes=stored.size,
+            mime_type=stored.mime_type,
+            created_by="uploader"
+        )
+
 # Register the agent
 registry.register("fastgpt", FastGPTAgent())
\ No newline at end of file
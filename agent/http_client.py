@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+import httpx
+from typing import Optional
+from dotenv import load_dotenv
+from services.metrics import UPSTREAM_TTFB, UPSTREAM_DURATION
+
+if os.path.exists('.env'):
+    load_dotenv('.env')
+
+logger = logging.getLogger(__name__)
+
+
+def _env(prefix: str, name: str, default: str) -> str:
+    """
+    读取连接池配置：优先使用 {PREFIX}_HTTP_{NAME}，其次 AGENT_HTTP_{NAME}，最后默认值。
+    """
+    if prefix:
+        value = os.getenv(f"{prefix}_HTTP_{name}")
+        if value:
+            return value
+    return os.getenv(f"AGENT_HTTP_{name}", default)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 依赖 h2 包（httpx[http2]），未安装时回退到 HTTP/1.1。"""
+    try:
+        import h2  # type: ignore  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _TimedByteStream(httpx.AsyncByteStream):
+    """包装响应体流，在关闭时记录上游请求总耗时"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, label: str, status: str, started: float):
+        self._stream = stream
+        self._label = label
+        self._status = status
+        self._started = started
+        self._observed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._observed:
+                self._observed = True
+                UPSTREAM_DURATION.observe(time.perf_counter() - self._started, self._label, self._status)
+
+
+class _MetricsTransport(httpx.AsyncBaseTransport):
+    """
+    记录上游首字节（响应头到达）延迟与总耗时的传输层包装。
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, label: str):
+        self._transport = transport
+        self._label = label
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            UPSTREAM_DURATION.observe(time.perf_counter() - started, self._label, "error")
+            raise
+        UPSTREAM_TTFB.observe(time.perf_counter() - started, self._label)
+        response.stream = _TimedByteStream(response.stream, self._label, str(response.status_code), started)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def build_async_client(prefix: str = "", timeout: float = 60.0, label: str = "") -> httpx.AsyncClient:
+    """
+    为单个智能体创建长连接复用的 httpx.AsyncClient。
+
+    可通过环境变量配置（均支持 {PREFIX}_HTTP_* 覆盖，如 FASTGPT_HTTP_MAX_CONNECTIONS）：
+        - AGENT_HTTP_MAX_CONNECTIONS: 最大连接数，默认 100
+        - AGENT_HTTP_MAX_KEEPALIVE: 最大空闲长连接数，默认 20
+        - AGENT_HTTP_KEEPALIVE_EXPIRY: 空闲长连接保活秒数，默认 30
+        - AGENT_HTTP_HTTP2: 是否启用 HTTP/2，默认 true（需安装 h2）
+        - AGENT_HTTP_CONNECT_TIMEOUT: 建连超时（秒），默认 5
+        - AGENT_HTTP_READ_TIMEOUT: 读超时（秒），默认取 timeout 参数
+        - AGENT_HTTP_POOL_TIMEOUT: 等待连接池空闲连接的超时（秒），默认 5
+
+    参数:
+        prefix (str): 智能体环境变量前缀，如 FASTGPT、DIFY
+        timeout (float): 默认超时时间（秒），单次请求可覆盖
+        label (str): 指标中的 agent 标签，默认取 prefix 小写
+
+    返回:
+        httpx.AsyncClient: 连接池客户端，需在应用关闭时 aclose()
+    """
+    limits = httpx.Limits(
+        max_connections=int(_env(prefix, "MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(_env(prefix, "MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(_env(prefix, "KEEPALIVE_EXPIRY", "30")),
+    )
+
+    http2 = _env(prefix, "HTTP2", "true").lower() in ("1", "true", "yes")
+    if http2 and not _http2_available():
+        logger.warning(f"[{prefix or 'agent'}] 未安装 h2，HTTP/2 已降级为 HTTP/1.1（pip install 'httpx[http2]'）")
+        http2 = False
+
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    return httpx.AsyncClient(
+        transport=_MetricsTransport(transport, label or prefix.lower() or "agent"),
+        timeout=build_timeout(prefix, timeout),
+    )
+
+
+def build_timeout(prefix: str = "", read: Optional[float] = 60.0) -> httpx.Timeout:
+    """
+    建连、读、写、取连接分别设置超时：上游不可达时在建连阶段快速失败，而不是占满整个读超时。
+
+    参数:
+        prefix (str): 智能体环境变量前缀
+        read (Optional[float]): 读超时默认值，None 表示不限制（流式响应）
+    """
+    read_env = _env(prefix, "READ_TIMEOUT", "")
+    if read is not None and read_env:
+        read = float(read_env)
+    connect = float(_env(prefix, "CONNECT_TIMEOUT", "5"))
+    return httpx.Timeout(
+        read,
+        connect=connect,
+        read=read,
+        write=read,
+        pool=float(_env(prefix, "POOL_TIMEOUT", "5")),
+    )
@@ -47,7 +47,7 @@ def load_agents():
     # 遍历 agent 目录下所有模块
     for (_, module_name, _) in pkgutil.iter_modules([str(package_dir)]):
         # 跳过特殊模块
-        if module_name in ['__init__', 'base', 'registry', 'loader']:
+        if module_name in ['__init__', 'base', 'registry', 'loader', 'http_client', 'sse', 'resilience']:
             continue
         
         # 动态导入模块
@@ -1,6 +1,9 @@
+import logging
 from typing import Dict, Optional
 from .base import BaseAgent
 
+logger = logging.getLogger(__name__)
+
 class AgentRegistry:
     """
     智能体注册表类，用于管理所有可用的智能体（Agent）。
@@ -46,5 +49,31 @@ class AgentRegistry:
         """
         return self._agents.copy()
 
+    def resilience_stats(self) -> Dict[str, dict]:
+        """
+        各智能体上游保护状态（熔断、并发、p95 耗时），用于健康检查。
+        """
+        return {name: agent.resilience.stats() for name, agent in self._agents.items()}
+
+    async def startup(self) -> None:
+        """
+        为所有已注册的智能体创建共享连接池（由应用 lifespan 调用）。
+        """
+        for name, agent in self._agents.items():
+            try:
+                await agent.startup()
+            except Exception as e:
+                logger.error(f"智能体 '{name}' 启动失败: {str(e)}")
+
+    async def shutdown(self) -> None:
+        """
+        关闭所有智能体的共享连接池（由应用 lifespan 调用）。
+        """
+        for name, agent in self._agents.items():
+            try:
+                await agent.shutdown()
+            except Exception as e:
+                logger.error(f"智能体 '{name}' 关闭失败: {str(e)}")
+
 # 创建单例注册表实例，供全局使用
 registry = AgentRegistry()
\ No newline at end of file
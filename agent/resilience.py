@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from services.metrics import metrics
+from .http_client import _env
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_RETRIES = metrics.counter(
+    "gateway_upstream_retries_total", "上游调用重试次数", ("agent",))
+UPSTREAM_REJECTIONS = metrics.counter(
+    "gateway_upstream_rejections_total", "因熔断或舱壁已满被直接拒绝的调用次数", ("agent", "reason"))
+UPSTREAM_HEDGES = metrics.counter(
+    "gateway_upstream_hedged_requests_total", "发出对冲请求的次数", ("agent", "winner"))
+CIRCUIT_STATE = metrics.gauge(
+    "gateway_circuit_state", "熔断器状态：0 关闭，1 半开，2 打开", ("agent",))
+
+# 请求未被上游处理、可安全重试的传输错误
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# 幂等调用额外允许重试的错误
+_IDEMPOTENT_ERRORS = (httpx.ReadTimeout, httpx.RemoteProtocolError, httpx.ReadError)
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class UpstreamUnavailableError(Exception):
+    """上游被熔断或并发已满，网关直接返回 503 而不再等待"""
+
+    def __init__(self, agent: str, reason: str, retry_after: Optional[int] = None):
+        self.agent = agent
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{agent} upstream unavailable: {reason}")
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """提取异常中的 HTTP 状态码（httpx.HTTPStatusError / DifyAPIError 等）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后打开，recovery_timeout 秒后进入半开状态放行一个探测请求，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> None:
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailableError(self.name, "circuit_open", int(remaining) + 1)
+            self._set_state(self.HALF_OPEN)
+        if self._probing:
+            raise UpstreamUnavailableError(self.name, "circuit_half_open", 1)
+        self._probing = True
+
+    def on_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            logger.info(f"[{self.name}] 熔断器已关闭")
+            self._set_state(self.CLOSED)
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold > 0):
+            logger.warning(f"[{self.name}] 熔断器打开（连续失败 {self.failures} 次）")
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def on_ignored(self) -> None:
+        """调用结束但不计入成功/失败（如 4xx 或被取消）"""
+        self._probing = False
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        CIRCUIT_STATE.set(state, self.name)
+
+
+class ResiliencePolicy:
+    """
+    单个智能体的上游调用保护：舱壁并发上限、熔断、带抖动的有限重试与可选对冲请求。
+
+    配置沿用连接池的环境变量规则（{PREFIX}_HTTP_* 覆盖 AGENT_HTTP_*）：
+        - AGENT_HTTP_MAX_CONCURRENCY: 同时进行的上游调用上限，默认 64，0 表示不限制
+        - AGENT_HTTP_BULKHEAD_TIMEOUT: 等待并发名额的最长秒数，默认 1.0，超时返回 503
+        - AGENT_HTTP_RETRIES: 最大重试次数，默认 2
+        - AGENT_HTTP_RETRY_BACKOFF: 重试退避基数（秒），按指数增长并加全抖动，默认 0.2
+        - AGENT_HTTP_BREAKER_FAILURES: 连续失败多少次打开熔断，默认 5，0 表示关闭熔断
+        - AGENT_HTTP_BREAKER_RECOVERY: 熔断打开后多少秒进入半开探测，默认 30
+        - AGENT_HTTP_HEDGE: 是否对幂等调用发出对冲请求，默认 false
+        - AGENT_HTTP_HEDGE_DELAY: 对冲等待秒数，默认 0 表示使用近期耗时的 p95
+
+    仅连接阶段失败（请求未发出）总是重试；读超时、429/502/503/504 只在幂等调用时重试。
+    4xx 视为调用方错误，不计入熔断失败。
+    """
+
+    def __init__(self, name: str, prefix: str = ""):
+        self.name = name
+        self.max_concurrency = int(_env(prefix, "MAX_CONCURRENCY", "64"))
+        self.bulkhead_timeout = float(_env(prefix, "BULKHEAD_TIMEOUT", "1.0"))
+        self.retries = int(_env(prefix, "RETRIES", "2"))
+        self.retry_backoff = float(_env(prefix, "RETRY_BACKOFF", "0.2"))
+        self.hedge = _env(prefix, "HEDGE", "false").lower() in ("1", "true", "yes")
+        self.hedge_delay = float(_env(prefix, "HEDGE_DELAY", "0"))
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(_env(prefix, "BREAKER_FAILURES", "5")),
+            recovery_timeout=float(_env(prefix, "BREAKER_RECOVERY", "30")),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+        self._latencies: deque = deque(maxlen=200)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], idempotent: bool = False) -> Any:
+        """
+        在保护策略下执行一次上游调用。
+
+        参数:
+            fn: 发起一次请求的协程工厂（每次重试/对冲都会重新调用）
+            idempotent: 是否幂等（无会话上下文），决定能否重试读超时与是否允许对冲
+
+        异常:
+            UpstreamUnavailableError: 熔断打开或舱壁已满
+        """
+        async with self.slot():
+            started = time.monotonic()
+            if self.hedge and idempotent:
+                result = await self._hedged(lambda: self._with_retries(fn, idempotent))
+            else:
+                result = await self._with_retries(fn, idempotent)
+            # 仅记录非流式调用耗时，作为对冲延迟（p95）的依据
+            self._latencies.append(time.monotonic() - started)
+            return result
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        占用一个并发名额并记录熔断结果；流式请求在整个流期间持有该名额。
+        """
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailableError as e:
+            UPSTREAM_REJECTIONS.inc(self.name, e.reason)
+            raise
+        acquired = False
+        try:
+            if self._semaphore is not None:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.bulkhead_timeout)
+                    acquired = True
+                except asyncio.TimeoutError:
+                    UPSTREAM_REJECTIONS.inc(self.name, "bulkhead_full")
+                    raise UpstreamUnavailableError(self.name, "bulkhead_full", 1)
+            yield
+            self.breaker.on_success()
+        except UpstreamUnavailableError:
+            self.breaker.on_ignored()
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.on_ignored()
+            raise
+        except Exception as e:
+            status = _status_code(e)
+            if status is not None and 400 <= status < 500 and status != 429:
+                self.breaker.on_ignored()
+            else:
+                self.breaker.on_failure()
+            raise
+        finally:
+            if acquired:
+                self._semaphore.release()
+
+    def check(self) -> None:
+        """在返回流式生成器前快速检查熔断状态（不占用名额）"""
+        if self.breaker.state == CircuitBreaker.OPEN:
+            remaining = self.breaker.opened_at + self.breaker.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                UPSTREAM_REJECTIONS.inc(self.name, "circuit_open")
+                raise UpstreamUnavailableError(self.name, "circuit_open", int(remaining) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit_state": ("closed", "half_open", "open")[self.breaker.state],
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": (self.max_concurrency - self._semaphore._value) if self._semaphore is not None else None,
+            "p95_latency": self._p95(),
+        }
+
+    def _is_retryable(self, exc: BaseException, idempotent: bool) -> bool:
+        if isinstance(exc, _UNSENT_ERRORS):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(exc, _IDEMPOTENT_ERRORS):
+            return True
+        return _status_code(exc) in _RETRYABLE_STATUS
+
+    async def _with_retries(self, fn: Callable[[], Awaitable[Any]], idempotent: bool) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= self.retries or not self._is_retryable(e, idempotent):
+                    raise
+                attempt += 1
+                UPSTREAM_RETRIES.inc(self.name)
+                # 指数退避 + 全抖动
+                delay = random.uniform(0, self.retry_backoff * (2 ** (attempt - 1)))
+                logger.warning(f"[{self.name}] 上游调用失败，{delay:.2f}s 后第 {attempt} 次重试: {e}")
+                await asyncio.sleep(delay)
+
+    def _p95(self) -> Optional[float]:
+        if len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        return round(ordered[int(len(ordered) * 0.95) - 1], 3)
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """首个请求超过对冲延迟仍未完成时再发一个，取先成功者，取消另一个"""
+        delay = self.hedge_delay or self._p95()
+        if not delay:
+            return await attempt()
+
+        first = asyncio.ensure_future(attempt())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            second = asyncio.ensure_future(attempt())
+            tasks.add(second)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        UPSTREAM_HEDGES.inc(self.name, "primary" if task is first else "hedge")
+                        return task.result()
+            # 两个请求均失败，抛出首个请求的异常
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
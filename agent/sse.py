@@ -0,0 +1,116 @@
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+
+def sse_wrap(payload: Dict[str, Any]) -> str:
+    """将 JSON 负载包装为一条 SSE 消息"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def build_delta(content: Optional[str]) -> Dict[str, Any]:
+    """统一的增量片段结构"""
+    return {
+        "id": "",
+        "object": "",
+        "created": 0,
+        "choices": [
+            {
+                "delta": {"content": content or ""},
+                "index": 0,
+                "finish_reason": None
+            }
+        ]
+    }
+
+
+def build_stop() -> Dict[str, Any]:
+    """统一的结束片段结构（finish_reason=stop）"""
+    return {
+        "id": "",
+        "object": "",
+        "created": 0,
+        "choices": [
+            {
+                "delta": {},
+                "index": 0,
+                "finish_reason": "stop"
+            }
+        ]
+    }
+
+
+async def aiter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    异步解析上游 SSE 响应，逐个事件产出 data 字段文本。
+
+    按 SSE 规范处理：空行分隔事件，多行 data 以换行拼接，忽略注释行（keepalive）与其他字段。
+    """
+    data_lines = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+class StreamStats:
+    """
+    单个流的性能统计：首字延迟（TTFT）与输出速率。
+
+    以统一增量片段中非空的 delta.content 计为一个 token（上游通常逐 token 推送）；
+    无法解析的片段（如 FastGPT 原样透传的其他事件）只计入片段数。
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.chunks = 0
+        self.tokens = 0
+
+    def observe(self, line: str) -> None:
+        self.chunks += 1
+        if not line.startswith("data:"):
+            return
+        try:
+            payload = json.loads(line[len("data:"):].strip())
+            content = payload["choices"][0]["delta"].get("content")
+        except Exception:
+            return
+        if not content:
+            return
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.first_token_at is None:
+            return None
+        return int((self.first_token_at - self.started) * 1000)
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        if self.tokens < 2 or self.last_token_at == self.first_token_at:
+            return None
+        return round((self.tokens - 1) / (self.last_token_at - self.first_token_at), 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ttft_ms": self.ttft_ms,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+        }
@@ -1,10 +1,13 @@
 import os
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Tuple
+import httpx
 from dotenv import load_dotenv
 from .base import BaseAgent
 from .registry import registry
 from .models import ChatRequest, UnifiedChatResponse, Usage, Choice, Message
+from .sse import sse_wrap, build_delta, build_stop, aiter_sse_data
+from .resilience import UpstreamUnavailableError
 
 if os.path.exists('.env'):
     load_dotenv('.env')
@@ -13,10 +16,15 @@ if os.path.exists('.env'):
 zhipu_api_key = os.getenv("ZHIPUAI_API_KEY")
 zhipu_base_url = os.getenv("ZHIPUAI_BASE_URL")  # 可选
 
+# 异步路径直接调用 OpenAI 兼容接口，未配置 ZHIPUAI_BASE_URL 时使用官方地址
+ZHIPU_DEFAULT_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+
 
 class ZhipuAgent(BaseAgent):
     """Agent for ZhipuAI (智谱清言) chat.completions API."""
 
+    http_env_prefix = "ZHIPUAI"
+
     def __init__(self):
         self.api_key = zhipu_api_key
         self.base_url = zhipu_base_url
@@ -111,23 +119,6 @@ class ZhipuAgent(BaseAgent):
 
         client = ZhipuAI(**client_kwargs)
 
-        def sse_wrap(payload: Dict[str, Any]) -> str:
-            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-
-        def build_delta(content: Optional[str]):
-            return {
-                "id": "",
-                "object": "",
-                "created": 0,
-                "choices": [
-                    {
-                        "delta": {"content": content or ""},
-                        "index": 0,
-                        "finish_reason": None
-                    }
-                ]
-            }
-
         def event_generator():
             # 先发一个空增量，兼容前端渲染器
             yield sse_wrap(build_delta(""))
@@ -152,20 +143,86 @@ class ZhipuAgent(BaseAgent):
                     except Exception:
                         continue
                 # 结束片段
-                done_payload = {
-                    "id": "",
-                    "object": "",
-                    "created": 0,
-                    "choices": [
-                        {"delta": {}, "index": 0, "finish_reason": "stop"}
-                    ]
-                }
-                yield sse_wrap(done_payload)
+                yield sse_wrap(build_stop())
             except Exception as e:
                 yield sse_wrap(build_delta(f"[stream error] {e}"))
 
         return event_generator()
 
+    async def aprocess_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        process_request 的异步版本：通过共享 AsyncClient 调用 OpenAI 兼容的 chat/completions 接口。
+        返回结构与 SDK 的 model_dump() 一致。
+        """
+        if not self.api_key:
+            return {"error": "ZHIPUAI_API_KEY not configured"}
+
+        url, headers, body = self._prepare_completion(request_data, stream=False)
+        async def send():
+            response = await self.http_client.post(url, headers=headers, json=body)
+            response.raise_for_status()
+            return response
+
+        try:
+            # 单轮请求无会话状态，可安全重试/对冲
+            response = await self.resilience.call(send, idempotent=True)
+            return response.json()
+        except UpstreamUnavailableError:
+            raise
+        except httpx.HTTPStatusError as e:
+            return {"error": f"Zhipu API error: HTTP {e.response.status_code}: {e.response.text}"}
+        except Exception as e:
+            return {"error": f"Zhipu API error: {e}"}
+
+    def astream_chat(self, request_data: Dict[str, Any]):
+        """
+        stream_chat 的异步版本：直接读取 chat/completions 的 SSE 并转换为统一增量格式。
+        配置校验在调用时立即执行，返回异步生成器。
+        """
+        if not self.api_key:
+            raise ValueError("ZHIPUAI_API_KEY not configured")
+
+        url, headers, body = self._prepare_completion(request_data, stream=True)
+        self.resilience.check()
+
+        async def event_generator():
+            # 先发一个空增量，兼容前端渲染器
+            yield sse_wrap(build_delta(""))
+            try:
+                async with self.resilience.slot():
+                    async with self.http_client.stream("POST", url, headers=headers, json=body, timeout=self.stream_timeout) as response:
+                        response.raise_for_status()
+                        async for data_text in aiter_sse_data(response):
+                            if data_text.strip() == "[DONE]":
+                                break
+                            try:
+                                delta = json.loads(data_text)["choices"][0]["delta"].get("content")
+                            except Exception:
+                                continue
+                            if delta:
+                                yield sse_wrap(build_delta(delta))
+                yield sse_wrap(build_stop())
+            except (httpx.HTTPError, UpstreamUnavailableError) as e:
+                yield sse_wrap(build_delta(f"[stream error] {e}"))
+
+        return event_generator()
+
+    def _prepare_completion(self, request_data: Dict[str, Any], stream: bool) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """组装 chat/completions 请求（参数与 SDK 调用保持一致）"""
+        base_url = (self.base_url or ZHIPU_DEFAULT_BASE_URL).rstrip("/")
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        body = {
+            "model": request_data.get('model') or "glm-4",
+            "messages": [{"role": "user", "content": request_data.get('query', '')}],
+            "temperature": request_data.get('temperature', 0.7),
+            "max_tokens": request_data.get('max_tokens', 1024),
+            "stream": stream,
+        }
+        return f"{base_url}/chat/completions", headers, body
+
     def format_response(self, response_data: Dict[str, Any]) -> UnifiedChatResponse:
         # 错误处理
         if isinstance(response_data, dict) and response_data.get("error"):
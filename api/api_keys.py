@@ -7,6 +7,7 @@ from models.user import (
     APIKeyUpdate, APIKeyUsage, UserResponse
 )
 from services.api_key_service import api_key_service
+from services.quota_service import quota_service
 from auth.dependencies import (
     get_current_active_user, get_admin_user, get_premium_user
 )
@@ -200,18 +201,21 @@ async def get_api_key_usage(
     api_key_id: str,
     current_user: UserResponse = Depends(get_current_active_user)
 ):
-    """获取API Key的使用统计信息"""
+    """获取API Key的使用统计信息（计数来自配额服务内存状态，已知归属时无需查库）"""
     try:
         # 首先检查API Key是否存在且属于当前用户
-        api_key = await api_key_service.get_api_key_by_id(api_key_id)
-        if not api_key:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="API Key不存在"
-            )
+        owner = quota_service.get_key_owner(api_key_id)
+        if owner is None:
+            api_key = await api_key_service.get_api_key_by_id(api_key_id)
+            if not api_key:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="API Key不存在"
+                )
+            owner = api_key.created_by
         
         # 检查权限：只能查看自己创建的或管理员可以查看所有
-        if api_key.created_by != current_user.id and current_user.role != "admin":
+        if owner != current_user.id and current_user.role != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="权限不足，只能查看自己创建的API Key使用统计"
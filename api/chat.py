@@ -1,16 +1,31 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from fastapi.responses import JSONResponse, StreamingResponse
-import asyncio
 from typing import List, Dict, Optional
+import asyncio
+import logging
+import os
+import time
 from agent import registry
 from agent.models import ChatRequest, UnifiedChatResponse
-from auth.dependencies import get_api_key_user, check_api_limit, increment_api_calls
+from agent.sse import StreamStats
+from agent.resilience import UpstreamUnavailableError
+from services.metrics import (
+    AGENT_REQUEST_DURATION, AGENT_REQUEST_ERRORS, STREAM_TTFT, STREAM_TOKENS_PER_SEC, STREAMS_IN_FLIGHT
+)
+from auth.dependencies import get_api_key_user, consume_api_quota
 from models.user import UserResponse
 from datetime import datetime
-from database.connection import db_manager
+from bson import ObjectId
+from services.log_sink import log_sink
+from services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
 
 chat = APIRouter()
 
+# 流式响应中检查客户端是否断开的最短间隔（秒）
+DISCONNECT_CHECK_INTERVAL = float(os.getenv("STREAM_DISCONNECT_CHECK_INTERVAL", "1.0"))
+
 
 @chat.post("/chat", response_model=UnifiedChatResponse)
 async def get_chat(
@@ -24,13 +39,6 @@ async def get_chat(
     此端点专门为API Key用户设计，提供稳定的聊天服务。
     用户需要先登录获取JWT令牌，然后使用JWT创建API Key，最后使用API Key访问此接口。
     """
-    # 检查API调用限制
-    if not check_api_limit(current_user.id):
-        raise HTTPException(
-            status_code=429, 
-            detail="API调用次数超限，请稍后重试或联系管理员"
-        )
-    
     agent_name = (
         request.headers.get("agent")
         or request.headers.get("Agent")
@@ -51,9 +59,9 @@ async def get_chat(
             "error": f"Unknown agent: {agent_name}"
         }, status_code=400)
     
-    # 调试信息：打印 agent 类型和名称
-    print(f"Debug: Agent type: {type(agent)}, Agent name: {agent_name}")
-    print(f"Debug: Available agents: {list(registry.list_agents().keys())}")
+    # 调试信息：agent 类型和名称
+    logger.debug(f"Agent type: {type(agent)}, Agent name: {agent_name}")
+    logger.debug(f"Available agents: {list(registry.list_agents().keys())}")
     
     request_data = body.model_dump()  # 使用 model_dump() 替代 dict()
     if not agent.validate_request(request_data):
@@ -61,90 +69,113 @@ async def get_chat(
             "error": f"Invalid request for agent: {agent_name}"
         }, status_code=400)
     
+    # 检查并扣减API调用配额（原子操作，超限返回 429）
+    await consume_api_quota(request, current_user)
+
     try:
-        # 增加API调用次数
-        await increment_api_calls(current_user.id)
-        
         # 如果是流式且非 detail 模式，使用 SSE，并记录分片日志
         if request_data.get("stream") and not request_data.get("detail"):
-            print(f"Debug: Using streaming mode for agent: {type(agent)}")
-            loop = asyncio.get_event_loop()
+            logger.debug(f"Using streaming mode for agent: {type(agent)}")
             started_at = datetime.now()
-            generator = await loop.run_in_executor(
-                None,
-                lambda: agent.stream_chat(request_data)
-            )
+            generator = agent.astream_chat(request_data)
 
-            # 先写入父级日志，获取 parent_id
-            parent_id = None
-            try:
-                db = db_manager.get_database()
-                insert_res = db.agent_logs.insert_one({
-                    "timestamp": started_at,
-                    "finished_at": None,
-                    "duration_ms": None,
-                    "user_id": current_user.id,
-                    "username": current_user.username,
-                    "agent": agent_name,
-                    "request": request_data,
-                    "raw_response": None,
-                    "formatted_response": None,
-                    "detail": False,
-                    "stream": True,
-                    "path": request.url.path,
-                })
-                parent_id = insert_res.inserted_id
-            except Exception:
-                parent_id = None
+            # 父级日志 ID 在本地生成，结束时随父级文档一次写入
+            parent_id = ObjectId()
+            aggregate = log_sink.aggregate_streams
 
-            def logging_wrapper():
+            async def logging_wrapper():
                 seq = 0
+                chunks = []
+                stats = StreamStats()
+                disconnected = False
+                last_check = time.monotonic()
+                STREAMS_IN_FLIGHT.inc(agent_name)
                 try:
-                    for line in generator:
+                    async for line in generator:
+                        # 客户端断开后停止读取，finally 中关闭上游连接
+                        now = time.monotonic()
+                        if now - last_check >= DISCONNECT_CHECK_INTERVAL:
+                            last_check = now
+                            if await request.is_disconnected():
+                                disconnected = True
+                                break
                         seq += 1
-                        # 异步写入每个分片（尽最大努力，不阻塞流）
-                        try:
-                            if parent_id is not None:
-                                db_manager.get_database().agent_logs_chunks.insert_one({
-                                    "parent_id": str(parent_id),
-                                    "seq": seq,
-                                    "chunk": line,
-                                    "timestamp": datetime.now(),
-                                    "agent": agent_name,
-                                    "user_id": current_user.id,
-                                })
-                        except Exception:
-                            pass
+                        stats.observe(line)
+                        if aggregate:
+                            # 聚合模式：分片暂存内存，结束时随父级文档写入
+                            if len(chunks) < log_sink.stream_max_chunks:
+                                chunks.append(line)
+                        else:
+                            # 分片模式：交给后台批量写入，不阻塞流
+                            await log_sink.emit("agent_logs_chunks", {
+                                "parent_id": str(parent_id),
+                                "seq": seq,
+                                "chunk": line,
+                                "timestamp": datetime.now(),
+                                "agent": agent_name,
+                                "user_id": current_user.id,
+                            })
                         yield line
+                except (asyncio.CancelledError, GeneratorExit):
+                    # 响应被取消（客户端断开）
+                    disconnected = True
+                    raise
                 finally:
+                    # 显式关闭上游流，释放连接
                     try:
-                        if parent_id is not None:
-                            finished = datetime.now()
-                            db = db_manager.get_database()
-                            db.agent_logs.update_one(
-                                {"_id": parent_id},
-                                {"$set": {
-                                    "finished_at": finished,
-                                    "duration_ms": int((finished - started_at).total_seconds() * 1000)
-                                }}
-                            )
+                        await generator.aclose()
+                    except Exception:
+                        pass
+                    STREAMS_IN_FLIGHT.dec(agent_name)
+                    finished = datetime.now()
+                    stream_stats = stats.to_dict()
+                    AGENT_REQUEST_DURATION.observe(time.monotonic() - stats.started, agent_name, "stream")
+                    if stats.ttft_ms is not None:
+                        STREAM_TTFT.observe(stats.ttft_ms / 1000, agent_name)
+                    if stats.tokens_per_sec is not None:
+                        STREAM_TOKENS_PER_SEC.observe(stats.tokens_per_sec, agent_name)
+                    logger.info(
+                        f"stream {agent_name}: ttft={stream_stats['ttft_ms']}ms tokens={stream_stats['tokens']} "
+                        f"tps={stream_stats['tokens_per_sec']} disconnected={disconnected}"
+                    )
+                    parent_doc = {
+                        "_id": parent_id,
+                        "timestamp": started_at,
+                        "finished_at": finished,
+                        "duration_ms": int((finished - started_at).total_seconds() * 1000),
+                        "user_id": current_user.id,
+                        "username": current_user.username,
+                        "agent": agent_name,
+                        "request": request_data,
+                        "raw_response": None,
+                        "formatted_response": None,
+                        "detail": False,
+                        "stream": True,
+                        "path": request.url.path,
+                        "chunk_count": seq,
+                        "client_disconnected": disconnected,
+                        **stream_stats,
+                    }
+                    if aggregate:
+                        parent_doc["chunks"] = chunks
+                        parent_doc["chunks_truncated"] = seq > len(chunks)
+                    try:
+                        await log_sink.emit("agent_logs", parent_doc)
                     except Exception:
                         pass
 
             return StreamingResponse(logging_wrapper(), media_type="text/event-stream")
 
-        loop = asyncio.get_event_loop()
         started_at = datetime.now()
-        response_data = await loop.run_in_executor(
-            None,
-            lambda: agent.process_request(request_data)
-        )
+        with AGENT_REQUEST_DURATION.time(agent_name, "blocking"):
+            response_data, cache_status = await response_cache.fetch(
+                agent_name, request_data, lambda: agent.aprocess_request(request_data)
+            )
         result = agent.format_response(response_data)
 
-        # 持久化原始响应日志
+        # 持久化原始响应日志（后台批量写入）
         try:
-            db = db_manager.get_database()
-            db.agent_logs.insert_one({
+            await log_sink.emit("agent_logs", {
                 "timestamp": started_at,
                 "finished_at": datetime.now(),
                 "duration_ms": int((datetime.now() - started_at).total_seconds() * 1000),
@@ -157,12 +188,24 @@ async def get_chat(
                 "detail": bool(request_data.get("detail")),
                 "stream": bool(request_data.get("stream")),
                 "path": request.url.path,
+                "cache": cache_status,
             })
         except Exception as _:
             pass
 
-        return JSONResponse(content=result.model_dump(exclude_none=True))
+        return JSONResponse(
+            content=result.model_dump(exclude_none=True),
+            headers={"X-Cache": cache_status}
+        )
+    except UpstreamUnavailableError as e:
+        # 熔断或并发已满：快速失败，提示客户端稍后重试
+        AGENT_REQUEST_ERRORS.inc(agent_name)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        return JSONResponse(content={
+            "error": str(e)
+        }, status_code=503, headers=headers)
     except Exception as e:
+        AGENT_REQUEST_ERRORS.inc(agent_name)
         import traceback
         traceback.print_exc()
         return JSONResponse(content={
@@ -1,15 +1,48 @@
-from fastapi import APIRouter, Request, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, Request, UploadFile, File, Form, Depends
 from fastapi.responses import JSONResponse
-import asyncio
+from fastapi.routing import APIRoute
 import os
-import tempfile
-from typing import Optional
+from typing import Callable, Optional
 from agent import registry
 from agent.models import FileUploadResponse, FastGPTFileInfo
-from auth.dependencies import get_api_key_user, check_api_limit, increment_api_calls
+from auth.dependencies import get_api_key_user, consume_api_quota
 from models.user import UserResponse
+from services.object_storage import UploadTooLargeError
 
-upload = APIRouter()
+# 单个文件大小上限（字节），默认 50MB，0 表示不限制
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# multipart 边界与表单字段的余量（字节）
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+class UploadLimitRoute(APIRoute):
+    """
+    在解析 multipart 表单之前检查 Content-Length。
+
+    FastAPI 会在调用端点函数前把整个表单读入临时文件，端点内再检查请求头时数据已经落盘；
+    因此在路由处理器入口处拒绝声明长度超限的请求，避免接收、落盘与计费。
+    未声明长度（chunked）的请求仍由上传过程中的 max_bytes 限制兜底。
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request):
+            content_length = request.headers.get("content-length")
+            if (UPLOAD_MAX_BYTES and content_length and content_length.isdigit()
+                    and int(content_length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+                return JSONResponse(content={
+                    "code": 413,
+                    "msg": f"File exceeds the maximum allowed size of {UPLOAD_MAX_BYTES} bytes",
+                    "data": None
+                }, status_code=413)
+            return await handler(request)
+
+        return limited_handler
+
+
+upload = APIRouter(route_class=UploadLimitRoute)
 
 @upload.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
@@ -33,13 +66,6 @@ async def upload_file(
     返回:
         FileUploadResponse: 包含文件信息的响应
     """
-    # 检查API调用限制
-    if not check_api_limit(current_user.id):
-        raise HTTPException(
-            status_code=429, 
-            detail="API调用次数超限，请稍后重试或联系管理员"
-        )
-    
     # 获取智能体名称，优先使用Form参数，其次使用Header（兼容大小写/变体）
     agent_name = agent or (
         request.headers.get("agent")
@@ -74,65 +100,57 @@ async def upload_file(
             "data": None
         }, status_code=400)
     
+    # 检查并扣减API调用配额（原子操作，超限返回 429）
+    await consume_api_quota(request, current_user)
+
     try:
-        # 增加API调用次数
-        await increment_api_calls(current_user.id)
-        
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as temp_file:
-            # 读取上传文件内容并写入临时文件
-            contents = await file.read()
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
-        try:
-            # 调用智能体的文件上传方法
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: agent_instance.upload_file(temp_file_path)
-            )
+        # 按块读取并直接交给智能体上传（FastGPT 为 S3 分片流式上传，其他智能体按块落盘）
+        result = await agent_instance.aupload_file(
+            file.read,
+            file.filename or "upload",
+            content_type=file.content_type,
+            max_bytes=UPLOAD_MAX_BYTES or None,
+        )
 
-            # 统一响应：如果 agent 返回 FastGPTFileInfo，直接使用；否则做最小包装
-            if isinstance(result, FastGPTFileInfo):
-                # 覆盖 created_by（优先使用表单 created_by，次之当前用户，最后 header: user）
-                cb = created_by or current_user.username or request.headers.get("user") or "unknown"
-                try:
-                    result.created_by = cb
-                except Exception:
-                    pass
-                return JSONResponse(content={
-                    "code": 0,
-                    "msg": "File uploaded successfully",
-                    "data": result.model_dump()
-                })
-            elif isinstance(result, dict):
-                # 尝试从 dict 中映射到规范字段
-                return JSONResponse(content={
-                    "code": 200,
-                    "msg": result.get("msg", "File uploaded successfully"),
-                    "data": result.get("data", result)
-                })
-            else:
-                # 字符串或其他 → 当作 URL/ID 返回，并补齐必要字段
-                cb = created_by or current_user.username or request.headers.get("user") or "unknown"
-                return JSONResponse(content={
-                    "code": 0,
-                    "msg": "File uploaded successfully",
-                    "data": {
-                        "file_id": str(result),
-                        "created_by": cb,
-                        "agent": agent_name
-                    }
-                })
-                
-        finally:
-            # 清理临时文件
+        # 统一响应：如果 agent 返回 FastGPTFileInfo，直接使用；否则做最小包装
+        if isinstance(result, FastGPTFileInfo):
+            # 覆盖 created_by（优先使用表单 created_by，次之当前用户，最后 header: user）
+            cb = created_by or current_user.username or request.headers.get("user") or "unknown"
             try:
-                os.unlink(temp_file_path)
-            except OSError:
-                pass  # 忽略清理失败
-                
+                result.created_by = cb
+            except Exception:
+                pass
+            return JSONResponse(content={
+                "code": 0,
+                "msg": "File uploaded successfully",
+                "data": result.model_dump()
+            })
+        elif isinstance(result, dict):
+            # 尝试从 dict 中映射到规范字段
+            return JSONResponse(content={
+                "code": 200,
+                "msg": result.get("msg", "File uploaded successfully"),
+                "data": result.get("data", result)
+            })
+        else:
+            # 字符串或其他 → 当作 URL/ID 返回，并补齐必要字段
+            cb = created_by or current_user.username or request.headers.get("user") or "unknown"
+            return JSONResponse(content={
+                "code": 0,
+                "msg": "File uploaded successfully",
+                "data": {
+                    "file_id": str(result),
+                    "created_by": cb,
+                    "agent": agent_name
+                }
+            })
+
+    except UploadTooLargeError as e:
+        return JSONResponse(content={
+            "code": 413,
+            "msg": str(e),
+            "data": None
+        }, status_code=413)
     except Exception as e:
         import traceback
         traceback.print_exc()
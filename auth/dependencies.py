@@ -5,6 +5,7 @@ import logging
 
 from services.user_service import user_service
 from services.api_key_service import api_key_service
+from services.quota_service import quota_service
 from models.user import UserRole, TokenData
 
 logger = logging.getLogger(__name__)
@@ -116,11 +117,18 @@ async def get_jwt_user(request: Request, current_user = Depends(get_current_user
     return current_user
 
 
-def check_api_limit(user_id: str) -> bool:
-    """检查用户API调用限制"""
-    return user_service.check_api_limit(user_id)
-
-
-async def increment_api_calls(user_id: str):
-    """增加用户API调用次数"""
-    await user_service.increment_api_calls(user_id)
+async def consume_api_quota(request: Request, current_user) -> None:
+    """
+    原子地检查并扣减一次API调用配额（用户总量、API Key 日/月与每分钟速率），超限时返回 429。
+    """
+    decision = await quota_service.acquire(
+        current_user.id,
+        getattr(request.state, "api_key_data", None)
+    )
+    if not decision.allowed:
+        headers = {"Retry-After": str(decision.retry_after)} if decision.retry_after else None
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"API调用次数超限（{decision.reason}），请稍后重试或联系管理员",
+            headers=headers,
+        )
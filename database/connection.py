@@ -1,8 +1,9 @@
 import os
-from pymongo import MongoClient
-from pymongo.database import Database
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
 from dotenv import load_dotenv
 import logging
+from services.metrics import MongoCommandMetrics
 
 # 初始化日志
 logger = logging.getLogger(__name__)
@@ -15,93 +16,130 @@ else:
     logger.info("[db] 未找到 .env 文件，使用系统环境变量")
 
 
+def _client_options() -> dict:
+    """
+    从环境变量读取连接池与超时配置：
+        - MONGO_MAX_POOL_SIZE: 最大连接数，默认 100
+        - MONGO_MIN_POOL_SIZE: 最小连接数，默认 0
+        - MONGO_MAX_IDLE_TIME_MS: 空闲连接回收时间，默认不回收
+        - MONGO_SERVER_SELECTION_TIMEOUT_MS: 服务器选择超时，默认 5000
+        - MONGO_CONNECT_TIMEOUT_MS: 建连超时，默认 10000
+        - MONGO_SOCKET_TIMEOUT_MS: 单次读写超时，默认不限制
+        - MONGO_READ_PREFERENCE: 读偏好，如 primary / primaryPreferred / secondaryPreferred，默认 primary
+    """
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        # 命令耗时指标（/metrics）
+        "event_listeners": [MongoCommandMetrics()],
+    }
+    if os.getenv("MONGO_SOCKET_TIMEOUT_MS"):
+        options["socketTimeoutMS"] = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS"))
+    if os.getenv("MONGO_MAX_IDLE_TIME_MS"):
+        options["maxIdleTimeMS"] = int(os.getenv("MONGO_MAX_IDLE_TIME_MS"))
+    return options
+
+
 class DatabaseManager:
-    """数据库管理器"""
-    
+    """数据库管理器（基于 pymongo 原生异步客户端 AsyncMongoClient）"""
+
     def __init__(self):
-        self.client: MongoClient = None
-        self.db: Database = None
-        
-    def connect(self):
+        self.client: AsyncMongoClient = None
+        self.db: AsyncDatabase = None
+
+    def _create_client(self):
+        """创建客户端（不触发网络 IO，首次操作时才建立连接）"""
+        mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+        database_name = os.getenv("MONGO_DATABASE", "ai-gateway")
+        self.client = AsyncMongoClient(mongo_uri, **_client_options())
+        self.db = self.client[database_name]
+        return database_name
+
+    async def connect(self):
         """连接到MongoDB"""
         try:
-            # 从环境变量获取MongoDB连接信息
-            mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-            database_name = os.getenv("MONGO_DATABASE", "ai-gateway")
-            
-            # 创建MongoDB客户端
-            self.client = MongoClient(mongo_uri)
-            
+            database_name = self._create_client()
+
             # 测试连接
-            self.client.admin.command('ping')
-            
-            # 获取数据库
-            self.db = self.client[database_name]
-            
+            await self.client.admin.command('ping')
+
             logger.info(f"✅ 成功连接到MongoDB数据库: {database_name}")
-            
+
             # 创建索引
-            self._create_indexes()
-            
+            await self._create_indexes()
+
         except Exception as e:
             logger.error(f"❌ 连接MongoDB失败: {str(e)}")
             raise
-    
-    def _create_indexes(self):
+
+    async def _create_indexes(self):
         """创建数据库索引"""
         try:
             # 用户集合索引
             users_collection = self.db.users
-            
+
             # 用户名唯一索引
-            users_collection.create_index("username", unique=True)
-            
+            await users_collection.create_index("username", unique=True)
+
             # 邮箱唯一索引
-            users_collection.create_index("email", unique=True)
-            
+            await users_collection.create_index("email", unique=True)
+
             # 角色索引
-            users_collection.create_index("role")
-            
+            await users_collection.create_index("role")
+
             # 状态索引
-            users_collection.create_index("status")
-            
+            await users_collection.create_index("status")
+
             # 创建时间索引
-            users_collection.create_index("created_at")
-            
+            await users_collection.create_index("created_at")
+
             # 请求日志集合索引
             request_logs = self.db.request_logs
-            request_logs.create_index("timestamp")
-            request_logs.create_index([("user_id", 1), ("timestamp", -1)])
-            request_logs.create_index([("ip", 1), ("timestamp", -1)])
-            request_logs.create_index([("agent", 1), ("timestamp", -1)])
-            request_logs.create_index("status_code")
+            await request_logs.create_index("timestamp")
+            await request_logs.create_index([("user_id", 1), ("timestamp", -1)])
+            await request_logs.create_index([("ip", 1), ("timestamp", -1)])
+            await request_logs.create_index([("agent", 1), ("timestamp", -1)])
+            await request_logs.create_index("status_code")
 
             # Agent 原始响应日志集合索引
             agent_logs = self.db.agent_logs
-            agent_logs.create_index("timestamp")
-            agent_logs.create_index([("user_id", 1), ("timestamp", -1)])
-            agent_logs.create_index([("agent", 1), ("timestamp", -1)])
+            await agent_logs.create_index("timestamp")
+            await agent_logs.create_index([("user_id", 1), ("timestamp", -1)])
+            await agent_logs.create_index([("agent", 1), ("timestamp", -1)])
 
             # 流式分片日志集合索引
             agent_logs_chunks = self.db.agent_logs_chunks
-            agent_logs_chunks.create_index([("parent_id", 1), ("seq", 1)])
-            agent_logs_chunks.create_index([("user_id", 1), ("timestamp", -1)])
+            await agent_logs_chunks.create_index([("parent_id", 1), ("seq", 1)])
+            await agent_logs_chunks.create_index([("user_id", 1), ("timestamp", -1)])
+
+            # API Key 集合索引（认证按 key_hash 查询）
+            await self.db.api_keys.create_index("key_hash")
+            await self.db.api_keys.create_index("created_by")
+            await self.db.api_key_usage.create_index("api_key_id")
+
+            # 响应缓存集合：到期自动删除
+            await self.db.response_cache.create_index("expires_at", expireAfterSeconds=0)
 
             logger.info("✅ 数据库索引创建成功")
-            
+
         except Exception as e:
             logger.error(f"❌ 创建索引失败: {str(e)}")
-    
-    def get_database(self) -> Database:
-        """获取数据库实例"""
+
+    def get_database(self) -> AsyncDatabase:
+        """获取数据库实例（未连接时惰性创建客户端）"""
         if self.db is None:
-            self.connect()
+            self._create_client()
         return self.db
-    
-    def close(self):
+
+    async def close(self):
         """关闭数据库连接"""
         if self.client:
-            self.client.close()
+            await self.client.close()
+            self.client = None
+            self.db = None
             logger.info("✅ MongoDB连接已关闭")
 
 
@@ -109,11 +147,11 @@ class DatabaseManager:
 db_manager = DatabaseManager()
 
 
-def get_database() -> Database:
+def get_database() -> AsyncDatabase:
     """获取数据库实例的便捷函数"""
     return db_manager.get_database()
 
 
-def close_database():
+async def close_database():
     """关闭数据库连接的便捷函数"""
-    db_manager.close()
+    await db_manager.close()
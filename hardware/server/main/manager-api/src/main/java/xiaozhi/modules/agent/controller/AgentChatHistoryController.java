@@ -1,5 +1,8 @@
 package xiaozhi.modules.agent.controller;
 
+import java.util.List;
+
+import org.springframework.validation.annotation.Validated;
 import org.springframework.web.bind.annotation.PostMapping;
 import org.springframework.web.bind.annotation.RequestBody;
 import org.springframework.web.bind.annotation.RequestMapping;
@@ -12,9 +15,11 @@ import lombok.RequiredArgsConstructor;
 import xiaozhi.common.utils.Result;
 import xiaozhi.modules.agent.dto.AgentChatHistoryReportDTO;
 import xiaozhi.modules.agent.service.biz.AgentChatHistoryBizService;
+import xiaozhi.modules.agent.vo.AgentChatHistoryReportBatchVO;
 
 @Tag(name = "智能体聊天历史管理")
 @RequiredArgsConstructor
+@Validated
 @RestController
 @RequestMapping("/agent/chat-history")
 public class AgentChatHistoryController {
@@ -33,4 +38,19 @@ public class AgentChatHistoryController {
         Boolean result = agentChatHistoryBizService.report(request);
         return new Result<Boolean>().ok(result);
     }
+
+    /**
+     * 小智服务聊天批量上报请求
+     * <p>
+     * 小智服务将多条聊天记录合并为一次请求上报，减少请求次数。
+     * 记录逐条校验，无效记录跳过并在结果中返回其下标，不会导致整批被拒绝。
+     *
+     * @param requests 聊天上报请求列表
+     */
+    @Operation(summary = "小智服务聊天批量上报请求")
+    @PostMapping("/report/batch")
+    public Result<AgentChatHistoryReportBatchVO> uploadBatch(@RequestBody List<AgentChatHistoryReportDTO> requests) {
+        AgentChatHistoryReportBatchVO result = agentChatHistoryBizService.reportBatch(requests);
+        return new Result<AgentChatHistoryReportBatchVO>().ok(result);
+    }
 }
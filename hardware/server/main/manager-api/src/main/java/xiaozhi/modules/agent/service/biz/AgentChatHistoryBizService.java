@@ -1,6 +1,9 @@
 package xiaozhi.modules.agent.service.biz;
 
+import java.util.List;
+
 import xiaozhi.modules.agent.dto.AgentChatHistoryReportDTO;
+import xiaozhi.modules.agent.vo.AgentChatHistoryReportBatchVO;
 
 /**
  * 智能体聊天历史业务逻辑层
@@ -19,4 +22,12 @@ public interface AgentChatHistoryBizService {
      * @return 上传结果，true表示成功，false表示失败
      */
     Boolean report(AgentChatHistoryReportDTO agentChatHistoryReportDTO);
+
+    /**
+     * 聊天批量上报方法，逐条校验，跳过无效记录，其余记录在同一事务中保存
+     *
+     * @param reports 聊天上报请求列表
+     * @return 成功保存的条数及未保存记录的下标
+     */
+    AgentChatHistoryReportBatchVO reportBatch(List<AgentChatHistoryReportDTO> reports);
 }
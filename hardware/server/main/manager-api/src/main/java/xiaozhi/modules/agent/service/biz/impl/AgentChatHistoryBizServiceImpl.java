@@ -2,6 +2,7 @@ package xiaozhi.modules.agent.service.biz.impl;
 
 import java.util.Base64;
 import java.util.Date;
+import java.util.List;
 import java.util.Objects;
 
 import org.springframework.stereotype.Service;
@@ -10,8 +11,10 @@ import org.springframework.transaction.annotation.Transactional;
 import lombok.RequiredArgsConstructor;
 import lombok.extern.slf4j.Slf4j;
 import xiaozhi.common.constant.Constant;
+import xiaozhi.common.exception.RenException;
 import xiaozhi.common.redis.RedisKeys;
 import xiaozhi.common.redis.RedisUtils;
+import xiaozhi.common.validator.ValidatorUtils;
 import xiaozhi.modules.agent.dto.AgentChatHistoryReportDTO;
 import xiaozhi.modules.agent.entity.AgentChatHistoryEntity;
 import xiaozhi.modules.agent.entity.AgentEntity;
@@ -19,6 +22,7 @@ import xiaozhi.modules.agent.service.AgentChatAudioService;
 import xiaozhi.modules.agent.service.AgentChatHistoryService;
 import xiaozhi.modules.agent.service.AgentService;
 import xiaozhi.modules.agent.service.biz.AgentChatHistoryBizService;
+import xiaozhi.modules.agent.vo.AgentChatHistoryReportBatchVO;
 import xiaozhi.modules.device.entity.DeviceEntity;
 import xiaozhi.modules.device.service.DeviceService;
 
@@ -83,6 +87,43 @@ public class AgentChatHistoryBizServiceImpl implements AgentChatHistoryBizServic
         return Boolean.TRUE;
     }
 
+    /**
+     * 批量处理聊天记录上报
+     * <p>
+     * 每条记录单独校验，校验失败或设备未绑定智能体的记录跳过并返回其下标，不影响同批的其他记录；
+     * 保存过程中出现异常时整批回滚，避免客户端重试时重复保存
+     *
+     * @param reports 聊天上报请求列表
+     * @return 成功保存的条数及未保存记录的下标
+     */
+    @Override
+    @Transactional(rollbackFor = Exception.class)
+    public AgentChatHistoryReportBatchVO reportBatch(List<AgentChatHistoryReportDTO> reports) {
+        AgentChatHistoryReportBatchVO result = new AgentChatHistoryReportBatchVO();
+        int saved = 0;
+        for (int i = 0; i < reports.size(); i++) {
+            AgentChatHistoryReportDTO report = reports.get(i);
+            if (report == null) {
+                result.getFailedIndexes().add(i);
+                continue;
+            }
+            try {
+                ValidatorUtils.validateEntity(report);
+            } catch (RenException e) {
+                log.warn("聊天批量上报第{}条记录校验失败: macAddress={}, {}", i, report.getMacAddress(), e.getMsg());
+                result.getFailedIndexes().add(i);
+                continue;
+            }
+            if (Boolean.TRUE.equals(report(report))) {
+                saved++;
+            } else {
+                result.getFailedIndexes().add(i);
+            }
+        }
+        result.setSaved(saved);
+        return result;
+    }
+
     /**
      * base64解码report.getOpusDataBase64(),存入ai_agent_chat_audio表
      */
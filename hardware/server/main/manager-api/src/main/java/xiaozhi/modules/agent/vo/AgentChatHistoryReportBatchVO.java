@@ -0,0 +1,20 @@
+package xiaozhi.modules.agent.vo;
+
+import java.util.ArrayList;
+import java.util.List;
+
+import io.swagger.v3.oas.annotations.media.Schema;
+import lombok.Data;
+
+/**
+ * 聊天记录批量上报结果的VO
+ */
+@Data
+@Schema(description = "聊天记录批量上报结果")
+public class AgentChatHistoryReportBatchVO {
+    @Schema(description = "成功保存的条数")
+    private Integer saved = 0;
+
+    @Schema(description = "未保存的记录在请求列表中的下标（校验失败、设备未绑定智能体等）")
+    private List<Integer> failedIndexes = new ArrayList<>();
+}
@@ -9,6 +9,7 @@ from core.utils.util import get_local_ip, validate_mcp_endpoint
 from core.http_server import SimpleHttpServer
 from core.websocket_server import WebSocketServer
 from core.utils.util import check_ffmpeg_installed
+from core.utils.http_client import close_http_sessions
 
 TAG = __name__
 logger = setup_logging()
@@ -128,6 +129,8 @@ async def main():
             timeout=3.0,
             return_when=asyncio.ALL_COMPLETED,
         )
+        await ws_server.close()
+        await close_http_sessions()
         print("服务器已关闭，程序退出。")
 
 
@@ -68,6 +68,9 @@ def get_config_from_api(config):
             "vision_explain": config["server"].get("vision_explain", ""),
             "auth_key": config["server"].get("auth_key", ""),
         }
+    # 聊天记录上报流水线的配置以本地为准
+    if config.get("report_pipeline"):
+        config_data["report_pipeline"] = config["report_pipeline"]
     return config_data
 
 
@@ -1,6 +1,5 @@
 import os
 import sys
-import copy
 import json
 import uuid
 import time
@@ -23,9 +22,8 @@ from core.utils.modules_initialize import (
     initialize_tts,
     initialize_asr,
 )
-from core.handle.reportHandle import report
 from core.providers.tts.default import DefaultTTS
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from core.utils.dialogue import Message, Dialogue
 from core.providers.asr.dto.dto import InterfaceType
 from core.handle.textHandle import handleTextMessage
@@ -39,6 +37,9 @@ from config.logger import setup_logging, build_module_string, create_connection_
 from config.manage_api_client import DeviceNotFoundException, DeviceBindException
 from core.utils.prompt_manager import PromptManager
 from core.utils.voiceprint_provider import VoiceprintProvider
+from core.utils.audio_frontend import AudioFrontend
+from core.utils.tool_calls import ToolCallCollector
+from core.utils.connection_factory import copy_on_write_config
 from core.utils import textUtils
 
 TAG = __name__
@@ -62,10 +63,14 @@ class ConnectionHandler:
         server=None,
     ):
         self.common_config = config
-        self.config = copy.deepcopy(config)
+        # 与服务端共享配置，差异化配置只替换连接自己的顶层键
+        self.config = copy_on_write_config(config)
         self.session_id = str(uuid.uuid4())
         self.logger = setup_logging()
         self.server = server  # 保存server实例的引用
+        # 连接工厂（共享线程池、预热的TTS/ASR实例），未经server创建时为None
+        self.factory = getattr(server, "connection_factory", None)
+        self.connect_time = None
 
         self.auth = AuthMiddleware(config)
         self.need_bind = False
@@ -90,11 +95,12 @@ class ConnectionHandler:
         # 线程任务相关
         self.loop = asyncio.get_event_loop()
         self.stop_event = threading.Event()
-        self.executor = ThreadPoolExecutor(max_workers=5)
+        if self.factory is not None:
+            self.executor = self.factory.executor
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=5)
 
-        # 添加上报线程池
-        self.report_queue = queue.Queue()
-        self.report_thread = None
+        # 聊天记录通过全局的上报流水线上报（core/utils/report_pipeline.py）
         # 未来可以通过修改此处，调节asr的上报和tts的上报，目前默认都开启
         self.report_asr_enable = self.read_config_from_api
         self.report_tts_enable = self.read_config_from_api
@@ -113,7 +119,8 @@ class ConnectionHandler:
         self.voiceprint_provider = None
 
         # vad相关变量
-        self.client_audio_buffer = bytearray()
+        # 上行音频只解码一次，VAD、ASR、声纹识别共用同一PCM缓冲区
+        self.audio_frontend = AudioFrontend()
         self.client_have_voice = False
         self.last_activity_time = 0.0  # 统一的活动时间戳（毫秒）
         self.client_voice_stop = False
@@ -204,11 +211,13 @@ class ConnectionHandler:
 
             # 初始化活动时间戳
             self.last_activity_time = time.time() * 1000
+            self.connect_time = time.perf_counter()
 
             # 启动超时检查任务
             self.timeout_task = asyncio.create_task(self._check_timeout())
 
-            self.welcome_msg = self.config["xiaozhi"]
+            # 欢迎消息会被逐个连接修改，不能直接引用共享配置
+            self.welcome_msg = dict(self.config["xiaozhi"])
             self.welcome_msg["session_id"] = self.session_id
 
             # 获取差异化配置
@@ -253,7 +262,9 @@ class ConnectionHandler:
                         loop = asyncio.new_event_loop()
                         asyncio.set_event_loop(loop)
                         loop.run_until_complete(
-                            self.memory.save_memory(self.dialogue.dialogue)
+                            self.memory.save_memory(
+                                self.dialogue.get_messages_for_memory()
+                            )
                         )
                     except Exception as e:
                         self.logger.bind(tag=TAG).error(f"保存记忆失败: {e}")
@@ -374,13 +385,19 @@ class ConnectionHandler:
 
             """加载记忆"""
             self._initialize_memory()
+            """配置对话上下文"""
+            self._initialize_dialogue()
             """加载意图识别"""
             self._initialize_intent()
-            """初始化上报线程"""
-            self._init_report_threads()
             """更新系统提示词"""
             self._init_prompt_enhancement()
 
+            if self.factory is not None and self.connect_time is not None:
+                self.factory.stats.record_ready(
+                    time.perf_counter() - self.connect_time,
+                    len(self.server.active_connections),
+                )
+
         except Exception as e:
             self.logger.bind(tag=TAG).error(f"实例化组件失败: {e}")
         # ===== 添加以下调试信息 =====
@@ -402,24 +419,14 @@ class ConnectionHandler:
             self.change_system_prompt(enhanced_prompt)
             self.logger.bind(tag=TAG).info("系统提示词已增强更新")
 
-    def _init_report_threads(self):
-        """初始化ASR和TTS上报线程"""
-        if not self.read_config_from_api or self.need_bind:
-            return
-        if self.chat_history_conf == 0:
-            return
-        if self.report_thread is None or not self.report_thread.is_alive():
-            self.report_thread = threading.Thread(
-                target=self._report_worker, daemon=True
-            )
-            self.report_thread.start()
-            self.logger.bind(tag=TAG).info("TTS上报线程已启动")
-
     def _initialize_tts(self):
         """初始化TTS"""
         tts = None
         if not self.need_bind:
-            tts = initialize_tts(self.config)
+            if self.factory is not None:
+                tts = self.factory.acquire_tts(self.config)
+            else:
+                tts = initialize_tts(self.config)
 
         if tts is None:
             tts = DefaultTTS(self.config, delete_audio_file=True)
@@ -435,7 +442,10 @@ class ConnectionHandler:
         else:
             # 如果公共ASR是远程服务，则初始化一个新实例
             # 因为远程ASR，涉及到websocket连接和接收线程，需要每个连接一个实例
-            asr = initialize_asr(self.config)
+            if self.factory is not None:
+                asr = self.factory.acquire_asr(self.config)
+            else:
+                asr = initialize_asr(self.config)
 
         return asr
 
@@ -444,7 +454,12 @@ class ConnectionHandler:
         try:
             voiceprint_config = self.config.get("voiceprint", {})
             if voiceprint_config:
-                self.voiceprint_provider = VoiceprintProvider(voiceprint_config)
+                if self.factory is not None:
+                    self.voiceprint_provider = self.factory.get_voiceprint_provider(
+                        voiceprint_config
+                    )
+                else:
+                    self.voiceprint_provider = VoiceprintProvider(voiceprint_config)
                 self.logger.bind(tag=TAG).info("声纹识别功能已在连接时动态启用")
             else:
                 self.logger.bind(tag=TAG).info("声纹识别功能未启用或配置不完整")
@@ -618,6 +633,12 @@ class ConnectionHandler:
                 self.memory.set_llm(self.llm)
                 self.logger.bind(tag=TAG).info("使用主LLM作为意图识别模型")
 
+    def _initialize_dialogue(self):
+        """配置对话上下文的 token 预算，淘汰的历史由记忆模块的 LLM 生成摘要"""
+        self.dialogue.configure(self.config)
+        summary_llm = getattr(self.memory, "llm", None) if self.memory else None
+        self.dialogue.set_summary_llm(summary_llm or self.llm)
+
     def _initialize_intent(self):
         if self.intent is None:
             return
@@ -725,9 +746,9 @@ class ConnectionHandler:
 
         # 处理流式响应
         tool_call_flag = False
-        function_name = None
-        function_id = None
-        function_arguments = ""
+        tool_calls = ToolCallCollector()
+        # 已开始执行的工具调用：future -> 调用数据（按开始顺序）
+        tool_futures = {}
         content_arguments = ""
         self.client_abort = False
         emotion_flag = True
@@ -748,12 +769,8 @@ class ConnectionHandler:
 
                 if tools_call is not None and len(tools_call) > 0:
                     tool_call_flag = True
-                    if tools_call[0].id is not None:
-                        function_id = tools_call[0].id
-                    if tools_call[0].function.name is not None:
-                        function_name = tools_call[0].function.name
-                    if tools_call[0].function.arguments is not None:
-                        function_arguments += tools_call[0].function.arguments
+                    # 后面出现新的调用时，前一个调用的参数已完整，提前开始执行
+                    self._start_function_calls(tool_calls.feed(tools_call), tool_futures)
             else:
                 content = response
 
@@ -779,16 +796,19 @@ class ConnectionHandler:
         # 处理function call
         if tool_call_flag:
             bHasError = False
-            if function_id is None:
+            if not tool_calls:
                 a = extract_json_from_string(content_arguments)
                 if a is not None:
                     try:
                         content_arguments_json = json.loads(a)
-                        function_name = content_arguments_json["name"]
-                        function_arguments = json.dumps(
-                            content_arguments_json["arguments"], ensure_ascii=False
-                        )
-                        function_id = str(uuid.uuid4().hex)
+                        function_call_data = {
+                            "name": content_arguments_json["name"],
+                            "id": str(uuid.uuid4().hex),
+                            "arguments": json.dumps(
+                                content_arguments_json["arguments"], ensure_ascii=False
+                            ),
+                        }
+                        self._start_function_calls([function_call_data], tool_futures)
                     except Exception as e:
                         bHasError = True
                         response_message.append(a)
@@ -799,6 +819,8 @@ class ConnectionHandler:
                     self.logger.bind(tag=TAG).error(
                         f"function call error: {content_arguments}"
                     )
+            else:
+                self._start_function_calls(tool_calls.finish(), tool_futures)
             if not bHasError:
                 # 如需要大模型先处理一轮，添加相关处理后的日志情况
                 if len(response_message) > 0:
@@ -806,23 +828,7 @@ class ConnectionHandler:
                     self.tts_MessageText = text_buff
                     self.dialogue.put(Message(role="assistant", content=text_buff))
                 response_message.clear()
-                self.logger.bind(tag=TAG).debug(
-                    f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}"
-                )
-                function_call_data = {
-                    "name": function_name,
-                    "id": function_id,
-                    "arguments": function_arguments,
-                }
-
-                # 使用统一工具处理器处理所有工具调用
-                result = asyncio.run_coroutine_threadsafe(
-                    self.func_handler.handle_llm_function_call(
-                        self, function_call_data
-                    ),
-                    self.loop,
-                ).result()
-                self._handle_function_result(result, function_call_data, depth=depth)
+                self._handle_function_results(tool_futures, depth=depth)
 
         # 存储对话内容
         if len(response_message) > 0:
@@ -847,44 +853,86 @@ class ConnectionHandler:
 
         return True
 
+    def _start_function_calls(self, calls, tool_futures):
+        """在事件循环中并发执行工具调用，不等待结果"""
+        for function_call_data in calls:
+            self.logger.bind(tag=TAG).debug(
+                f"function_name={function_call_data['name']}, function_id={function_call_data['id']}, function_arguments={function_call_data['arguments']}"
+            )
+            # 使用统一工具处理器处理所有工具调用
+            future = asyncio.run_coroutine_threadsafe(
+                self.func_handler.handle_llm_function_call(self, function_call_data),
+                self.loop,
+            )
+            tool_futures[future] = function_call_data
+
+    def _handle_function_results(self, tool_futures, depth):
+        """
+        按完成顺序处理工具调用结果：直接回复类的结果立即播报，
+        需要大模型继续处理的结果全部完成后合并为一轮请求
+        """
+        reqllm_results = []
+        for future in as_completed(list(tool_futures)):
+            function_call_data = tool_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                self.logger.bind(tag=TAG).error(
+                    f"工具调用失败 {function_call_data['name']}: {e}"
+                )
+                result = ActionResponse(
+                    action=Action.ERROR, result=str(e), response=str(e)
+                )
+            if result is None:
+                continue
+            if result.action == Action.REQLLM:
+                if result.result is not None and len(result.result) > 0:
+                    reqllm_results.append((function_call_data, result.result))
+            else:
+                self._handle_function_result(result, function_call_data, depth=depth)
+
+        if not reqllm_results:
+            return
+        # 调用函数后再请求llm生成回复
+        self.dialogue.put(
+            Message(
+                role="assistant",
+                tool_calls=[
+                    {
+                        "id": function_call_data["id"],
+                        "function": {
+                            "arguments": (
+                                "{}"
+                                if function_call_data["arguments"] == ""
+                                else function_call_data["arguments"]
+                            ),
+                            "name": function_call_data["name"],
+                        },
+                        "type": "function",
+                        "index": index,
+                    }
+                    for index, (function_call_data, _) in enumerate(reqllm_results)
+                ],
+            )
+        )
+        for function_call_data, text in reqllm_results:
+            function_id = function_call_data["id"]
+            self.dialogue.put(
+                Message(
+                    role="tool",
+                    tool_call_id=(
+                        str(uuid.uuid4()) if function_id is None else function_id
+                    ),
+                    content=text,
+                )
+            )
+        self.chat("\n".join(text for _, text in reqllm_results), depth=depth + 1)
+
     def _handle_function_result(self, result, function_call_data, depth):
         if result.action == Action.RESPONSE:  # 直接回复前端
             text = result.response
             self.tts.tts_one_sentence(self, ContentType.TEXT, content_detail=text)
             self.dialogue.put(Message(role="assistant", content=text))
-        elif result.action == Action.REQLLM:  # 调用函数后再请求llm生成回复
-            text = result.result
-            if text is not None and len(text) > 0:
-                function_id = function_call_data["id"]
-                function_name = function_call_data["name"]
-                function_arguments = function_call_data["arguments"]
-                self.dialogue.put(
-                    Message(
-                        role="assistant",
-                        tool_calls=[
-                            {
-                                "id": function_id,
-                                "function": {
-                                    "arguments": "{}" if function_arguments == "" else function_arguments,
-                                    "name": function_name,
-                                },
-                                "type": "function",
-                                "index": 0,
-                            }
-                        ],
-                    )
-                )
-
-                self.dialogue.put(
-                    Message(
-                        role="tool",
-                        tool_call_id=(
-                            str(uuid.uuid4()) if function_id is None else function_id
-                        ),
-                        content=text,
-                    )
-                )
-                self.chat(text, depth=depth + 1)
         elif result.action == Action.NOTFOUND or result.action == Action.ERROR:
             text = result.response if result.response else result.result
             self.tts.tts_one_sentence(self, ContentType.TEXT, content_detail=text)
@@ -892,40 +940,6 @@ class ConnectionHandler:
         else:
             pass
 
-    def _report_worker(self):
-        """聊天记录上报工作线程"""
-        while not self.stop_event.is_set():
-            try:
-                # 从队列获取数据，设置超时以便定期检查停止事件
-                item = self.report_queue.get(timeout=1)
-                if item is None:  # 检测毒丸对象
-                    break
-                try:
-                    # 检查线程池状态
-                    if self.executor is None:
-                        continue
-                    # 提交任务到线程池
-                    self.executor.submit(self._process_report, *item)
-                except Exception as e:
-                    self.logger.bind(tag=TAG).error(f"聊天记录上报线程异常: {e}")
-            except queue.Empty:
-                continue
-            except Exception as e:
-                self.logger.bind(tag=TAG).error(f"聊天记录上报工作线程异常: {e}")
-
-        self.logger.bind(tag=TAG).info("聊天记录上报线程已退出")
-
-    def _process_report(self, type, text, audio_data, report_time):
-        """处理上报任务"""
-        try:
-            # 执行上报（传入二进制数据）
-            report(self, type, text, audio_data, report_time)
-        except Exception as e:
-            self.logger.bind(tag=TAG).error(f"上报处理异常: {e}")
-        finally:
-            # 标记任务完成
-            self.report_queue.task_done()
-
     def clearSpeakStatus(self):
         self.client_is_speaking = False
         self.logger.bind(tag=TAG).debug(f"清除服务端讲话状态")
@@ -995,12 +1009,14 @@ class ConnectionHandler:
                 self.logger.bind(tag=TAG).error(f"关闭WebSocket连接时出错: {ws_error}")
 
             if self.tts:
+                await self.tts.close_audio_channels()
                 await self.tts.close()
 
-            # 最后关闭线程池（避免阻塞）
+            # 最后关闭线程池（避免阻塞），共享线程池由连接工厂负责关闭
             if self.executor:
                 try:
-                    self.executor.shutdown(wait=False)
+                    if self.factory is None:
+                        self.executor.shutdown(wait=False)
                 except Exception as executor_error:
                     self.logger.bind(tag=TAG).error(
                         f"关闭线程池时出错: {executor_error}"
@@ -1026,7 +1042,6 @@ class ConnectionHandler:
             for q in [
                 self.tts.tts_text_queue,
                 self.tts.tts_audio_queue,
-                self.report_queue,
             ]:
                 if not q:
                     continue
@@ -1041,7 +1056,7 @@ class ConnectionHandler:
             )
 
     def reset_vad_states(self):
-        self.client_audio_buffer = bytearray()
+        self.audio_frontend.skip_vad_pending()
         self.client_have_voice = False
         self.client_voice_stop = False
         self.logger.bind(tag=TAG).debug("VAD states reset.")
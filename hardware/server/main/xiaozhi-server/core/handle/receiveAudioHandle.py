@@ -6,13 +6,16 @@ from core.utils.output_counter import check_device_output_limit
 from core.handle.abortHandle import handleAbortMessage
 from core.handle.sendAudioHandle import SentenceType
 from core.utils.util import audio_to_data_stream
+from core.utils.cache.tts_cache import tts_audio_cache
 
 TAG = __name__
 
 
 async def handleAudioMessage(conn, audio):
+    # 解码一次写入连接的PCM缓冲区，供VAD、ASR、声纹识别共用
+    conn.audio_frontend.push(audio, conn.audio_format)
     # 当前片段是否有人说话
-    have_voice = conn.vad.is_vad(conn, audio)
+    have_voice = await conn.vad.detect(conn, audio)
 
     if have_voice:
         if conn.client_is_speaking:
@@ -148,12 +151,16 @@ async def check_bind_device(conn):
 
 
 def play_audio_frames(conn, file_path):
-    """播放音频文件并处理发送帧数据"""
+    """播放音频文件并处理发送帧数据（编码结果按文件缓存，提示音只需编码一次）"""
     def handle_audio_frame(frame_data):
         conn.tts.tts_audio_queue.put((SentenceType.MIDDLE, frame_data, None))
 
-    audio_to_data_stream(
-        file_path,
-        is_opus=True,
-        callback=handle_audio_frame
-    )
+    cache_key = tts_audio_cache.file_key(file_path) if tts_audio_cache.enabled else None
+    packets = tts_audio_cache.get(cache_key) if cache_key else None
+    if packets is None:
+        packets = []
+        audio_to_data_stream(file_path, is_opus=True, callback=packets.append)
+        if cache_key:
+            tts_audio_cache.put(cache_key, packets)
+    for frame_data in packets:
+        handle_audio_frame(frame_data)
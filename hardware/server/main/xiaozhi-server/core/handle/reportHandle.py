@@ -1,96 +1,38 @@
 """
-TTS上报功能已集成到ConnectionHandler类中。
+聊天记录上报
 
 上报功能包括：
-1. 每个连接对象拥有自己的上报队列和处理线程
-2. 上报线程的生命周期与连接对象绑定
-3. 使用ConnectionHandler.enqueue_tts_report方法进行上报
+1. ASR和TTS的记录通过 enqueue_asr_report / enqueue_tts_report 提交到全局的上报流水线
+2. 流水线在进程池中编码音频，批量异步上传到 manager-api，失败时退避重试并落盘
 
-具体实现请参考core/connection.py中的相关代码。
+具体实现请参考core/utils/report_pipeline.py中的相关代码。
 """
 
 import time
 
-import opuslib_next
-
-from config.manage_api_client import report as manage_report
+from core.utils.report_pipeline import chat_report_pipeline
 
 TAG = __name__
 
 
-def report(conn, type, text, opus_data, report_time):
-    """执行聊天记录上报操作
+def report(conn, type, text, audio_data, report_time):
+    """提交一条聊天记录到上报流水线
 
     Args:
         conn: 连接对象
         type: 上报类型，1为用户，2为智能体
         text: 合成文本
-        opus_data: opus音频数据
+        audio_data: opus音频数据包列表，或音频前端已解码的PCM字节，不上报音频时为 None
         report_time: 上报时间
     """
-    try:
-        if opus_data:
-            audio_data = opus_to_wav(conn, opus_data)
-        else:
-            audio_data = None
-        # 执行上报
-        manage_report(
-            mac_address=conn.device_id,
-            session_id=conn.session_id,
-            chat_type=type,
-            content=text,
-            audio=audio_data,
-            report_time=report_time,
-        )
-    except Exception as e:
-        conn.logger.bind(tag=TAG).error(f"聊天记录上报失败: {e}")
-
-
-def opus_to_wav(conn, opus_data):
-    """将Opus数据转换为WAV格式的字节流
-
-    Args:
-        output_dir: 输出目录（保留参数以保持接口兼容）
-        opus_data: opus音频数据
-
-    Returns:
-        bytes: WAV格式的音频数据
-    """
-    decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-    pcm_data = []
-
-    for opus_packet in opus_data:
-        try:
-            pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-            pcm_data.append(pcm_frame)
-        except opuslib_next.OpusError as e:
-            conn.logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-
-    if not pcm_data:
-        raise ValueError("没有有效的PCM数据")
-
-    # 创建WAV文件头
-    pcm_data_bytes = b"".join(pcm_data)
-    num_samples = len(pcm_data_bytes) // 2  # 16-bit samples
-
-    # WAV文件头
-    wav_header = bytearray()
-    wav_header.extend(b"RIFF")  # ChunkID
-    wav_header.extend((36 + len(pcm_data_bytes)).to_bytes(4, "little"))  # ChunkSize
-    wav_header.extend(b"WAVE")  # Format
-    wav_header.extend(b"fmt ")  # Subchunk1ID
-    wav_header.extend((16).to_bytes(4, "little"))  # Subchunk1Size
-    wav_header.extend((1).to_bytes(2, "little"))  # AudioFormat (PCM)
-    wav_header.extend((1).to_bytes(2, "little"))  # NumChannels
-    wav_header.extend((16000).to_bytes(4, "little"))  # SampleRate
-    wav_header.extend((32000).to_bytes(4, "little"))  # ByteRate
-    wav_header.extend((2).to_bytes(2, "little"))  # BlockAlign
-    wav_header.extend((16).to_bytes(2, "little"))  # BitsPerSample
-    wav_header.extend(b"data")  # Subchunk2ID
-    wav_header.extend(len(pcm_data_bytes).to_bytes(4, "little"))  # Subchunk2Size
-
-    # 返回完整的WAV数据
-    return bytes(wav_header) + pcm_data_bytes
+    return chat_report_pipeline.submit(
+        mac_address=conn.device_id,
+        session_id=conn.session_id,
+        chat_type=type,
+        content=text,
+        audio=audio_data,
+        report_time=report_time,
+    )
 
 
 def enqueue_tts_report(conn, text, opus_data):
@@ -106,14 +48,14 @@ def enqueue_tts_report(conn, text, opus_data):
         opus_data: opus音频数据
     """
     try:
-        # 使用连接对象的队列，传入文本和二进制数据而非文件路径
+        # 传入文本和二进制数据，音频由流水线在进程池中编码
         if conn.chat_history_conf == 2:
-            conn.report_queue.put((2, text, opus_data, int(time.time())))
+            report(conn, 2, text, opus_data, int(time.time()))
             conn.logger.bind(tag=TAG).debug(
                 f"TTS数据已加入上报队列: {conn.device_id}, 音频大小: {len(opus_data)} "
             )
         else:
-            conn.report_queue.put((2, text, None, int(time.time())))
+            report(conn, 2, text, None, int(time.time()))
             conn.logger.bind(tag=TAG).debug(
                 f"TTS数据已加入上报队列: {conn.device_id}, 不上报音频"
             )
@@ -131,17 +73,20 @@ def enqueue_asr_report(conn, text, opus_data):
     Args:
         conn: 连接对象
         text: 合成文本
-        opus_data: opus音频数据
+        opus_data: opus音频数据包列表，或音频前端的PCM视图
     """
     try:
-        # 使用连接对象的队列，传入文本和二进制数据而非文件路径
+        # 传入文本和二进制数据，音频由流水线在进程池中编码
         if conn.chat_history_conf == 2:
-            conn.report_queue.put((1, text, opus_data, int(time.time())))
+            # PCM视图在下一个音频包写入后失效，入队前复制
+            if isinstance(opus_data, memoryview):
+                opus_data = bytes(opus_data)
+            report(conn, 1, text, opus_data, int(time.time()))
             conn.logger.bind(tag=TAG).debug(
                 f"ASR数据已加入上报队列: {conn.device_id}, 音频大小: {len(opus_data)} "
             )
         else:
-            conn.report_queue.put((1, text, None, int(time.time())))
+            report(conn, 1, text, None, int(time.time()))
             conn.logger.bind(tag=TAG).debug(
                 f"ASR数据已加入上报队列: {conn.device_id}, 不上报音频"
             )
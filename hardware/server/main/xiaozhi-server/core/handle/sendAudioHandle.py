@@ -2,6 +2,7 @@ import json
 import asyncio
 from core.providers.tts.dto.dto import SentenceType
 from core.utils import textUtils
+from core.utils.util import audio_to_data_stream
 
 TAG = __name__
 
@@ -53,11 +54,15 @@ async def send_tts_message(conn, state, text=None):
             stop_tts_notify_voice = conn.config.get(
                 "stop_tts_notify_voice", "config/assets/tts_notify.mp3"
             )
-            conn.tts.audio_to_opus_data_stream(
+            # 在线程中编码，且不使用 TTS 的句子编码器（可能正被其他线程中的编码任务使用）
+            await asyncio.to_thread(
+                audio_to_data_stream,
                 stop_tts_notify_voice,
+                is_opus=True,
                 callback=lambda audio_data: asyncio.run_coroutine_threadsafe(
                     sendAudio(conn, audio_data), conn.loop
                 ),
+                encoder=None,
             )
         # 清除服务端讲话状态
         conn.clearSpeakStatus()
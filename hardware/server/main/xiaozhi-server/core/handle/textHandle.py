@@ -36,6 +36,9 @@ async def handleTextMessage(conn, message):
             if msg_json["state"] == "start":
                 conn.client_have_voice = True
                 conn.client_voice_stop = False
+                # 非实时模式下设备播完语音才会开始拾音，用于校正音频发送节奏
+                if conn.client_listen_mode != "realtime" and conn.tts is not None:
+                    conn.tts.flow_controller.on_device_drained()
             elif msg_json["state"] == "stop":
                 conn.client_have_voice = True
                 conn.client_voice_stop = True
@@ -44,6 +47,7 @@ async def handleTextMessage(conn, message):
             elif msg_json["state"] == "detect":
                 conn.client_have_voice = False
                 conn.asr_audio.clear()
+                conn.audio_frontend.discard_utterance()
                 if "text" in msg_json:
                     conn.last_activity_time = time.time() * 1000
                     original_text = msg_json["text"]  # 保留原始文本
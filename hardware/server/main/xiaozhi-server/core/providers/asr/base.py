@@ -9,7 +9,6 @@ import opuslib_next
 import json
 import io
 import time
-import concurrent.futures
 from abc import ABC, abstractmethod
 from config.logger import setup_logging
 from typing import Optional, Tuple, List
@@ -23,6 +22,9 @@ logger = setup_logging()
 
 
 class ASRProviderBase(ABC):
+    # 本地模型的批量推理队列（见 batch_queue.py），远程服务为 None
+    batch_queue = None
+
     def __init__(self):
         pass
 
@@ -63,27 +65,44 @@ class ASRProviderBase(ABC):
             conn.asr_audio = conn.asr_audio[-10:]
             return
 
+        # 语句开始（含之前约 10 帧的预录音频）
+        conn.audio_frontend.begin_utterance()
+
         if conn.client_voice_stop:
             asr_audio_task = conn.asr_audio.copy()
             conn.asr_audio.clear()
+            # 直接使用音频前端中已解码的PCM，无需再次解码
+            pcm_data = conn.audio_frontend.take_utterance()
             conn.reset_vad_states()
 
             if len(asr_audio_task) > 15:
-                await self.handle_voice_stop(conn, asr_audio_task)
+                await self.handle_voice_stop(conn, asr_audio_task, pcm_data)
 
     # 处理语音停止
-    async def handle_voice_stop(self, conn, asr_audio_task: List[bytes]):
-        """并行处理ASR和声纹识别"""
+    async def handle_voice_stop(
+        self, conn, asr_audio_task: List[bytes], pcm_data: Optional[memoryview] = None
+    ):
+        """并行处理ASR和声纹识别
+
+        Args:
+            asr_audio_task: 本句的原始音频包
+            pcm_data: 音频前端已解码的本句PCM（为空时按原始音频包处理）
+        """
         try:
             total_start_time = time.monotonic()
             
-            # 准备音频数据
-            if conn.audio_format == "pcm":
-                pcm_data = asr_audio_task
+            # 准备音频数据：优先使用已解码的PCM，ASR以pcm格式读取同一块内存
+            if pcm_data is not None:
+                combined_pcm_data = pcm_data
+                asr_input, asr_format = [pcm_data], "pcm"
             else:
-                pcm_data = self.decode_opus(asr_audio_task)
-            
-            combined_pcm_data = b"".join(pcm_data)
+                asr_input, asr_format = asr_audio_task, conn.audio_format
+                if not conn.voiceprint_provider:
+                    combined_pcm_data = b""
+                elif conn.audio_format == "pcm":
+                    combined_pcm_data = b"".join(asr_audio_task)
+                else:
+                    combined_pcm_data = b"".join(self.decode_opus(asr_audio_task))
             
             # 预先准备WAV数据
             wav_data = None
@@ -93,61 +112,38 @@ class ASRProviderBase(ABC):
             
             
             # 定义ASR任务
-            def run_asr():
+            async def run_asr():
                 start_time = time.monotonic()
                 try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        result = loop.run_until_complete(
-                            self.speech_to_text(asr_audio_task, conn.session_id, conn.audio_format)
-                        )
-                        end_time = time.monotonic()
-                        logger.bind(tag=TAG).info(f"ASR耗时: {end_time - start_time:.3f}s")
-                        return result
-                    finally:
-                        loop.close()
-                except Exception as e:
+                    result = await self.run_speech_to_text(
+                        asr_input, conn.session_id, asr_format
+                    )
                     end_time = time.monotonic()
+                    logger.bind(tag=TAG).info(f"ASR耗时: {end_time - start_time:.3f}s")
+                    return result
+                except Exception as e:
                     logger.bind(tag=TAG).error(f"ASR失败: {e}")
                     return ("", None)
-            
+
             # 定义声纹识别任务
-            def run_voiceprint():
+            async def run_voiceprint():
                 if not wav_data:
                     return None
                 try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        # 使用连接的声纹识别提供者
-                        result = loop.run_until_complete(
-                            conn.voiceprint_provider.identify_speaker(wav_data, conn.session_id)
-                        )
-                        return result
-                    finally:
-                        loop.close()
+                    # 使用连接的声纹识别提供者
+                    return await conn.voiceprint_provider.identify_speaker(
+                        wav_data, conn.session_id
+                    )
                 except Exception as e:
                     logger.bind(tag=TAG).error(f"声纹识别失败: {e}")
                     return None
-            
-            # 使用线程池执行器并行运行
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as thread_executor:
-                asr_future = thread_executor.submit(run_asr)
-                
-                if conn.voiceprint_provider and wav_data:
-                    voiceprint_future = thread_executor.submit(run_voiceprint)
-                    
-                    # 等待两个线程都完成
-                    asr_result = asr_future.result(timeout=15)
-                    voiceprint_result = voiceprint_future.result(timeout=15)
-                    
-                    results = {"asr": asr_result, "voiceprint": voiceprint_result}
-                else:
-                    asr_result = asr_future.result(timeout=15)
-                    results = {"asr": asr_result, "voiceprint": None}
-            
-            
+
+            # ASR与声纹识别并发执行，等待期间不阻塞事件循环
+            asr_result, voiceprint_result = await asyncio.wait_for(
+                asyncio.gather(run_asr(), run_voiceprint()), timeout=15
+            )
+            results = {"asr": asr_result, "voiceprint": voiceprint_result}
+
             # 处理结果
             raw_text, file_path = results.get("asr", ("", None))
             speaker_name = results.get("voiceprint", None)
@@ -172,13 +168,38 @@ class ASRProviderBase(ABC):
                 
                 # 使用自定义模块进行上报
                 await startToChat(conn, enhanced_text)
-                enqueue_asr_report(conn, enhanced_text, asr_audio_task)
+                enqueue_asr_report(
+                    conn, enhanced_text, pcm_data if pcm_data is not None else asr_audio_task
+                )
                 
         except Exception as e:
             logger.bind(tag=TAG).error(f"处理语音停止失败: {e}")
             import traceback
             logger.bind(tag=TAG).debug(f"异常详情: {traceback.format_exc()}")
 
+    async def run_speech_to_text(
+        self, asr_input: List[bytes], session_id: str, audio_format: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """执行语音识别
+
+        本地模型通过批量推理队列识别，speech_to_text 只等待结果，直接在事件循环中执行；
+        其余实现可能包含同步阻塞调用，在线程中以独立的事件循环运行
+        """
+        if self.batch_queue is not None:
+            return await self.speech_to_text(asr_input, session_id, audio_format)
+
+        def run_in_thread():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                return loop.run_until_complete(
+                    self.speech_to_text(asr_input, session_id, audio_format)
+                )
+            finally:
+                loop.close()
+
+        return await asyncio.to_thread(run_in_thread)
+
     def _build_enhanced_text(self, text: str, speaker_name: Optional[str]) -> str:
         """构建包含说话人信息的文本"""
         if speaker_name and speaker_name.strip():
@@ -0,0 +1,185 @@
+"""
+本地ASR批量推理队列
+本地模型（FunASR、sherpa-onnx）只有一个实例，由所有连接共享：
+各连接结束的语句进入同一个队列，按语句时长分桶组成批次，在固定数量的工作线程上批量推理，
+同一批次内的语句时长相近，补齐（padding）浪费少；同时统计排队等待时间和实时率（RTF）
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, Any, List, Optional
+
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 16kHz 16bit 单声道PCM每秒字节数
+PCM_BYTES_PER_SECOND = 16000 * 2
+# 语句时长分桶边界（秒）
+BUCKET_EDGES = (2, 4, 8, 16)
+
+
+def default_workers(threads_per_worker: int = 1) -> int:
+    """按CPU核数确定工作线程数（每个工作线程的推理本身还会占用 threads_per_worker 个核）"""
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+
+class _Request:
+    __slots__ = ("pcm", "duration", "bucket", "future", "enqueue_time")
+
+    def __init__(self, pcm: bytes):
+        self.pcm = pcm
+        self.duration = len(pcm) / PCM_BYTES_PER_SECOND
+        self.bucket = sum(1 for edge in BUCKET_EDGES if self.duration >= edge)
+        self.future: Future = Future()
+        self.enqueue_time = time.monotonic()
+
+
+class ASRBatchStats:
+    """排队等待、实时率和批大小统计"""
+
+    def __init__(self, name: str, log_interval: int):
+        self.name = name
+        self.log_interval = max(1, log_interval)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.infer_total = 0.0
+        self.audio_total = 0.0
+
+    def record(self, batch: List[_Request], start_time: float, infer_time: float):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            for request in batch:
+                wait = start_time - request.enqueue_time
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.audio_total += request.duration
+            self.infer_total += infer_time
+            should_log = self.batches % self.log_interval == 0
+        if should_log:
+            logger.bind(tag=TAG).info(f"{self.name}批量识别统计: {self.get_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "batch_avg": round(self.requests / self.batches if self.batches else 0.0, 2),
+            "queue_wait_avg_ms": round(
+                self.wait_total / self.requests * 1000 if self.requests else 0.0, 1
+            ),
+            "queue_wait_max_ms": round(self.wait_max * 1000, 1),
+            "rtf": round(
+                self.infer_total / self.audio_total if self.audio_total else 0.0, 4
+            ),
+        }
+
+
+class ASRBatchQueue:
+    """
+    跨连接的ASR批量推理队列
+
+    工作线程取队首语句所在的时长分桶，等待同一分桶的语句凑满批次（最多等到队首语句
+    入队后 max_batch_wait_ms），然后一次推理整批；负载高时语句本身已在排队，无需额外等待。
+
+    配置（ASR 模块配置中的同名字段）:
+        - max_batch_size: 单批最多语句数，默认 8
+        - max_batch_wait_ms: 为凑批最多等待的时间（毫秒），0 表示不等待，默认 20
+        - workers: 工作线程数，0 表示按CPU核数自动确定
+        - stats_log_interval: 每多少个批次输出一次统计，默认 100
+    """
+
+    def __init__(
+        self,
+        name: str,
+        infer_batch: Callable[[List[bytes]], List[str]],
+        config: Dict[str, Any],
+        workers: int,
+    ):
+        self.name = name
+        self._infer_batch = infer_batch
+        self.max_batch_size = max(1, int(config.get("max_batch_size", 8)))
+        self.max_batch_wait = max(0.0, float(config.get("max_batch_wait_ms", 20)) / 1000)
+        self.workers = int(config.get("workers", 0)) or workers
+        self.stats = ASRBatchStats(name, int(config.get("stats_log_interval", 100)))
+        self._pending: List[_Request] = []
+        self._cond = threading.Condition()
+        for i in range(self.workers):
+            threading.Thread(
+                target=self._worker, name=f"{name}-asr-{i}", daemon=True
+            ).start()
+        logger.bind(tag=TAG).info(
+            f"{name}批量识别队列已启动: 工作线程{self.workers}, 批大小{self.max_batch_size}, "
+            f"凑批等待{self.max_batch_wait * 1000:.0f}ms"
+        )
+
+    def submit(self, pcm: bytes) -> Future:
+        """提交一句16kHz单声道PCM，返回识别文本的Future"""
+        request = _Request(pcm)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    async def transcribe(self, pcm: bytes) -> str:
+        """在事件循环中等待识别结果（不占用线程）"""
+        return await asyncio.wrap_future(self.submit(pcm))
+
+    def _next_batch(self) -> List[_Request]:
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+                first = self._pending[0]
+                deadline = first.enqueue_time + self.max_batch_wait
+                while True:
+                    same_bucket = [r for r in self._pending if r.bucket == first.bucket]
+                    remaining = deadline - time.monotonic()
+                    if len(same_bucket) >= self.max_batch_size or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    if first not in self._pending:
+                        # 队首语句已被其他工作线程取走，重新选择
+                        break
+                if first not in self._pending:
+                    continue
+                batch = same_bucket[: self.max_batch_size]
+                taken = set(map(id, batch))
+                self._pending = [r for r in self._pending if id(r) not in taken]
+                if self._pending:
+                    self._cond.notify()
+                batch = [r for r in batch if not r.future.cancelled()]
+                if batch:
+                    return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            start_time = time.monotonic()
+            try:
+                texts = self._infer_batch([r.pcm for r in batch])
+                error: Optional[Exception] = None
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"{self.name}批量识别失败: {e}")
+                texts, error = [], e
+            infer_time = time.monotonic() - start_time
+            logger.bind(tag=TAG).debug(
+                f"{self.name}批量识别: {len(batch)}句, 耗时 {infer_time:.3f}s"
+            )
+            for i, request in enumerate(batch):
+                try:
+                    if error is not None:
+                        request.future.set_exception(error)
+                    else:
+                        request.future.set_result(texts[i] if i < len(texts) else "")
+                except InvalidStateError:
+                    # 等待方已超时取消
+                    pass
+            self.stats.record(batch, start_time, infer_time)
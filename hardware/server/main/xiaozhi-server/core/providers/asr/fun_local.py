@@ -1,5 +1,6 @@
 import time
 import os
+import asyncio
 import sys
 import io
 import psutil
@@ -10,6 +11,7 @@ from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 import shutil
 from core.providers.asr.dto.dto import InterfaceType
+from core.providers.asr.batch_queue import ASRBatchQueue
 
 TAG = __name__
 logger = setup_logging()
@@ -60,6 +62,39 @@ class ASRProvider(ASRProviderBase):
                 hub="hf",
                 # device="cuda:0",  # 启用GPU加速
             )
+        # 模型实例由所有连接共享，各连接的语句进入批量推理队列；
+        # PyTorch 单次推理已使用全部CPU核，默认只开一个工作线程
+        self._batch_supported = True
+        self.batch_queue = ASRBatchQueue("FunASR", self._infer_batch, config, workers=1)
+
+    def _infer_batch(self, pcm_list: List[bytes]) -> List[str]:
+        """一次推理一批语句（在批量队列的工作线程中执行）"""
+        if self._batch_supported and len(pcm_list) > 1:
+            try:
+                results = self.model.generate(
+                    input=pcm_list,
+                    cache={},
+                    language="auto",
+                    use_itn=True,
+                    batch_size_s=60,
+                    batch_size=len(pcm_list),
+                )
+                return [rich_transcription_postprocess(r["text"]) for r in results]
+            except NotImplementedError:
+                # 部分模型不支持批量解码，退化为逐句推理
+                logger.bind(tag=TAG).warning("当前FunASR模型不支持批量解码，改为逐句识别")
+                self._batch_supported = False
+        texts = []
+        for pcm in pcm_list:
+            result = self.model.generate(
+                input=pcm,
+                cache={},
+                language="auto",
+                use_itn=True,
+                batch_size_s=60,
+            )
+            texts.append(rich_transcription_postprocess(result[0]["text"]))
+        return texts
 
     async def speech_to_text(
         self, opus_data: List[bytes], session_id: str, audio_format="opus"
@@ -74,7 +109,7 @@ class ASRProvider(ASRProviderBase):
                 if audio_format == "pcm":
                     pcm_data = opus_data
                 else:
-                    pcm_data = self.decode_opus(opus_data)
+                    pcm_data = await asyncio.to_thread(self.decode_opus, opus_data)
 
                 combined_pcm_data = b"".join(pcm_data)
 
@@ -88,18 +123,13 @@ class ASRProvider(ASRProviderBase):
                 if self.delete_audio_file:
                     pass
                 else:
-                    file_path = self.save_audio_to_file(pcm_data, session_id)
+                    file_path = await asyncio.to_thread(
+                        self.save_audio_to_file, pcm_data, session_id
+                    )
 
-                # 语音识别
+                # 语音识别（进入批量推理队列）
                 start_time = time.time()
-                result = self.model.generate(
-                    input=combined_pcm_data,
-                    cache={},
-                    language="auto",
-                    use_itn=True,
-                    batch_size_s=60,
-                )
-                text = rich_transcription_postprocess(result[0]["text"])
+                text = await self.batch_queue.transcribe(combined_pcm_data)
                 logger.bind(tag=TAG).debug(
                     f"语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}"
                 )
@@ -116,7 +146,7 @@ class ASRProvider(ASRProviderBase):
                 logger.bind(tag=TAG).warning(
                     f"语音识别失败，正在重试（{retry_count}/{MAX_RETRIES}）: {e}"
                 )
-                time.sleep(RETRY_DELAY)
+                await asyncio.sleep(RETRY_DELAY)
 
             except Exception as e:
                 logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
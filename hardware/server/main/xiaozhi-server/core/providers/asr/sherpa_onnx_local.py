@@ -1,5 +1,6 @@
 import time
 import wave
+import asyncio
 import os
 import sys
 import io
@@ -7,6 +8,7 @@ from config.logger import setup_logging
 from typing import Optional, Tuple, List
 from core.providers.asr.dto.dto import InterfaceType
 from core.providers.asr.base import ASRProviderBase
+from core.providers.asr.batch_queue import ASRBatchQueue, default_workers
 
 import numpy as np
 import sherpa_onnx
@@ -95,6 +97,24 @@ class ASRProvider(ASRProviderBase):
                     debug=False,
                     use_itn=True,
                 )
+        # 识别器由所有连接共享，各连接的语句进入批量推理队列，用 decode_streams 一次解码一批；
+        # 每次解码占用 num_threads(2) 个核，工作线程数按核数确定
+        self.batch_queue = ASRBatchQueue(
+            "SherpaASR", self._infer_batch, config, workers=default_workers(2)
+        )
+
+    def _infer_batch(self, pcm_list: List[bytes]) -> List[str]:
+        """一次解码一批语句（在批量队列的工作线程中执行）"""
+        streams = []
+        for pcm in pcm_list:
+            if len(pcm) % 2:
+                pcm = pcm[:-1]
+            samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768
+            stream = self.model.create_stream()
+            stream.accept_waveform(16000, samples)
+            streams.append(stream)
+        self.model.decode_streams(streams)
+        return [stream.result.text for stream in streams]
 
     def read_wave(self, wave_filename: str) -> Tuple[np.ndarray, int]:
         """
@@ -126,24 +146,24 @@ class ASRProvider(ASRProviderBase):
         """语音转文本主处理逻辑"""
         file_path = None
         try:
-            # 保存音频文件
-            start_time = time.time()
             if audio_format == "pcm":
                 pcm_data = opus_data
             else:
-                pcm_data = self.decode_opus(opus_data)
-            file_path = self.save_audio_to_file(pcm_data, session_id)
-            logger.bind(tag=TAG).debug(
-                f"音频文件保存耗时: {time.time() - start_time:.3f}s | 路径: {file_path}"
-            )
+                pcm_data = await asyncio.to_thread(self.decode_opus, opus_data)
+
+            # 需要保留音频时才保存文件，识别直接使用内存中的PCM
+            if not self.delete_audio_file:
+                start_time = time.time()
+                file_path = await asyncio.to_thread(
+                    self.save_audio_to_file, pcm_data, session_id
+                )
+                logger.bind(tag=TAG).debug(
+                    f"音频文件保存耗时: {time.time() - start_time:.3f}s | 路径: {file_path}"
+                )
 
-            # 语音识别
+            # 语音识别（进入批量推理队列）
             start_time = time.time()
-            s = self.model.create_stream()
-            samples, sample_rate = self.read_wave(file_path)
-            s.accept_waveform(sample_rate, samples)
-            self.model.decode_stream(s)
-            text = s.result.text
+            text = await self.batch_queue.transcribe(b"".join(pcm_data))
             logger.bind(tag=TAG).debug(
                 f"语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}"
             )
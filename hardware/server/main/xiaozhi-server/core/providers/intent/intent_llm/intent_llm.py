@@ -2,7 +2,9 @@ from typing import List, Dict
 from ..base import IntentProviderBase
 from plugins_func.functions.play_music import initialize_music_handler
 from config.logger import setup_logging
+from .intent_router import IntentRouter, normalize_text
 import re
+import asyncio
 import json
 import hashlib
 import time
@@ -22,6 +24,9 @@ class IntentProvider(IntentProviderBase):
         self.cache_manager = cache_manager
         self.CacheType = CacheType
         self.history_count = 4  # 默认使用最近4条对话记录
+        self.functions = None
+        # LLM之前的快速路径：规范化缓存、关键词规则、本地分类器
+        self.router = IntentRouter(config.get("router"))
 
     def get_intent_system_prompt(self, functions_list: str) -> str:
         """
@@ -103,6 +108,18 @@ class IntentProvider(IntentProviderBase):
         )
         return prompt
 
+    def _clean_tool_history(self, conn, intent: str):
+        """继续聊天时清理工具调用相关的历史消息"""
+        if '"continue_chat"' not in intent:
+            return
+        history = conn.dialogue.dialogue
+        if not any(msg.role in ["tool", "function"] for msg in history):
+            return
+        # 保留非工具相关的消息
+        conn.dialogue.dialogue = [
+            msg for msg in history if msg.role not in ["tool", "function"]
+        ]
+
     def replyResult(self, text: str, original_text: str):
         llm_result = self.llm.response_no_stream(
             system_prompt=text,
@@ -124,38 +141,72 @@ class IntentProvider(IntentProviderBase):
         model_info = getattr(self.llm, "model_name", str(self.llm.__class__.__name__))
         logger.bind(tag=TAG).debug(f"使用意图识别模型: {model_info}")
 
-        # 计算缓存键
-        cache_key = hashlib.md5((conn.device_id + text).encode()).hexdigest()
-
-        # 检查缓存
-        cached_intent = self.cache_manager.get(self.CacheType.INTENT, cache_key)
-        if cached_intent is not None:
-            cache_time = time.time() - total_start_time
-            logger.bind(tag=TAG).debug(
-                f"使用缓存的意图: {cache_key} -> {cached_intent}, 耗时: {cache_time:.4f}秒"
-            )
-            return cached_intent
-
         if self.promot == "":
-            functions = conn.func_handler.get_functions()
+            self.functions = conn.func_handler.get_functions()
             if hasattr(conn, "mcp_client"):
                 mcp_tools = conn.mcp_client.get_available_tools()
                 if mcp_tools is not None and len(mcp_tools) > 0:
-                    if functions is None:
-                        functions = []
-                    functions.extend(mcp_tools)
+                    if self.functions is None:
+                        self.functions = []
+                    self.functions.extend(mcp_tools)
 
-            self.promot = self.get_intent_system_prompt(functions)
+            self.promot = self.get_intent_system_prompt(self.functions)
 
         music_config = initialize_music_handler(conn)
         music_file_names = music_config["music_file_names"]
-        prompt_music = f"{self.promot}\n<musicNames>{music_file_names}\n</musicNames>"
 
         home_assistant_cfg = conn.config["plugins"].get("home_assistant")
         if home_assistant_cfg:
             devices = home_assistant_cfg.get("devices", [])
         else:
             devices = []
+
+        # 规则随函数列表、曲库、设备列表变化重建
+        signature = self.router.make_signature(self.functions, music_file_names, devices)
+        if signature != self.router.signature:
+            self.router.rebuild(self.functions, music_file_names, devices)
+
+        # 计算缓存键（规范化文本）：规则和本地分类器的结果只取决于文本，各设备共享；
+        # LLM 的结果还取决于设备的对话上下文，只在本设备内复用
+        normalized = normalize_text(text)
+        rule_cache_key = hashlib.md5((signature + normalized).encode()).hexdigest()
+        cache_key = hashlib.md5(
+            (signature + (conn.device_id or "") + normalized).encode()
+        ).hexdigest()
+
+        # 检查缓存
+        for key in (rule_cache_key, cache_key):
+            cached_intent = self.cache_manager.get(self.CacheType.INTENT, key)
+            if cached_intent is not None:
+                cache_time = time.time() - total_start_time
+                self.router.record("cache", cache_time)
+                logger.bind(tag=TAG).debug(
+                    f"使用缓存的意图: {key} -> {cached_intent}, 耗时: {cache_time:.4f}秒"
+                )
+                self._clean_tool_history(conn, cached_intent)
+                return cached_intent
+
+        # 规则和本地分类器能确定时不再请求LLM
+        if self.router.enabled:
+            decision = self.router.match_rules(text)
+            if decision is None or decision.confidence < self.router.rule_threshold:
+                decision = self.router.classify_local(text)
+            if decision is not None and (
+                decision.tier == "local"
+                or decision.confidence >= self.router.rule_threshold
+            ):
+                intent = decision.to_json()
+                route_time = time.time() - total_start_time
+                self.router.record(decision.tier, route_time)
+                logger.bind(tag=TAG).info(
+                    f"{decision.tier} 识别到意图: {decision.name}, 参数: {decision.arguments}, "
+                    f"置信度: {decision.confidence:.2f}, 耗时: {route_time:.4f}秒"
+                )
+                self.cache_manager.set(self.CacheType.INTENT, rule_cache_key, intent)
+                self._clean_tool_history(conn, intent)
+                return intent
+
+        prompt_music = f"{self.promot}\n<musicNames>{music_file_names}\n</musicNames>"
         if len(devices) > 0:
             hass_prompt = "\n下面是我家智能设备列表（位置，设备名，entity_id），可以通过homeassistant控制\n"
             for device in devices:
@@ -179,12 +230,14 @@ class IntentProvider(IntentProviderBase):
         preprocess_time = time.time() - total_start_time
         logger.bind(tag=TAG).debug(f"意图识别预处理耗时: {preprocess_time:.4f}秒")
 
-        # 使用LLM进行意图识别
+        # 使用LLM进行意图识别（在线程中执行，不阻塞事件循环）
         llm_start_time = time.time()
         logger.bind(tag=TAG).debug(f"开始LLM意图识别调用, 模型: {model_info}")
 
-        intent = self.llm.response_no_stream(
-            system_prompt=prompt_music, user_prompt=user_prompt
+        intent = await asyncio.to_thread(
+            self.llm.response_no_stream,
+            system_prompt=prompt_music,
+            user_prompt=user_prompt,
         )
 
         # 记录LLM调用完成时间
@@ -224,17 +277,12 @@ class IntentProvider(IntentProviderBase):
                 )
 
                 # 如果是继续聊天，清理工具调用相关的历史消息
-                if function_name == "continue_chat":
-                    # 保留非工具相关的消息
-                    clean_history = [
-                        msg
-                        for msg in conn.dialogue.dialogue
-                        if msg.role not in ["tool", "function"]
-                    ]
-                    conn.dialogue.dialogue = clean_history
+                self._clean_tool_history(conn, intent)
 
-                # 添加到缓存
+                # 添加到缓存，并作为本地分类器的样本
                 self.cache_manager.set(self.CacheType.INTENT, cache_key, intent)
+                self.router.learn(text, intent)
+                self.router.record("llm", time.time() - total_start_time)
 
                 # 后处理时间
                 postprocess_time = time.time() - postprocess_start_time
@@ -245,6 +293,7 @@ class IntentProvider(IntentProviderBase):
             else:
                 # 添加到缓存
                 self.cache_manager.set(self.CacheType.INTENT, cache_key, intent)
+                self.router.record("llm", time.time() - total_start_time)
 
                 # 后处理时间
                 postprocess_time = time.time() - postprocess_start_time
@@ -258,5 +307,6 @@ class IntentProvider(IntentProviderBase):
             logger.bind(tag=TAG).error(
                 f"无法解析意图JSON: {intent}, 后处理耗时: {postprocess_time:.4f}秒"
             )
+            self.router.record("llm", time.time() - total_start_time)
             # 如果解析失败，默认返回继续聊天意图
             return '{"intent": "继续聊天"}'
@@ -0,0 +1,540 @@
+"""
+分级意图路由
+在调用意图识别 LLM 之前依次尝试：规范化文本缓存 -> 关键词规则（Aho-Corasick 多模式匹配）
+-> 本地字符 n-gram 相似度分类器，只有置信度不足时才交给 LLM
+"""
+
+import re
+import json
+import math
+import hashlib
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+CONTINUE_CHAT = "continue_chat"
+TIERS = ("cache", "rule", "local", "llm")
+# 每识别多少次输出一次各级命中统计
+_STATS_LOG_INTERVAL = 100
+
+_PUNCT_PATTERN = re.compile(r"[^\w]+", re.UNICODE)
+
+# 疑问/否定词：出现时规则层不做判断（例如“怎么退出了？”不是要退出）
+_QUESTION_WORDS = ("怎么", "为什么", "为啥", "如何", "是不是", "什么", "吗", "哪")
+_NEGATION_WORDS = ("不要", "别", "不用", "不想听", "不想看")
+# 语气、填充词：计算“未被规则解释的剩余文本”时忽略
+_FILLER_WORDS = (
+    "请你", "请", "帮我", "给我", "我想", "我要", "想要", "一下", "一首", "首", "一些", "点",
+    "好的", "那么", "那", "我们", "先", "今天", "就", "这样", "吧", "了", "啦", "呀", "啊",
+    "呢", "哦", "嗯", "小智", "你",
+)
+_WEATHER_FILLERS = (
+    "今天", "明天", "后天", "现在", "最近", "这几天", "这两天", "未来", "的", "怎么样", "如何",
+    "会不会", "会", "查一下", "查查", "看看", "告诉我", "多少度", "几度", "情况", "预报", "天",
+)
+# 退出意图中“退出/结束”可以带的宾语，其他宾语（如“退出音乐”）不是结束会话
+_EXIT_OBJECTS = ("系统", "对话", "聊天", "会话", "程序")
+# 天气地点：省级行政区与常见城市，其他地点需以行政区划后缀结尾，否则交给 LLM 判断
+_WEATHER_LOCATIONS = frozenset((
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江",
+    "安徽", "福建", "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州",
+    "云南", "陕西", "甘肃", "青海", "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆", "香港",
+    "澳门", "石家庄", "太原", "沈阳", "大连", "长春", "哈尔滨", "南京", "苏州", "无锡", "常州",
+    "徐州", "杭州", "宁波", "温州", "绍兴", "嘉兴", "金华", "台州", "合肥", "福州", "厦门",
+    "泉州", "南昌", "济南", "青岛", "烟台", "潍坊", "郑州", "洛阳", "武汉", "宜昌", "襄阳",
+    "长沙", "株洲", "广州", "深圳", "珠海", "汕头", "佛山", "东莞", "中山", "惠州", "海口",
+    "三亚", "成都", "绵阳", "贵阳", "昆明", "大理", "丽江", "西安", "兰州", "西宁", "呼和浩特",
+    "南宁", "桂林", "拉萨", "银川", "乌鲁木齐", "保定", "唐山", "秦皇岛", "邯郸", "扬州",
+    "南通", "镇江", "盐城", "连云港", "芜湖", "漳州", "赣州", "九江", "威海", "临沂", "淄博",
+))
+_LOCATION_SUFFIXES = ("市", "省", "区", "县")
+
+# 继续聊天的初始样本，之后由 LLM 的判定结果持续补充
+_CHAT_SEEDS = (
+    "你好", "你是谁", "你叫什么名字", "讲个故事", "给我讲个笑话", "我有点难过",
+    "谢谢你", "你能做什么", "今天过得怎么样", "陪我聊聊天",
+)
+
+
+def normalize_text(text: str) -> str:
+    """规范化：全角转半角、小写、去掉标点和空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _PUNCT_PATTERN.sub("", text).replace("_", "")
+
+
+def _strip_words(text: str, words: Iterable[str]) -> str:
+    for word in sorted(words, key=len, reverse=True):
+        if word:
+            text = text.replace(word, "")
+    return text
+
+
+class AhoCorasick:
+    """多模式字符串匹配，一次扫描找出文本中出现的全部关键词"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+        self._built = True
+
+    def add(self, word: str, payload: Any):
+        if not word:
+            return
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((word, payload))
+        self._built = False
+
+    def build(self):
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                if self._fail[nxt] == nxt:
+                    self._fail[nxt] = 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def search(self, text: str) -> List[Tuple[int, str, Any]]:
+        """返回 (起始位置, 关键词, 附带数据) 列表"""
+        if not self._built:
+            self.build()
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for word, payload in self._out[state]:
+                matches.append((i - len(word) + 1, word, payload))
+        return matches
+
+
+@dataclass
+class IntentDecision:
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    confidence: float = 1.0
+    tier: str = "rule"
+
+    def to_json(self) -> str:
+        function_call: Dict[str, Any] = {"name": self.name}
+        if self.arguments:
+            function_call["arguments"] = self.arguments
+        return json.dumps({"function_call": function_call}, ensure_ascii=False)
+
+
+def _ngrams(text: str) -> Counter:
+    grams = Counter(text)
+    grams.update(text[i : i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _cosine(a: Counter, a_norm: float, b: Counter, b_norm: float) -> float:
+    if not a_norm or not b_norm:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0) for k, v in a.items()) / (a_norm * b_norm)
+
+
+class NgramClassifier:
+    """
+    本地轻量分类器：字符 unigram+bigram 余弦相似度的最近邻
+    样本来自关键词规则和 LLM 的历史判定，每个类别保留最近的若干条
+    """
+
+    def __init__(self, max_examples_per_label: int = 200):
+        self.max_examples_per_label = max_examples_per_label
+        self._examples: Dict[str, "OrderedDict[str, Tuple[Counter, float]]"] = {}
+
+    def add(self, label: str, text: str):
+        if not text:
+            return
+        examples = self._examples.setdefault(label, OrderedDict())
+        if text in examples:
+            examples.move_to_end(text)
+            return
+        grams = _ngrams(text)
+        examples[text] = (grams, math.sqrt(sum(v * v for v in grams.values())))
+        while len(examples) > self.max_examples_per_label:
+            examples.popitem(last=False)
+
+    def discard(self, labels: Iterable[str]):
+        """删除不再可用的类别（函数列表变化时）"""
+        for label in list(self._examples):
+            if label not in labels:
+                del self._examples[label]
+
+    def predict(self, text: str) -> Optional[Tuple[str, float, float]]:
+        """返回 (类别, 最高相似度, 与第二名类别的差距)"""
+        if not text or not self._examples:
+            return None
+        grams = _ngrams(text)
+        norm = math.sqrt(sum(v * v for v in grams.values()))
+        scores = []
+        for label, examples in self._examples.items():
+            best = 0.0
+            for ex_grams, ex_norm in examples.values():
+                score = _cosine(grams, norm, ex_grams, ex_norm)
+                if score > best:
+                    best = score
+            scores.append((best, label))
+        scores.sort(reverse=True)
+        best_score, best_label = scores[0]
+        second = scores[1][0] if len(scores) > 1 else 0.0
+        return best_label, best_score, best_score - second
+
+
+class IntentRouter:
+    """
+    意图识别的快速路径
+
+    配置（Intent.intent_llm 下的 router）:
+        - enable: 是否启用，默认 true
+        - rule_threshold: 规则层置信度阈值，默认 0.8
+        - local_threshold: 本地分类器相似度阈值，默认 0.75
+        - local_margin: 本地分类器与第二名类别的最小差距，默认 0.15
+        - max_examples_per_label: 本地分类器每个类别保留的样本数，默认 200
+        - weather_locations: 规则层可直接识别的天气地点（补充内置的省市列表）
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = str(config.get("enable", True)).lower() in ("true", "1", "yes")
+        self.rule_threshold = float(config.get("rule_threshold", 0.8))
+        self.local_threshold = float(config.get("local_threshold", 0.75))
+        self.local_margin = float(config.get("local_margin", 0.15))
+        self.classifier = NgramClassifier(int(config.get("max_examples_per_label", 200)))
+        self.weather_locations = _WEATHER_LOCATIONS | frozenset(
+            config.get("weather_locations") or ()
+        )
+        self.signature = ""
+        self._functions: Dict[str, Dict[str, Any]] = {}
+        self._automaton = AhoCorasick()
+        self._stats = {tier: {"hits": 0, "time": 0.0} for tier in TIERS}
+        self._total = 0
+
+    # ---------- 规则构建 ----------
+
+    @staticmethod
+    def make_signature(
+        functions: List[Dict[str, Any]], music_names: List[str], hass_devices: List[str]
+    ) -> str:
+        names = sorted(f.get("function", {}).get("name", "") for f in functions or [])
+        raw = json.dumps([names, sorted(music_names), sorted(hass_devices)], ensure_ascii=False)
+        return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+    def rebuild(
+        self,
+        functions: List[Dict[str, Any]],
+        music_names: List[str],
+        hass_devices: List[str],
+    ):
+        """根据当前可用的函数描述、音乐列表和设备列表重建规则"""
+        self.signature = self.make_signature(functions, music_names, hass_devices)
+        self._functions = {
+            f.get("function", {}).get("name", ""): f.get("function", {})
+            for f in functions or []
+        }
+        automaton = AhoCorasick()
+        keywords: Dict[str, Tuple[str, ...]] = {
+            "handle_exit_intent": (
+                "退出系统", "退出", "结束对话", "结束聊天", "不聊了", "不想聊了",
+                "我不想和你说话了", "再见", "拜拜", "退下",
+            ),
+            "play_music": (
+                "播放音乐", "放音乐", "放点音乐", "听音乐", "听歌", "放首歌", "来首歌",
+                "唱首歌", "唱歌", "放一首", "来一首", "唱一首", "播放",
+            ),
+            "get_weather": ("天气", "气温", "下雨", "下雪", "温度", "刮风", "带伞"),
+            "news": ("新闻", "热搜", "头条", "资讯"),
+            "hass_on": ("打开", "开启", "开一下"),
+            "hass_off": ("关闭", "关掉", "关上", "关一下"),
+            "hass_pause": ("暂停",),
+            "hass_continue": ("继续播放",),
+            "hass_state": ("状态", "开着吗", "关着吗", "是开着", "是关着"),
+            "news_detail": ("详细", "具体内容", "展开说说"),
+        }
+        for kind, words in keywords.items():
+            for word in words:
+                automaton.add(word, (kind, word))
+        if "play_music" in self._functions:
+            for name in music_names or []:
+                title = normalize_text(name.replace("\\", "/").split("/")[-1])
+                if len(title) >= 2:
+                    automaton.add(title, ("song", name))
+        news_function = self._news_function()
+        if news_function:
+            desc = json.dumps(self._functions[news_function], ensure_ascii=False)
+            match = re.search(r"例如(.+?)等", desc)
+            if match:
+                for source in re.split(r"[、,，]", match.group(1)):
+                    source = source.strip()
+                    if source:
+                        automaton.add(normalize_text(source), ("news_source", source))
+        if "hass_set_state" in self._functions or "hass_get_state" in self._functions:
+            for device in hass_devices or []:
+                parts = [p.strip() for p in device.split(",")]
+                if len(parts) >= 3 and parts[1]:
+                    automaton.add(
+                        normalize_text(parts[1]), ("hass_device", (parts[0], parts[1], parts[2]))
+                    )
+        automaton.build()
+        self._automaton = automaton
+
+        self.classifier.discard(set(self._functions) | {CONTINUE_CHAT})
+        for seed in _CHAT_SEEDS:
+            self.classifier.add(CONTINUE_CHAT, normalize_text(seed))
+        for kind in ("handle_exit_intent", "play_music", "get_weather"):
+            if kind in self._functions:
+                for word in keywords[kind]:
+                    self.classifier.add(kind, word)
+
+    def _news_function(self) -> Optional[str]:
+        for name in ("get_news_from_newsnow", "get_news_from_chinanews"):
+            if name in self._functions:
+                return name
+        return None
+
+    # ---------- 各级识别 ----------
+
+    def match_rules(self, text: str) -> Optional[IntentDecision]:
+        """关键词规则层；多个函数同时高置信命中（复合指令）时交给后续层"""
+        norm = normalize_text(text)
+        if not norm:
+            return None
+        matches = self._automaton.search(norm)
+        if not matches:
+            return None
+        by_kind: Dict[str, List[Tuple[int, str, Any]]] = {}
+        for start, word, (kind, value) in matches:
+            by_kind.setdefault(kind, []).append((start, word, value))
+        has_question = any(w in norm for w in _QUESTION_WORDS)
+        has_negation = any(w in norm for w in _NEGATION_WORDS)
+
+        candidates = [
+            c
+            for c in (
+                self._rule_exit(norm, by_kind, has_question, has_negation),
+                self._rule_music(norm, by_kind, has_question, has_negation),
+                self._rule_weather(norm, by_kind),
+                self._rule_news(norm, by_kind, has_negation),
+                self._rule_hass(norm, by_kind, has_negation),
+            )
+            if c is not None
+        ]
+        if not candidates:
+            return None
+        candidates.sort(key=lambda c: c.confidence, reverse=True)
+        confident = [c for c in candidates if c.confidence >= self.rule_threshold]
+        if len({c.name for c in confident}) > 1:
+            return None
+        return candidates[0]
+
+    @staticmethod
+    def _residual(
+        norm: str, matches: Iterable[Tuple[int, str, Any]], extra_fillers: Iterable[str] = ()
+    ) -> str:
+        """去掉命中的关键词（按位置，重叠的关键词不会互相破坏）和填充词后剩余的文本"""
+        covered = [False] * len(norm)
+        for start, word, _ in matches:
+            for i in range(start, start + len(word)):
+                covered[i] = True
+        rest = "".join(ch for ch, hit in zip(norm, covered) if not hit)
+        return _strip_words(rest, tuple(extra_fillers) + _FILLER_WORDS)
+
+    def _rule_exit(self, norm, by_kind, has_question, has_negation):
+        if "handle_exit_intent" not in self._functions or "handle_exit_intent" not in by_kind:
+            return None
+        if has_question or has_negation:
+            return None
+        # 只有整句都是退出短语（加语气词）时才直接判定，“帮我退出音乐”这类带宾语的交给 LLM
+        residual = self._residual(norm, by_kind["handle_exit_intent"], _EXIT_OBJECTS)
+        confidence = 0.95 if not residual else 0.5
+        return IntentDecision(
+            "handle_exit_intent", {"say_goodbye": "再见，祝您生活愉快！"}, confidence
+        )
+
+    def _rule_music(self, norm, by_kind, has_question, has_negation):
+        if "play_music" not in self._functions:
+            return None
+        songs = by_kind.get("song", [])
+        triggers = by_kind.get("play_music", [])
+        if not triggers or has_negation:
+            return None
+        if songs:
+            _, word, name = max(songs, key=lambda m: len(m[1]))
+            return IntentDecision(
+                "play_music", {"song_name": name}, 0.6 if has_question else 0.95
+            )
+        residual = self._residual(norm, triggers, ("歌曲", "歌", "音乐", "随便", "随机"))
+        if has_question:
+            return IntentDecision("play_music", {"song_name": "random"}, 0.5)
+        if not residual:
+            return IntentDecision("play_music", {"song_name": "random"}, 0.9)
+        # 曲库里没有的歌名交给 LLM 判断
+        return IntentDecision("play_music", {"song_name": residual}, 0.6)
+
+    def _rule_weather(self, norm, by_kind):
+        if "get_weather" not in self._functions or "get_weather" not in by_kind:
+            return None
+        residual = self._residual(
+            norm, by_kind["get_weather"], _WEATHER_FILLERS + _QUESTION_WORDS
+        )
+        arguments = {"lang": "zh_CN"}
+        if not residual:
+            return IntentDecision("get_weather", arguments, 0.9)
+        if self._is_location(residual):
+            arguments["location"] = residual
+            return IntentDecision("get_weather", arguments, 0.85)
+        # 剩余文本不是已知地点（如“温度调高一点”“我讨厌下雨天”）时交给 LLM
+        return IntentDecision("get_weather", arguments, 0.5)
+
+    def _is_location(self, text: str) -> bool:
+        if not 2 <= len(text) <= 8 or not all("一" <= ch <= "鿿" for ch in text):
+            return False
+        return text in self.weather_locations or text.endswith(_LOCATION_SUFFIXES)
+
+    def _rule_news(self, norm, by_kind, has_negation):
+        name = self._news_function()
+        if name is None or has_negation:
+            return None
+        detail = "news_detail" in by_kind
+        if "news" not in by_kind and not (detail and "新闻" in norm):
+            return None
+        arguments: Dict[str, Any] = {"lang": "zh_CN"}
+        matched = list(by_kind.get("news", []))
+        sources = by_kind.get("news_source", [])
+        if sources and name == "get_news_from_newsnow":
+            source_match = max(sources, key=lambda m: len(m[1]))
+            arguments["source"] = source_match[2]
+            matched.append(source_match)
+        if detail:
+            arguments["detail"] = True
+            matched.extend(by_kind["news_detail"])
+        residual = self._residual(
+            norm, matched, ("最新", "的", "这", "条", "一下", "看看", "说说", "讲讲", "播报")
+        )
+        return IntentDecision(name, arguments, 0.9 if len(residual) <= 3 else 0.6)
+
+    def _rule_hass(self, norm, by_kind, has_negation):
+        devices = by_kind.get("hass_device", [])
+        if not devices or has_negation:
+            return None
+        # 同名设备按位置区分
+        candidates = {value for _, _, value in devices}
+        if len(candidates) > 1:
+            located = {d for d in candidates if d[0] and d[0] in norm}
+            candidates = located or candidates
+        if len(candidates) != 1:
+            return None
+        location, device_name, entity_id = next(iter(candidates))
+        actions = [
+            action
+            for kind, action in (
+                ("hass_on", "turn_on"),
+                ("hass_off", "turn_off"),
+                ("hass_pause", "pause"),
+                ("hass_continue", "continue"),
+            )
+            if kind in by_kind
+        ]
+        if "hass_state" in by_kind and not actions and "hass_get_state" in self._functions:
+            return IntentDecision("hass_get_state", {"entity_id": entity_id}, 0.85)
+        if len(actions) != 1 or "hass_set_state" not in self._functions:
+            return None
+        return IntentDecision(
+            "hass_set_state",
+            {"entity_id": entity_id, "state": {"type": actions[0]}},
+            0.95,
+        )
+
+    def classify_local(self, text: str) -> Optional[IntentDecision]:
+        """本地分类器层：只接受不需要额外参数、或参数能由规则补全的类别"""
+        norm = normalize_text(text)
+        prediction = self.classifier.predict(norm)
+        if prediction is None:
+            return None
+        label, score, margin = prediction
+        if score < self.local_threshold or margin < self.local_margin:
+            return None
+        if label == CONTINUE_CHAT:
+            # 含有任何函数关键词时不在本地判定为闲聊
+            if self._automaton.search(norm):
+                return None
+            return IntentDecision(CONTINUE_CHAT, {}, score, "local")
+        rule = self.match_rules(text)
+        if rule is not None and rule.name == label:
+            # 规则层认为有歧义（如“帮我退出音乐”）时不在本地判定
+            if rule.confidence < self.rule_threshold:
+                return None
+            return IntentDecision(label, rule.arguments, score, "local")
+        function = self._functions.get(label)
+        if function is not None and not (function.get("parameters") or {}).get("required"):
+            return IntentDecision(label, {}, score, "local")
+        return None
+
+    def learn(self, text: str, intent_json: str):
+        """记录 LLM 的判定结果，作为本地分类器的样本"""
+        try:
+            data = json.loads(intent_json)
+        except (TypeError, ValueError):
+            return
+        function_call = data.get("function_call") if isinstance(data, dict) else None
+        if not isinstance(function_call, dict):
+            return
+        name = function_call.get("name")
+        if name == CONTINUE_CHAT or name in self._functions:
+            self.classifier.add(name, normalize_text(text))
+
+    # ---------- 统计 ----------
+
+    def record(self, tier: str, elapsed: float):
+        stats = self._stats[tier]
+        stats["hits"] += 1
+        stats["time"] += elapsed
+        self._total += 1
+        if self._total % _STATS_LOG_INTERVAL == 0:
+            logger.bind(tag=TAG).info(f"意图路由统计: {self.format_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        result = {"total": self._total}
+        for tier, stats in self._stats.items():
+            hits = stats["hits"]
+            result[tier] = {
+                "hits": hits,
+                "rate": hits / self._total if self._total else 0.0,
+                "avg_ms": stats["time"] * 1000 / hits if hits else 0.0,
+            }
+        return result
+
+    def format_stats(self) -> str:
+        stats = self.get_stats()
+        return ", ".join(
+            f"{tier} {stats[tier]['hits']}次({stats[tier]['rate']:.1%}, {stats[tier]['avg_ms']:.1f}ms)"
+            for tier in TIERS
+        )
@@ -3,5 +3,6 @@
 from .mcp_manager import ServerMCPManager
 from .mcp_executor import ServerMCPExecutor
 from .mcp_client import ServerMCPClient
+from .mcp_pool import ServerMCPPool
 
-__all__ = ["ServerMCPManager", "ServerMCPExecutor", "ServerMCPClient"]
+__all__ = ["ServerMCPManager", "ServerMCPExecutor", "ServerMCPClient", "ServerMCPPool"]
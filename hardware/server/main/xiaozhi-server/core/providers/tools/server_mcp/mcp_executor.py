@@ -1,9 +1,10 @@
 """服务端MCP工具执行器"""
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from ..base import ToolType, ToolDefinition, ToolExecutor
 from plugins_func.register import Action, ActionResponse
 from .mcp_manager import ServerMCPManager
+from .mcp_pool import ServerMCPPool
 
 
 class ServerMCPExecutor(ToolExecutor):
@@ -11,14 +12,22 @@ class ServerMCPExecutor(ToolExecutor):
 
     def __init__(self, conn):
         self.conn = conn
-        self.mcp_manager: Optional[ServerMCPManager] = None
+        self.mcp_manager: Optional[Union[ServerMCPManager, ServerMCPPool]] = None
+        # 是否借用的是 WebSocketServer 的共享连接池（连接关闭时不能清理）
+        self._shared = False
         self._initialized = False
 
     async def initialize(self):
-        """初始化MCP管理器"""
+        """初始化MCP管理器，优先借用服务端共享的MCP连接池"""
         if not self._initialized:
-            self.mcp_manager = ServerMCPManager(self.conn)
-            await self.mcp_manager.initialize_servers()
+            mcp_pool = getattr(getattr(self.conn, "server", None), "mcp_pool", None)
+            if mcp_pool is not None:
+                await mcp_pool.wait_ready()
+                self.mcp_manager = mcp_pool
+                self._shared = True
+            else:
+                self.mcp_manager = ServerMCPManager(self.conn)
+                await self.mcp_manager.initialize_servers()
             self._initialized = True
 
     async def execute(
@@ -84,6 +93,6 @@ class ServerMCPExecutor(ToolExecutor):
         return self.mcp_manager.is_mcp_tool(actual_tool_name)
 
     async def cleanup(self):
-        """清理MCP连接"""
-        if self.mcp_manager:
+        """清理MCP连接（共享连接池由 WebSocketServer 负责关闭）"""
+        if self.mcp_manager and not self._shared:
             await self.mcp_manager.cleanup_all()
@@ -0,0 +1,219 @@
+"""服务端MCP连接池（进程内所有连接共享）"""
+
+import asyncio
+import os
+import json
+from typing import Dict, Any, List, Optional
+from config.config_loader import get_project_dir
+from config.logger import setup_logging
+from .mcp_client import ServerMCPClient
+
+TAG = __name__
+logger = setup_logging()
+
+
+class ServerMCPPool:
+    """
+    进程级的服务端MCP连接池，由 WebSocketServer 持有
+
+    启动时并行连接 data/.mcp_server_settings.json 中的全部服务，各连接共用同一组客户端；
+    每个服务用信号量限制同时进行的调用数，工具目录在连接或重启后缓存，
+    后台定期做健康检查，断开或无响应的服务自动重启。
+
+    配置（config.yaml 中的 mcp_pool）:
+        - max_concurrent_calls: 每个服务同时进行的调用数上限，默认 8
+        - health_check_interval: 健康检查间隔（秒），0 表示不检查，默认 30
+        - ready_timeout: 连接初始化时等待连接池就绪的最长时间（秒），默认 30
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        pool_config = config.get("mcp_pool") or {}
+        self.max_concurrent_calls = int(pool_config.get("max_concurrent_calls", 8))
+        self.health_check_interval = float(pool_config.get("health_check_interval", 30))
+        self.ready_timeout = float(pool_config.get("ready_timeout", 30))
+
+        self.config_path = get_project_dir() + "data/.mcp_server_settings.json"
+        if not os.path.exists(self.config_path):
+            self.config_path = ""
+        self.server_configs: Dict[str, Dict[str, Any]] = {}
+        self.clients: Dict[str, ServerMCPClient] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._restart_locks: Dict[str, asyncio.Lock] = {}
+        # 工具目录缓存：工具名 -> 服务名，以及 function 定义列表
+        self._tool_owner: Dict[str, str] = {}
+        self._tools: List[Dict[str, Any]] = []
+        self._ready = asyncio.Event()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def load_config(self) -> Dict[str, Any]:
+        """加载MCP服务配置"""
+        if len(self.config_path) == 0:
+            return {}
+
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            return config.get("mcpServers", {})
+        except Exception as e:
+            logger.bind(tag=TAG).error(
+                f"Error loading MCP config from {self.config_path}: {e}"
+            )
+            return {}
+
+    async def start(self) -> None:
+        """并行启动所有MCP服务，完成后开始健康检查"""
+        try:
+            for name, srv_config in self.load_config().items():
+                if not srv_config.get("command") and not srv_config.get("url"):
+                    logger.bind(tag=TAG).warning(
+                        f"Skipping server {name}: neither command nor url specified"
+                    )
+                    continue
+                self.server_configs[name] = srv_config
+                self._semaphores[name] = asyncio.Semaphore(self.max_concurrent_calls)
+                self._restart_locks[name] = asyncio.Lock()
+
+            if self.server_configs:
+                await asyncio.gather(
+                    *(self._connect(name) for name in self.server_configs)
+                )
+                self._rebuild_catalog()
+                logger.bind(tag=TAG).info(
+                    f"服务端MCP连接池已就绪: {len(self.clients)}/{len(self.server_configs)}个服务, "
+                    f"{len(self._tools)}个工具"
+                )
+        finally:
+            self._ready.set()
+
+        if self.server_configs and self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def wait_ready(self) -> bool:
+        """等待连接池启动完成，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=self.ready_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.bind(tag=TAG).warning("等待服务端MCP连接池就绪超时")
+            return False
+
+    async def _connect(self, name: str) -> bool:
+        """连接（或重新连接）一个服务"""
+        try:
+            logger.bind(tag=TAG).info(f"初始化服务端MCP客户端: {name}")
+            client = ServerMCPClient(self.server_configs[name])
+            await client.initialize()
+            if not client.is_connected():
+                await client.cleanup()
+                raise RuntimeError("连接失败")
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Failed to initialize MCP server {name}: {e}")
+            return False
+
+        old = self.clients.get(name)
+        self.clients[name] = client
+        if old is not None:
+            try:
+                await asyncio.wait_for(old.cleanup(), timeout=20)
+            except (asyncio.TimeoutError, Exception) as e:
+                logger.bind(tag=TAG).error(f"关闭服务端MCP客户端 {name} 时出错: {e}")
+        return True
+
+    async def _restart(self, name: str, failed_client: Optional[ServerMCPClient]) -> bool:
+        """重启服务；多个调用同时失败时只重启一次"""
+        async with self._restart_locks[name]:
+            if failed_client is not None and self.clients.get(name) is not failed_client:
+                # 其他调用已经完成了重启
+                return True
+            logger.bind(tag=TAG).info(f"重新连接 MCP 客户端 {name}")
+            ok = await self._connect(name)
+            if ok:
+                self._rebuild_catalog()
+                logger.bind(tag=TAG).info(f"成功重新连接 MCP 客户端: {name}")
+            return ok
+
+    def _rebuild_catalog(self):
+        tool_owner = {}
+        tools = []
+        for name, client in self.clients.items():
+            for tool in client.get_available_tools():
+                tool_name = tool["function"]["name"]
+                if tool_name in tool_owner:
+                    continue
+                tool_owner[tool_name] = name
+                tools.append(tool)
+        self._tool_owner = tool_owner
+        self._tools = tools
+
+    async def _health_loop(self):
+        """定期检查各服务，断开或 ping 不通时重启"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for name in list(self.server_configs):
+                client = self.clients.get(name)
+                if client is not None and client.is_connected():
+                    ping = getattr(client.session, "send_ping", None)
+                    if ping is None:
+                        continue
+                    try:
+                        await asyncio.wait_for(ping(), timeout=10)
+                        continue
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.bind(tag=TAG).warning(f"MCP服务 {name} 健康检查失败: {e}")
+                await self._restart(name, client)
+
+    def get_all_tools(self) -> List[Dict[str, Any]]:
+        """获取所有服务的工具function定义（缓存）"""
+        return self._tools
+
+    def is_mcp_tool(self, tool_name: str) -> bool:
+        """检查是否是MCP工具"""
+        return tool_name in self._tool_owner
+
+    async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """执行工具调用，失败时会尝试重新连接"""
+        logger.bind(tag=TAG).info(f"执行服务端MCP工具 {tool_name}，参数: {arguments}")
+
+        max_retries = 3  # 最大重试次数
+        retry_interval = 2  # 重试间隔(秒)
+
+        # 找到对应的服务
+        client_name = self._tool_owner.get(tool_name)
+        if client_name is None:
+            raise ValueError(f"工具 {tool_name} 在任意MCP服务中未找到")
+
+        # 带重试机制的工具调用
+        for attempt in range(max_retries):
+            target_client = self.clients.get(client_name)
+            try:
+                if target_client is None:
+                    raise RuntimeError(f"MCP服务 {client_name} 未连接")
+                async with self._semaphores[client_name]:
+                    return await target_client.call_tool(tool_name, arguments)
+            except Exception as e:
+                # 最后一次尝试失败时直接抛出异常
+                if attempt == max_retries - 1:
+                    raise
+
+                logger.bind(tag=TAG).warning(
+                    f"执行工具 {tool_name} 失败 (尝试 {attempt+1}/{max_retries}): {e}"
+                )
+                await self._restart(client_name, target_client)
+
+                # 等待一段时间再重试
+                await asyncio.sleep(retry_interval)
+
+    async def close(self) -> None:
+        """关闭所有 MCP客户端（服务退出时调用）"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for name, client in list(self.clients.items()):
+            try:
+                await asyncio.wait_for(client.cleanup(), timeout=20)
+                logger.bind(tag=TAG).info(f"服务端MCP客户端已关闭: {name}")
+            except (asyncio.TimeoutError, Exception) as e:
+                logger.bind(tag=TAG).error(f"关闭服务端MCP客户端 {name} 时出错: {e}")
+        self.clients.clear()
@@ -1,5 +1,6 @@
 """服务端插件工具执行器"""
 
+import asyncio
 from typing import Dict, Any
 from ..base import ToolType, ToolDefinition, ToolExecutor
 from plugins_func.register import all_function_registry, Action, ActionResponse
@@ -23,20 +24,22 @@ class ServerPluginExecutor(ToolExecutor):
             )
 
         try:
+            # 插件函数是同步实现（内部可能有阻塞的网络请求），放到线程中执行，
+            # 不阻塞事件循环，同一轮的多个工具调用可以并发
             # 根据工具类型决定如何调用
             if hasattr(func_item, "type"):
                 func_type = func_item.type
                 if func_type.code in [4, 5]:  # SYSTEM_CTL, IOT_CTL (需要conn参数)
-                    result = func_item.func(conn, **arguments)
+                    result = await asyncio.to_thread(func_item.func, conn, **arguments)
                 elif func_type.code == 2:  # WAIT
-                    result = func_item.func(**arguments)
+                    result = await asyncio.to_thread(func_item.func, **arguments)
                 elif func_type.code == 3:  # CHANGE_SYS_PROMPT
-                    result = func_item.func(conn, **arguments)
+                    result = await asyncio.to_thread(func_item.func, conn, **arguments)
                 else:
-                    result = func_item.func(**arguments)
+                    result = await asyncio.to_thread(func_item.func, **arguments)
             else:
                 # 默认不传conn参数
-                result = func_item.func(**arguments)
+                result = await asyncio.to_thread(func_item.func, **arguments)
 
             return result
 
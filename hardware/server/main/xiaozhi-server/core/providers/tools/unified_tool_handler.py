@@ -1,6 +1,7 @@
 """统一工具处理器"""
 
 import json
+import asyncio
 from typing import Dict, List, Any, Optional
 from config.logger import setup_logging
 from plugins_func.loadplugins import auto_import_modules
@@ -50,6 +51,11 @@ class UnifiedToolHandler:
             ToolType.MCP_ENDPOINT, self.mcp_endpoint_executor
         )
 
+        # 工具调用超时（秒）：默认值和按工具名单独设置的值
+        tool_call_config = self.config.get("tool_call") or {}
+        self.default_timeout = float(tool_call_config.get("timeout", 30))
+        self.tool_timeouts = tool_call_config.get("timeouts") or {}
+
         # 初始化标志
         self.finish_init = False
 
@@ -140,15 +146,17 @@ class UnifiedToolHandler:
     ) -> Optional[ActionResponse]:
         """处理LLM函数调用"""
         try:
-            # 处理多函数调用
+            # 处理多函数调用（并发执行）
             if "function_calls" in function_call_data:
-                responses = []
-                for call in function_call_data["function_calls"]:
-                    result = await self.tool_manager.execute_tool(
-                        call["name"], call.get("arguments", {})
+                responses = await asyncio.gather(
+                    *(
+                        self._execute_with_timeout(
+                            call["name"], call.get("arguments", {})
+                        )
+                        for call in function_call_data["function_calls"]
                     )
-                    responses.append(result)
-                return self._combine_responses(responses)
+                )
+                return self._combine_responses(list(responses))
 
             # 处理单函数调用
             function_name = function_call_data["name"]
@@ -168,13 +176,35 @@ class UnifiedToolHandler:
             self.logger.debug(f"调用函数: {function_name}, 参数: {arguments}")
 
             # 执行工具调用
-            result = await self.tool_manager.execute_tool(function_name, arguments)
+            result = await self._execute_with_timeout(function_name, arguments)
             return result
 
         except Exception as e:
             self.logger.error(f"处理function call错误: {e}")
             return ActionResponse(action=Action.ERROR, response=str(e))
 
+    def get_tool_timeout(self, tool_name: str) -> float:
+        """获取工具调用的超时时间，0 表示不限制"""
+        return float(self.tool_timeouts.get(tool_name, self.default_timeout))
+
+    async def _execute_with_timeout(
+        self, tool_name: str, arguments: Dict[str, Any]
+    ) -> ActionResponse:
+        """执行工具调用，超时后返回错误，不影响同一轮的其他工具"""
+        timeout = self.get_tool_timeout(tool_name)
+        try:
+            return await asyncio.wait_for(
+                self.tool_manager.execute_tool(tool_name, arguments),
+                timeout=timeout if timeout > 0 else None,
+            )
+        except asyncio.TimeoutError:
+            self.logger.error(f"工具调用超时: {tool_name}, 超时时间: {timeout}秒")
+            return ActionResponse(
+                action=Action.ERROR,
+                result=f"工具 {tool_name} 调用超时",
+                response="操作超时了，请稍后再试",
+            )
+
     def _combine_responses(self, responses: List[ActionResponse]) -> ActionResponse:
         """合并多个函数调用的响应"""
         if not responses:
@@ -1,5 +1,6 @@
 import uuid
 import json
+import asyncio
 import hmac
 import hashlib
 import base64
@@ -10,6 +11,7 @@ from config.logger import setup_logging
 import time
 import uuid
 from urllib import parse
+from core.utils.http_client import http_request
 
 TAG = __name__
 logger = setup_logging()
@@ -166,7 +168,7 @@ class TTSProvider(TTSProviderBase):
     async def text_to_speak(self, text, output_file):
         if self._is_token_expired():
             logger.warning("Token已过期，正在自动刷新...")
-            self._refresh_token()
+            await asyncio.to_thread(self._refresh_token)
         request_json = {
             "appkey": self.appkey,
             "token": self.token,
@@ -181,13 +183,13 @@ class TTSProvider(TTSProviderBase):
 
         # print(self.api_url, json.dumps(request_json, ensure_ascii=False))
         try:
-            resp = requests.post(
-                self.api_url, json.dumps(request_json), headers=self.header
+            resp = await http_request(
+                "POST", self.api_url, data=json.dumps(request_json), headers=self.header
             )
             if resp.status_code == 401:  # Token过期特殊处理
-                self._refresh_token()
-                resp = requests.post(
-                    self.api_url, json.dumps(request_json), headers=self.header
+                await asyncio.to_thread(self._refresh_token)
+                resp = await http_request(
+                    "POST", self.api_url, data=json.dumps(request_json), headers=self.header
                 )
             # 检查返回请求数据的mime类型是否是audio/***，是则保存到指定路径下；返回的是binary格式的
             if resp.headers["Content-Type"].startswith("audio/"):
@@ -4,7 +4,6 @@ import hmac
 import hashlib
 import base64
 import time
-import queue
 import asyncio
 import traceback
 from asyncio import Task
@@ -17,10 +16,14 @@ from core.providers.tts.dto.dto import SentenceType, ContentType, InterfaceType
 from core.utils.tts import MarkdownCleaner
 from core.utils import opus_encoder_utils, textUtils
 from config.logger import setup_logging
+from core.utils.ws_pool import provider_ws_pool, is_ws_open
 
 TAG = __name__
 logger = setup_logging()
 
+# 10秒内才可以复用链接进行连续对话
+WS_IDLE_TTL = 10
+
 
 class AccessToken:
     @staticmethod
@@ -176,6 +179,26 @@ class TTSProvider(TTSProviderBase):
             return False
         return time.time() > self.expire_time
 
+    @property
+    def pool_key(self) -> str:
+        # 按账号区分而不是按 Token：Token 只在握手时校验，刷新后已建立的连接仍可复用
+        return f"aliyun_tts|{self.ws_url}|{self.appkey}|{self.access_key_id or self.token}"
+
+    async def _connect(self):
+        """建立新的WebSocket连接（由连接池调用，后台补充预连接时 Token 可能已过期）"""
+        if self._is_token_expired():
+            await asyncio.to_thread(self._refresh_token)
+        logger.bind(tag=TAG).info("开始建立新连接...")
+        ws = await websockets.connect(
+            self.ws_url,
+            additional_headers={"X-NLS-Token": self.token},
+            ping_interval=30,
+            ping_timeout=10,
+            close_timeout=10,
+        )
+        logger.bind(tag=TAG).info("WebSocket连接建立成功")
+        return ws
+
     async def _ensure_connection(self):
         """确保WebSocket连接可用"""
         try:
@@ -183,20 +206,18 @@ class TTSProvider(TTSProviderBase):
                 logger.bind(tag=TAG).warning("Token已过期，正在自动刷新...")
                 self._refresh_token()
             current_time = time.time()
-            if self.ws and current_time - self.last_active_time < 10:
-                # 10秒内才可以复用链接进行连续对话
+            if is_ws_open(self.ws) and current_time - self.last_active_time < WS_IDLE_TTL:
                 logger.bind(tag=TAG).info(f"使用已有链接...")
                 return self.ws
-            logger.bind(tag=TAG).info("开始建立新连接...")
-
-            self.ws = await websockets.connect(
-                self.ws_url,
-                additional_headers={"X-NLS-Token": self.token},
-                ping_interval=30,
-                ping_timeout=10,
-                close_timeout=10,
+            if self.ws:
+                # 空闲过久的连接可能已被服务端关闭，不再使用
+                provider_ws_pool.release(self.pool_key, self.ws, reusable=False)
+                self.ws = None
+
+            # 从连接池租用（预连接或其他连接归还的连接）
+            self.ws = await provider_ws_pool.lease(
+                self.pool_key, self._connect, WS_IDLE_TTL
             )
-            logger.bind(tag=TAG).info("WebSocket连接建立成功")
             self.last_active_time = time.time()
             return self.ws
         except Exception as e:
@@ -205,11 +226,11 @@ class TTSProvider(TTSProviderBase):
             self.last_active_time = None
             raise
 
-    def tts_text_priority_thread(self):
-        """流式文本处理线程"""
+    async def tts_text_priority_task(self):
+        """流式文本处理任务"""
         while not self.conn.stop_event.is_set():
             try:
-                message = self.tts_text_queue.get(timeout=1)
+                message = await self.tts_text_queue.get()
                 logger.bind(tag=TAG).debug(
                     f"收到TTS任务｜{message.sentence_type.name} ｜ {message.content_type.name} | 会话ID: {self.conn.sentence_id}"
                 )
@@ -219,7 +240,7 @@ class TTSProvider(TTSProviderBase):
                     self.reset_flow_controller()
 
                 if self.conn.client_abort:
-                    logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理线程")
+                    logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理任务")
                     continue
 
                 if message.sentence_type == SentenceType.FIRST:
@@ -235,11 +256,7 @@ class TTSProvider(TTSProviderBase):
                         self.message_id = str(uuid.uuid4().hex)
 
                         logger.bind(tag=TAG).info("开始启动TTS会话...")
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.start_session(self.conn.sentence_id),
-                            loop=self.conn.loop,
-                        )
-                        future.result()
+                        await self.start_session(self.conn.sentence_id)
                         self.before_stop_play_files.clear()
                         logger.bind(tag=TAG).info("TTS会话启动成功")
 
@@ -253,11 +270,7 @@ class TTSProvider(TTSProviderBase):
                             logger.bind(tag=TAG).debug(
                                 f"开始发送TTS文本: {message.content_detail}"
                             )
-                            future = asyncio.run_coroutine_threadsafe(
-                                self.text_to_speak(message.content_detail, None),
-                                loop=self.conn.loop,
-                            )
-                            future.result()
+                            await self.text_to_speak(message.content_detail, None)
                             logger.bind(tag=TAG).debug("TTS文本发送成功")
                         except Exception as e:
                             logger.bind(tag=TAG).error(f"发送TTS文本失败: {str(e)}")
@@ -269,21 +282,15 @@ class TTSProvider(TTSProviderBase):
                     )
                     if message.content_file and os.path.exists(message.content_file):
                         # 先处理文件音频数据
-                        self._process_audio_file_stream(message.content_file, callback=lambda audio_data: self.handle_audio_file(audio_data, message.content_detail))
+                        await self._process_audio_file_stream(message.content_file, callback=lambda audio_data: self.handle_audio_file(audio_data, message.content_detail))
                 if message.sentence_type == SentenceType.LAST:
                     try:
                         logger.bind(tag=TAG).info("开始结束TTS会话...")
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.finish_session(self.conn.sentence_id),
-                            loop=self.conn.loop,
-                        )
-                        future.result()
+                        await self.finish_session(self.conn.sentence_id)
                     except Exception as e:
                         logger.bind(tag=TAG).error(f"结束TTS会话失败: {str(e)}")
                         continue
 
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.bind(tag=TAG).error(
                     f"处理TTS文本失败: {str(e)}, 类型: {type(e).__name__}, 堆栈: {traceback.format_exc()}"
@@ -399,6 +406,11 @@ class TTSProvider(TTSProviderBase):
 
     async def close(self):
         """资源清理"""
+        # 没有进行中的会话、且仍在可复用时间内的连接归还连接池
+        reusable = (
+            self._monitor_task is None or self._monitor_task.done()
+        ) and self.last_active_time is not None
+        idle_for = time.time() - self.last_active_time if reusable else 0.0
         if self._monitor_task:
             try:
                 self._monitor_task.cancel()
@@ -410,10 +422,7 @@ class TTSProvider(TTSProviderBase):
             self._monitor_task = None
 
         if self.ws:
-            try:
-                await self.ws.close()
-            except:
-                pass
+            provider_ws_pool.release(self.pool_key, self.ws, reusable, idle_for)
             self.ws = None
             self.last_active_time = None
 
@@ -1,19 +1,23 @@
 import os
 import re
-import queue
+import json
 import uuid
+import hashlib
 import asyncio
-import threading
-from typing import Callable, Any
+from typing import Callable, Any, Optional
 from core.utils import p3
 import time
 from datetime import datetime
 from core.utils import textUtils
 from abc import ABC, abstractmethod
 from config.logger import setup_logging
-from core.utils.audio_flow_control import FlowControlConfig, simulate_device_consumption
-from core.utils.util import audio_bytes_to_data_stream, audio_to_data_stream
+from core.utils.audio_flow_control import FlowControlConfig
+from core.utils.util import audio_bytes_to_data_stream, audio_to_data_stream, new_sentence_encoder
+from core.utils.loop_queue import LoopQueue
+from core.utils.sentence_segmenter import SentenceSegmenter
+from core.utils.cache.tts_cache import tts_audio_cache
 from core.utils.tts import MarkdownCleaner
+from core.utils.opus_encoder_utils import OpusEncoderUtils
 from core.utils.output_counter import add_device_output
 from core.handle.reportHandle import enqueue_tts_report
 from core.handle.sendAudioHandle import sendAudioMessage
@@ -38,40 +42,31 @@ class TTSProviderBase(ABC):
         self.delete_audio_file = delete_audio_file
         self.audio_file_type = "wav"
         self.output_file = config.get("output_dir", "tmp/")
-        self.tts_text_queue = queue.Queue()
-        self.tts_audio_queue = queue.Queue()
+        # 两个队列都可以跨线程投递，由事件循环中的协程消费
+        self.tts_text_queue = LoopQueue()
+        self.tts_audio_queue = LoopQueue()
         self.tts_audio_first_sentence = True
         self.before_stop_play_files = []
 
-        self.tts_text_buff = []
-        self.punctuations = (
-            "。",
-            "？",
-            "?",
-            "！",
-            "!",
-            "；",
-            ";",
-            "：",
-        )
-        self.first_sentence_punctuations = (
-            "，",
-            "~",
-            "、",
-            ",",
-            "。",
-            "？",
-            "?",
-            "！",
-            "!",
-            "；",
-            ";",
-            "：",
-        )
+        # LLM 流式文本的增量分句器
+        self.segmenter = SentenceSegmenter()
         self.tts_stop_request = False
-        self.processed_chars = 0
-        self.is_first_sentence = True
         self.flow_controller = FlowControlConfig.create_flow_controller()
+        # 整句音频转Opus时复用的编码器（每个连接一个TTS实例，即每个连接一个编码器）
+        self._sentence_encoder = None
+        # 缓存键中的提供方配置签名，配置（音色、语速、接口等）变化时缓存自然失效
+        self._cache_signature = hashlib.sha256(
+            json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        # 文本处理与音频播放任务（运行在连接的事件循环中）
+        self._text_task = None
+        self._audio_play_task = None
+
+    @property
+    def sentence_encoder(self) -> OpusEncoderUtils:
+        if self._sentence_encoder is None:
+            self._sentence_encoder = new_sentence_encoder()
+        return self._sentence_encoder
 
     def generate_filename(self, extension=".wav"):
         return os.path.join(
@@ -86,21 +81,70 @@ class TTSProviderBase(ABC):
     def handle_audio_file(self, file_audio: bytes, text):
         self.before_stop_play_files.append((file_audio, text))
 
-    def to_tts_stream(self, text, opus_handler: Callable[[bytes], None] = None) -> None:
+    def tts_cache_key(self, text) -> Optional[str]:
+        """句子缓存键，返回 None 表示不缓存（缓存关闭、文本过长或输出不是 Opus）"""
+        if not tts_audio_cache.accepts(text):
+            return None
+        if (
+            not self.delete_audio_file
+            and self.conn is not None
+            and self.conn.audio_format == "pcm"
+        ):
+            return None
+        provider = f"{type(self).__module__}:{self._cache_signature}"
+        return tts_audio_cache.make_key(
+            provider, str(getattr(self, "voice", "") or ""), text
+        )
+
+    async def to_tts_stream(
+        self, text, opus_handler: Callable[[bytes], None] = None
+    ) -> None:
         text = MarkdownCleaner.clean_markdown(text)
+        cache_key = self.tts_cache_key(text)
+        if cache_key is None:
+            await self._synthesize_stream(text, opus_handler)
+            return None
+
+        packets = tts_audio_cache.get(cache_key)
+        if packets is not None:
+            logger.bind(tag=TAG).info(f"语音缓存命中: {text}")
+            self.tts_audio_queue.put((SentenceType.FIRST, None, text))
+            for packet in packets:
+                opus_handler(packet)
+            return None
+
+        # 未命中：合成的同时收集 Opus 帧，成功后写入缓存
+        packets = []
+
+        def collect_opus(opus_data):
+            packets.append(opus_data)
+            opus_handler(opus_data)
+
+        if await self._synthesize_stream(text, collect_opus) and packets:
+            await asyncio.to_thread(tts_audio_cache.put, cache_key, packets)
+        return None
+
+    async def _synthesize_stream(
+        self, text, opus_handler: Callable[[bytes], None] = None
+    ) -> bool:
+        """调用 TTS 合成一句话并把 Opus 帧交给 opus_handler，返回是否成功"""
         max_repeat_time = 5
         if self.delete_audio_file:
             # 需要删除文件的直接转为音频数据
             while max_repeat_time > 0:
                 try:
-                    audio_bytes = asyncio.run(self.text_to_speak(text, None))
+                    audio_bytes = await self.text_to_speak(text, None)
                     if audio_bytes:
                         self.tts_audio_queue.put((SentenceType.FIRST, None, text))
-                        audio_bytes_to_data_stream(
+                        # 解码与Opus编码是CPU计算，放到共享线程池，避免占用事件循环
+                        await asyncio.to_thread(
+                            audio_bytes_to_data_stream,
                             audio_bytes,
                             file_type=self.audio_file_type,
                             is_opus=True,
                             callback=opus_handler,
+                            encoder=self.sentence_encoder,
+                            pcm_sample_rate=int(getattr(self, "sample_rate", 16000) or 16000),
                         )
                         break
                     else:
@@ -118,13 +162,13 @@ class TTSProviderBase(ABC):
                 logger.bind(tag=TAG).error(
                     f"语音生成失败: {text}，请检查网络或服务是否正常"
                 )
-            return None
+            return max_repeat_time > 0
         else:
             tmp_file = self.generate_filename()
             try:
                 while not os.path.exists(tmp_file) and max_repeat_time > 0:
                     try:
-                        asyncio.run(self.text_to_speak(text, tmp_file))
+                        await self.text_to_speak(text, tmp_file)
                     except Exception as e:
                         logger.bind(tag=TAG).warning(
                             f"语音生成失败{5 - max_repeat_time + 1}次: {text}，错误: {e}"
@@ -143,10 +187,58 @@ class TTSProviderBase(ABC):
                         f"语音生成失败: {text}，请检查网络或服务是否正常"
                     )
                     self.tts_audio_queue.put((SentenceType.FIRST, None, text))
-                self._process_audio_file_stream(tmp_file, callback=opus_handler)
+                await self._process_audio_file_stream(tmp_file, callback=opus_handler)
+                return max_repeat_time > 0
             except Exception as e:
                 logger.bind(tag=TAG).error(f"Failed to generate TTS file: {e}")
-                return None
+                return False
+
+    async def prewarm_cache(self, text) -> bool:
+        """预先合成一句话并写入缓存（不经过播放队列），返回缓存中是否已有该句"""
+        if self.interface_type != InterfaceType.NON_STREAM:
+            # 流式接口不经过 to_tts_stream，不使用句子缓存
+            return False
+        text = MarkdownCleaner.clean_markdown(
+            textUtils.get_string_no_punctuation_or_emoji(text)
+        )
+        cache_key = self.tts_cache_key(text)
+        if cache_key is None:
+            return False
+        if tts_audio_cache.contains(cache_key):
+            return True
+
+        packets = []
+        audio_bytes = None
+        try:
+            audio_bytes = await self.text_to_speak(text, None)
+        except Exception:
+            audio_bytes = None
+        if audio_bytes:
+            await asyncio.to_thread(
+                audio_bytes_to_data_stream,
+                audio_bytes,
+                file_type=self.audio_file_type,
+                is_opus=True,
+                callback=packets.append,
+                encoder=self.sentence_encoder,
+                pcm_sample_rate=int(getattr(self, "sample_rate", 16000) or 16000),
+            )
+        else:
+            # 只支持输出到文件的提供方
+            tmp_file = self.generate_filename()
+            try:
+                await self.text_to_speak(text, tmp_file)
+                if os.path.exists(tmp_file):
+                    await asyncio.to_thread(
+                        self.audio_to_opus_data_stream, tmp_file, callback=packets.append
+                    )
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+        if not packets:
+            return False
+        await asyncio.to_thread(tts_audio_cache.put, cache_key, packets)
+        return True
 
     @abstractmethod
     async def text_to_speak(self, text, output_file):
@@ -162,7 +254,12 @@ class TTSProviderBase(ABC):
         self, audio_file_path, callback: Callable[[Any], Any] = None
     ):
         """音频文件转换为Opus编码"""
-        return audio_to_data_stream(audio_file_path, is_opus=True, callback=callback)
+        return audio_to_data_stream(
+            audio_file_path,
+            is_opus=True,
+            callback=callback,
+            encoder=self.sentence_encoder,
+        )
 
     def tts_one_sentence(
         self,
@@ -195,78 +292,94 @@ class TTSProviderBase(ABC):
     async def open_audio_channels(self, conn):
         self.conn = conn
         self.tts_timeout = conn.config.get("tts_timeout", 10)
-        # tts 消化线程
-        self.tts_priority_thread = threading.Thread(
-            target=self.tts_text_priority_thread, daemon=True
-        )
-        self.tts_priority_thread.start()
-
-        # 音频播放 消化线程
-        self.audio_play_priority_thread = threading.Thread(
-            target=self._audio_play_priority_thread, daemon=True
-        )
-        self.audio_play_priority_thread.start()
+        self.segmenter.configure(conn.config)
+        self.flow_controller = FlowControlConfig.create_flow_controller(conn.config)
+        loop = asyncio.get_running_loop()
+        self.tts_text_queue.bind(loop)
+        self.tts_audio_queue.bind(loop)
+        # tts 消化任务
+        self._text_task = loop.create_task(self.tts_text_priority_task())
+        # 音频播放 消化任务
+        self._audio_play_task = loop.create_task(self._audio_play_priority_task())
+
+    async def close_audio_channels(self):
+        """停止文本处理与音频播放任务"""
+        current = asyncio.current_task()
+        tasks = [
+            task
+            for task in (self._text_task, self._audio_play_task)
+            if task is not None and not task.done() and task is not current
+        ]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._text_task = None
+        self._audio_play_task = None
 
     # 这里默认是非流式的处理方式
     # 流式处理方式请在子类中重写
-    def tts_text_priority_thread(self):
+    async def tts_text_priority_task(self):
         while not self.conn.stop_event.is_set():
             try:
-                message = self.tts_text_queue.get(timeout=1)
+                message = await self._next_text_message()
+                if message is None:
+                    # 第一句等待超时，提前送入TTS
+                    for segment_text, timing in self._poll_segment_texts():
+                        await self._speak_segment(
+                            segment_text, timing, opus_handler=self.handle_opus
+                        )
+                    continue
                 if message.sentence_type == SentenceType.FIRST:
                     self.conn.client_abort = False
                 if self.conn.client_abort:
-                    logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理线程")
+                    logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理任务")
                     continue
                 if message.sentence_type == SentenceType.FIRST:
                     # 初始化参数
                     self.tts_stop_request = False
-                    self.processed_chars = 0
-                    self.tts_text_buff = []
-                    self.is_first_sentence = True
+                    self.segmenter.reset()
                     self.tts_audio_first_sentence = True
                     self.reset_flow_controller()
                 elif ContentType.TEXT == message.content_type:
-                    self.tts_text_buff.append(message.content_detail)
-                    segment_text = self._get_segment_text()
-                    if segment_text:
-                        self.to_tts_stream(segment_text, opus_handler=self.handle_opus)
+                    for segment_text, timing in self._get_segment_texts(
+                        message.content_detail
+                    ):
+                        await self._speak_segment(
+                            segment_text, timing, opus_handler=self.handle_opus
+                        )
                 elif ContentType.FILE == message.content_type:
-                    self._process_remaining_text_stream(opus_handler=self.handle_opus)
+                    await self._process_remaining_text_stream(
+                        opus_handler=self.handle_opus
+                    )
                     tts_file = message.content_file
                     if tts_file and os.path.exists(tts_file):
-                        self._process_audio_file_stream(
+                        await self._process_audio_file_stream(
                             tts_file, callback=self.handle_opus
                         )
                 if message.sentence_type == SentenceType.LAST:
-                    self._process_remaining_text_stream(opus_handler=self.handle_opus)
+                    await self._process_remaining_text_stream(
+                        opus_handler=self.handle_opus
+                    )
+                    self._log_segment_timings()
                     self.tts_audio_queue.put(
                         (message.sentence_type, [], message.content_detail)
                     )
 
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.bind(tag=TAG).error(
                     f"处理TTS文本失败: {str(e)}, 类型: {type(e).__name__}, 堆栈: {traceback.format_exc()}"
                 )
                 continue
 
-    def _audio_play_priority_thread(self):
+    async def _audio_play_priority_task(self):
         # 需要上报的文本和音频列表
         enqueue_text = None
         enqueue_audio = None
         while not self.conn.stop_event.is_set():
             text = None
             try:
-                try:
-                    sentence_type, audio_datas, text = self.tts_audio_queue.get(
-                        timeout=0.1
-                    )
-                except queue.Empty:
-                    if self.conn.stop_event.is_set():
-                        break
-                    continue
+                sentence_type, audio_datas, text = await self.tts_audio_queue.get()
 
                 if self.conn.client_abort:
                     logger.bind(tag=TAG).debug("收到打断信号，跳过当前音频数据")
@@ -293,72 +406,27 @@ class TTSProviderBase(ABC):
                 if self.conn.max_output_size > 0 and text:
                     add_device_output(self.conn.headers.get("device-id"), len(text))
 
-                # 流控检查
+                # 按帧时长的节奏发送，设备端只保留少量预缓冲
                 if frame_count > 0:
-                    max_wait_time = FlowControlConfig.DEFAULT_MAX_WAIT_TIME
-                    wait_start_time = time.time()
-                    retry_interval = FlowControlConfig.DEFAULT_RETRY_INTERVAL
-
-                    while not self.flow_controller.can_send_frames(frame_count):
-                        # 检查是否超时或需要停止
-                        if (
-                            time.time() - wait_start_time > max_wait_time
-                            or self.conn.stop_event.is_set()
-                            or self.conn.client_abort
-                        ):
-                            logger.bind(tag=TAG).debug(
-                                "流控等待超时或收到停止信号，跳过音频发送"
-                            )
-                            break
-                        # 短暂等待后重试
-                        time.sleep(retry_interval)
-                    else:
-                        # 可以发送，记录发送的帧数
-                        self.flow_controller.record_sent_frames(frame_count)
-
-                        # 发送音频
-                        future = asyncio.run_coroutine_threadsafe(
-                            self._send_audio_with_flow_control(
-                                sentence_type, audio_datas, text
-                            ),
-                            self.conn.loop,
-                        )
-                        future.result()
-
-                        # 输出流控状态（调试用）
-                        # status = self.flow_controller.get_status()
-                        # logger.bind(tag=TAG).debug(
-                        #     f"流控状态: 缓冲区使用率={status['buffer_usage_percent']:.1f}%, "
-                        #     f"可用令牌={status['available_tokens']}..."
-                        #     f"发送帧数={status['sent_frames']}..."
-                        #     f"消费帧数={status['consumed_frames']}..."
-                        #     f"代播放帧数={status['sent_frames'] - status['consumed_frames']}..."
-                        # )
-                else:
-                    # 没有音频数据，直接发送
-                    future = asyncio.run_coroutine_threadsafe(
-                        self._send_audio_with_flow_control(
-                            sentence_type, audio_datas, text
-                        ),
-                        self.conn.loop,
-                    )
-                    future.result()
+                    await self.flow_controller.wait_for_slot()
+                    if self.conn.stop_event.is_set() or self.conn.client_abort:
+                        logger.bind(tag=TAG).debug("收到停止或打断信号，跳过音频发送")
+                        continue
+
+                # 直接在事件循环中发送音频
+                await self._send_audio_with_flow_control(
+                    sentence_type, audio_datas, text
+                )
+                if frame_count > 0:
+                    self.flow_controller.record_sent_frames(frame_count)
 
             except Exception as e:
-                logger.bind(tag=TAG).error(f"audio_play_priority_thread: {text} {e}")
+                logger.bind(tag=TAG).error(f"audio_play_priority_task: {text} {e}")
 
     async def _send_audio_with_flow_control(self, sentence_type, audio_datas, text):
-        """
-        带流控的音频发送方法 模拟设备消费音频帧的过程
-        实际应用中应该根据设备反馈来更新消费情况
-        """
+        """发送音频，发送节奏由 _audio_play_priority_task 中的 flow_controller 控制"""
         await sendAudioMessage(self.conn, sentence_type, audio_datas, text)
 
-        # 模拟设备消费（实际应用中应该从设备获取反馈）防止音字不同步
-        if isinstance(audio_datas, bytes):
-            frame_count = 1
-            asyncio.create_task(simulate_device_consumption(self.flow_controller, frame_count))
-
     # 在类中添加流控制器重置方法
     def reset_flow_controller(self):
         """重置流控制器状态，通常在新会话开始时调用"""
@@ -377,60 +445,88 @@ class TTSProviderBase(ABC):
         if hasattr(self, "ws") and self.ws:
             await self.ws.close()
 
-    def _get_segment_text(self):
-        # 合并当前全部文本并处理未分割部分
-        full_text = "".join(self.tts_text_buff)
-        current_text = full_text[self.processed_chars :]  # 从未处理的位置开始
-        last_punct_pos = -1
-
-        # 根据是否是第一句话选择不同的标点符号集合
-        punctuations_to_use = (
-            self.first_sentence_punctuations
-            if self.is_first_sentence
-            else self.punctuations
-        )
-
-        for punct in punctuations_to_use:
-            pos = current_text.rfind(punct)
-            if (pos != -1 and last_punct_pos == -1) or (
-                pos != -1 and pos < last_punct_pos
-            ):
-                last_punct_pos = pos
-
-        if last_punct_pos != -1:
-            segment_text_raw = current_text[: last_punct_pos + 1]
-            segment_text = textUtils.get_string_no_punctuation_or_emoji(
-                segment_text_raw
-            )
-            self.processed_chars += len(segment_text_raw)  # 更新已处理字符位置
+    async def _next_text_message(self):
+        """
+        取下一条TTS文本消息；第一句设置了等待超时且LLM输出停顿时，
+        到期返回 None，由调用方通过 _poll_segment_texts() 提前切出第一句
+        """
+        wait_left = self.segmenter.first_sentence_wait_left()
+        if wait_left is None:
+            return await self.tts_text_queue.get()
+        try:
+            return await asyncio.wait_for(self.tts_text_queue.get(), wait_left)
+        except asyncio.TimeoutError:
+            return None
 
-            # 如果是第一句话，在找到第一个逗号后，将标志设置为False
-            if self.is_first_sentence:
-                self.is_first_sentence = False
+    def _get_segment_texts(self, text):
+        """
+        追加一段LLM输出的文本，返回可以送入TTS的句子及其分句耗时记录
+        （句子已去掉首尾标点与表情）
+        """
+        return self._clean_segments(self.segmenter.push(text))
+
+    def _poll_segment_texts(self):
+        """第一句等待超时检查，返回提前切出的句子（同 _get_segment_texts）"""
+        segment = self.segmenter.poll()
+        return self._clean_segments([segment] if segment is not None else [])
+
+    def _clean_segments(self, segments):
+        if not segments:
+            return []
+        # 本次切出的句子对应最后几条分句耗时记录
+        timings = self.segmenter.timings[-len(segments):]
+        result = []
+        for segment, timing in zip(segments, timings):
+            segment_text = textUtils.get_string_no_punctuation_or_emoji(segment)
+            if segment_text:
+                result.append((segment_text, timing))
+        return result
 
-            return segment_text
-        elif self.tts_stop_request and current_text:
-            segment_text = current_text
-            self.is_first_sentence = True  # 重置标志
-            return segment_text
-        else:
-            return None
+    async def _speak_segment(
+        self, segment_text, timing=None, opus_handler: Callable[[bytes], None] = None
+    ):
+        """合成一句话，并记录该句的合成耗时"""
+        start = time.monotonic()
+        await self.to_tts_stream(segment_text, opus_handler=opus_handler)
+        if timing is not None:
+            timing.synthesis_ms = (time.monotonic() - start) * 1000
+            logger.bind(tag=TAG).debug(f"分句耗时: {timing.to_dict()} {segment_text}")
+
+    def _log_segment_timings(self):
+        """输出本轮回复的分句耗时，用于调整分句参数"""
+        timings = self.segmenter.timings
+        if not timings:
+            return
+        first = timings[0]
+        synthesis = [t.synthesis_ms for t in timings if t.synthesis_ms is not None]
+        logger.bind(tag=TAG).info(
+            f"本轮分句{len(timings)}句: 首句{first.chars}字({first.reason})，"
+            f"首句切分耗时{first.since_turn_ms:.0f}ms，"
+            f"首句合成{first.synthesis_ms or 0:.0f}ms，"
+            f"平均合成{(sum(synthesis) / len(synthesis)) if synthesis else 0:.0f}ms"
+        )
 
-    def _process_audio_file_stream(
+    async def _process_audio_file_stream(
         self, tts_file, callback: Callable[[Any], Any]
     ) -> None:
-        """处理音频文件并转换为指定格式
+        """处理音频文件并转换为指定格式（文件读取与编码在共享线程池中执行）
 
         Args:
             tts_file: 音频文件路径
             callback: 文件处理函数
         """
         if tts_file.endswith(".p3"):
-            p3.decode_opus_from_file_stream(tts_file, callback=callback)
+            await asyncio.to_thread(
+                p3.decode_opus_from_file_stream, tts_file, callback=callback
+            )
         elif self.conn.audio_format == "pcm":
-            self.audio_to_pcm_data_stream(tts_file, callback=callback)
+            await asyncio.to_thread(
+                self.audio_to_pcm_data_stream, tts_file, callback=callback
+            )
         else:
-            self.audio_to_opus_data_stream(tts_file, callback=callback)
+            await asyncio.to_thread(
+                self.audio_to_opus_data_stream, tts_file, callback=callback
+            )
 
         if (
             self.delete_audio_file
@@ -446,7 +542,7 @@ class TTSProviderBase(ABC):
         self.before_stop_play_files.clear()
         self.tts_audio_queue.put((SentenceType.LAST, [], None))
 
-    def _process_remaining_text_stream(
+    async def _process_remaining_text_stream(
         self, opus_handler: Callable[[bytes], None] = None
     ):
         """处理剩余的文本并生成语音
@@ -454,12 +550,12 @@ class TTSProviderBase(ABC):
         Returns:
             bool: 是否成功处理了文本
         """
-        full_text = "".join(self.tts_text_buff)
-        remaining_text = full_text[self.processed_chars :]
+        remaining_text = self.segmenter.flush()
         if remaining_text:
             segment_text = textUtils.get_string_no_punctuation_or_emoji(remaining_text)
             if segment_text:
-                self.to_tts_stream(segment_text, opus_handler=opus_handler)
-                self.processed_chars += len(full_text)
+                await self._speak_segment(
+                    segment_text, self.segmenter.last_timing, opus_handler=opus_handler
+                )
                 return True
         return False
@@ -1,5 +1,5 @@
-import requests
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import http_request
 
 
 class TTSProvider(TTSProviderBase):
@@ -29,7 +29,7 @@ class TTSProvider(TTSProviderBase):
         }
 
         try:
-            response = requests.request(
+            response = await http_request(
                 "POST", self.api_url, json=request_json, headers=headers
             )
             data = response.content
@@ -1,7 +1,6 @@
 import os
 import uuid
 import json
-import queue
 import asyncio
 import traceback
 from typing import Callable, Any
@@ -10,6 +9,7 @@ from core.utils.tts import MarkdownCleaner
 from config.logger import setup_logging
 from core.utils import opus_encoder_utils
 from core.utils.util import check_model_key
+from core.utils.ws_pool import provider_ws_pool, is_ws_open
 from core.providers.tts.base import TTSProviderBase
 from core.providers.tts.dto.dto import SentenceType, ContentType, InterfaceType
 from asyncio import Task
@@ -18,6 +18,9 @@ from asyncio import Task
 TAG = __name__
 logger = setup_logging()
 
+# 连接在服务端的最长空闲时间（秒），空闲连接超过后不再复用
+WS_IDLE_TTL = 60
+
 PROTOCOL_VERSION = 0b0001
 DEFAULT_HEADER_SIZE = 0b0001
 
@@ -162,6 +165,10 @@ class TTSProvider(TTSProviderBase):
         self.ws_url = config.get("ws_url")
         self.authorization = config.get("authorization")
         self.header = {"Authorization": f"{self.authorization}{self.access_token}"}
+        # 连接跨会话复用，连接关闭时正常结束的连接归还连接池，供其他连接直接使用
+        self.pool_key = (
+            f"huoshan_tts|{self.ws_url}|{self.appId}|{self.access_token}|{self.resource_id}"
+        )
         self.enable_two_way = True
         self.tts_text = ""
         self.opus_encoder = opus_encoder_utils.OpusEncoderUtils(
@@ -179,34 +186,41 @@ class TTSProvider(TTSProviderBase):
             self.ws = None
             raise
 
+    async def _connect(self):
+        """建立新的WebSocket连接（由连接池调用）"""
+        logger.bind(tag=TAG).info("开始建立新连接...")
+        ws_header = {
+            "X-Api-App-Key": self.appId,
+            "X-Api-Access-Key": self.access_token,
+            "X-Api-Resource-Id": self.resource_id,
+            "X-Api-Connect-Id": str(uuid.uuid4()),
+        }
+        ws = await websockets.connect(
+            self.ws_url, additional_headers=ws_header, max_size=1000000000
+        )
+        logger.bind(tag=TAG).info("WebSocket连接建立成功")
+        return ws
+
     async def _ensure_connection(self):
-        """建立新的WebSocket连接"""
+        """获取可用的WebSocket连接，没有时从连接池租用"""
         try:
-            if self.ws:
+            if is_ws_open(self.ws):
                 logger.bind(tag=TAG).info(f"使用已有链接...")
                 return self.ws
-            logger.bind(tag=TAG).info("开始建立新连接...")
-            ws_header = {
-                "X-Api-App-Key": self.appId,
-                "X-Api-Access-Key": self.access_token,
-                "X-Api-Resource-Id": self.resource_id,
-                "X-Api-Connect-Id": uuid.uuid4(),
-            }
-            self.ws = await websockets.connect(
-                self.ws_url, additional_headers=ws_header, max_size=1000000000
+            self.ws = await provider_ws_pool.lease(
+                self.pool_key, self._connect, WS_IDLE_TTL
             )
-            logger.bind(tag=TAG).info("WebSocket连接建立成功")
             return self.ws
         except Exception as e:
             logger.bind(tag=TAG).error(f"建立连接失败: {str(e)}")
             self.ws = None
             raise
 
-    def tts_text_priority_thread(self):
-        """火山引擎双流式TTS的文本处理线程"""
+    async def tts_text_priority_task(self):
+        """火山引擎双流式TTS的文本处理任务"""
         while not self.conn.stop_event.is_set():
             try:
-                message = self.tts_text_queue.get(timeout=1)
+                message = await self.tts_text_queue.get()
                 logger.bind(tag=TAG).debug(
                     f"收到TTS任务｜{message.sentence_type.name} ｜ {message.content_type.name} | 会话ID: {self.conn.sentence_id}"
                 )
@@ -217,11 +231,8 @@ class TTSProvider(TTSProviderBase):
 
                 if self.conn.client_abort:
                     try:
-                        logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理线程")
-                        asyncio.run_coroutine_threadsafe(
-                            self.cancel_session(self.conn.sentence_id),
-                            loop=self.conn.loop,
-                        )
+                        logger.bind(tag=TAG).info("收到打断信息，终止TTS文本处理任务")
+                        await self.cancel_session(self.conn.sentence_id)
                         continue
                     except Exception as e:
                         logger.bind(tag=TAG).error(f"取消TTS会话失败: {str(e)}")
@@ -235,11 +246,7 @@ class TTSProvider(TTSProviderBase):
                             logger.bind(tag=TAG).info(f"自动生成新的 会话ID: {self.conn.sentence_id}")
 
                         logger.bind(tag=TAG).info("开始启动TTS会话...")
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.start_session(self.conn.sentence_id),
-                            loop=self.conn.loop,
-                        )
-                        future.result()
+                        await self.start_session(self.conn.sentence_id)
                         self.before_stop_play_files.clear()
                         logger.bind(tag=TAG).info("TTS会话启动成功")
                     except Exception as e:
@@ -252,11 +259,7 @@ class TTSProvider(TTSProviderBase):
                             logger.bind(tag=TAG).debug(
                                 f"开始发送TTS文本: {message.content_detail}"
                             )
-                            future = asyncio.run_coroutine_threadsafe(
-                                self.text_to_speak(message.content_detail, None),
-                                loop=self.conn.loop,
-                            )
-                            future.result()
+                            await self.text_to_speak(message.content_detail, None)
                             logger.bind(tag=TAG).debug("TTS文本发送成功")
                         except Exception as e:
                             logger.bind(tag=TAG).error(f"发送TTS文本失败: {str(e)}")
@@ -268,21 +271,15 @@ class TTSProvider(TTSProviderBase):
                     )
                     if message.content_file and os.path.exists(message.content_file):
                         # 先处理文件音频数据
-                        self._process_audio_file_stream(message.content_file, callback=lambda audio_data: self.handle_audio_file(audio_data, message.content_detail))
+                        await self._process_audio_file_stream(message.content_file, callback=lambda audio_data: self.handle_audio_file(audio_data, message.content_detail))
                 if message.sentence_type == SentenceType.LAST:
                     try:
                         logger.bind(tag=TAG).info("开始结束TTS会话...")
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.finish_session(self.conn.sentence_id),
-                            loop=self.conn.loop,
-                        )
-                        future.result()
+                        await self.finish_session(self.conn.sentence_id)
                     except Exception as e:
                         logger.bind(tag=TAG).error(f"结束TTS会话失败: {str(e)}")
                         continue
 
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.bind(tag=TAG).error(
                     f"处理TTS文本失败: {str(e)}, 类型: {type(e).__name__}, 堆栈: {traceback.format_exc()}"
@@ -406,6 +403,8 @@ class TTSProvider(TTSProviderBase):
 
     async def close(self):
         """资源清理方法"""
+        # 没有进行中的会话时，连接可以归还连接池继续使用
+        reusable = self._monitor_task is None or self._monitor_task.done()
         # 取消监听任务
         if self._monitor_task:
             try:
@@ -418,10 +417,7 @@ class TTSProvider(TTSProviderBase):
             self._monitor_task = None
 
         if self.ws:
-            try:
-                await self.ws.close()
-            except:
-                pass
+            provider_ws_pool.release(self.pool_key, self.ws, reusable)
             self.ws = None
 
     async def _start_monitor_tts_response(self):
@@ -6,6 +6,7 @@ from datetime import datetime
 from typing import Iterator, Optional, Union
 from core.providers.tts.base import TTSProviderBase
 from core.utils.util import parse_string_to_list
+from core.utils.http_client import http_request
 
 
 class TTSProvider(TTSProviderBase):
@@ -77,8 +78,8 @@ class TTSProvider(TTSProviderBase):
             request_json["voice_setting"]["voice_id"] = ""
 
         try:
-            resp = requests.post(
-                self.api_url, json.dumps(request_json), headers=self.header
+            resp = await http_request(
+                "POST", self.api_url, data=json.dumps(request_json), headers=self.header
             )
             if resp.json()["base_resp"]["status_code"] == 0:
                 data = resp.json()["data"]["audio"]
@@ -1,7 +1,7 @@
-import requests
 from core.utils.util import check_model_key
 from core.providers.tts.base import TTSProviderBase
 from config.logger import setup_logging
+from core.utils.http_client import http_request
 
 TAG = __name__
 logger = setup_logging()
@@ -41,7 +41,7 @@ class TTSProvider(TTSProviderBase):
             "response_format": "wav",
             "speed": self.speed,
         }
-        response = requests.post(self.api_url, json=data, headers=headers)
+        response = await http_request("POST", self.api_url, json=data, headers=headers)
         if response.status_code == 200:
             if output_file:
                 with open(output_file, "wb") as audio_file:
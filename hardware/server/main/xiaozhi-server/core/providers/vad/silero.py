@@ -1,26 +1,160 @@
 import time
+import queue
+import asyncio
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from typing import List
+
 import numpy as np
 import torch
-import opuslib_next
 from config.logger import setup_logging
 from core.providers.vad.base import VADProviderBase
 
 TAG = __name__
 logger = setup_logging()
 
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 512
+CONTEXT_SAMPLES = 64
+
+
+class _ModelState:
+    """单个连接的 Silero RNN 状态与上下文（各连接互不影响）"""
+
+    __slots__ = ("state", "context")
+
+    def __init__(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = np.zeros((1, CONTEXT_SAMPLES), dtype=np.float32)
+
+
+class _Request:
+    __slots__ = ("model_state", "window", "future")
+
+    def __init__(self, model_state: _ModelState, window: np.ndarray):
+        self.model_state = model_state
+        self.window = window
+        self.future = Future()
+
+
+class SileroBatchEngine:
+    """
+    跨连接批量推理的 Silero VAD
+
+    各连接提交 32ms 窗口后由专用工作线程合并成一个批次推理，
+    每个连接在一个批次中最多一个窗口（后续窗口依赖前一个窗口的 RNN 状态，顺延到下一批）。
+    """
+
+    def __init__(self, model, use_onnx: bool, max_batch_size: int, max_wait_ms: float):
+        self.model = model
+        self.use_onnx = use_onnx
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._worker, name="silero-vad-batch", daemon=True
+        )
+        self._thread.start()
+
+        # 统计信息
+        self.batches = 0
+        self.windows = 0
+
+    def submit(self, model_state: _ModelState, window: np.ndarray) -> Future:
+        """提交一个窗口（float32，512 采样点），返回语音概率的 Future"""
+        request = _Request(model_state, window)
+        self._queue.put(request)
+        return request.future
+
+    def infer(self, requests: List[_Request]) -> np.ndarray:
+        """同步推理一个批次（同一连接在批次中最多出现一次），并更新各连接状态"""
+        windows = np.stack([r.window for r in requests])
+        contexts = np.concatenate([r.model_state.context for r in requests])
+        states = np.concatenate([r.model_state.state for r in requests], axis=1)
+        with self._lock:
+            if self.use_onnx:
+                x = np.concatenate([contexts, windows], axis=1)
+                out, new_states = self.model.session.run(
+                    None,
+                    {
+                        "input": x,
+                        "state": states,
+                        "sr": np.array(SAMPLE_RATE, dtype=np.int64),
+                    },
+                )
+                probs = np.asarray(out).reshape(-1)
+            else:
+                # JIT 模型在内部保存状态，推理前换入各连接的状态，推理后取回
+                batch_size = len(requests)
+                self.model._state = torch.from_numpy(states)
+                self.model._context = torch.from_numpy(contexts)
+                self.model._last_sr = SAMPLE_RATE
+                self.model._last_batch_size = batch_size
+                with torch.no_grad():
+                    out = self.model(torch.from_numpy(windows), SAMPLE_RATE)
+                probs = out.reshape(-1).numpy()
+                new_states = self.model._state.numpy()
+        for i, request in enumerate(requests):
+            request.model_state.state = np.ascontiguousarray(new_states[:, i : i + 1])
+            request.model_state.context = windows[i : i + 1, -CONTEXT_SAMPLES:].copy()
+        self.batches += 1
+        self.windows += len(requests)
+        return probs
+
+    def _worker(self):
+        pending = deque()
+        while True:
+            if not pending:
+                pending.append(self._queue.get())
+            # 等待其他连接的窗口凑批，最多 max_wait
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    pending.append(
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+
+            batch, deferred, seen = [], deque(), set()
+            while pending and len(batch) < self.max_batch_size:
+                request = pending.popleft()
+                if id(request.model_state) in seen:
+                    deferred.append(request)
+                    continue
+                seen.add(id(request.model_state))
+                batch.append(request)
+            deferred.extend(pending)
+            pending = deferred
+
+            try:
+                probs = self.infer(batch)
+                for request, prob in zip(batch, probs):
+                    request.future.set_result(float(prob))
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"VAD批量推理失败: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+
 
 class VADProvider(VADProviderBase):
     def __init__(self, config):
         logger.bind(tag=TAG).info("SileroVAD", config)
+        use_onnx = str(config.get("use_onnx", False)).lower() in ("1", "true", "yes")
         self.model, _ = torch.hub.load(
             repo_or_dir=config["model_dir"],
             source="local",
             model="silero_vad",
             force_reload=False,
+            onnx=use_onnx,
         )
 
-        self.decoder = opuslib_next.Decoder(16000, 1)
-
         # 处理空字符串的情况
         threshold = config.get("threshold", "0.5")
         threshold_low = config.get("threshold_low", "0.2")
@@ -36,53 +170,82 @@ class VADProvider(VADProviderBase):
         # 至少要多少帧才算有语音,增加灵敏度
         self.frame_window_threshold = 1
 
-    def is_vad(self, conn, opus_packet):
-        try:
-            pcm_frame = self.decoder.decode(opus_packet, 960)
-            conn.client_audio_buffer.extend(pcm_frame)  # 将新数据加入缓冲区
+        # 批量推理：单批最多窗口数、凑批等待时间（毫秒）
+        max_batch_size = config.get("batch_max_size", 64)
+        max_wait_ms = config.get("batch_max_wait_ms", 2)
+        self.engine = SileroBatchEngine(
+            self.model,
+            use_onnx,
+            int(max_batch_size) if max_batch_size else 64,
+            float(max_wait_ms) if max_wait_ms not in (None, "") else 2.0,
+        )
+        # 每个连接独立的模型状态
+        self._model_states = weakref.WeakKeyDictionary()
 
-            # 处理缓冲区中的完整帧（每次处理512采样点）
-            client_have_voice = False
-            while len(conn.client_audio_buffer) >= 512 * 2:
-                # 提取前512个采样点（1024字节）
-                chunk = conn.client_audio_buffer[: 512 * 2]
-                conn.client_audio_buffer = conn.client_audio_buffer[512 * 2 :]
+    def _model_state(self, conn) -> _ModelState:
+        model_state = self._model_states.get(conn)
+        if model_state is None:
+            model_state = self._model_states[conn] = _ModelState()
+        return model_state
 
-                # 转换为模型需要的张量格式
-                audio_int16 = np.frombuffer(chunk, dtype=np.int16)
-                audio_float32 = audio_int16.astype(np.float32) / 32768.0
-                audio_tensor = torch.from_numpy(audio_float32)
+    @staticmethod
+    def _to_float(chunk) -> np.ndarray:
+        return chunk.astype(np.float32) / 32768.0
 
-                # 检测语音活动
-                with torch.no_grad():
-                    speech_prob = self.model(audio_tensor, 16000).item()
-
-                # 双阈值判断
-                if speech_prob >= self.vad_threshold:
-                    is_voice = True
-                elif speech_prob <= self.vad_threshold_low:
-                    is_voice = False
-                else:
-                    is_voice = conn.last_is_voice
-
-                # 声音没低于最低值则延续前一个状态，判断为有声音
-                conn.last_is_voice = is_voice
-
-                # 更新滑动窗口
-                conn.client_voice_window.append(is_voice)
-                client_have_voice = (conn.client_voice_window.count(True) >= self.frame_window_threshold)
-
-                # 如果之前有声音，但本次没有声音，且与上次有声音的时间差已经超过了静默阈值，则认为已经说完一句话
-                if conn.client_have_voice and not client_have_voice:
-                    stop_duration = time.time() * 1000 - conn.last_activity_time
-                    if stop_duration >= self.silence_threshold_ms:
-                        conn.client_voice_stop = True
-                if client_have_voice:
-                    conn.client_have_voice = True
-                    conn.last_activity_time = time.time() * 1000
+    def is_vad(self, conn, opus_packet):
+        """同步检测：在调用线程中直接推理（逐窗口，批大小为 1）"""
+        try:
+            model_state = self._model_state(conn)
+            client_have_voice = False
+            for chunk in conn.audio_frontend.vad_windows(WINDOW_SAMPLES):
+                request = _Request(model_state, self._to_float(chunk))
+                speech_prob = float(self.engine.infer([request])[0])
+                client_have_voice = self._update_state(conn, speech_prob)
+            return client_have_voice
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
 
+    async def detect(self, conn, opus_packet):
+        """异步检测：窗口提交到批量推理线程，等待结果期间不阻塞事件循环"""
+        try:
+            model_state = self._model_state(conn)
+            # 音频包已由连接的音频前端解码（每包只解码一次），这里只读取新的 512 采样点窗口
+            futures = [
+                self.engine.submit(model_state, self._to_float(chunk))
+                for chunk in conn.audio_frontend.vad_windows(WINDOW_SAMPLES)
+            ]
+            client_have_voice = False
+            for future in futures:
+                speech_prob = await asyncio.wrap_future(future)
+                client_have_voice = self._update_state(conn, speech_prob)
             return client_have_voice
-        except opuslib_next.OpusError as e:
-            logger.bind(tag=TAG).info(f"解码错误: {e}")
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
+
+    def _update_state(self, conn, speech_prob: float) -> bool:
+        # 双阈值判断
+        if speech_prob >= self.vad_threshold:
+            is_voice = True
+        elif speech_prob <= self.vad_threshold_low:
+            is_voice = False
+        else:
+            is_voice = conn.last_is_voice
+
+        # 声音没低于最低值则延续前一个状态，判断为有声音
+        conn.last_is_voice = is_voice
+
+        # 更新滑动窗口
+        conn.client_voice_window.append(is_voice)
+        client_have_voice = (
+            conn.client_voice_window.count(True) >= self.frame_window_threshold
+        )
+
+        # 如果之前有声音，但本次没有声音，且与上次有声音的时间差已经超过了静默阈值，则认为已经说完一句话
+        if conn.client_have_voice and not client_have_voice:
+            stop_duration = time.time() * 1000 - conn.last_activity_time
+            if stop_duration >= self.silence_threshold_ms:
+                conn.client_voice_stop = True
+        if client_have_voice:
+            conn.client_have_voice = True
+            conn.last_activity_time = time.time() * 1000
+        return client_have_voice
@@ -0,0 +1,125 @@
+"""
+进程内音频解码与重采样
+wav/pcm/mp3/flac/ogg 直接在进程内转换为 16kHz 单声道 16 位 PCM（mp3 需要 libsndfile>=1.1，soundfile 的安装包已自带），
+无需为每句话启动 ffmpeg 子进程；无法在进程内解码的格式返回 None，由调用方回退到 pydub
+"""
+
+import io
+import wave
+from typing import Optional
+
+import numpy as np
+
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+TARGET_SAMPLE_RATE = 16000
+
+try:
+    import soundfile  # type: ignore
+except ImportError:  # 未安装时 mp3 等格式回退到 pydub
+    soundfile = None
+
+# 低通滤波器缓存：(输入采样率, 输出采样率) -> 滤波器系数
+_lowpass_cache = {}
+
+
+def _lowpass(in_rate: int, out_rate: int, taps: int = 63) -> np.ndarray:
+    """降采样前的抗混叠低通滤波器（Hamming 窗 sinc）"""
+    key = (in_rate, out_rate)
+    kernel = _lowpass_cache.get(key)
+    if kernel is None:
+        cutoff = 0.5 * out_rate / in_rate * 0.95
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        kernel = (kernel / kernel.sum()).astype(np.float32)
+        _lowpass_cache[key] = kernel
+    return kernel
+
+
+def to_pcm16k(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    将 float32 样本（形状 [n] 或 [n, channels]，范围 -1~1）转换为 16kHz 单声道 16 位 PCM
+    """
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    samples = samples.astype(np.float32, copy=False)
+    if sample_rate != TARGET_SAMPLE_RATE and len(samples) > 0:
+        if sample_rate > TARGET_SAMPLE_RATE:
+            samples = np.convolve(
+                samples, _lowpass(sample_rate, TARGET_SAMPLE_RATE), mode="same"
+            )
+        out_len = int(round(len(samples) * TARGET_SAMPLE_RATE / sample_rate))
+        positions = np.arange(out_len, dtype=np.float64) * (sample_rate / TARGET_SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def _int_pcm_to_float(raw: bytes, sample_width: int, channels: int) -> np.ndarray:
+    if sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        data = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        value = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        value = np.where(value >= 1 << 23, value - (1 << 24), value)
+        data = value.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        data = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"不支持的采样位宽: {sample_width}")
+    if channels > 1:
+        data = data[: len(data) // channels * channels].reshape(-1, channels)
+    return data
+
+
+def decode_wav(audio_bytes: bytes) -> Optional[bytes]:
+    """解码整数 PCM 编码的 WAV，其他编码（如 float WAV）返回 None"""
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
+            channels = wf.getnchannels()
+            sample_width = wf.getsampwidth()
+            sample_rate = wf.getframerate()
+            raw = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if sample_rate == TARGET_SAMPLE_RATE and channels == 1 and sample_width == 2:
+        # 已是目标格式，无需转换
+        return raw[: len(raw) // 2 * 2]
+    return to_pcm16k(_int_pcm_to_float(raw, sample_width, channels), sample_rate)
+
+
+def decode_to_pcm16k(
+    audio_bytes: bytes, file_type: str, pcm_sample_rate: int = TARGET_SAMPLE_RATE
+) -> Optional[bytes]:
+    """
+    在进程内把音频数据转换为 16kHz 单声道 16 位 PCM
+
+    Args:
+        audio_bytes: 音频二进制数据
+        file_type: 格式（wav、pcm、mp3 ...）
+        pcm_sample_rate: file_type 为 pcm 时原始数据的采样率
+
+    Returns:
+        PCM 数据；格式不支持时返回 None
+    """
+    file_type = (file_type or "").lower().lstrip(".")
+    try:
+        if file_type == "pcm":
+            raw = audio_bytes[: len(audio_bytes) // 2 * 2]
+            if pcm_sample_rate == TARGET_SAMPLE_RATE:
+                return raw
+            return to_pcm16k(_int_pcm_to_float(raw, 2, 1), pcm_sample_rate)
+        if file_type == "wav":
+            pcm = decode_wav(audio_bytes)
+            if pcm is not None:
+                return pcm
+        if soundfile is not None and file_type in ("wav", "mp3", "flac", "ogg"):
+            samples, sample_rate = soundfile.read(io.BytesIO(audio_bytes), dtype="float32")
+            return to_pcm16k(samples, sample_rate)
+    except Exception as e:
+        logger.bind(tag=TAG).debug(f"进程内解码失败({file_type})，回退到ffmpeg: {e}")
+    return None
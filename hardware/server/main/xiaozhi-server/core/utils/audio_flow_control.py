@@ -1,201 +1,197 @@
 """
 音频流控模块
-包含令牌桶算法和音频流控制器的实现
+按 Opus 帧时长（60ms）的固定节奏在事件循环中发送音频帧：
+每轮回复开头先连续发送少量预缓冲帧，之后每帧按计划时间点发送，
+设备端缓冲始终保持在预缓冲帧数左右，既不会溢出也不会积压过多导致打断延迟
 """
 
-import asyncio
 import time
-import threading
-from collections import deque
+import asyncio
 from typing import Optional, Dict, Any
 
+from config.logger import setup_logging
 
-class TokenBucket:
-    """令牌桶实现，用于限流控制"""
-
-    def __init__(self, capacity: int, refill_rate: float, initial_tokens: Optional[int] = None):
-        """
-        初始化令牌桶
-
-        Args:
-            capacity: 桶容量（最大令牌数）
-            refill_rate: 令牌补充速率（每秒补充的令牌数）
-            initial_tokens: 初始令牌数，默认为桶容量
-        """
-        self.capacity = capacity
-        self.refill_rate = refill_rate
-        self.tokens = initial_tokens if initial_tokens is not None else capacity
-        self.last_refill_time = time.time()
-        self.lock = threading.Lock()
+TAG = __name__
+logger = setup_logging()
 
-    def get_tokens(self, requested_tokens: int = 1) -> bool:
-        """
-        获取指定数量的令牌
-
-        Args:
-            requested_tokens: 请求的令牌数量
-
-        Returns:
-            bool: 是否成功获取到令牌
-        """
-        with self.lock:
-            self._refill_tokens()
-
-            if self.tokens >= requested_tokens:
-                self.tokens -= requested_tokens
-                return True
-            else:
-                return False
-
-    def get_available_tokens(self) -> int:
-        """获取当前可用令牌数"""
-        with self.lock:
-            self._refill_tokens()
-            return int(self.tokens)
-
-    def _refill_tokens(self):
-        """内部方法：补充令牌"""
-        current_time = time.time()
-        time_passed = current_time - self.last_refill_time
-        tokens_to_add = time_passed * self.refill_rate
-
-        self.tokens = min(self.capacity, self.tokens + tokens_to_add)
-        self.last_refill_time = current_time
 
+class FlowControlConfig:
+    """流控配置（config.yaml 中的 audio_pacing）"""
 
-class AudioFlowController:
-    """音频流控制器，基于令牌桶算法控制音频数据发送"""
+    # Opus 帧时长（毫秒）
+    OPUS_FRAME_DURATION_MS = 60
+    # 预缓冲帧数：每轮回复开头（以及欠载后）不等待直接发送的帧数
+    PRE_BUFFER_FRAMES = 5
+    # 每多少轮回复输出一次全局统计
+    STATS_LOG_INTERVAL = 100
 
-    def __init__(self, max_device_buffer: int = 3000, refill_rate: float = 20):
+    @classmethod
+    def create_flow_controller(cls, config: Optional[Dict[str, Any]] = None) -> "FramePacer":
         """
-        初始化音频流控制器
+        创建帧节奏控制器
 
         Args:
-            max_device_buffer: 设备端最大缓冲区大小（Opus帧数）
-            refill_rate: 令牌补充速率（每秒允许发送的帧数）
+            config: 全局配置，读取其中的 audio_pacing 部分
         """
-        self.max_device_buffer = max_device_buffer
-        self.token_bucket = TokenBucket(
-            capacity=max_device_buffer,
-            refill_rate=refill_rate,
-            initial_tokens=max_device_buffer // 2  # 初始令牌为容量的一半
+        pacing_config = (config or {}).get("audio_pacing") or {}
+        return FramePacer(
+            frame_duration_ms=float(
+                pacing_config.get("frame_duration_ms", cls.OPUS_FRAME_DURATION_MS)
+            ),
+            pre_buffer_frames=int(
+                pacing_config.get("pre_buffer_frames", cls.PRE_BUFFER_FRAMES)
+            ),
         )
-        self.sent_frames_count = 0  # 已发送帧数计数
-        self.device_consumed_frames = 0  # 设备端已消费帧数
-        self.pending_queue = deque()  # 等待发送的数据队列
-        self._lock = threading.Lock()
 
-    def can_send_frames(self, frame_count: int) -> bool:
-        """
-        检查是否可以发送指定数量的帧
-
-        Args:
-            frame_count: 要发送的帧数
-
-        Returns:
-            bool: 是否可以发送
-        """
-        with self._lock:
-            # 检查设备端缓冲区是否会溢出
-            estimated_device_buffer = self.sent_frames_count - self.device_consumed_frames
-            if estimated_device_buffer + frame_count > self.max_device_buffer:
-                return False
 
-            # 检查令牌桶是否有足够令牌
-            return self.token_bucket.get_tokens(frame_count)
-
-    def update_device_consumption(self, consumed_frames: int):
-        """
-        更新设备端消费的帧数
+class PacingStats:
+    """所有连接的发送节奏统计"""
+
+    def __init__(self):
+        self.replies = 0
+        self.frames = 0
+        self.underruns = 0
+        self.jitter_sum_ms = 0.0
+        self.jitter_max_ms = 0.0
+        self.paced_frames = 0
+
+    def add(self, pacer: "FramePacer"):
+        self.replies += 1
+        self.frames += pacer.frames_sent
+        self.underruns += pacer.underruns
+        self.jitter_sum_ms += pacer.jitter_sum_ms
+        self.paced_frames += pacer.paced_frames
+        self.jitter_max_ms = max(self.jitter_max_ms, pacer.jitter_max_ms)
+        if self.replies % FlowControlConfig.STATS_LOG_INTERVAL == 0:
+            logger.bind(tag=TAG).info(f"音频发送节奏统计: {self.get_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "replies": self.replies,
+            "frames": self.frames,
+            "underruns": self.underruns,
+            "jitter_avg_ms": round(
+                self.jitter_sum_ms / self.paced_frames if self.paced_frames else 0.0, 2
+            ),
+            "jitter_max_ms": round(self.jitter_max_ms, 2),
+        }
+
+
+# 全局统计实例
+pacing_stats = PacingStats()
+
+
+class FramePacer:
+    """
+    帧节奏控制器（只在连接的事件循环中使用）
 
-        Args:
-            consumed_frames: 设备端消费的帧数
-        """
-        with self._lock:
-            self.device_consumed_frames += consumed_frames
+    以本轮第一帧的发送时间为锚点，估算设备端已播放的帧数：
+    第 n 帧（从 0 开始）的计划发送时间 = 锚点 + (n - 预缓冲帧数) × 帧时长，
+    早于计划时间的帧 sleep 到计划时间再发送（一次 sleep，不轮询）。
+    生产方跟不上导致设备端缓冲耗尽时记为一次欠载，并重新预缓冲。
+    设备上报播放进度（或进入聆听状态表示已播完）时用实际进度校正锚点。
+    """
 
-    def record_sent_frames(self, frame_count: int):
+    def __init__(self, frame_duration_ms: float = 60, pre_buffer_frames: int = 5):
+        self.frame_duration = frame_duration_ms / 1000
+        self.pre_buffer_frames = max(0, pre_buffer_frames)
+        self._reset_state()
+
+    def _reset_state(self):
+        # 锚点：设备开始播放 _anchor_index 号帧的时间
+        self._anchor: Optional[float] = None
+        self._anchor_index = 0
+        self.frames_sent = 0
+        self.paced_frames = 0
+        self.underruns = 0
+        self.jitter_sum_ms = 0.0
+        self.jitter_max_ms = 0.0
+        self.wait_total = 0.0
+
+    @staticmethod
+    def _now() -> float:
+        return time.monotonic()
+
+    def _deadline(self, index: int) -> float:
+        """第 index 帧的计划发送时间"""
+        return self._anchor + (
+            index - self._anchor_index - self.pre_buffer_frames
+        ) * self.frame_duration
+
+    def buffered_frames(self) -> float:
+        """估算的设备端缓冲帧数"""
+        if self._anchor is None:
+            return 0.0
+        played = (self._now() - self._anchor) / self.frame_duration
+        return self.frames_sent - self._anchor_index - played
+
+    async def wait_for_slot(self) -> float:
         """
-        记录已发送的帧数
+        等待下一帧的发送时间点
 
-        Args:
-            frame_count: 发送的帧数
+        Returns:
+            实际等待的秒数
         """
-        with self._lock:
-            self.sent_frames_count += frame_count
+        now = self._now()
+        index = self.frames_sent
+        if self._anchor is None:
+            self._anchor = now
+            self._anchor_index = index
+            return 0.0
+        if self.buffered_frames() < 0:
+            # 设备端已经播完了已发送的帧：记为欠载，从当前帧开始重新预缓冲
+            self.underruns += 1
+            self._anchor = now
+            self._anchor_index = index
+            return 0.0
+        deadline = self._deadline(index)
+        if deadline <= now:
+            # 预缓冲阶段或生产方稍慢，直接发送
+            return 0.0
+        await asyncio.sleep(deadline - now)
+        # 实际发送时间与计划时间的偏差
+        jitter_ms = abs(self._now() - deadline) * 1000
+        self.paced_frames += 1
+        self.jitter_sum_ms += jitter_ms
+        if jitter_ms > self.jitter_max_ms:
+            self.jitter_max_ms = jitter_ms
+        waited = deadline - now
+        self.wait_total += waited
+        return waited
+
+    def record_sent_frames(self, frame_count: int = 1):
+        """记录已发送的帧数"""
+        self.frames_sent += frame_count
+
+    def on_device_ack(self, played_frames: int):
+        """设备上报本轮已播放的帧数时，按实际进度校正锚点"""
+        if self._anchor is None:
+            return
+        played_frames = max(0, min(played_frames, self.frames_sent))
+        self._anchor = self._now() - played_frames * self.frame_duration
+        self._anchor_index = 0
+
+    def on_device_drained(self):
+        """设备已播完全部音频（例如进入聆听状态），下一帧重新预缓冲"""
+        if self._anchor is not None:
+            self.on_device_ack(self.frames_sent)
 
     def get_status(self) -> Dict[str, Any]:
-        """获取流控状态信息"""
-        with self._lock:
-            estimated_buffer = self.sent_frames_count - self.device_consumed_frames
-            return {
-                "sent_frames": self.sent_frames_count,
-                "consumed_frames": self.device_consumed_frames,
-                "estimated_device_buffer": estimated_buffer,
-                "available_tokens": self.token_bucket.get_available_tokens(),
-                "pending_queue_size": len(self.pending_queue),
-                "buffer_usage_percent": (estimated_buffer / self.max_device_buffer) * 100
-            }
+        """获取本轮的发送节奏状态"""
+        return {
+            "sent_frames": self.frames_sent,
+            "estimated_device_buffer": round(self.buffered_frames(), 2),
+            "underruns": self.underruns,
+            "jitter_avg_ms": round(
+                self.jitter_sum_ms / self.paced_frames if self.paced_frames else 0.0, 2
+            ),
+            "jitter_max_ms": round(self.jitter_max_ms, 2),
+            "wait_total_s": round(self.wait_total, 3),
+        }
 
     def reset(self):
-        """重置流控状态"""
-        with self._lock:
-            self.sent_frames_count = 0
-            self.device_consumed_frames = 0
-            self.pending_queue.clear()
-            # 重新初始化令牌桶
-            self.token_bucket = TokenBucket(
-                capacity=self.max_device_buffer,
-                refill_rate=self.token_bucket.refill_rate,
-                initial_tokens=self.max_device_buffer // 2
-            )
-
-
-async def simulate_device_consumption(
-    flow_controller: AudioFlowController, frame_count: int
-):
-    """
-    模拟设备消费音频帧的过程
-    实际应用中应该根据设备反馈来更新消费情况
-    Args:
-        flow_controller: 流控制器实例
-        frame_count: 消费的帧数
-    """
-    # 模拟设备播放延迟（60ms per frame）
-    await asyncio.sleep(frame_count * 0.06)
-    flow_controller.update_device_consumption(frame_count)
-
-
-# 流控配置常量
-class FlowControlConfig:
-    """流控配置常量"""
-    # Opus 编码参数
-    OPUS_FRAME_DURATION_MS = 60  # Opus帧时长（毫秒）
-    OPUS_FRAMES_PER_SECOND = 1000 / OPUS_FRAME_DURATION_MS  # 每秒帧数
-
-    # 默认流控参数
-    DEFAULT_MAX_DEVICE_BUFFER = 40  # 设备端最大缓冲帧数
-    DEFAULT_REFILL_RATE = OPUS_FRAMES_PER_SECOND  # 默认令牌补充速率（帧/秒）
-    DEFAULT_MAX_WAIT_TIME = 5.0  # 流控最大等待时间（秒）
-    DEFAULT_RETRY_INTERVAL = 0.06  # 流控重试间隔（秒）
-
-    # 预缓冲参数
-    PRE_BUFFER_FRAMES = 3  # 预缓冲帧数
-
-    @classmethod
-    def create_flow_controller(cls, max_buffer: Optional[int] = None,
-                               refill_rate: Optional[float] = None) -> AudioFlowController:
-        """
-        创建流控制器的工厂方法
-
-        Args:
-            max_buffer: 最大缓冲区大小，使用默认值如果为None
-            refill_rate: 令牌补充速率，使用默认值如果为None
-
-        Returns:
-            AudioFlowController: 配置好的流控制器实例
-        """
-        return AudioFlowController(
-            max_device_buffer=max_buffer or cls.DEFAULT_MAX_DEVICE_BUFFER,
-            refill_rate=refill_rate or cls.DEFAULT_REFILL_RATE
-        )
+        """新一轮回复开始时调用，记录上一轮的统计并重置状态"""
+        if self.frames_sent > 0:
+            logger.bind(tag=TAG).debug(f"本轮音频发送节奏: {self.get_status()}")
+            pacing_stats.add(self)
+        self._reset_state()
@@ -0,0 +1,147 @@
+"""
+连接级音频前端
+每个上行音频包只解码一次，写入预分配的 int16 PCM 缓冲区，
+VAD、ASR、声纹识别与音频保存都从同一缓冲区读取（memoryview 零拷贝）
+"""
+
+from typing import Iterator, Optional
+
+import numpy as np
+import opuslib_next
+
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+SAMPLE_RATE = 16000
+# 上行 Opus 帧长 60ms
+FRAME_SAMPLES = 960
+
+
+class AudioFrontend:
+    """
+    单个连接的上行音频缓冲
+
+    缓冲区按采样点线性写入，空闲时（没有进行中的语句）在写满前把预录部分与未被 VAD 处理的
+    采样点搬到缓冲区开头，因此一句话的 PCM 总是连续的，可以直接以 memoryview 交给 ASR。
+    语句超过缓冲区容量时按倍数扩容。
+    """
+
+    def __init__(
+        self,
+        max_seconds: int = 60,
+        pre_roll_frames: int = 10,
+    ):
+        """
+        Args:
+            max_seconds: 预分配的缓冲时长（秒）
+            pre_roll_frames: 语句开始前保留的帧数，与原先保留最近 10 个音频包一致
+        """
+        self.decoder = opuslib_next.Decoder(SAMPLE_RATE, 1)
+        self.pre_roll_samples = pre_roll_frames * FRAME_SAMPLES
+        self._allocate(max_seconds * SAMPLE_RATE)
+        self.reset()
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self._buf = bytearray(capacity * 2)
+        self._samples = np.frombuffer(self._buf, dtype=np.int16)
+
+    def reset(self):
+        """清空缓冲区与所有读指针"""
+        self._write = 0
+        self._vad_pos = 0
+        self._last_push = 0
+        self._utterance_start: Optional[int] = None
+
+    @property
+    def in_utterance(self) -> bool:
+        return self._utterance_start is not None
+
+    def push(self, packet: bytes, audio_format: str = "opus") -> int:
+        """
+        写入一个上行音频包
+
+        Args:
+            packet: Opus 数据包，或 audio_format 为 pcm 时的 16 位 PCM 数据
+            audio_format: 客户端音频格式
+
+        Returns:
+            写入的采样点数，解码失败或空包时为 0
+        """
+        if not packet:
+            return 0
+        if audio_format == "pcm":
+            pcm = packet
+        else:
+            try:
+                pcm = self.decoder.decode(packet, FRAME_SAMPLES)
+            except opuslib_next.OpusError as e:
+                logger.bind(tag=TAG).info(f"解码错误: {e}")
+                return 0
+        count = len(pcm) // 2
+        if count == 0:
+            return 0
+        self._reserve(count)
+        self._buf[self._write * 2 : (self._write + count) * 2] = pcm[: count * 2]
+        self._write += count
+        self._last_push = count
+        return count
+
+    def _reserve(self, count: int):
+        """保证还能写入 count 个采样点"""
+        if self._write + count <= self.capacity:
+            return
+        if self._utterance_start is None:
+            # 空闲：只保留预录部分
+            keep_from = max(self._write - self.pre_roll_samples, 0)
+        else:
+            keep_from = self._utterance_start
+        # VAD 每个包都会消费窗口，积压通常不足一个窗口；未被消费的旧数据直接跳过
+        self._vad_pos = max(self._vad_pos, keep_from)
+        kept = self._write - keep_from
+        if kept + count > self.capacity:
+            # 语句过长：扩容（旧缓冲区仍被已导出的 memoryview 引用时不受影响）
+            old = self._samples[keep_from : self._write].copy()
+            self._allocate(max(self.capacity * 2, kept + count))
+            self._samples[:kept] = old
+        elif keep_from > 0:
+            self._samples[:kept] = self._samples[keep_from : self._write]
+        self._write -= keep_from
+        self._vad_pos -= keep_from
+        if self._utterance_start is not None:
+            self._utterance_start -= keep_from
+
+    def vad_windows(self, window: int = 512) -> Iterator[np.ndarray]:
+        """依次产出尚未处理的定长窗口（int16 视图，不复制）"""
+        while self._write - self._vad_pos >= window:
+            start = self._vad_pos
+            self._vad_pos += window
+            yield self._samples[start : start + window]
+
+    def skip_vad_pending(self):
+        """丢弃不足一个窗口的 VAD 残留采样点"""
+        self._vad_pos = self._write
+
+    def begin_utterance(self):
+        """标记语句开始，包含当前包与之前的预录部分"""
+        if self._utterance_start is not None:
+            return
+        self._utterance_start = max(
+            self._write - self._last_push - self.pre_roll_samples, 0
+        )
+
+    def take_utterance(self) -> memoryview:
+        """
+        结束当前语句并返回其 PCM（memoryview，零拷贝）
+
+        返回的视图在下一次 push 之前有效，需要跨越该时刻保存时请自行 bytes() 复制。
+        """
+        start = self._utterance_start if self._utterance_start is not None else self._write
+        self._utterance_start = None
+        return memoryview(self._buf)[start * 2 : self._write * 2]
+
+    def discard_utterance(self):
+        """放弃当前语句"""
+        self._utterance_start = None
@@ -0,0 +1,308 @@
+"""
+TTS 合成结果缓存
+按 (TTS提供方, 音色, 清理后的文本) 缓存编码好的 Opus 帧（p3 格式），
+命中时直接投递到播放队列，跳过 TTS 请求、解码与 Opus 编码
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config.logger import setup_logging
+from core.utils import p3
+
+TAG = __name__
+logger = setup_logging()
+
+_MB = 1024 * 1024
+# 每查询多少次输出一次统计信息
+_STATS_LOG_INTERVAL = 500
+
+
+class TTSAudioCache:
+    """
+    两级 LRU 缓存：内存层保存 p3 数据，磁盘层每个条目一个 .p3 文件
+
+    内存层、磁盘层分别按字节数限制容量，超出时淘汰最久未使用的条目；
+    磁盘层在启动时按文件修改时间恢复 LRU 顺序，命中时更新修改时间。
+
+    配置（config.yaml 中的 tts_cache）:
+        - enable: 是否启用，默认 true
+        - memory_max_mb: 内存层容量（MB），默认 64
+        - disk_enable: 是否启用磁盘层，默认 true
+        - disk_dir: 磁盘层目录，默认 tmp/tts_cache
+        - disk_max_mb: 磁盘层容量（MB），默认 512
+        - max_text_length: 超过该长度的句子不缓存，默认 200
+        - prewarm: 启动时预先合成的固定话术列表
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory_max_bytes = 64 * _MB
+        self.disk_enabled = False
+        self.disk_dir = "tmp/tts_cache"
+        self.disk_max_bytes = 512 * _MB
+        self.max_text_length = 200
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def configure(self, config: Dict[str, Any]):
+        """根据全局配置初始化缓存"""
+        cache_config = config.get("tts_cache") or {}
+        self.enabled = str(cache_config.get("enable", True)).lower() in ("true", "1", "yes")
+        self.memory_max_bytes = int(float(cache_config.get("memory_max_mb", 64)) * _MB)
+        self.disk_enabled = str(cache_config.get("disk_enable", True)).lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+        self.disk_dir = cache_config.get("disk_dir") or "tmp/tts_cache"
+        self.disk_max_bytes = int(float(cache_config.get("disk_max_mb", 512)) * _MB)
+        self.max_text_length = int(cache_config.get("max_text_length", 200))
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._disk_bytes = 0
+        if self.enabled and self.disk_enabled:
+            self._load_disk_index()
+        if self.enabled:
+            logger.bind(tag=TAG).info(
+                f"TTS缓存已启用: 内存{self.memory_max_bytes // _MB}MB, "
+                f"磁盘{'%dMB' % (self.disk_max_bytes // _MB) if self.disk_enabled else '关闭'}, "
+                f"已有磁盘条目{len(self._disk)}个"
+            )
+
+    @staticmethod
+    def make_key(provider: str, voice: str, text: str) -> str:
+        """生成内容寻址的缓存键"""
+        raw = f"{provider}\x1f{voice}\x1f{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    @staticmethod
+    def file_key(file_path: str) -> Optional[str]:
+        """音频文件的缓存键（文件修改后自动失效）"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        raw = f"file\x1f{os.path.abspath(file_path)}\x1f{stat.st_mtime_ns}\x1f{stat.st_size}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def accepts(self, text: str) -> bool:
+        """该文本是否适合缓存"""
+        return self.enabled and bool(text) and len(text) <= self.max_text_length
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key: str) -> Optional[List[bytes]]:
+        """查找缓存，命中时返回 Opus 帧列表"""
+        if not self.enabled or not key:
+            return None
+        self._maybe_log_stats()
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return p3.decode_opus_packets(data)
+            on_disk = key in self._disk
+        if on_disk:
+            data = self._read_disk(key)
+            if data is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._store_memory(key, data)
+                return p3.decode_opus_packets(data)
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, packets: List[bytes]):
+        """写入缓存"""
+        if not self.enabled or not key or not packets:
+            return
+        data = p3.encode_opus_packets(packets)
+        with self._lock:
+            self._store_memory(key, data)
+            self._stats["stores"] += 1
+        if self.disk_enabled:
+            self._write_disk(key, data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats.update(
+                {
+                    "memory_entries": len(self._memory),
+                    "memory_bytes": self._memory_bytes,
+                    "disk_entries": len(self._disk),
+                    "disk_bytes": self._disk_bytes,
+                    "hit_rate": (
+                        (stats["memory_hits"] + stats["disk_hits"]) / lookups
+                        if lookups
+                        else 0.0
+                    ),
+                }
+            )
+            return stats
+
+    def _maybe_log_stats(self):
+        with self._lock:
+            lookups = (
+                self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            )
+        if lookups and lookups % _STATS_LOG_INTERVAL == 0:
+            stats = self.get_stats()
+            logger.bind(tag=TAG).info(
+                f"TTS缓存统计: 命中率{stats['hit_rate']:.1%}, "
+                f"内存命中{stats['memory_hits']}, 磁盘命中{stats['disk_hits']}, 未命中{stats['misses']}, "
+                f"内存{stats['memory_entries']}条/{stats['memory_bytes'] // 1024}KB, "
+                f"磁盘{stats['disk_entries']}条/{stats['disk_bytes'] // 1024}KB"
+            )
+
+    def _store_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats["memory_evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.p3")
+
+    def _load_disk_index(self):
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(".p3"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-3], stat.st_size))
+        except OSError as e:
+            logger.bind(tag=TAG).warning(f"TTS磁盘缓存目录不可用，已关闭磁盘缓存: {e}")
+            self.disk_enabled = False
+            return
+        entries.sort()
+        with self._lock:
+            for _, key, size in entries:
+                self._disk[key] = size
+                self._disk_bytes += size
+            evicted = self._evict_disk()
+        self._remove_files(evicted)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        if len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.bind(tag=TAG).warning(f"写入TTS磁盘缓存失败: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = self._evict_disk()
+        self._remove_files(evicted)
+
+    def _evict_disk(self) -> List[str]:
+        evicted = []
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._stats["disk_evictions"] += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove_files(self, keys: List[str]):
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+
+async def prewarm_tts_cache(config: Dict[str, Any]):
+    """启动时预先合成配置的固定话术并写入缓存"""
+    phrases = (config.get("tts_cache") or {}).get("prewarm") or []
+    if not tts_audio_cache.enabled or not phrases:
+        return
+    # 延迟导入，避免与 TTS 模块循环导入
+    from core.utils.modules_initialize import initialize_tts
+
+    try:
+        tts = initialize_tts(config)
+    except Exception as e:
+        logger.bind(tag=TAG).warning(f"TTS缓存预热失败，无法初始化TTS: {e}")
+        return
+    start = time.monotonic()
+    warmed = 0
+    for phrase in phrases:
+        try:
+            if await tts.prewarm_cache(phrase):
+                warmed += 1
+        except Exception as e:
+            logger.bind(tag=TAG).warning(f"TTS缓存预热失败: {phrase}，错误: {e}")
+    logger.bind(tag=TAG).info(
+        f"TTS缓存预热完成: {warmed}/{len(phrases)}句，耗时{time.monotonic() - start:.2f}秒"
+    )
+
+
+# 全局 TTS 缓存实例
+tts_audio_cache = TTSAudioCache()
@@ -0,0 +1,302 @@
+"""
+连接工厂
+所有连接共享同一份只读配置（写时复制）、同一个有界线程池、预热好的 TTS / 远程 ASR 实例
+和按配置共享的声纹识别客户端，新连接只做必要的私有初始化；同时统计连接就绪耗时和每连接内存占用
+"""
+
+import os
+import time
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+
+from config.logger import setup_logging
+from core.providers.asr.dto.dto import InterfaceType
+from core.utils.modules_initialize import initialize_tts, initialize_asr
+from core.utils.voiceprint_provider import VoiceprintProvider
+
+TAG = __name__
+logger = setup_logging()
+
+
+def copy_on_write_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    为连接创建配置视图，代替整份 deepcopy
+
+    只复制顶层字典和 selected_module，其余子配置与服务端共享；
+    连接的差异化配置必须整体替换顶层键（如 config["TTS"] = private_config["TTS"]），
+    不能原地修改共享的子字典
+    """
+    view = dict(config)
+    view["selected_module"] = dict(config.get("selected_module") or {})
+    return view
+
+
+class ModulePool:
+    """
+    预热的模块实例池
+
+    TTS / 远程 ASR 实例打开通道后绑定了连接状态，因此实例只借出一次、不归还，
+    借出后由后台线程补充到目标数量，新连接拿到的总是已经构造好的实例
+    """
+
+    def __init__(self, name: str, create: Callable[[], Any], size: int, executor):
+        self.name = name
+        self._create = create
+        self.size = max(0, size)
+        self._executor = executor
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self._warmup_begin: Optional[float] = None
+
+    def start(self):
+        self._warmup_begin = time.time()
+        self._schedule_refill()
+
+    def acquire(self) -> Any:
+        """取出一个预热实例，池为空时同步创建"""
+        with self._lock:
+            instance = self._idle.pop() if self._idle else None
+        if instance is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            instance = self._create()
+        self._schedule_refill()
+        return instance
+
+    def _schedule_refill(self):
+        with self._lock:
+            if self._closed or self._refilling or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        try:
+            self._executor.submit(self._refill)
+        except RuntimeError:
+            # 线程池已关闭
+            with self._lock:
+                self._refilling = False
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) >= self.size:
+                        return
+                instance = self._create()
+                with self._lock:
+                    if self._closed:
+                        return
+                    self._idle.append(instance)
+                    warmed_up = len(self._idle) >= self.size
+                if warmed_up and self._warmup_begin is not None:
+                    # 启动预热耗时：新连接就绪前不再需要构造实例
+                    cost = time.time() - self._warmup_begin
+                    self._warmup_begin = None
+                    logger.bind(tag=TAG).info(
+                        f"{self.name}实例预热完成: {self.size}个, 耗时 {cost * 1000:.1f}ms, "
+                        f"平均每个 {cost / self.size * 1000:.1f}ms"
+                    )
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"预热{self.name}实例失败: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def close(self):
+        """停止补充并丢弃空闲实例（空闲实例尚未打开通道，无需释放）"""
+        with self._lock:
+            self._closed = True
+            self._idle.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"idle": len(self._idle), "hits": self.hits, "misses": self.misses}
+
+
+class ConnectionStats:
+    """连接就绪耗时与每连接内存占用统计"""
+
+    def __init__(self, log_interval: int):
+        self.log_interval = max(1, log_interval)
+        self._process = psutil.Process(os.getpid())
+        self._lock = threading.Lock()
+        self.baseline_rss = 0
+        self.connections = 0
+        self.ready_total = 0.0
+        self.ready_max = 0.0
+        self.rss_per_connection = 0.0
+
+    def rss(self) -> int:
+        return self._process.memory_info().rss
+
+    def mark_baseline(self):
+        """服务启动时记录基线内存"""
+        self.baseline_rss = self.rss()
+
+    def record_ready(self, latency: float, active_connections: int):
+        """记录一个连接从建立到组件就绪的耗时"""
+        rss = self.rss()
+        with self._lock:
+            self.connections += 1
+            self.ready_total += latency
+            self.ready_max = max(self.ready_max, latency)
+            if active_connections > 0:
+                self.rss_per_connection = (
+                    max(0, rss - self.baseline_rss) / active_connections
+                )
+            should_log = self.connections % self.log_interval == 0
+        if should_log:
+            logger.bind(tag=TAG).info(f"连接初始化统计: {self.get_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "ready_avg_ms": round(
+                self.ready_total / self.connections * 1000 if self.connections else 0.0,
+                1,
+            ),
+            "ready_max_ms": round(self.ready_max * 1000, 1),
+            "rss_mb": round(self.rss() / 1024 / 1024, 1),
+            "rss_per_connection_mb": round(self.rss_per_connection / 1024 / 1024, 2),
+        }
+
+
+class ConnectionFactory:
+    """
+    连接工厂（由 WebSocketServer 持有，所有连接共享）
+
+    配置（config.yaml 中的 connection_factory）:
+        - max_workers: 所有连接共享的线程池大小，默认 64
+        - tts_pool_size: 预热的 TTS 实例数，0 表示不预热，默认 2
+        - asr_pool_size: 预热的远程 ASR 实例数（本地 ASR 本身就是共享的），默认 2
+        - stats_log_interval: 每多少个连接输出一次初始化统计，默认 50
+        - voiceprint_cache_size: 缓存的声纹识别客户端数（按配置区分，最近最少使用的先淘汰），默认 64
+    """
+
+    def __init__(self, config: Dict[str, Any], shared_asr=None):
+        factory_config = config.get("connection_factory") or {}
+        self.tts_pool_size = int(factory_config.get("tts_pool_size", 2))
+        self.asr_pool_size = int(factory_config.get("asr_pool_size", 2))
+        self.max_workers = int(factory_config.get("max_workers", 64))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="conn",
+        )
+        self.stats = ConnectionStats(int(factory_config.get("stats_log_interval", 50)))
+        self.voiceprint_cache_size = max(
+            1, int(factory_config.get("voiceprint_cache_size", 64))
+        )
+        self._voiceprint_lock = threading.Lock()
+        self._voiceprint_providers: "OrderedDict[str, VoiceprintProvider]" = OrderedDict()
+        self.tts_pool: Optional[ModulePool] = None
+        self.asr_pool: Optional[ModulePool] = None
+        self._started = False
+        self.reload(config, shared_asr)
+
+    def reload(self, config: Dict[str, Any], shared_asr=None):
+        """按新的服务端配置重建预热池（配置更新时调用）"""
+        old_pools = (self.tts_pool, self.asr_pool)
+        self.config = config
+        selected = config.get("selected_module") or {}
+
+        self.tts_pool = None
+        if self.tts_pool_size > 0 and selected.get("TTS"):
+            self.tts_pool = ModulePool(
+                "TTS", lambda: initialize_tts(config), self.tts_pool_size, self.executor
+            )
+
+        self.asr_pool = None
+        if (
+            self.asr_pool_size > 0
+            and shared_asr is not None
+            and shared_asr.interface_type != InterfaceType.LOCAL
+        ):
+            self.asr_pool = ModulePool(
+                "ASR", lambda: initialize_asr(config), self.asr_pool_size, self.executor
+            )
+
+        with self._voiceprint_lock:
+            self._voiceprint_providers.clear()
+
+        for pool in old_pools:
+            if pool is not None:
+                pool.close()
+        if self._started:
+            self._start_pools()
+
+    def _start_pools(self):
+        for pool in (self.tts_pool, self.asr_pool):
+            if pool is not None:
+                pool.start()
+
+    def start(self):
+        """记录基线内存并开始在后台预热实例"""
+        self.stats.mark_baseline()
+        self._started = True
+        self._start_pools()
+        logger.bind(tag=TAG).info(
+            f"连接工厂已启动: 线程池{self.max_workers}, "
+            f"预热TTS {self.tts_pool.size if self.tts_pool else 0}个, "
+            f"预热ASR {self.asr_pool.size if self.asr_pool else 0}个, "
+            f"基线内存 {self.stats.baseline_rss / 1024 / 1024:.1f}MB"
+        )
+
+    def _same_module(self, config: Dict[str, Any], module: str) -> bool:
+        """连接配置中的模块是否仍与服务端配置相同（未被差异化配置替换）"""
+        return config.get(module) is self.config.get(module) and (
+            config.get("selected_module") or {}
+        ).get(module) == (self.config.get("selected_module") or {}).get(module)
+
+    def acquire_tts(self, config: Dict[str, Any]):
+        """连接的TTS与服务端配置一致时取预热实例，否则按连接配置新建"""
+        pool = self.tts_pool
+        if pool is not None and self._same_module(config, "TTS"):
+            return pool.acquire()
+        return initialize_tts(config)
+
+    def acquire_asr(self, config: Dict[str, Any]):
+        """连接的远程ASR与服务端配置一致时取预热实例，否则按连接配置新建"""
+        pool = self.asr_pool
+        if pool is not None and self._same_module(config, "ASR"):
+            return pool.acquire()
+        return initialize_asr(config)
+
+    def get_voiceprint_provider(self, voiceprint_config: Dict[str, Any]):
+        """
+        声纹识别客户端创建后不再变化，相同配置的连接共用一个（避免每个连接做一次健康检查）；
+        未启用的客户端（未配置或健康检查失败）不缓存，之后的连接重新检查，声纹服务恢复后即可使用
+        """
+        key = json.dumps(voiceprint_config, sort_keys=True, default=str)
+        with self._voiceprint_lock:
+            provider = self._voiceprint_providers.get(key)
+            if provider is not None:
+                self._voiceprint_providers.move_to_end(key)
+                return provider
+            provider = VoiceprintProvider(voiceprint_config)
+            if provider.enabled:
+                self._voiceprint_providers[key] = provider
+                while len(self._voiceprint_providers) > self.voiceprint_cache_size:
+                    self._voiceprint_providers.popitem(last=False)
+        return provider
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.get_stats()
+        if self.tts_pool is not None:
+            stats["tts_pool"] = self.tts_pool.get_stats()
+        if self.asr_pool is not None:
+            stats["asr_pool"] = self.asr_pool.get_stats()
+        return stats
+
+    def close(self):
+        for pool in (self.tts_pool, self.asr_pool):
+            if pool is not None:
+                pool.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
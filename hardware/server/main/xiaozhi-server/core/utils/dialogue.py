@@ -1,8 +1,80 @@
 import uuid
 import re
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # 可选依赖
+    tiktoken = None
+
+# 每条消息的格式开销（role、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+_MEMORY_PATTERN = re.compile(r"<memory>.*?</memory>", flags=re.DOTALL)
+# 各 LLM 请求失败时返回或在输出中插入的提示，如 【LLM服务响应异常】
+_LLM_ERROR_PATTERN = re.compile(r"【[^】]*异常】")
+
+# 所有连接共用的摘要线程池，摘要请求不占用对话线程
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dialogue-summary")
+
+_tiktoken_encoding = None
+
+# 智能体平台类 LLM（自带知识库/工作流与会话），不适合用来生成摘要
+AGENT_LLM_TYPES = frozenset({"dify", "fastgpt", "coze", "xiaoxbao", "homeassistant"})
+# 摘要失败时最多保留等待重试的已淘汰消息条数
+_MAX_PENDING_SUMMARY_MESSAGES = 50
+
+SUMMARY_PROMPT = (
+    "你是对话摘要助手。请把【已有摘要】和【新增对话】合并成一段新的摘要，"
+    "保留用户的身份信息、偏好、提出的问题、已经给出的关键结论和未完成的事项，"
+    "省略寒暄和重复内容。只输出摘要正文，不超过{max_chars}字。"
+)
+
+
+def _llm_type(llm) -> str:
+    """LLM 实例的类型（core.providers.llm.<type>.<type> 中的 type）"""
+    parts = type(llm).__module__.split(".")
+    return parts[-2] if len(parts) >= 2 else ""
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+        or 0x3040 <= code <= 0x30FF
+        or 0xAC00 <= code <= 0xD7AF
+    )
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的 token 数
+    安装了 tiktoken 时使用 cl100k_base 精确计数；否则按中日韩字符约 1 token/字、
+    其他字符约 4 字符/token 估算
+    """
+    global _tiktoken_encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            if _tiktoken_encoding is None:
+                _tiktoken_encoding = tiktoken.get_encoding("cl100k_base")
+            return len(_tiktoken_encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return cjk + (len(text) - cjk + 3) // 4
+
 
 class Message:
     def __init__(
@@ -21,29 +93,203 @@ class Message:
 
 
 class Dialogue:
+    """
+    对话上下文
+
+    系统消息之外的历史按 token 预算保留一个滑动窗口，超出预算时从最早的消息开始淘汰，
+    被淘汰的消息在后台由记忆模块的 LLM 合并为滚动摘要，并以 <conversation_summary> 附加到系统提示词中。
+    每条消息只在写入时渲染一次，系统提示词按（原始内容、记忆、说话人、摘要、当前分钟）缓存，
+    每轮请求只需拼接已渲染好的结果。
+
+    配置（config.yaml 中的 dialogue）:
+        - max_context_tokens: 历史消息的 token 预算，0 表示不限制
+        - keep_recent_messages: 至少保留的最近消息条数，不受预算影响
+        - summary_enable: 是否对淘汰的消息生成摘要
+        - summary_max_chars: 摘要的最大字数
+    """
+
     def __init__(self):
-        self.dialogue: List[Message] = []
         # 获取当前时间
         self.current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.max_context_tokens = 0
+        self.keep_recent_messages = 6
+        self.summary_enable = True
+        self.summary_max_chars = 300
+        self.summary = ""
+        self._summary_llm = None
+        self._lock = threading.RLock()
+        # 等待摘要的已淘汰消息
+        self._evicted: List[Message] = []
+        self._summary_running = False
+        self._system_cache_key = None
+        self._system_cache_value = None
+        self.dialogue = []
+
+    @property
+    def dialogue(self) -> List[Message]:
+        return self._messages
+
+    @dialogue.setter
+    def dialogue(self, messages: List[Message]):
+        """整体替换历史（如清理工具调用消息），重新建立渲染缓存"""
+        with self._lock:
+            self._messages: List[Message] = []
+            self._system_message: Optional[Message] = None
+            # 与非系统消息一一对应：(渲染结果, token 数)
+            self._rendered: List[Tuple[Dict, int]] = []
+            self._history_tokens = 0
+            for m in messages:
+                self._append(m)
+
+    def configure(self, config: dict):
+        """读取全局配置中的 dialogue 部分"""
+        dialogue_config = config.get("dialogue") or {}
+        self.max_context_tokens = int(dialogue_config.get("max_context_tokens", 0) or 0)
+        self.keep_recent_messages = int(dialogue_config.get("keep_recent_messages", 6))
+        self.summary_enable = str(dialogue_config.get("summary_enable", True)).lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+        self.summary_max_chars = int(dialogue_config.get("summary_max_chars", 300))
+        with self._lock:
+            self._trim()
+
+    def set_summary_llm(self, llm):
+        """设置生成滚动摘要所用的 LLM（通常为记忆模块的 LLM），智能体平台类 LLM 不用于摘要"""
+        if llm is not None and _llm_type(llm) in AGENT_LLM_TYPES:
+            logger.bind(tag=TAG).info(
+                f"{_llm_type(llm)} 为智能体平台，不用于生成对话摘要，淘汰的历史将直接丢弃"
+            )
+            llm = None
+        self._summary_llm = llm
 
     def put(self, message: Message):
-        self.dialogue.append(message)
+        with self._lock:
+            self._append(message)
+            self._trim()
+
+    def _append(self, message: Message):
+        if message.role == "system":
+            # 只使用第一条系统消息，其余系统消息不发送给 LLM
+            if self._system_message is None:
+                self._system_message = message
+            self._messages.append(message)
+            return
+        rendered = self._render(message)
+        tokens = _MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.content)
+        if message.tool_calls is not None:
+            tokens += sum(
+                estimate_tokens(str(call.get("function", {}).get("arguments", "")))
+                + estimate_tokens(str(call.get("function", {}).get("name", "")))
+                for call in message.tool_calls
+                if isinstance(call, dict)
+            )
+        self._messages.append(message)
+        self._rendered.append((rendered, tokens))
+        self._history_tokens += tokens
+
+    def _trim(self):
+        """超出 token 预算时从最早的消息开始淘汰"""
+        if self.max_context_tokens <= 0:
+            return
+        evicted = []
+        while (
+            self._history_tokens > self.max_context_tokens
+            and len(self._rendered) > self.keep_recent_messages
+        ):
+            evicted.append(self._pop_oldest())
+        # 工具调用结果不能脱离对应的调用单独出现在窗口开头
+        while self._rendered and self._rendered[0][0]["role"] == "tool":
+            evicted.append(self._pop_oldest())
+        if evicted:
+            self._evicted.extend(evicted)
+            self._schedule_summary()
+
+    def _pop_oldest(self) -> Message:
+        index = next(i for i, m in enumerate(self._messages) if m.role != "system")
+        message = self._messages.pop(index)
+        _, tokens = self._rendered.pop(0)
+        self._history_tokens -= tokens
+        return message
+
+    def _schedule_summary(self):
+        if not self.summary_enable or self._summary_llm is None:
+            # 未启用摘要时直接丢弃
+            self._evicted.clear()
+            return
+        if self._summary_running:
+            # 正在生成的摘要结束后会继续处理新淘汰的消息
+            return
+        self._summary_running = True
+        _summary_executor.submit(self._summarize)
+
+    def _summarize(self):
+        """在后台线程中把已淘汰的消息合并进滚动摘要"""
+        while True:
+            with self._lock:
+                evicted = self._evicted
+                self._evicted = []
+                previous = self.summary
+                if not evicted:
+                    self._summary_running = False
+                    return
+            lines = []
+            for m in evicted:
+                if m.role == "user" and m.content:
+                    lines.append(f"User: {m.content}")
+                elif m.role == "assistant" and m.content:
+                    lines.append(f"Assistant: {m.content}")
+                elif m.role == "tool" and m.content:
+                    lines.append(f"Tool: {m.content}")
+            if not lines:
+                continue
+            user_prompt = f"【已有摘要】\n{previous or '无'}\n\n【新增对话】\n" + "\n".join(
+                lines
+            )
+            try:
+                result = self._summary_llm.response_no_stream(
+                    SUMMARY_PROMPT.format(max_chars=self.summary_max_chars),
+                    user_prompt,
+                )
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"对话摘要生成失败: {e}")
+                result = None
+            summary = (result or "").strip()
+            if not summary or _LLM_ERROR_PATTERN.search(summary):
+                # 保留原摘要，淘汰的消息留到下次淘汰时重试，摘要成功后才真正丢弃
+                logger.bind(tag=TAG).warning(
+                    f"对话摘要生成失败，保留原摘要: {summary or '空响应'}"
+                )
+                with self._lock:
+                    self._evicted = (evicted + self._evicted)[
+                        -_MAX_PENDING_SUMMARY_MESSAGES:
+                    ]
+                    self._summary_running = False
+                return
+            with self._lock:
+                self.summary = summary[: self.summary_max_chars * 2]
+            logger.bind(tag=TAG).debug(
+                f"对话摘要已更新（合并{len(evicted)}条消息）: {self.summary}"
+            )
 
     def getMessages(self, m, dialogue):
+        dialogue.append(self._render(m))
+
+    @staticmethod
+    def _render(m) -> Dict:
         if m.tool_calls is not None:
-            dialogue.append({"role": m.role, "tool_calls": m.tool_calls})
+            return {"role": m.role, "tool_calls": m.tool_calls}
         elif m.role == "tool":
-            dialogue.append(
-                {
-                    "role": m.role,
-                    "tool_call_id": (
-                        str(uuid.uuid4()) if m.tool_call_id is None else m.tool_call_id
-                    ),
-                    "content": m.content,
-                }
-            )
+            return {
+                "role": m.role,
+                "tool_call_id": (
+                    str(uuid.uuid4()) if m.tool_call_id is None else m.tool_call_id
+                ),
+                "content": m.content,
+            }
         else:
-            dialogue.append({"role": m.role, "content": m.content})
+            return {"role": m.role, "content": m.content}
 
     def get_llm_dialogue(self) -> List[Dict[str, str]]:
         # 直接调用get_llm_dialogue_with_memory，传入None作为memory_str
@@ -52,12 +298,73 @@ class Dialogue:
 
     def update_system_message(self, new_content: str):
         """更新或添加系统消息"""
-        # 查找第一个系统消息
-        system_msg = next((msg for msg in self.dialogue if msg.role == "system"), None)
-        if system_msg:
-            system_msg.content = new_content
-        else:
-            self.put(Message(role="system", content=new_content))
+        with self._lock:
+            if self._system_message is not None:
+                self._system_message.content = new_content
+            else:
+                self.put(Message(role="system", content=new_content))
+
+    def get_messages_for_memory(self) -> List[Message]:
+        """保存记忆时使用的消息：滚动摘要（如有）加当前窗口内的消息"""
+        with self._lock:
+            messages = list(self._messages)
+            if self.summary:
+                messages.insert(
+                    0, Message(role="assistant", content=f"（此前对话摘要）{self.summary}")
+                )
+            return messages
+
+    def get_token_usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "history_tokens": self._history_tokens,
+                "history_messages": len(self._rendered),
+                "summary_tokens": estimate_tokens(self.summary),
+            }
+
+    def _build_system_prompt(
+        self, content: str, memory_str: Optional[str], voiceprint_config: Optional[dict]
+    ) -> str:
+        # 基础系统提示
+        enhanced_system_prompt = content
+        # 替换时间占位符
+        enhanced_system_prompt = enhanced_system_prompt.replace(
+            "{{current_time}}", datetime.now().strftime("%H:%M")
+        )
+
+        # 添加说话人个性化描述
+        try:
+            speakers = voiceprint_config.get("speakers", [])
+            if speakers:
+                enhanced_system_prompt += "\n\n<speakers_info>"
+                for speaker_str in speakers:
+                    try:
+                        parts = speaker_str.split(",", 2)
+                        if len(parts) >= 2:
+                            name = parts[1].strip()
+                            # 如果描述为空，则为""
+                            description = parts[2].strip() if len(parts) >= 3 else ""
+                            enhanced_system_prompt += f"\n- {name}：{description}"
+                    except:
+                        pass
+                enhanced_system_prompt += "\n\n</speakers_info>"
+        except:
+            # 配置读取失败时忽略错误，不影响其他功能
+            pass
+
+        # 使用正则表达式匹配 <memory> 标签，不管中间有什么内容
+        if memory_str is not None:
+            enhanced_system_prompt = _MEMORY_PATTERN.sub(
+                lambda _: f"<memory>\n{memory_str}\n</memory>",
+                enhanced_system_prompt,
+            )
+
+        # 附加被淘汰消息的滚动摘要
+        if self.summary:
+            enhanced_system_prompt += (
+                f"\n\n<conversation_summary>\n{self.summary}\n</conversation_summary>"
+            )
+        return enhanced_system_prompt
 
     def get_llm_dialogue_with_memory(
         self, memory_str: str = None, voiceprint_config: dict = None
@@ -65,54 +372,32 @@ class Dialogue:
         # 构建对话
         dialogue = []
 
-        # 添加系统提示和记忆
-        system_message = next(
-            (msg for msg in self.dialogue if msg.role == "system"), None
-        )
-
-        if system_message:
-            # 基础系统提示
-            enhanced_system_prompt = system_message.content
-            # 替换时间占位符
-            enhanced_system_prompt = enhanced_system_prompt.replace(
-                "{{current_time}}", datetime.now().strftime("%H:%M")
-            )
-
-            # 添加说话人个性化描述
-            try:
-                speakers = voiceprint_config.get("speakers", [])
-                if speakers:
-                    enhanced_system_prompt += "\n\n<speakers_info>"
-                    for speaker_str in speakers:
-                        try:
-                            parts = speaker_str.split(",", 2)
-                            if len(parts) >= 2:
-                                name = parts[1].strip()
-                                # 如果描述为空，则为""
-                                description = (
-                                    parts[2].strip() if len(parts) >= 3 else ""
-                                )
-                                enhanced_system_prompt += f"\n- {name}：{description}"
-                        except:
-                            pass
-                    enhanced_system_prompt += "\n\n</speakers_info>"
-            except:
-                # 配置读取失败时忽略错误，不影响其他功能
-                pass
-
-            # 使用正则表达式匹配 <memory> 标签，不管中间有什么内容
-            if memory_str is not None:
-                enhanced_system_prompt = re.sub(
-                    r"<memory>.*?</memory>",
-                    f"<memory>\n{memory_str}\n</memory>",
-                    enhanced_system_prompt,
-                    flags=re.DOTALL,
+        with self._lock:
+            system_message = self._system_message
+            if system_message:
+                content = system_message.content
+                speakers = None
+                if isinstance(voiceprint_config, dict):
+                    speakers = voiceprint_config.get("speakers")
+                cache_key = (
+                    content,
+                    memory_str,
+                    tuple(speakers) if isinstance(speakers, list) else speakers,
+                    self.summary,
+                    (
+                        datetime.now().strftime("%H:%M")
+                        if "{{current_time}}" in content
+                        else None
+                    ),
                 )
-            dialogue.append({"role": "system", "content": enhanced_system_prompt})
+                if cache_key != self._system_cache_key:
+                    self._system_cache_value = self._build_system_prompt(
+                        content, memory_str, voiceprint_config
+                    )
+                    self._system_cache_key = cache_key
+                dialogue.append({"role": "system", "content": self._system_cache_value})
 
-        # 添加用户和助手的对话
-        for m in self.dialogue:
-            if m.role != "system":  # 跳过原始的系统消息
-                self.getMessages(m, dialogue)
+            # 添加用户和助手的对话（复制一层，LLM 提供方可能会修改消息内容）
+            dialogue.extend(dict(rendered) for rendered, _ in self._rendered)
 
         return dialogue
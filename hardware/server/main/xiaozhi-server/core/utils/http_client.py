@@ -0,0 +1,96 @@
+"""
+共享 HTTP 客户端
+进程内所有连接共用一个 aiohttp 会话（按事件循环区分），复用连接池与 keep-alive，
+替代在协程里直接调用阻塞的 requests
+"""
+
+import json
+import asyncio
+import weakref
+from typing import Any, Dict, Mapping, Optional
+
+import aiohttp
+
+# 事件循环 -> ClientSession
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# 与原先 requests 的行为接近：不限制总时长，只限制建连与两次读取之间的间隔
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+
+
+class HttpResponse:
+    """已读取完毕的响应，属性与 requests.Response 常用部分保持一致"""
+
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code: int, headers: Mapping[str, str], content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """获取当前事件循环的共享会话（惰性创建）"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            timeout=DEFAULT_TIMEOUT,
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=32),
+        )
+        _sessions[loop] = session
+    return session
+
+
+def _encode_params(params: Mapping[str, Any]):
+    """按 requests 的规则编码查询参数：跳过 None，列表展开为同名参数，其余转字符串"""
+    encoded = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        encoded.extend((key, str(v)) for v in values)
+    return encoded
+
+
+async def http_request(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    **kwargs,
+) -> HttpResponse:
+    """
+    通过共享会话发送请求并读取完整响应体
+
+    Args:
+        method: 请求方法
+        url: 请求地址
+        params: 查询参数
+        **kwargs: 透传给 aiohttp（json、data、headers、timeout 等）
+    """
+    if params:
+        kwargs["params"] = _encode_params(params)
+    async with get_http_session().request(method, url, **kwargs) as resp:
+        content = await resp.read()
+        return HttpResponse(resp.status, resp.headers, content)
+
+
+async def close_http_sessions():
+    """关闭所有共享会话（服务退出时调用）"""
+    for session in list(_sessions.values()):
+        if not session.closed:
+            await session.close()
+    _sessions.clear()
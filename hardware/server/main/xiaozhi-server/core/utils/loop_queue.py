@@ -0,0 +1,76 @@
+"""
+事件循环队列
+任意线程都可以投递，消费方在事件循环中以协程方式等待，不需要轮询线程
+"""
+
+import queue
+import asyncio
+from collections import deque
+from typing import Any, Optional
+
+
+class LoopQueue:
+    """
+    跨线程投递、在事件循环中异步消费的队列
+
+    put/put_nowait/get_nowait/qsize/empty 与 queue.Queue 保持一致（get_nowait 为空时抛出 queue.Empty），
+    已有的线程侧生产者（LLM 线程池、意图处理等）无需改动；get() 是协程，只能在绑定的事件循环中调用。
+    """
+
+    def __init__(self):
+        self._items = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """绑定消费方所在的事件循环"""
+        self._loop = loop
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        self._items.append(item)
+        # 先写入再读取等待者：消费方先登记等待者再检查队列，两者不会错过唤醒
+        if self._waiter is None or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup()
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup)
+            except RuntimeError:
+                # 事件循环已关闭（连接已释放）
+                pass
+
+    def put_nowait(self, item: Any):
+        self.put(item)
+
+    def get_nowait(self) -> Any:
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    async def get(self) -> Any:
+        while True:
+            if self._items:
+                return self._items.popleft()
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                if not self._items:
+                    await self._waiter
+            finally:
+                self._waiter = None
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
@@ -14,7 +14,15 @@ from opuslib_next import constants
 class OpusEncoderUtils:
     """PCM到Opus的编码器"""
 
-    def __init__(self, sample_rate: int, channels: int, frame_size_ms: int):
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+        frame_size_ms: int,
+        bitrate: Optional[int] = 24000,
+        complexity: Optional[int] = 10,
+        signal: Optional[int] = constants.SIGNAL_VOICE,
+    ):
         """
         初始化Opus编码器
 
@@ -22,6 +30,9 @@ class OpusEncoderUtils:
             sample_rate: 采样率 (Hz)
             channels: 通道数 (1=单声道, 2=立体声)
             frame_size_ms: 帧大小 (毫秒)
+            bitrate: 比特率 (bps)，为None时使用libopus默认值
+            complexity: 编码复杂度 0-10，越高音质越好、CPU占用越高，为None时使用libopus默认值
+            signal: 信号类型提示，为None时由libopus自动判断
         """
         self.sample_rate = sample_rate
         self.channels = channels
@@ -32,8 +43,8 @@ class OpusEncoderUtils:
         self.total_frame_size = self.frame_size * channels
 
         # 比特率和复杂度设置
-        self.bitrate = 24000  # bps
-        self.complexity = 10  # 最高质量
+        self.bitrate = bitrate  # bps
+        self.complexity = complexity  # 10为最高质量
 
         # 缓冲区初始化为空
         self.buffer = np.array([], dtype=np.int16)
@@ -43,9 +54,12 @@ class OpusEncoderUtils:
             self.encoder = Encoder(
                 sample_rate, channels, constants.APPLICATION_AUDIO  # 音频优化模式
             )
-            self.encoder.bitrate = self.bitrate
-            self.encoder.complexity = self.complexity
-            self.encoder.signal = constants.SIGNAL_VOICE  # 语音信号优化
+            if self.bitrate is not None:
+                self.encoder.bitrate = self.bitrate
+            if self.complexity is not None:
+                self.encoder.complexity = self.complexity
+            if signal is not None:
+                self.encoder.signal = signal  # 语音信号优化
         except Exception as e:
             logging.error(f"初始化Opus编码器失败: {e}")
             raise RuntimeError("初始化失败") from e
@@ -1,6 +1,6 @@
 import io
 import struct
-from typing import Callable, Any
+from typing import Callable, Any, Iterable, List
 
 
 def decode_opus_from_file_stream(input_file, callback: Callable[[Any], Any]):
@@ -40,3 +40,23 @@ def decode_opus_from_bytes_stream(input_bytes, callback: Callable[[Any], Any]):
         if len(opus_data) != data_len:
             raise ValueError(f"Data length({len(opus_data)}) mismatch({data_len}) in the bytes.")
         callback(opus_data)
+
+
+def encode_opus_packets(packets: Iterable[bytes]) -> bytes:
+    """
+    把 Opus 数据包列表编码为p3二进制数据（每包前加4字节头部）。
+    """
+    buf = bytearray()
+    for packet in packets:
+        buf += struct.pack('>BBH', 0, 0, len(packet))
+        buf += packet
+    return bytes(buf)
+
+
+def decode_opus_packets(input_bytes) -> List[bytes]:
+    """
+    从p3二进制数据中解析出 Opus 数据包列表。
+    """
+    packets = []
+    decode_opus_from_bytes_stream(input_bytes, packets.append)
+    return packets
@@ -0,0 +1,88 @@
+"""
+聊天记录上报的音频编码
+在上报进程池的子进程中执行（Opus 解码、加 WAV 头、base64 编码；Windows 上在线程中执行），
+子进程从预先导入 report_worker 与本模块的 forkserver 进程派生，
+本模块不能导入会读取配置或初始化日志的模块
+"""
+
+import base64
+from typing import List, Optional, Union
+
+import opuslib_next
+
+# 16kHz 单声道，60ms 一帧
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 960
+
+
+def opus_to_wav(opus_data: List[bytes]) -> bytes:
+    """将Opus数据包列表转换为WAV格式的字节流
+
+    Args:
+        opus_data: opus音频数据
+
+    Returns:
+        bytes: WAV格式的音频数据
+    """
+    decoder = opuslib_next.Decoder(SAMPLE_RATE, 1)
+    pcm_data = []
+
+    for opus_packet in opus_data:
+        try:
+            pcm_data.append(decoder.decode(opus_packet, FRAME_SAMPLES))
+        except opuslib_next.OpusError:
+            # 跳过损坏的数据包
+            continue
+
+    if not pcm_data:
+        raise ValueError("没有有效的PCM数据")
+
+    return pcm_to_wav(b"".join(pcm_data))
+
+
+def pcm_to_wav(pcm_data_bytes: bytes) -> bytes:
+    """为16kHz单声道16位PCM数据加上WAV文件头
+
+    Args:
+        pcm_data_bytes: PCM字节数据
+
+    Returns:
+        bytes: WAV格式的音频数据
+    """
+    # WAV文件头
+    wav_header = bytearray()
+    wav_header.extend(b"RIFF")  # ChunkID
+    wav_header.extend((36 + len(pcm_data_bytes)).to_bytes(4, "little"))  # ChunkSize
+    wav_header.extend(b"WAVE")  # Format
+    wav_header.extend(b"fmt ")  # Subchunk1ID
+    wav_header.extend((16).to_bytes(4, "little"))  # Subchunk1Size
+    wav_header.extend((1).to_bytes(2, "little"))  # AudioFormat (PCM)
+    wav_header.extend((1).to_bytes(2, "little"))  # NumChannels
+    wav_header.extend((SAMPLE_RATE).to_bytes(4, "little"))  # SampleRate
+    wav_header.extend((SAMPLE_RATE * 2).to_bytes(4, "little"))  # ByteRate
+    wav_header.extend((2).to_bytes(2, "little"))  # BlockAlign
+    wav_header.extend((16).to_bytes(2, "little"))  # BitsPerSample
+    wav_header.extend(b"data")  # Subchunk2ID
+    wav_header.extend(len(pcm_data_bytes).to_bytes(4, "little"))  # Subchunk2Size
+
+    # 返回完整的WAV数据
+    return bytes(wav_header) + pcm_data_bytes
+
+
+def encode_report_audio(audio: Union[bytes, List[bytes], None]) -> Optional[str]:
+    """
+    将上报音频编码为 base64 的 WAV
+
+    Args:
+        audio: opus音频数据包列表，或音频前端已解码的PCM字节
+
+    Returns:
+        base64 字符串，没有音频时返回 None
+    """
+    if not audio:
+        return None
+    if isinstance(audio, (bytes, bytearray)):
+        wav = pcm_to_wav(bytes(audio))
+    else:
+        wav = opus_to_wav(audio)
+    return base64.b64encode(wav).decode("ascii")
@@ -0,0 +1,660 @@
+"""
+聊天记录上报流水线（进程内所有连接共享）
+各连接的上报记录进入同一个有界队列，音频在进程池中编码为WAV，编码完成的记录按批次异步上传到
+manager-api；上传失败时指数退避重试（只推迟上传，不占用任何线程），manager-api 持续不可用时
+记录落盘，恢复后自动补传；各阶段（排队、编码、上传、落盘）分别统计
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from config.config_loader import get_project_dir
+from config.logger import setup_logging
+from core.utils.http_client import http_request
+from core.utils.report_codec import encode_report_audio
+from core.utils.report_worker import MAIN_PATH_ENV
+
+TAG = __name__
+logger = setup_logging()
+
+# 批量上报接口，旧版本 manager-api 没有该接口时逐条上报
+BATCH_ENDPOINT = "/agent/chat-history/report/batch"
+SINGLE_ENDPOINT = "/agent/chat-history/report"
+# 可重试的HTTP状态码
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+class _RetryableError(Exception):
+    """网络错误或服务端暂时不可用，稍后重试"""
+
+
+class ReportRecord:
+    """一条聊天记录"""
+
+    __slots__ = ("payload", "audio", "enqueue_time", "seq", "encoded")
+
+    def __init__(
+        self,
+        mac_address: str,
+        session_id: str,
+        chat_type: int,
+        content: str,
+        audio,
+        report_time: int,
+    ):
+        self.payload = {
+            "macAddress": mac_address,
+            "sessionId": session_id,
+            "chatType": chat_type,
+            "content": content,
+            "reportTime": report_time,
+            "audioBase64": None,
+        }
+        # 待编码的音频（opus数据包列表或PCM字节），编码后释放
+        self.audio = audio
+        self.enqueue_time = time.monotonic()
+        # 入队序号，编码完成后按该顺序上传
+        self.seq = 0
+        self.encoded = False
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "ReportRecord":
+        """从落盘数据恢复"""
+        record = cls.__new__(cls)
+        record.payload = payload
+        record.audio = None
+        record.enqueue_time = time.monotonic()
+        record.seq = 0
+        record.encoded = True
+        return record
+
+    def size(self) -> int:
+        return len(self.payload.get("content") or "") + len(
+            self.payload.get("audioBase64") or ""
+        )
+
+
+class ReportStats:
+    """各阶段统计"""
+
+    def __init__(self):
+        self.enqueued = 0
+        # 队列已满被丢弃
+        self.dropped = 0
+        self.encoded = 0
+        self.encode_errors = 0
+        self.encode_total = 0.0
+        self.batches = 0
+        self.uploaded = 0
+        self.upload_total = 0.0
+        self.latency_total = 0.0
+        self.retries = 0
+        # manager-api 明确拒绝（如设备不存在），不再重试
+        self.rejected = 0
+        self.spilled = 0
+        self.replayed = 0
+        # 落盘空间已满被丢弃
+        self.spill_dropped = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        live = self.uploaded + self.rejected - self.replayed
+        return {
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "encoded": self.encoded,
+            "encode_errors": self.encode_errors,
+            "encode_avg_ms": round(
+                self.encode_total / self.encoded * 1000 if self.encoded else 0.0, 1
+            ),
+            "batches": self.batches,
+            "uploaded": self.uploaded,
+            "batch_avg": round(self.uploaded / self.batches if self.batches else 0.0, 2),
+            "upload_avg_ms": round(
+                self.upload_total / self.batches * 1000 if self.batches else 0.0, 1
+            ),
+            # 从入队到上传完成的平均耗时（补传的记录不计入）
+            "latency_avg_ms": round(
+                self.latency_total / live * 1000 if live > 0 else 0.0, 1
+            ),
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "spill_dropped": self.spill_dropped,
+        }
+
+
+class ChatReportPipeline:
+    """
+    聊天记录上报流水线，由 WebSocketServer 配置和启动
+
+    配置（config.yaml 中的 report_pipeline，使用智控台时在 data/.config.yaml 中配置）:
+        - queue_size: 等待编码的记录数上限，超出时丢弃新记录，默认 1000
+        - encode_workers: 音频编码进程数，0 表示在线程中编码（Windows 上始终在线程中编码），默认 2
+        - batch_size: 单次上传的最多记录数，默认 20
+        - max_batch_kb: 单次上传的最大数据量（KB），默认 4096
+        - flush_interval_ms: 不足一批时最多等待的时间（毫秒），默认 500
+        - request_timeout: 单次上传超时（秒），默认 30
+        - retry_base_delay / retry_max_delay: 重试退避的初始与最大间隔（秒），默认 1 / 60
+        - spill_after_failures: 连续失败多少次后把待上传记录落盘，默认 3
+        - spill_dir: 落盘目录，默认 data/report_spill
+        - spill_max_mb: 落盘数据上限（MB），超出后丢弃，默认 200
+        - drain_timeout: 服务退出时等待上传完成的时间（秒），未完成的记录落盘，默认 5
+        - stats_log_interval: 每上传多少批输出一次统计，默认 100
+    """
+
+    def __init__(self):
+        self.enable = False
+        self._configure({})
+        self.stats = ReportStats()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: List[ReportRecord] = []
+        # 正在编码或等待前序记录编码完成的记录（按入队序号），编码完成后按序移入 _pending
+        self._reorder: Dict[int, ReportRecord] = {}
+        self._next_seq = 0
+        self._release_seq = 0
+        self._flush_event: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._batch_supported = True
+        self._failures = 0
+        self._spill_bytes = 0
+        self._spill_seq = 0
+
+    def _configure(self, pipeline_config: Dict[str, Any]):
+        self.queue_size = max(1, int(pipeline_config.get("queue_size", 1000)))
+        self.encode_workers = max(0, int(pipeline_config.get("encode_workers", 2)))
+        self.batch_size = max(1, int(pipeline_config.get("batch_size", 20)))
+        self.max_batch_bytes = int(pipeline_config.get("max_batch_kb", 4096)) * 1024
+        self.flush_interval = float(pipeline_config.get("flush_interval_ms", 500)) / 1000
+        self.request_timeout = float(pipeline_config.get("request_timeout", 30))
+        self.retry_base_delay = float(pipeline_config.get("retry_base_delay", 1))
+        self.retry_max_delay = float(pipeline_config.get("retry_max_delay", 60))
+        self.spill_after_failures = max(
+            1, int(pipeline_config.get("spill_after_failures", 3))
+        )
+        spill_dir = pipeline_config.get("spill_dir", "data/report_spill")
+        self.spill_dir = (
+            spill_dir if os.path.isabs(spill_dir) else get_project_dir() + spill_dir
+        )
+        self.spill_max_bytes = int(pipeline_config.get("spill_max_mb", 200)) * 1024 * 1024
+        self.drain_timeout = float(pipeline_config.get("drain_timeout", 5))
+        self.stats_log_interval = max(
+            1, int(pipeline_config.get("stats_log_interval", 100))
+        )
+
+    def configure(self, config: Dict[str, Any]):
+        """只有从 manager-api 读取配置时才上报聊天记录"""
+        api_config = config.get("manager-api") or {}
+        self.base_url = (api_config.get("url") or "").rstrip("/")
+        self._headers = {
+            "Accept": "application/json",
+            "Authorization": "Bearer " + (api_config.get("secret") or ""),
+        }
+        self.enable = bool(config.get("read_config_from_api") and self.base_url)
+        self._configure(config.get("report_pipeline") or {})
+
+    async def start(self):
+        """创建队列、编码进程池和后台任务（需在服务的事件循环中调用）"""
+        if not self.enable or self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._flush_event = asyncio.Event()
+        self._spill_bytes = await asyncio.to_thread(self._scan_spill_dir)
+        if self.encode_workers > 0 and sys.platform != "win32":
+            self._process_pool = self._create_process_pool()
+        # 编码任务数多于进程数，使进程池始终有待处理的任务
+        for _ in range(max(1, self.encode_workers * 2)):
+            self._tasks.append(asyncio.create_task(self._encode_loop()))
+        self._tasks.append(asyncio.create_task(self._upload_loop()))
+        logger.bind(tag=TAG).info(
+            f"聊天记录上报流水线已启动: 编码进程{self.encode_workers}, 批大小{self.batch_size}, "
+            f"待补传 {self._spill_bytes / 1024:.1f}KB"
+        )
+
+    def _create_process_pool(self) -> ProcessPoolExecutor:
+        # 服务进程中有多个线程，fork 可能复制到被其他线程持有的锁而死锁，因此由单线程的 forkserver 进程派生子进程；
+        # forkserver 只预先导入 report_worker（编码的最小入口），子进程不会重新执行 app.py、读取配置或初始化日志。
+        # Windows 只支持 spawn，子进程必然重新导入 app.py，因此在线程中编码
+        main_module = sys.modules.get("__main__")
+        main_path = getattr(main_module, "__file__", None)
+        if main_path:
+            os.environ[MAIN_PATH_ENV] = os.path.normpath(os.path.abspath(main_path))
+        # forkserver 进程不继承服务进程的 sys.path，预先导入失败时会被静默忽略，
+        # 不在项目目录下启动服务时需要通过 PYTHONPATH 找到 core 包
+        project_dir = os.path.normpath(get_project_dir())
+        python_path = os.environ.get("PYTHONPATH", "")
+        if project_dir not in python_path.split(os.pathsep):
+            os.environ["PYTHONPATH"] = (
+                project_dir + os.pathsep + python_path if python_path else project_dir
+            )
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["core.utils.report_worker"])
+        pool = ProcessPoolExecutor(
+            max_workers=self.encode_workers,
+            mp_context=context,
+        )
+        # 服务启动时就创建子进程，而不是在第一条记录到来时
+        pool.submit(encode_report_audio, None)
+        return pool
+
+    def submit(
+        self,
+        mac_address: str,
+        session_id: str,
+        chat_type: int,
+        content: str,
+        audio,
+        report_time: int,
+    ) -> bool:
+        """
+        提交一条聊天记录（可在任意线程调用，不阻塞）
+
+        Args:
+            chat_type: 1为用户，2为智能体
+            audio: opus音频数据包列表，或音频前端已解码的PCM字节，不上报音频时为 None
+        """
+        if not content or self._loop is None or self._loop.is_closed():
+            return False
+        record = ReportRecord(
+            mac_address, session_id, chat_type, content, audio, report_time
+        )
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._put(record)
+        else:
+            self._loop.call_soon_threadsafe(self._put, record)
+        return True
+
+    def _put(self, record: ReportRecord):
+        try:
+            record.seq = self._next_seq
+            self._queue.put_nowait(record)
+            self._next_seq += 1
+            self.stats.enqueued += 1
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            if self.stats.dropped % 100 == 1:
+                logger.bind(tag=TAG).warning(
+                    f"聊天记录上报队列已满，已丢弃 {self.stats.dropped} 条"
+                )
+
+    async def _encode(self, record: ReportRecord):
+        """在进程池中编码音频，编码失败时只上报文本"""
+        audio, record.audio = record.audio, None
+        if not audio:
+            return
+        begin = time.monotonic()
+        try:
+            pool = self._process_pool
+            if pool is not None:
+                try:
+                    encoded = await self._loop.run_in_executor(
+                        pool, encode_report_audio, audio
+                    )
+                except BrokenProcessPool:
+                    # 多个编码任务会同时收到该异常，只由第一个任务重建，避免关闭刚重建好的进程池
+                    if self._process_pool is pool:
+                        logger.bind(tag=TAG).warning("音频编码进程异常退出，重建进程池")
+                        pool.shutdown(wait=False)
+                        self._process_pool = self._create_process_pool()
+                    encoded = await asyncio.to_thread(encode_report_audio, audio)
+            else:
+                encoded = await asyncio.to_thread(encode_report_audio, audio)
+            record.payload["audioBase64"] = encoded
+            self.stats.encoded += 1
+            self.stats.encode_total += time.monotonic() - begin
+        except Exception as e:
+            self.stats.encode_errors += 1
+            logger.bind(tag=TAG).error(f"上报音频编码失败: {e}")
+
+    async def _encode_loop(self):
+        while True:
+            record = await self._queue.get()
+            self._reorder[record.seq] = record
+            try:
+                await self._encode(record)
+            finally:
+                # 编码失败或被取消的记录也要放行，否则排在它后面的记录会一直等待
+                record.encoded = True
+                self._release_encoded()
+                self._queue.task_done()
+            if len(self._pending) >= self.batch_size:
+                self._flush_event.set()
+
+    def _release_encoded(self):
+        """多个编码任务按完成顺序结束，这里按入队顺序把连续编码完成的记录追加到 _pending"""
+        while True:
+            record = self._reorder.get(self._release_seq)
+            if record is None or not record.encoded:
+                return
+            del self._reorder[self._release_seq]
+            self._release_seq += 1
+            self._pending.append(record)
+
+    def _take_batch(self, records: List[ReportRecord]) -> List[ReportRecord]:
+        """按条数和数据量取出一批（至少一条）"""
+        batch, size = [], 0
+        for record in records[: self.batch_size]:
+            size += record.size()
+            if batch and size > self.max_batch_bytes:
+                break
+            batch.append(record)
+        return batch
+
+    async def _upload_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_event.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                if await self._flush_pending() and self._spill_bytes > 0:
+                    await self._replay_spilled()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"聊天记录上报异常: {e}")
+            if self._failures > 0:
+                await asyncio.sleep(self._backoff_delay())
+
+    async def _flush_pending(self) -> bool:
+        """上传全部待上传记录，返回 manager-api 是否可用"""
+        while self._pending:
+            batch = self._take_batch(self._pending)
+            count = len(batch)
+            try:
+                await self._send(batch)
+            except _RetryableError as e:
+                self._on_failure(e)
+                # 逐条上报时 batch 中只剩失败的记录，仍留在队首以保持上传顺序
+                self._pending[:count] = batch
+                if self._failures >= self.spill_after_failures:
+                    pending, self._pending = self._pending, []
+                    await self._spill(pending)
+                return False
+            # 上传期间编码任务只会在末尾追加记录
+            del self._pending[:count]
+            now = time.monotonic()
+            for record in batch:
+                self.stats.latency_total += now - record.enqueue_time
+        return True
+
+    async def _replay_spilled(self):
+        """manager-api 恢复后，按落盘顺序补传"""
+        for path in await asyncio.to_thread(self._list_spill_files):
+            records = await asyncio.to_thread(self._read_spill_file, path)
+            while records:
+                batch = self._take_batch(records)
+                # 部分记录上报失败时 _send 会把 batch 缩减为失败的记录
+                taken = len(batch)
+                try:
+                    await self._send(batch)
+                except _RetryableError as e:
+                    self._on_failure(e)
+                    # 已保存的记录不再写回文件，避免重复补传
+                    self.stats.replayed += taken - len(batch)
+                    records = batch + records[taken:]
+                    await asyncio.to_thread(self._rewrite_spill_file, path, records)
+                    return
+                records = records[taken:]
+                self.stats.replayed += taken
+            await asyncio.to_thread(self._remove_spill_file, path)
+            if self._pending:
+                # 优先上传新产生的记录
+                return
+        logger.bind(tag=TAG).info("落盘的聊天记录已全部补传")
+
+    async def _send(self, batch: List[ReportRecord]):
+        """上传一批记录；可重试的失败抛出 _RetryableError，其余失败丢弃并计数"""
+        begin = time.monotonic()
+        if self._batch_supported:
+            status, result = await self._post(
+                BATCH_ENDPOINT, [record.payload for record in batch]
+            )
+            if status == 404:
+                self._batch_supported = False
+                logger.bind(tag=TAG).info("manager-api 不支持批量上报，改为逐条上报")
+                accepted = await self._send_each(batch)
+            elif status < 400 and isinstance(result, dict) and result.get("code") == 0:
+                accepted = self._count_batch_result(result.get("data"), len(batch))
+            else:
+                # 整批被拒绝（如旧版本接口中某条记录校验失败）时逐条上报，只丢弃真正被拒绝的记录
+                msg = result.get("msg") if isinstance(result, dict) else f"HTTP {status}"
+                logger.bind(tag=TAG).warning(f"批量上报被拒绝，改为逐条上报本批记录: {msg}")
+                accepted = await self._send_each(batch)
+        else:
+            accepted = await self._send_each(batch)
+        self._failures = 0
+        self.stats.batches += 1
+        self.stats.uploaded += accepted
+        self.stats.upload_total += time.monotonic() - begin
+        if self.stats.batches % self.stats_log_interval == 0:
+            logger.bind(tag=TAG).info(f"聊天记录上报统计: {self.get_stats()}")
+
+    async def _send_each(self, batch: List[ReportRecord]) -> int:
+        """逐条上报，单条失败不影响同批的其他记录，只重试失败的记录；返回保存成功的条数"""
+        results = await asyncio.gather(
+            *(self._post(SINGLE_ENDPOINT, record.payload) for record in batch),
+            return_exceptions=True,
+        )
+        accepted = 0
+        retry = []
+        for record, item in zip(batch, results):
+            try:
+                if isinstance(item, BaseException):
+                    raise item
+                if self._check_result(item[0], item[1], 1):
+                    accepted += 1
+            except _RetryableError:
+                retry.append(record)
+        if retry:
+            # 已成功的记录计入统计，batch 中只保留需要重试的记录
+            self.stats.uploaded += accepted
+            batch[:] = retry
+            raise _RetryableError(f"{len(retry)} 条上报失败")
+        return accepted
+
+    def _count_batch_result(self, data, count: int) -> int:
+        """
+        解析批量上报结果 {"saved": 保存条数, "failedIndexes": [未保存的记录下标]}，
+        未保存的记录（校验失败、设备未绑定等）重试也不会成功，计入 rejected
+        """
+        failed = []
+        if isinstance(data, dict):
+            saved = int(data.get("saved") or 0)
+            failed = data.get("failedIndexes") or []
+        elif isinstance(data, int):
+            saved = data
+        else:
+            saved = count
+        rejected = max(0, count - saved)
+        if rejected:
+            self.stats.rejected += rejected
+            logger.bind(tag=TAG).warning(
+                f"批量上报中 {rejected}/{count} 条未保存，下标: {failed}"
+            )
+        return min(saved, count)
+
+    async def _post(self, endpoint: str, body):
+        try:
+            response = await http_request(
+                "POST",
+                self.base_url + endpoint,
+                json=body,
+                headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            raise _RetryableError(f"请求失败: {e}") from e
+        if response.status_code in RETRY_STATUS:
+            raise _RetryableError(f"HTTP {response.status_code}")
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        return response.status_code, result
+
+    def _check_result(self, status: int, result, count: int) -> bool:
+        if status < 400 and isinstance(result, dict) and result.get("code") == 0:
+            return True
+        # 业务错误（如设备未绑定）重试也不会成功，直接丢弃
+        self.stats.rejected += count
+        msg = result.get("msg") if isinstance(result, dict) else f"HTTP {status}"
+        logger.bind(tag=TAG).warning(f"聊天记录上报被拒绝({count}条): {msg}")
+        return False
+
+    def _on_failure(self, error: Exception):
+        self._failures += 1
+        self.stats.retries += 1
+        logger.bind(tag=TAG).warning(
+            f"聊天记录上报失败(连续{self._failures}次)，"
+            f"{self._backoff_delay():.1f}秒后重试: {error}"
+        )
+
+    def _backoff_delay(self) -> float:
+        delay = min(
+            self.retry_max_delay,
+            self.retry_base_delay * (2 ** min(self._failures - 1, 16)),
+        )
+        # 加入抖动，避免多个服务实例同时重试
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _spill(self, records: List[ReportRecord]):
+        """把记录写入落盘目录，等待 manager-api 恢复后补传"""
+        if not records:
+            return
+        lines = [json.dumps(record.payload, ensure_ascii=False) for record in records]
+        size = sum(len(line.encode("utf-8")) + 1 for line in lines)
+        if self._spill_bytes + size > self.spill_max_bytes:
+            self.stats.spill_dropped += len(records)
+            logger.bind(tag=TAG).error(
+                f"落盘数据已达上限 {self.spill_max_bytes // 1024 // 1024}MB，丢弃 {len(records)} 条聊天记录"
+            )
+            return
+        self._spill_seq += 1
+        path = os.path.join(
+            self.spill_dir, f"{time.time_ns()}_{os.getpid()}_{self._spill_seq}.jsonl"
+        )
+        try:
+            await asyncio.to_thread(self._write_spill_file, path, lines)
+        except OSError as e:
+            self.stats.spill_dropped += len(records)
+            logger.bind(tag=TAG).error(f"聊天记录落盘失败: {e}")
+            return
+        self._spill_bytes += size
+        self.stats.spilled += len(records)
+        logger.bind(tag=TAG).warning(f"manager-api 不可用，{len(records)} 条聊天记录已落盘")
+
+    def _write_spill_file(self, path: str, lines: List[str]):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def _list_spill_files(self) -> List[str]:
+        if not os.path.isdir(self.spill_dir):
+            return []
+        names = sorted(n for n in os.listdir(self.spill_dir) if n.endswith(".jsonl"))
+        return [os.path.join(self.spill_dir, n) for n in names]
+
+    def _scan_spill_dir(self) -> int:
+        return sum(os.path.getsize(path) for path in self._list_spill_files())
+
+    def _read_spill_file(self, path: str) -> List[ReportRecord]:
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(ReportRecord.from_payload(json.loads(line)))
+                except ValueError:
+                    logger.bind(tag=TAG).warning(f"跳过损坏的落盘记录: {path}")
+        return records
+
+    def _rewrite_spill_file(self, path: str, records: List[ReportRecord]):
+        """补传中断时只保留未上传的记录"""
+        old_size = os.path.getsize(path)
+        lines = [json.dumps(record.payload, ensure_ascii=False) for record in records]
+        self._write_spill_file(path, lines)
+        self._spill_bytes += os.path.getsize(path) - old_size
+
+    def _remove_spill_file(self, path: str):
+        size = os.path.getsize(path)
+        os.remove(path)
+        self._spill_bytes = max(0, self._spill_bytes - size)
+
+    async def close(self):
+        """服务退出时调用：在 drain_timeout 内尽量上传完，剩余记录落盘"""
+        if self._loop is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        # 等待前序记录的记录按入队顺序追加（编码被中断的记录只上报文本）
+        for seq in sorted(self._reorder):
+            self._pending.append(self._reorder[seq])
+        self._reorder.clear()
+        self._release_seq = self._next_seq
+        # 尚未编码的记录在线程中编码
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            try:
+                record.payload["audioBase64"] = await asyncio.to_thread(
+                    encode_report_audio, record.audio
+                )
+            except Exception:
+                pass
+            record.audio = None
+            self._pending.append(record)
+        if self._pending and self._failures == 0:
+            try:
+                await asyncio.wait_for(self._flush_pending(), timeout=self.drain_timeout)
+            except (asyncio.TimeoutError, Exception):
+                pass
+        pending, self._pending = self._pending, []
+        await self._spill(pending)
+
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        logger.bind(tag=TAG).info(f"聊天记录上报流水线已关闭: {self.get_stats()}")
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.get_stats()
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["pending"] = len(self._pending)
+        stats["spill_kb"] = round(self._spill_bytes / 1024, 1)
+        return stats
+
+
+# 全局实例
+chat_report_pipeline = ChatReportPipeline()
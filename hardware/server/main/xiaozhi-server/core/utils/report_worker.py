@@ -0,0 +1,27 @@
+"""
+聊天记录上报编码进程的最小入口
+由 forkserver 进程预先导入，编码子进程从 forkserver 派生。
+multiprocessing 默认会在每个子进程中重新执行服务入口脚本（app.py），而导入 app.py 会初始化日志、
+读取配置（使用智控台时还会请求 manager-api）并导入整个服务的模块；这里把入口脚本登记为
+forkserver 中已加载的 __main__，子进程因此跳过这一步，只加载编码所需的模块。
+本模块不能导入会读取配置或初始化日志的模块
+"""
+
+import os
+import sys
+
+# 服务进程在创建进程池前写入入口脚本的路径
+MAIN_PATH_ENV = "XIAOZHI_REPORT_MAIN_PATH"
+
+
+def _register_main():
+    main_path = os.environ.get(MAIN_PATH_ENV)
+    main_module = sys.modules.get("__main__")
+    # 服务进程的 __main__ 就是 app.py，只在没有入口脚本的 forkserver 进程中登记
+    if main_path and main_module is not None and getattr(main_module, "__file__", None) is None:
+        main_module.__file__ = main_path
+
+
+_register_main()
+
+from core.utils.report_codec import encode_report_audio  # noqa: E402
@@ -0,0 +1,220 @@
+"""
+增量分句器
+LLM 流式输出的文本逐段写入，只扫描新追加的字符，按标点切出适合送入 TTS 的句子；
+第一句可按长度/等待时间提前切分以缩短首包语音时延，并记录每句的分句耗时
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+# 非第一句的分句标点
+PUNCTUATIONS = frozenset("。？?！!；;：")
+# 第一句的分句标点（包含逗号等，尽快送出第一句）
+FIRST_SENTENCE_PUNCTUATIONS = frozenset("，~、,。？?！!；;：")
+# 提前切分时优先选择的断点（空白）
+SOFT_BREAKS = frozenset(" \t\n")
+
+
+@dataclass
+class SentenceTiming:
+    """单句的分句时间信息（时间单位：秒，time.monotonic）"""
+
+    index: int
+    chars: int
+    # 切分原因：punct 标点、length 长度提前切分、timeout 等待超时提前切分、final 回复结束
+    reason: str
+    turn_start: float
+    first_char_at: float
+    emitted_at: float
+    synthesis_ms: Optional[float] = None
+
+    @property
+    def wait_ms(self) -> float:
+        """从本句第一个字到切分出来的耗时"""
+        return (self.emitted_at - self.first_char_at) * 1000
+
+    @property
+    def since_turn_ms(self) -> float:
+        """从本轮回复第一个字到本句切分出来的耗时"""
+        return (self.emitted_at - self.turn_start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "chars": self.chars,
+            "reason": self.reason,
+            "wait_ms": round(self.wait_ms, 1),
+            "since_turn_ms": round(self.since_turn_ms, 1),
+            "synthesis_ms": (
+                round(self.synthesis_ms, 1) if self.synthesis_ms is not None else None
+            ),
+        }
+
+
+class SentenceSegmenter:
+    """
+    单轮回复的增量分句器
+
+    未切出的文本保存在 _pending 中，_scan_pos 之前的字符已扫描过且不含断点，
+    每个字符只会被扫描一次（切句后扫描位置随剩余文本平移）；
+    切出一句后 _pending 只保留剩余部分，长度不超过一句话。
+    """
+
+    def __init__(
+        self,
+        first_sentence_max_chars: int = 0,
+        first_sentence_max_wait_ms: float = 0,
+    ):
+        """
+        Args:
+            first_sentence_max_chars: 第一句超过该长度仍无标点时提前切分，0 表示不启用
+            first_sentence_max_wait_ms: 第一句等待超过该时长仍无标点时提前切分，0 表示不启用
+        """
+        self.first_sentence_max_chars = first_sentence_max_chars
+        self.first_sentence_max_wait_ms = first_sentence_max_wait_ms
+        self.timings: List[SentenceTiming] = []
+        self.reset()
+
+    def configure(self, config: Dict[str, Any]):
+        """从全局配置读取提前切分参数（config.yaml 中的 tts_segmenter）"""
+        segmenter_config = config.get("tts_segmenter") or {}
+        max_chars = segmenter_config.get("first_sentence_max_chars", 0)
+        max_wait_ms = segmenter_config.get("first_sentence_max_wait_ms", 0)
+        self.first_sentence_max_chars = int(max_chars) if max_chars else 0
+        self.first_sentence_max_wait_ms = float(max_wait_ms) if max_wait_ms else 0
+
+    def reset(self):
+        """开始新一轮回复"""
+        self._pending = ""
+        self._scan_pos = 0
+        self.is_first_sentence = True
+        self._turn_start: Optional[float] = None
+        self._first_char_at: Optional[float] = None
+        self.timings = []
+
+    @property
+    def pending_text(self) -> str:
+        return self._pending
+
+    def push(self, text: str) -> List[str]:
+        """
+        追加一段文本，返回能切出的句子（包含结尾标点），没有时返回空列表
+
+        第一句在第一个断点处切分；之后的句子在新文本中最后一个断点处切分，
+        同一段里连续的多个短句合并成一次 TTS 请求。第一句切出后，
+        同一段里剩余的完整句子也立即切出，不等下一段文本。
+        """
+        if not text:
+            return []
+        now = time.monotonic()
+        if self._turn_start is None:
+            self._turn_start = now
+        if self._first_char_at is None:
+            self._first_char_at = now
+        self._pending += text
+
+        segments = []
+        segment = self._cut_at_punctuation(now)
+        while segment is not None:
+            segments.append(segment)
+            segment = self._cut_at_punctuation(now)
+
+        if (
+            not segments
+            and self.is_first_sentence
+            and self.first_sentence_max_chars
+            and len(self._pending) >= self.first_sentence_max_chars
+        ):
+            segments.append(self._emit(self._soft_cut(), "length", now))
+        if not segments:
+            segment = self.poll(now)
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def poll(self, now: Optional[float] = None) -> Optional[str]:
+        """
+        第一句等待超时检查：超过 first_sentence_max_wait_ms 仍无标点时提前切出，否则返回 None
+        LLM 输出停顿（没有新文本触发 push）时由调用方在 first_sentence_wait_left() 到期后调用
+        """
+        if now is None:
+            now = time.monotonic()
+        if (
+            self.is_first_sentence
+            and self._pending
+            and self.first_sentence_max_wait_ms
+            and (now - self._first_char_at) * 1000 >= self.first_sentence_max_wait_ms
+        ):
+            return self._emit(self._soft_cut(), "timeout", now)
+        return None
+
+    def first_sentence_wait_left(self) -> Optional[float]:
+        """距第一句等待超时还剩的秒数，未启用或当前没有待切分的第一句时返回 None"""
+        if (
+            not self.is_first_sentence
+            or not self._pending
+            or not self.first_sentence_max_wait_ms
+        ):
+            return None
+        elapsed = time.monotonic() - self._first_char_at
+        return max(0.0, self.first_sentence_max_wait_ms / 1000 - elapsed)
+
+    def flush(self) -> Optional[str]:
+        """回复结束，返回剩余的全部文本"""
+        if not self._pending:
+            return None
+        segment = self._emit(len(self._pending), "final", time.monotonic())
+        self.is_first_sentence = True
+        return segment
+
+    def _cut_at_punctuation(self, now: float) -> Optional[str]:
+        """从上次扫描位置继续查找断点，找到时切出一句"""
+        punctuations = (
+            FIRST_SENTENCE_PUNCTUATIONS if self.is_first_sentence else PUNCTUATIONS
+        )
+        cut = -1
+        pending = self._pending
+        for i in range(self._scan_pos, len(pending)):
+            if pending[i] in punctuations:
+                cut = i
+                if self.is_first_sentence:
+                    break
+        if cut == -1:
+            self._scan_pos = len(pending)
+            return None
+        # 第一句只扫描到断点为止，剩余部分按后续句子的标点继续扫描
+        self._scan_pos = cut + 1 if self.is_first_sentence else len(pending)
+        return self._emit(cut + 1, "punct", now)
+
+    def _soft_cut(self) -> int:
+        """提前切分时尽量在空白处断开，避免切断英文单词"""
+        pending = self._pending
+        pos = max(pending.rfind(ch) for ch in SOFT_BREAKS)
+        if pos > len(pending) // 2:
+            return pos + 1
+        return len(pending)
+
+    def _emit(self, end: int, reason: str, now: float) -> str:
+        segment = self._pending[:end]
+        self._pending = self._pending[end:]
+        self._scan_pos = max(0, self._scan_pos - end)
+        self.timings.append(
+            SentenceTiming(
+                index=len(self.timings),
+                chars=len(segment),
+                reason=reason,
+                turn_start=self._turn_start if self._turn_start is not None else now,
+                first_char_at=(
+                    self._first_char_at if self._first_char_at is not None else now
+                ),
+                emitted_at=now,
+            )
+        )
+        self.is_first_sentence = False
+        self._first_char_at = now if self._pending else None
+        return segment
+
+    @property
+    def last_timing(self) -> Optional[SentenceTiming]:
+        return self.timings[-1] if self.timings else None
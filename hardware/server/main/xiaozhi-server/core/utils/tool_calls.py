@@ -0,0 +1,74 @@
+"""
+流式工具调用的拼装
+LLM 以增量方式返回工具调用（名称、参数分多个分片到达），这里按 index 拼装成完整的调用；
+某个调用之后出现了新的调用时，它的参数已经完整，可以提前开始执行
+"""
+
+import uuid
+from typing import Any, Dict, List, Optional
+
+
+class ToolCallCollector:
+    """按 index 拼装流式返回的多个工具调用"""
+
+    def __init__(self):
+        # index -> {"id", "name", "arguments"}
+        self._calls: Dict[Any, Dict[str, Optional[str]]] = {}
+        self._order: List[Any] = []
+        # 已经交出去执行的调用数量（按出现顺序）
+        self._released = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._order)
+
+    def feed(self, tools_call) -> List[Dict[str, str]]:
+        """
+        写入一个分片中的工具调用增量
+
+        Returns:
+            参数已经完整、可以开始执行的调用（之后又出现了新调用的那些）
+        """
+        for tc in tools_call or []:
+            key = getattr(tc, "index", None)
+            tc_id = getattr(tc, "id", None)
+            if key is None:
+                # 没有 index 的提供方：出现新的 id 视为新的调用，否则追加到最后一个调用
+                last = self._calls[self._order[-1]] if self._order else None
+                if last is None or (tc_id is not None and last["id"] not in (None, tc_id)):
+                    key = len(self._order)
+                else:
+                    key = self._order[-1]
+            call = self._calls.get(key)
+            if call is None:
+                call = {"id": None, "name": None, "arguments": ""}
+                self._calls[key] = call
+                self._order.append(key)
+            if tc_id is not None:
+                call["id"] = tc_id
+            function = getattr(tc, "function", None)
+            if function is not None:
+                if getattr(function, "name", None) is not None:
+                    call["name"] = function.name
+                if getattr(function, "arguments", None) is not None:
+                    call["arguments"] += function.arguments
+        return self._release(len(self._order) - 1)
+
+    def finish(self) -> List[Dict[str, str]]:
+        """流结束，返回剩余未执行的调用"""
+        return self._release(len(self._order))
+
+    def _release(self, upto: int) -> List[Dict[str, str]]:
+        released = []
+        while self._released < upto:
+            call = self._calls[self._order[self._released]]
+            self._released += 1
+            if not call["name"]:
+                continue
+            released.append(
+                {
+                    "name": call["name"],
+                    "id": call["id"] or str(uuid.uuid4().hex),
+                    "arguments": call["arguments"],
+                }
+            )
+        return released
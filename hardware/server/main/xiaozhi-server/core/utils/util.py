@@ -6,9 +6,9 @@ import os
 from io import BytesIO
 from typing import Callable, Any
 from core.utils import p3
-import numpy as np
+from core.utils.audio_codec import decode_to_pcm16k
+from core.utils.opus_encoder_utils import OpusEncoderUtils
 import requests
-import opuslib_next
 from pydub import AudioSegment
 import copy
 
@@ -211,49 +211,75 @@ def extract_json_from_string(input_string):
     return None
 
 
-def audio_to_data_stream(audio_file_path, is_opus=True, callback: Callable[[Any], Any]=None) -> None:
+def audio_to_data_stream(audio_file_path, is_opus=True, callback: Callable[[Any], Any]=None, encoder=None) -> None:
     # 获取文件后缀名
     file_type = os.path.splitext(audio_file_path)[1]
     if file_type:
         file_type = file_type.lstrip(".")
-    # 读取音频文件，-nostdin 参数：不要从标准输入读取数据，否则FFmpeg会阻塞
-    audio = AudioSegment.from_file(
-        audio_file_path, format=file_type, parameters=["-nostdin"]
-    )
-
-    # 转换为单声道/16kHz采样率/16位小端编码（确保与编码器匹配）
-    audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
+    with open(audio_file_path, "rb") as f:
+        audio_bytes = f.read()
+    audio_bytes_to_data_stream(audio_bytes, file_type, is_opus, callback, encoder=encoder)
 
-    # 获取原始PCM数据（16位小端）
-    raw_data = audio.raw_data
-    pcm_to_data_stream(raw_data, is_opus, callback)
 
-
-def audio_bytes_to_data_stream(audio_bytes, file_type, is_opus, callback: Callable[[Any], Any]) -> None:
+def audio_bytes_to_data_stream(
+    audio_bytes, file_type, is_opus, callback: Callable[[Any], Any], encoder=None, pcm_sample_rate=16000
+) -> None:
     """
-    直接用音频二进制数据转为opus/pcm数据，支持wav、mp3、p3
+    直接用音频二进制数据转为opus/pcm数据，支持wav、mp3、p3、pcm
+    wav/pcm在进程内解码重采样，其他格式（或进程内解码失败时）使用pydub(ffmpeg)
     """
     if file_type == "p3":
         # 直接用p3解码
         return p3.decode_opus_from_bytes_stream(audio_bytes, callback)
-    else:
-        # 其他格式用pydub
+    raw_data = decode_to_pcm16k(audio_bytes, file_type, pcm_sample_rate)
+    if raw_data is None:
+        # 其他格式用pydub，-nostdin 参数：不要从标准输入读取数据，否则FFmpeg会阻塞
         audio = AudioSegment.from_file(
             BytesIO(audio_bytes), format=file_type, parameters=["-nostdin"]
         )
+        # 转换为单声道/16kHz采样率/16位小端编码（确保与编码器匹配）
         audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
         raw_data = audio.raw_data
-        pcm_to_data_stream(raw_data, is_opus, callback)
+    pcm_to_data_stream(raw_data, is_opus, callback, encoder=encoder)
+
+
+def new_sentence_encoder() -> OpusEncoderUtils:
+    """
+    创建整句TTS音频使用的Opus编码器
+    沿用libopus默认的比特率与复杂度（与原先每句新建的编码器一致），
+    不使用流式TTS的24kbps/复杂度10配置，避免每帧编码的CPU开销上升
+    """
+    return OpusEncoderUtils(
+        sample_rate=16000,
+        channels=1,
+        frame_size_ms=60,
+        bitrate=None,
+        complexity=None,
+        signal=None,
+    )
 
 
-def pcm_to_data_stream(raw_data, is_opus=True, callback: Callable[[Any], Any] = None):
-    # 初始化Opus编码器
-    encoder = opuslib_next.Encoder(16000, 1, opuslib_next.APPLICATION_AUDIO)
+def pcm_to_data_stream(raw_data, is_opus=True, callback: Callable[[Any], Any] = None, encoder=None):
+    """
+    16kHz单声道PCM按60ms分帧，编码为Opus（或直接输出PCM帧）
 
+    Args:
+        encoder: 可复用的OpusEncoderUtils（如每个连接一个），为空时临时创建
+    """
     # 编码参数
     frame_duration = 60  # 60ms per frame
     frame_size = int(16000 * frame_duration / 1000)  # 960 samples/frame
 
+    if is_opus:
+        if encoder is None:
+            encoder = new_sentence_encoder()
+        else:
+            # 每句话从干净的编码器状态开始
+            encoder.reset_state()
+        # 按帧编码并逐帧回调，最后一帧不足时补零
+        encoder.encode_pcm_to_opus_stream(raw_data, True, callback)
+        return
+
     # 按帧处理所有音频数据（包括最后一帧可能补零）
     for i in range(0, len(raw_data), frame_size * 2):  # 16bit=2bytes/sample
         # 获取当前帧的二进制数据
@@ -263,15 +289,8 @@ def pcm_to_data_stream(raw_data, is_opus=True, callback: Callable[[Any], Any] =
         if len(chunk) < frame_size * 2:
             chunk += b"\x00" * (frame_size * 2 - len(chunk))
 
-        if is_opus:
-            # 转换为numpy数组处理
-            np_frame = np.frombuffer(chunk, dtype=np.int16)
-            # 编码Opus数据
-            frame_data = encoder.encode(np_frame.tobytes(), frame_size)
-            callback(frame_data)
-        else:
-            frame_data = chunk if isinstance(chunk, bytes) else bytes(chunk)
-            callback(frame_data)
+        frame_data = chunk if isinstance(chunk, bytes) else bytes(chunk)
+        callback(frame_data)
 
 
 def check_vad_update(before_config, new_config):
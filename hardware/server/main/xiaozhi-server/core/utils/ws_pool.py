@@ -0,0 +1,282 @@
+"""
+流式语音服务的 WebSocket 连接池
+按服务地址 + 凭证区分，提前建好连接（预连接）并保持，语句/合成会话开始时直接租用，
+省去每轮对话的 DNS、TLS 与 WebSocket 握手；会话正常结束的连接归还后可被其他连接复用，
+空闲过久或已断开的连接自动丢弃并在后台补充
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+Connector = Callable[[], Awaitable[Any]]
+
+
+def is_ws_open(ws) -> bool:
+    """连接是否仍处于打开状态（兼容不同版本的 websockets）"""
+    if ws is None:
+        return False
+    state = getattr(ws, "state", None)
+    if state is not None:
+        return getattr(state, "name", "") == "OPEN"
+    return not getattr(ws, "closed", True)
+
+
+class _KeyState:
+    """同一服务地址 + 凭证下的连接"""
+
+    __slots__ = (
+        "connect", "idle_ttl", "idle", "last_used", "refilling", "retry_at", "unused_refills"
+    )
+
+    def __init__(self, connect: Connector, idle_ttl: float):
+        self.connect = connect
+        self.idle_ttl = idle_ttl
+        # (连接, 开始空闲的时间)
+        self.idle: Deque[Tuple[Any, float]] = deque()
+        self.last_used = 0.0
+        self.refilling = False
+        # 预连接失败后暂停补充，直到该时间
+        self.retry_at = 0.0
+        # 上次租用后，因预连接空闲过期而补充的次数
+        self.unused_refills = 0
+
+
+class ProviderWSPool:
+    """
+    流式语音服务 WebSocket 连接池（进程内共享）
+
+    配置（config.yaml 中的 ws_pool）:
+        - enable: 是否启用，关闭后每次都新建连接
+        - min_idle: 每个服务保持的预连接数，默认 1
+        - max_idle: 每个服务最多保留的空闲连接数，默认 4
+        - warm_window: 最近一次使用后保持预连接的时间（秒），超过后释放空闲连接，默认 300
+        - max_unused_refills: 预连接未被使用就因空闲过期时，最多补充的次数（每次租用后重新计数），默认 1；
+          服务端空闲超时较短（如 10 秒）时避免在 warm_window 内反复握手
+        - stats_log_interval: 每租用多少次输出一次统计，默认 100
+    """
+
+    CHECK_INTERVAL = 2
+    # 预连接失败后的重试间隔（秒）
+    RETRY_INTERVAL = 30
+
+    def __init__(self):
+        self.enable = True
+        self.min_idle = 1
+        self.max_idle = 4
+        self.warm_window = 300.0
+        self.max_unused_refills = 1
+        self.stats_log_interval = 100
+        self._keys: Dict[str, _KeyState] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._maintain_task: Optional[asyncio.Task] = None
+        # 后台补充、关闭连接的任务，保留引用直到完成
+        self._tasks: Set[asyncio.Task] = set()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.leases = 0
+        self.reused = 0
+        self.handshakes = 0
+        self.handshake_total = 0.0
+        self.failures = 0
+
+    def configure(self, config: Dict[str, Any]):
+        pool_config = config.get("ws_pool") or {}
+        self.enable = bool(pool_config.get("enable", True))
+        self.min_idle = max(0, int(pool_config.get("min_idle", 1)))
+        self.max_idle = max(self.min_idle, int(pool_config.get("max_idle", 4)))
+        self.warm_window = float(pool_config.get("warm_window", 300))
+        self.max_unused_refills = max(0, int(pool_config.get("max_unused_refills", 1)))
+        self.stats_log_interval = max(1, int(pool_config.get("stats_log_interval", 100)))
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # 连接属于创建它的事件循环，换了事件循环（例如测试工具多次 asyncio.run）时重新开始
+        self._keys.clear()
+        self._tasks.clear()
+        self._loop = loop
+        self._maintain_task = loop.create_task(self._maintain())
+
+    async def lease(
+        self, key: str, connect: Connector, idle_ttl: float, fresh: bool = False
+    ):
+        """
+        租用一个已连接的 WebSocket
+
+        Args:
+            key: 服务地址 + 凭证，决定连接能否共用
+            connect: 新建连接的协程函数
+            idle_ttl: 服务端允许的空闲时间（秒），空闲超过该时间的连接不再使用
+            fresh: 为 True 时跳过空闲连接直接新建（预连接被服务端关闭后重试）
+        """
+        self._bind_loop()
+        state = self._keys.get(key)
+        if state is None:
+            state = _KeyState(connect, idle_ttl)
+            self._keys[key] = state
+        state.connect = connect
+        state.idle_ttl = idle_ttl
+        state.last_used = time.monotonic()
+        state.unused_refills = 0
+        self.leases += 1
+        if self.leases % self.stats_log_interval == 0:
+            logger.bind(tag=TAG).info(f"流式服务连接池统计: {self.get_stats()}")
+
+        if self.enable and not fresh:
+            now = time.monotonic()
+            while state.idle:
+                ws, idle_since = state.idle.popleft()
+                if is_ws_open(ws) and now - idle_since < idle_ttl:
+                    self.reused += 1
+                    self._schedule_refill(key, state)
+                    return ws
+                self._close_later(ws)
+
+        ws = await self._connect(state)
+        self._schedule_refill(key, state)
+        return ws
+
+    def release(
+        self, key: str, ws, reusable: bool = True, idle_for: float = 0.0
+    ):
+        """
+        归还连接；会话未正常结束（reusable=False）或连接已断开时关闭
+
+        Args:
+            idle_for: 归还前连接已经空闲的秒数，计入空闲时间
+        """
+        if ws is None:
+            return
+        state = self._keys.get(key)
+        if state is not None:
+            state.last_used = time.monotonic()
+        if (
+            reusable
+            and self.enable
+            and state is not None
+            and is_ws_open(ws)
+            and len(state.idle) < self.max_idle
+        ):
+            state.idle.append((ws, time.monotonic() - max(0.0, idle_for)))
+            return
+        self._close_later(ws)
+
+    async def _connect(self, state: _KeyState):
+        begin = time.monotonic()
+        try:
+            ws = await state.connect()
+        except Exception:
+            self.failures += 1
+            raise
+        self.handshakes += 1
+        self.handshake_total += time.monotonic() - begin
+        return ws
+
+    def _schedule_refill(self, key: str, state: _KeyState) -> bool:
+        """需要时在后台补充预连接，返回是否开始补充"""
+        if (
+            not self.enable
+            or state.refilling
+            or len(state.idle) >= self.min_idle
+            or time.monotonic() < state.retry_at
+        ):
+            return False
+        state.refilling = True
+        self._spawn(self._refill(key, state))
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: str, state: _KeyState):
+        try:
+            while self._keys.get(key) is state and len(state.idle) < self.min_idle:
+                ws = await self._connect(state)
+                state.idle.append((ws, time.monotonic()))
+        except Exception as e:
+            state.retry_at = time.monotonic() + self.RETRY_INTERVAL
+            logger.bind(tag=TAG).warning(f"预连接失败 {key.split('|', 1)[0]}: {e}")
+        finally:
+            state.refilling = False
+
+    async def _maintain(self):
+        """丢弃快要过期或已断开的空闲连接，最近有使用的服务保持预连接"""
+        while True:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            now = time.monotonic()
+            for key, state in list(self._keys.items()):
+                warm = now - state.last_used < self.warm_window
+                if not warm and not state.idle and not state.refilling:
+                    # 超过 warm_window 未使用且没有空闲连接的服务不再保留状态，避免凭证或地址变化后状态越积越多
+                    del self._keys[key]
+                    continue
+                # 留出余量，避免租用时连接恰好被服务端因空闲关闭
+                expire = state.idle_ttl * 0.8
+                kept = deque()
+                for ws, idle_since in state.idle:
+                    if warm and is_ws_open(ws) and now - idle_since < expire:
+                        kept.append((ws, idle_since))
+                    else:
+                        self._close_later(ws)
+                state.idle = kept
+                # 预连接没被用到就过期时只补充有限次数，直到下次租用
+                if warm and state.unused_refills < self.max_unused_refills:
+                    if self._schedule_refill(key, state):
+                        state.unused_refills += 1
+
+    def _close_later(self, ws):
+        async def close():
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+        self._spawn(close())
+
+    async def close(self):
+        """关闭全部空闲连接并取消后台任务（服务退出时调用）"""
+        if self._maintain_task:
+            self._maintain_task.cancel()
+            self._maintain_task = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        for state in self._keys.values():
+            while state.idle:
+                ws, _ = state.idle.popleft()
+                try:
+                    await ws.close()
+                except Exception:
+                    pass
+        self._keys.clear()
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        handshake_avg = self.handshake_total / self.handshakes if self.handshakes else 0.0
+        return {
+            "leases": self.leases,
+            "reused": self.reused,
+            "handshakes": self.handshakes,
+            "failures": self.failures,
+            "handshake_avg_ms": round(handshake_avg * 1000, 1),
+            # 租用时直接拿到已连接的 WebSocket，省下的握手时间
+            "saved_ms": round(self.reused * handshake_avg * 1000, 1),
+        }
+
+
+# 全局实例
+provider_ws_pool = ProviderWSPool()
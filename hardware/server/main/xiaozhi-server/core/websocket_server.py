@@ -5,6 +5,11 @@ from core.connection import ConnectionHandler
 from config.config_loader import get_config_from_api
 from core.utils.modules_initialize import initialize_modules
 from core.utils.util import check_vad_update, check_asr_update
+from core.utils.cache.tts_cache import tts_audio_cache, prewarm_tts_cache
+from core.providers.tools.server_mcp import ServerMCPPool
+from core.utils.connection_factory import ConnectionFactory
+from core.utils.ws_pool import provider_ws_pool
+from core.utils.report_pipeline import chat_report_pipeline
 
 TAG = __name__
 
@@ -31,17 +36,45 @@ class WebSocketServer:
         self._memory = modules["memory"] if "memory" in modules else None
 
         self.active_connections = set()
+        # TTS 句子缓存（所有连接共享）
+        tts_audio_cache.configure(self.config)
+        # 流式ASR/TTS服务的WebSocket连接池（所有连接共享）
+        provider_ws_pool.configure(self.config)
+        # 聊天记录上报流水线（所有连接共享，仅从manager-api读取配置时启用）
+        chat_report_pipeline.configure(self.config)
+        # 服务端MCP连接池（所有连接共享，启动时并行连接各服务）
+        self.mcp_pool = ServerMCPPool(self.config)
+        self._mcp_task = None
+        # 连接工厂：共享线程池、预热TTS/远程ASR实例
+        self.connection_factory = ConnectionFactory(self.config, self._asr)
 
     async def start(self):
         server_config = self.config["server"]
         host = server_config.get("ip", "0.0.0.0")
         port = int(server_config.get("port", 8000))
 
+        # 后台预热固定话术的TTS缓存，不阻塞服务启动
+        self._prewarm_task = asyncio.create_task(prewarm_tts_cache(self.config))
+        self.connection_factory.start()
+        # 后台启动MCP服务，连接初始化时等待其就绪
+        self._mcp_task = asyncio.create_task(self.mcp_pool.start())
+        await chat_report_pipeline.start()
+
         async with websockets.serve(
             self._handle_connection, host, port, process_request=self._http_response
         ):
             await asyncio.Future()
 
+    async def close(self):
+        """释放服务级共享资源（进程退出时调用）"""
+        if self._mcp_task and not self._mcp_task.done():
+            self._mcp_task.cancel()
+        await self.mcp_pool.close()
+        self.connection_factory.close()
+        await provider_ws_pool.close()
+        # 尽量上传完剩余的聊天记录，未完成的落盘
+        await chat_report_pipeline.close()
+
     async def _handle_connection(self, websocket):
         """处理新连接，每次创建独立的ConnectionHandler"""
         # 创建ConnectionHandler时传入当前server实例
@@ -131,6 +164,7 @@ class WebSocketServer:
                     self._intent = modules["intent"]
                 if "memory" in modules:
                     self._memory = modules["memory"]
+                self.connection_factory.reload(new_config, self._asr)
                 self.logger.bind(tag=TAG).info(f"更新配置任务执行完毕")
                 return True
         except Exception as e:
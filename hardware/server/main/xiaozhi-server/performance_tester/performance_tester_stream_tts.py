@@ -20,6 +20,7 @@ class StreamTTSPerformanceTester:
         """测试阿里云流式TTS首词延迟（测试多次取平均）"""
         text = text or self.test_texts[0]
         latencies = []
+        handshakes = []
         
         for i in range(test_count):
             try:
@@ -32,6 +33,8 @@ class StreamTTSPerformanceTester:
 
                 start_time = time.time()
                 async with websockets.connect(ws_url, extra_headers={"X-NLS-Token": token}) as ws:
+                    # 握手耗时：使用预连接时可以省去的部分
+                    handshakes.append(time.time() - start_time)
                     task_id = str(uuid.uuid4())
                     message_id = str(uuid.uuid4())
                     
@@ -84,12 +87,13 @@ class StreamTTSPerformanceTester:
             except Exception as e:
                 latencies.append(0)
         
-        return self._calculate_result("阿里云TTS", latencies, test_count)
+        return self._calculate_result("阿里云TTS", latencies, test_count, handshakes)
 
     async def test_doubao_tts(self, text=None, test_count=5):
         """测试火山引擎流式TTS首词延迟（测试多次取平均）"""
         text = text or self.test_texts[0]
         latencies = []
+        handshakes = []
         
         for i in range(test_count):
             try:
@@ -108,6 +112,8 @@ class StreamTTSPerformanceTester:
                     "X-Api-Connect-Id": str(uuid.uuid4()),
                 }
                 async with websockets.connect(ws_url, additional_headers=ws_header, max_size=1000000000) as ws:
+                    # 握手耗时：使用预连接时可以省去的部分
+                    handshakes.append(time.time() - start_time)
                     session_id = uuid.uuid4().hex
                     
                     # 发送会话启动请求
@@ -147,12 +153,13 @@ class StreamTTSPerformanceTester:
             except Exception as e:
                 latencies.append(0)
         
-        return self._calculate_result("火山引擎TTS", latencies, test_count)
+        return self._calculate_result("火山引擎TTS", latencies, test_count, handshakes)
 
     async def test_paddlespeech_tts(self, text=None, test_count=5):
         """测试PaddleSpeech流式TTS首词延迟（测试多次取平均）"""
         text = text or self.test_texts[0]
         latencies = []
+        handshakes = []
         
         for i in range(test_count):
             try:
@@ -164,6 +171,8 @@ class StreamTTSPerformanceTester:
 
                 start_time = time.time()
                 async with websockets.connect(tts_url) as ws:
+                    # 握手耗时：使用预连接时可以省去的部分
+                    handshakes.append(time.time() - start_time)
                     # 发送开始请求
                     await ws.send(json.dumps({
                         "task": "tts",
@@ -203,7 +212,7 @@ class StreamTTSPerformanceTester:
             except Exception as e:
                 latencies.append(0)
         
-        return self._calculate_result("PaddleSpeechTTS", latencies, test_count)
+        return self._calculate_result("PaddleSpeechTTS", latencies, test_count, handshakes)
             
     async def test_indexstream_tts(self, text=None, test_count=5):
         """测试IndexStream流式TTS首词延迟（测试多次取平均）"""
@@ -287,7 +296,7 @@ class StreamTTSPerformanceTester:
         return self._calculate_result("LinkeraiTTS", latencies, test_count)
 
 
-    def _calculate_result(self, service_name, latencies, test_count):
+    def _calculate_result(self, service_name, latencies, test_count, handshakes=None):
         """计算测试结果"""
         valid_latencies = [l for l in latencies if l > 0]
         if valid_latencies:
@@ -296,7 +305,14 @@ class StreamTTSPerformanceTester:
         else:
             avg_latency = 0
             status = "失败: 所有测试均失败"
-        return {"name": service_name, "latency": avg_latency, "status": status}
+        # 握手耗时：服务端使用连接池预连接后首词延迟可以省去的部分
+        avg_handshake = sum(handshakes) / len(handshakes) if handshakes else None
+        return {
+            "name": service_name,
+            "latency": avg_latency,
+            "handshake": avg_handshake,
+            "status": status,
+        }
 
     def _print_results(self, test_text, test_count):
         """打印测试结果"""
@@ -318,12 +334,21 @@ class StreamTTSPerformanceTester:
         failed_results = [r for r in self.results if "成功" not in r["status"]]
 
         table_data = [
-            [r["name"], f"{r['latency']:.3f}", r["status"]]
+            [
+                r["name"],
+                f"{r['latency']:.3f}",
+                f"{r['handshake']:.3f}" if r.get("handshake") is not None else "-",
+                f"{max(0.0, r['latency'] - r['handshake']):.3f}"
+                if r.get("handshake") is not None and r["latency"] > 0
+                else "-",
+                r["status"],
+            ]
             for r in success_results + failed_results
         ]
 
-        print(tabulate(table_data, headers=["TTS服务", "首词延迟(秒)", "状态"], tablefmt="grid"))
+        print(tabulate(table_data, headers=["TTS服务", "首词延迟(秒)", "握手耗时(秒)", "预连接首词延迟(秒)", "状态"], tablefmt="grid"))
         print("\n测试说明：测量从发送请求到接收第一个音频数据块的时间，取多次测试平均值")
+        print("- 握手耗时: 建立WebSocket连接的时间，服务端启用 ws_pool 预连接后首词延迟可省去这部分")
         print("- 超时控制: 单个请求最大等待时间为10秒")
         print("- 错误处理: 无法连接和超时的列为网络错误")
         print("- 排序规则: 按平均耗时从快到慢排序")
@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import time
 import random
 import difflib
@@ -47,9 +48,9 @@ def play_music(conn, song_name: str):
                 action=Action.RESPONSE, result="系统繁忙", response="请稍后再试"
             )
 
-        # 提交异步任务
-        task = conn.loop.create_task(
-            handle_music_command(conn, music_intent)  # 封装异步逻辑
+        # 提交异步任务（插件在工作线程中执行，需线程安全地提交到事件循环）
+        task = asyncio.run_coroutine_threadsafe(
+            handle_music_command(conn, music_intent), conn.loop  # 封装异步逻辑
         )
 
         # 非阻塞回调处理
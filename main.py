@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api.chat import chat
 from api.upload import upload
@@ -8,9 +8,17 @@ from api.mcp import mcp_router
 from api.auth import router as auth
 from api.api_keys import router as api_keys
 from agent.loader import load_agents
+from agent import registry
 from database.connection import db_manager
+from services.log_sink import log_sink
+from services.api_key_service import api_key_service
+from services.user_service import user_service
+from services.quota_service import quota_service
+from services.metrics import metrics, HTTP_REQUEST_DURATION, InstrumentedThreadPoolExecutor
+from services.response_cache import response_cache
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from datetime import datetime
@@ -41,23 +49,61 @@ fastgpt_base_url = os.getenv("FASTGPT_BASE_URL")
 fastgpt_api_key = os.getenv("FASTGPT_API_KEY")
 print(f"FASTGPT_BASE_URL: {fastgpt_base_url}")
 
+# 事件循环的默认线程池（asyncio.to_thread / run_in_executor(None)），启动时安装以便导出排队与执行中任务数
+default_executor = InstrumentedThreadPoolExecutor(
+    max_workers=int(os.getenv("DEFAULT_EXECUTOR_MAX_WORKERS", "0")) or None,
+    thread_name_prefix="gateway",
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期管理：启动时连接DB并加载智能体，关闭时断开DB。"""
+    """应用生命周期管理：启动时连接DB、加载智能体并创建连接池，关闭时释放连接池并断开DB。"""
     try:
+        asyncio.get_running_loop().set_default_executor(default_executor)
+
         # 连接MongoDB数据库
-        db_manager.connect()
+        await db_manager.connect()
         logger.info("✅ 数据库连接成功")
 
+        # 启动后台日志批量写入
+        await log_sink.start()
+
+        # 启动 API Key 最后使用时间的合并写入
+        await api_key_service.start()
+
+        # 启动调用配额计数的定期写回
+        await quota_service.start()
+
         # 加载智能体
         load_agents()
         logger.info("✅ 智能体加载完成")
 
+        # 为每个智能体创建共享 HTTP 连接池
+        await registry.startup()
+        logger.info("✅ 智能体连接池已就绪")
+
         yield
     finally:
         try:
-            db_manager.close()
+            await registry.shutdown()
+            logger.info("✅ 智能体连接池已关闭")
+        except Exception as e:
+            logger.error(f"❌ 关闭智能体连接池失败: {str(e)}")
+        try:
+            await quota_service.stop()
+        except Exception as e:
+            logger.error(f"❌ 写回调用配额计数失败: {str(e)}")
+        try:
+            await api_key_service.stop()
+        except Exception as e:
+            logger.error(f"❌ 停止API Key刷新任务失败: {str(e)}")
+        try:
+            await log_sink.stop()
+        except Exception as e:
+            logger.error(f"❌ 停止日志写入服务失败: {str(e)}")
+        try:
+            await db_manager.close()
             logger.info("✅ 数据库连接已关闭")
         except Exception as e:
             logger.error(f"❌ 关闭数据库连接失败: {str(e)}")
@@ -115,6 +161,15 @@ async def request_logging_middleware(request: Request, call_next):
     # 计算耗时
     duration_ms = int((time.time() - start_time) * 1000)
 
+    # 路由耗时指标（使用路由模板，避免路径参数导致标签膨胀）
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", None) or "unmatched"
+    HTTP_REQUEST_DURATION.observe(duration_ms / 1000, request.method, route_path, str(response.status_code))
+
+    # 指标抓取请求不写入请求日志
+    if route_path == "/metrics":
+        return response
+
     # 尝试获取响应体（JSON完整记录，其他类型记录文本，流式标记）
     response_body = None
     is_streaming = False
@@ -161,9 +216,9 @@ async def request_logging_middleware(request: Request, call_next):
         "trace_id": request.headers.get("x-request-id") or request.headers.get("x-trace-id"),
     }
 
+    # 交给后台日志服务批量写入，不阻塞事件循环
     try:
-        db = db_manager.get_database()
-        db.request_logs.insert_one(log_doc)
+        await log_sink.emit("request_logs", log_doc)
     except Exception as e:
         logger.error(f"写入请求日志失败: {str(e)}")
 
@@ -186,9 +241,56 @@ async def health_check():
         "status": "healthy",
         "timestamp": "2024-01-01T00:00:00Z",
         "version": "0.2.0",
-        "database": "connected" if db_manager.db is not None else "disconnected"
+        "database": "connected" if db_manager.db is not None else "disconnected",
+        "log_sink": log_sink.stats(),
+        "auth_cache": {
+            "api_key": api_key_service.cache_stats(),
+            "user": user_service.cache_stats(),
+        },
+        "quota": quota_service.stats(),
+        "response_cache": response_cache.stats(),
+        "upstreams": registry.resilience_stats(),
     }
 
+def _collect_runtime_metrics():
+    """导出时读取缓存、配额、日志写入与线程池的现有统计"""
+    caches = [api_key_service.cache_stats(), user_service.cache_stats(), response_cache.stats()]
+    yield ("gateway_cache_hits_total", "counter", "缓存命中次数",
+           [({"cache": c["name"]}, c["hits"]) for c in caches])
+    yield ("gateway_cache_misses_total", "counter", "缓存未命中次数",
+           [({"cache": c["name"]}, c["misses"]) for c in caches])
+    yield ("gateway_cache_hit_ratio", "gauge", "缓存命中率",
+           [({"cache": c["name"]}, c["hit_ratio"]) for c in caches])
+    yield ("gateway_cache_size", "gauge", "缓存条目数",
+           [({"cache": c["name"]}, c["size"]) for c in caches])
+
+    quota = quota_service.stats()
+    yield ("gateway_quota_rejections_total", "counter", "配额拒绝次数",
+           [({"reason": reason}, count) for reason, count in quota["rejections"].items()])
+
+    sink = log_sink.stats()
+    yield ("gateway_log_sink_docs_total", "counter", "日志写入服务处理的文档数",
+           [({"result": k}, sink[k]) for k in ("enqueued", "written", "dropped", "failed")])
+    yield ("gateway_log_sink_queue_size", "gauge", "日志写入队列长度", [({}, sink["queue_size"])])
+
+    # 默认线程池（asyncio.to_thread / run_in_executor(None)）排队与执行中的任务数
+    executor = default_executor.stats()
+    yield ("gateway_executor_queue_depth", "gauge", "默认线程池排队任务数",
+           [({}, executor["queued"])])
+    yield ("gateway_executor_active", "gauge", "默认线程池执行中的任务数",
+           [({}, executor["active"])])
+    yield ("gateway_executor_max_workers", "gauge", "默认线程池线程数上限",
+           [({}, executor["max_workers"])])
+
+
+metrics.register_collector(_collect_runtime_metrics)
+
+
+@app.get("/metrics", tags=["系统"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus 文本格式指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 包含路由
 app.include_router(auth, prefix="/api/v1/auth", tags=["用户认证"])
 app.include_router(api_keys, prefix="/api/v1/api-keys", tags=["API Key管理"])
@@ -258,6 +360,7 @@ if __name__ == "__main__":
     print("🔑 API Key管理: http://localhost:8000/api/v1/api-keys/")
     print("🔍 智能体管理: http://localhost:8000/api/v1/agents/")
     print("💚 健康检查: http://localhost:8000/health")
+    print("📈 运行指标: http://localhost:8000/metrics")
     print("\n按 Ctrl+C 停止服务")
 
     uvicorn.run(
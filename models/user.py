@@ -104,6 +104,9 @@ class APIKeyCreate(BaseModel):
     description: Optional[str] = Field(None, max_length=500, description="API Key描述")
     expires_at: Optional[datetime] = Field(None, description="过期时间，为空表示永不过期")
     permissions: List[str] = Field(default=[], description="权限列表")
+    daily_limit: Optional[int] = Field(None, ge=1, description="每日调用上限，为空使用全局配置")
+    monthly_limit: Optional[int] = Field(None, ge=1, description="每月调用上限，为空使用全局配置")
+    rate_limit_per_minute: Optional[int] = Field(None, ge=1, description="每分钟调用上限，为空使用全局配置")
 
 
 class APIKeyResponse(BaseModel):
@@ -118,6 +121,9 @@ class APIKeyResponse(BaseModel):
     permissions: List[str]
     is_active: bool
     created_by: str = Field(..., description="创建者用户ID")
+    daily_limit: Optional[int] = None
+    monthly_limit: Optional[int] = None
+    rate_limit_per_minute: Optional[int] = None
 
 
 class APIKeyFullResponse(APIKeyResponse):
@@ -132,6 +138,9 @@ class APIKeyUpdate(BaseModel):
     expires_at: Optional[datetime] = None
     permissions: Optional[List[str]] = None
     is_active: Optional[bool] = None
+    daily_limit: Optional[int] = Field(None, ge=1)
+    monthly_limit: Optional[int] = Field(None, ge=1)
+    rate_limit_per_minute: Optional[int] = Field(None, ge=1)
 
 
 class APIKeyUsage(BaseModel):
@@ -140,3 +149,4 @@ class APIKeyUsage(BaseModel):
     last_used_at: Optional[datetime] = Field(None, description="最后使用时间")
     calls_today: int = Field(default=0, description="今日调用次数")
     calls_this_month: int = Field(default=0, description="本月调用次数")
+    calls_last_minute: int = Field(default=0, description="最近一分钟调用次数（滑动窗口）")
@@ -21,7 +21,7 @@ async def create_admin_user():
     """创建管理员用户"""
     try:
         # 连接数据库
-        db_manager.connect()
+        await db_manager.connect()
         
         # 检查是否已存在管理员用户
         existing_admin = await user_service.get_user_by_username("admin")
@@ -57,14 +57,14 @@ async def create_admin_user():
     
     finally:
         # 关闭数据库连接
-        db_manager.close()
+        await db_manager.close()
 
 
 async def create_demo_users():
     """创建演示用户"""
     try:
         # 连接数据库
-        db_manager.connect()
+        await db_manager.connect()
         
         # 演示用户列表
         demo_users = [
@@ -116,7 +116,7 @@ async def create_demo_users():
     
     finally:
         # 关闭数据库连接
-        db_manager.close()
+        await db_manager.close()
 
 
 async def main():
@@ -1,10 +1,15 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Optional, List, Dict
 from bson import ObjectId
+from pymongo import UpdateOne
+import asyncio
+import os
 import secrets
 import hashlib
 import logging
 from database.connection import get_database
+from services.cache import TTLCache
+from services.quota_service import quota_service
 from models.user import (
     APIKeyCreate, APIKeyResponse, APIKeyFullResponse, 
     APIKeyUpdate, APIKeyUsage, UserRole
@@ -15,11 +20,85 @@ logger = logging.getLogger(__name__)
 
 class APIKeyService:
     """API Key管理服务"""
-    
+
     def __init__(self):
-        self.db = get_database()
-        self.api_keys_collection = self.db.api_keys
-        self.api_key_usage_collection = self.db.api_key_usage
+        # 认证缓存：key_hash -> APIKeyResponse（AUTH_CACHE_MAXSIZE / AUTH_CACHE_TTL 秒）
+        self._key_cache = TTLCache(
+            maxsize=int(os.getenv("AUTH_CACHE_MAXSIZE", "10000")),
+            ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+            name="api_key",
+        )
+        # 合并写入的最后使用时间：api_key_id -> datetime，每 AUTH_LAST_USED_FLUSH_INTERVAL 秒刷新
+        self._pending_last_used: Dict[str, datetime] = {}
+        self._flush_interval = float(os.getenv("AUTH_LAST_USED_FLUSH_INTERVAL", "30"))
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动最后使用时间的后台刷新任务（应用启动时调用）"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台刷新并写出剩余的最后使用时间（应用关闭时调用）"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush_last_used()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush_last_used()
+
+    async def flush_last_used(self) -> int:
+        """批量写入合并后的最后使用时间，返回写入条数"""
+        if not self._pending_last_used:
+            return 0
+        pending, self._pending_last_used = self._pending_last_used, {}
+        try:
+            await self.api_keys_collection.bulk_write([
+                UpdateOne({"_id": ObjectId(api_key_id)}, {"$max": {"last_used_at": used_at}})
+                for api_key_id, used_at in pending.items()
+            ], ordered=False)
+            return len(pending)
+        except Exception as e:
+            logger.error(f"❌ 批量更新API Key最后使用时间失败: {str(e)}")
+            # 写回未写入的时间，等待下次刷新
+            for api_key_id, used_at in pending.items():
+                current = self._pending_last_used.get(api_key_id)
+                if current is None or current < used_at:
+                    self._pending_last_used[api_key_id] = used_at
+            return 0
+
+    async def _touch(self, api_key_id: str):
+        """记录最后使用时间；后台刷新未启动时（如脚本）直接写库"""
+        now = datetime.now()
+        if self._flusher is not None and not self._flusher.done():
+            self._pending_last_used[api_key_id] = now
+            return
+        await self.api_keys_collection.update_one(
+            {"_id": ObjectId(api_key_id)},
+            {"$set": {"last_used_at": now}}
+        )
+
+    def invalidate_api_key(self, api_key_id: str) -> None:
+        """使指定 API Key 的认证缓存失效"""
+        self._key_cache.invalidate_where(lambda _, v: v.id == api_key_id)
+
+    def cache_stats(self) -> dict:
+        return self._key_cache.stats()
+    
+    @property
+    def api_keys_collection(self):
+        return get_database().api_keys
+
+    @property
+    def api_key_usage_collection(self):
+        return get_database().api_key_usage
     
     def _generate_api_key(self) -> str:
         """生成安全的API Key"""
@@ -50,7 +129,7 @@ class APIKeyService:
             key_prefix = self._get_key_prefix(full_key)
             
             # 检查前缀是否已存在（极小概率）
-            while self.api_keys_collection.find_one({"key_prefix": key_prefix}):
+            while await self.api_keys_collection.find_one({"key_prefix": key_prefix}):
                 full_key = self._generate_api_key()
                 key_prefix = self._get_key_prefix(full_key)
             
@@ -81,11 +160,14 @@ class APIKeyService:
                 "last_used_at": None,
                 "permissions": api_key_create.permissions or [],
                 "is_active": True,
-                "created_by": user_id
+                "created_by": user_id,
+                "daily_limit": api_key_create.daily_limit,
+                "monthly_limit": api_key_create.monthly_limit,
+                "rate_limit_per_minute": api_key_create.rate_limit_per_minute
             }
             
             # 插入数据库
-            result = self.api_keys_collection.insert_one(api_key_doc)
+            result = await self.api_keys_collection.insert_one(api_key_doc)
             api_key_doc["_id"] = str(result.inserted_id)
             api_key_doc["id"] = api_key_doc["_id"]
             
@@ -99,7 +181,7 @@ class APIKeyService:
                 "last_reset_date": now.date().isoformat(),
                 "last_reset_month": now.strftime("%Y-%m")
             }
-            self.api_key_usage_collection.insert_one(usage_doc)
+            await self.api_key_usage_collection.insert_one(usage_doc)
             
             logger.info(f"✅ API Key创建成功: {api_key_create.name} (用户: {user_id})")
             
@@ -118,34 +200,31 @@ class APIKeyService:
             # 计算API Key的哈希值
             key_hash = hashlib.sha256(api_key.encode()).hexdigest()
             
-            # 查找API Key
-            api_key_doc = self.api_keys_collection.find_one({"key_hash": key_hash})
-            if not api_key_doc:
-                return None
+            # 优先读取认证缓存，未命中再查库
+            api_key_data = self._key_cache.get(key_hash)
+            if api_key_data is None:
+                api_key_doc = await self.api_keys_collection.find_one({"key_hash": key_hash})
+                if not api_key_doc:
+                    return None
+                api_key_doc["_id"] = str(api_key_doc["_id"])
+                api_key_doc["id"] = api_key_doc["_id"]
+                api_key_data = APIKeyResponse(**api_key_doc)
+                self._key_cache.set(key_hash, api_key_data)
             
             # 检查是否激活
-            if not api_key_doc.get("is_active", True):
-                logger.warning(f"API Key已停用: {api_key_doc['key_prefix']}")
+            if not api_key_data.is_active:
+                logger.warning(f"API Key已停用: {api_key_data.key_prefix}")
                 return None
             
             # 检查是否过期
-            if api_key_doc.get("expires_at") and datetime.now() > api_key_doc["expires_at"]:
-                logger.warning(f"API Key已过期: {api_key_doc['key_prefix']}")
+            if api_key_data.expires_at and datetime.now() > api_key_data.expires_at:
+                logger.warning(f"API Key已过期: {api_key_data.key_prefix}")
                 return None
             
-            # 更新最后使用时间
-            self.api_keys_collection.update_one(
-                {"_id": api_key_doc["_id"]},
-                {"$set": {"last_used_at": datetime.now()}}
-            )
-            
-            # 更新使用统计
-            await self._increment_usage(api_key_doc["_id"])
-            
-            api_key_doc["_id"] = str(api_key_doc["_id"])
-            api_key_doc["id"] = api_key_doc["_id"]
+            # 更新最后使用时间（合并后定期写入）
+            await self._touch(api_key_data.id)
             
-            return APIKeyResponse(**api_key_doc)
+            return api_key_data
             
         except Exception as e:
             logger.error(f"❌ 验证API Key失败: {str(e)}")
@@ -154,7 +233,7 @@ class APIKeyService:
     async def get_api_key_by_id(self, api_key_id: str) -> Optional[APIKeyResponse]:
         """根据ID获取API Key信息"""
         try:
-            api_key_doc = self.api_keys_collection.find_one({"_id": ObjectId(api_key_id)})
+            api_key_doc = await self.api_keys_collection.find_one({"_id": ObjectId(api_key_id)})
             if api_key_doc:
                 api_key_doc["_id"] = str(api_key_doc["_id"])
                 api_key_doc["id"] = api_key_doc["_id"]
@@ -170,7 +249,7 @@ class APIKeyService:
             cursor = self.api_keys_collection.find({"created_by": user_id})
             api_keys = []
             
-            for api_key_doc in cursor:
+            async for api_key_doc in cursor:
                 api_key_doc["_id"] = str(api_key_doc["_id"])
                 api_key_doc["id"] = api_key_doc["_id"]
                 api_keys.append(APIKeyResponse(**api_key_doc))
@@ -187,7 +266,7 @@ class APIKeyService:
             cursor = self.api_keys_collection.find({}).skip(skip).limit(limit)
             api_keys = []
             
-            for api_key_doc in cursor:
+            async for api_key_doc in cursor:
                 api_key_doc["_id"] = str(api_key_doc["_id"])
                 api_key_doc["id"] = api_key_doc["_id"]
                 api_keys.append(APIKeyResponse(**api_key_doc))
@@ -228,15 +307,20 @@ class APIKeyService:
                 update_data["permissions"] = api_key_update.permissions
             if api_key_update.is_active is not None:
                 update_data["is_active"] = api_key_update.is_active
+            for limit_field in ("daily_limit", "monthly_limit", "rate_limit_per_minute"):
+                value = getattr(api_key_update, limit_field)
+                if value is not None:
+                    update_data[limit_field] = value
             
             if update_data:
                 update_data["updated_at"] = datetime.now()
                 
-                result = self.api_keys_collection.update_one(
+                result = await self.api_keys_collection.update_one(
                     {"_id": ObjectId(api_key_id)},
                     {"$set": update_data}
                 )
                 
+                self.invalidate_api_key(api_key_id)
                 if result.modified_count > 0:
                     logger.info(f"✅ API Key更新成功: {api_key_id}")
                     return await self.get_api_key_by_id(api_key_id)
@@ -265,10 +349,13 @@ class APIKeyService:
                 raise ValueError("权限不足，只能删除自己创建的API Key")
             
             # 删除API Key
-            result = self.api_keys_collection.delete_one({"_id": ObjectId(api_key_id)})
+            result = await self.api_keys_collection.delete_one({"_id": ObjectId(api_key_id)})
+            self.invalidate_api_key(api_key_id)
+            self._pending_last_used.pop(api_key_id, None)
+            quota_service.forget_key(api_key_id)
             if result.deleted_count > 0:
                 # 删除使用统计
-                self.api_key_usage_collection.delete_one({"api_key_id": api_key_id})
+                await self.api_key_usage_collection.delete_one({"api_key_id": api_key_id})
                 logger.info(f"✅ API Key删除成功: {api_key_id}")
                 return True
             return False
@@ -295,10 +382,11 @@ class APIKeyService:
                 raise ValueError("权限不足，只能撤销自己创建的API Key")
             
             # 停用API Key
-            result = self.api_keys_collection.update_one(
+            result = await self.api_keys_collection.update_one(
                 {"_id": ObjectId(api_key_id)},
                 {"$set": {"is_active": False, "updated_at": datetime.now()}}
             )
+            self.invalidate_api_key(api_key_id)
             
             if result.modified_count > 0:
                 logger.info(f"✅ API Key撤销成功: {api_key_id}")
@@ -310,72 +398,18 @@ class APIKeyService:
             raise
     
     async def get_api_key_usage(self, api_key_id: str) -> Optional[APIKeyUsage]:
-        """获取API Key使用统计"""
+        """获取API Key使用统计（由配额服务提供，包含尚未写回的计数）"""
         try:
-            usage_doc = self.api_key_usage_collection.find_one({"api_key_id": api_key_id})
-            if usage_doc:
-                return APIKeyUsage(**usage_doc)
-            return None
+            return await quota_service.get_key_usage(api_key_id)
         except Exception as e:
             logger.error(f"❌ 获取API Key使用统计失败: {str(e)}")
             return None
     
-    async def _increment_usage(self, api_key_id: str):
-        """增加API Key使用次数"""
-        try:
-            now = datetime.now()
-            today = now.date().isoformat()
-            this_month = now.strftime("%Y-%m")
-            
-            # 更新使用统计
-            update_data = {
-                "$inc": {"total_calls": 1},
-                "$set": {"last_used_at": now}
-            }
-            
-            # 检查是否需要重置今日和本月计数
-            usage_doc = self.api_key_usage_collection.find_one({"api_key_id": api_key_id})
-            if usage_doc:
-                if usage_doc.get("last_reset_date") != today:
-                    update_data["$set"]["calls_today"] = 1
-                    update_data["$set"]["last_reset_date"] = today
-                else:
-                    update_data["$inc"]["calls_today"] = 1
-                
-                if usage_doc.get("last_reset_month") != this_month:
-                    update_data["$set"]["calls_this_month"] = 1
-                    update_data["$set"]["last_reset_month"] = this_month
-                else:
-                    update_data["$inc"]["calls_this_month"] = 1
-            else:
-                # 如果不存在，创建新的使用统计
-                update_data = {
-                    "$set": {
-                        "api_key_id": api_key_id,
-                        "total_calls": 1,
-                        "last_used_at": now,
-                        "calls_today": 1,
-                        "calls_this_month": 1,
-                        "last_reset_date": today,
-                        "last_reset_month": this_month
-                    }
-                }
-                self.api_key_usage_collection.insert_one(update_data["$set"])
-                return
-            
-            self.api_key_usage_collection.update_one(
-                {"api_key_id": api_key_id},
-                update_data
-            )
-            
-        except Exception as e:
-            logger.error(f"❌ 更新API Key使用统计失败: {str(e)}")
-    
     async def cleanup_expired_keys(self) -> int:
         """清理过期的API Key"""
         try:
             now = datetime.now()
-            result = self.api_keys_collection.update_many(
+            result = await self.api_keys_collection.update_many(
                 {
                     "expires_at": {"$lt": now},
                     "is_active": True
@@ -384,6 +418,7 @@ class APIKeyService:
             )
             
             if result.modified_count > 0:
+                self._key_cache.clear()
                 logger.info(f"✅ 清理过期API Key: {result.modified_count} 个")
             
             return result.modified_count
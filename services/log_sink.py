@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class LogSink:
+    """
+    后台日志写入服务
+
+    request_logs / agent_logs / agent_logs_chunks 的写入统一进入有界 asyncio 队列，
+    由后台任务按条数或时间批量 insert_many，避免在事件循环上逐条同步写库。
+
+    环境变量:
+        - LOG_SINK_QUEUE_SIZE: 队列容量，默认 10000
+        - LOG_SINK_BATCH_SIZE: 单次批量写入条数上限，默认 200
+        - LOG_SINK_FLUSH_INTERVAL: 最长刷新间隔（秒），默认 1.0
+        - LOG_SINK_OVERFLOW: 队列满时策略 drop_new | drop_oldest | block，默认 drop_new
+        - LOG_SINK_BLOCK_TIMEOUT: block 策略最长等待秒数，超时后丢弃，默认 0.5
+        - LOG_STREAM_MODE: 流式日志模式 aggregate（结束时写一条）| chunks（逐片写入分片集合），默认 aggregate
+        - LOG_STREAM_MAX_CHUNKS: aggregate 模式下单个流最多保留的分片数，默认 5000
+    """
+
+    OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block")
+
+    def __init__(self):
+        self.queue_size = int(os.getenv("LOG_SINK_QUEUE_SIZE", "10000"))
+        self.batch_size = int(os.getenv("LOG_SINK_BATCH_SIZE", "200"))
+        self.flush_interval = float(os.getenv("LOG_SINK_FLUSH_INTERVAL", "1.0"))
+        self.block_timeout = float(os.getenv("LOG_SINK_BLOCK_TIMEOUT", "0.5"))
+        overflow = os.getenv("LOG_SINK_OVERFLOW", "drop_new").lower()
+        if overflow not in self.OVERFLOW_POLICIES:
+            logger.warning(f"未知的 LOG_SINK_OVERFLOW={overflow}，使用 drop_new")
+            overflow = "drop_new"
+        self.overflow = overflow
+        self.stream_mode = os.getenv("LOG_STREAM_MODE", "aggregate").lower()
+        self.stream_max_chunks = int(os.getenv("LOG_STREAM_MAX_CHUNKS", "5000"))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._counters: Dict[str, int] = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "flushes": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def aggregate_streams(self) -> bool:
+        """流式日志是否在内存中聚合，结束时写入一条文档"""
+        return self.stream_mode != "chunks"
+
+    async def start(self):
+        """启动后台刷新任务（应用启动时调用）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"✅ 日志写入服务已启动 (batch={self.batch_size}, interval={self.flush_interval}s, "
+            f"overflow={self.overflow}, stream_mode={self.stream_mode})"
+        )
+
+    async def stop(self):
+        """停止后台任务并写出队列中剩余的日志（应用关闭时调用）"""
+        if not self.running:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        # 等待进行中的批量写入完成，再写出剩余日志
+        if self._inflight is not None:
+            await asyncio.gather(self._inflight, return_exceptions=True)
+            self._inflight = None
+        while not self._queue.empty():
+            await self._flush(self._drain(self.batch_size))
+        self._worker = None
+        logger.info(f"✅ 日志写入服务已停止: {self.stats()}")
+
+    async def emit(self, collection: str, doc: Dict[str, Any]) -> bool:
+        """
+        提交一条日志文档，按溢出策略处理队列已满的情况。
+
+        返回:
+            bool: 是否成功入队（未启动时直接写库）
+        """
+        if not self.running:
+            # 未启动（如脚本直接调用）时退化为直接写入
+            await self._flush([(collection, doc)])
+            return True
+
+        item = (collection, doc)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.overflow == "drop_oldest":
+                try:
+                    self._queue.get_nowait()
+                    self._counters["dropped"] += 1
+                except asyncio.QueueEmpty:
+                    pass
+                try:
+                    self._queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self._counters["dropped"] += 1
+                    return False
+            elif self.overflow == "block":
+                try:
+                    await asyncio.wait_for(self._queue.put(item), timeout=self.block_timeout)
+                except asyncio.TimeoutError:
+                    self._counters["dropped"] += 1
+                    return False
+            else:
+                self._counters["dropped"] += 1
+                return False
+
+        self._counters["enqueued"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """返回写入计数与队列状态"""
+        return {
+            **self._counters,
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "queue_capacity": self.queue_size,
+            "overflow": self.overflow,
+            "stream_mode": self.stream_mode,
+        }
+
+    def _drain(self, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _run(self):
+        """按条数或时间批量刷新"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while len(batch) < self.batch_size:
+                    batch.extend(self._drain(self.batch_size - len(batch)))
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 停止时写出已取出的日志
+                await self._flush(batch)
+                raise
+            # shield：停止任务时不中断进行中的写入，由 stop() 等待其完成
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        if not batch:
+            return
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for collection, doc in batch:
+            grouped.setdefault(collection, []).append(doc)
+
+        for collection, docs in grouped.items():
+            try:
+                db = db_manager.get_database()
+                await db[collection].insert_many(docs, ordered=False)
+                self._counters["written"] += len(docs)
+            except Exception as e:
+                self._counters["failed"] += len(docs)
+                logger.error(f"批量写入日志失败 ({collection}, {len(docs)} 条): {str(e)}")
+        self._counters["flushes"] += 1
+
+
+# 全局日志写入服务实例
+log_sink = LogSink()
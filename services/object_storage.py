@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from database.connection import get_database
+
+logger = logging.getLogger(__name__)
+
+# S3 分片最小 5MB（最后一片除外）
+_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"File exceeds the maximum allowed size of {max_bytes} bytes")
+
+
+@dataclass
+class StoredObject:
+    """已写入对象存储的文件"""
+    object_key: str
+    size: int
+    sha256: str
+    mime_type: str
+    url: Optional[str]
+    deduplicated: bool = False
+
+
+class ObjectStorage:
+    """
+    S3 / MinIO 对象存储
+
+    复用单个 boto3 客户端（线程安全），上传时边读边传：
+    小文件直接 put_object，超过一个分片的文件走分片上传，分片并发上传且内存中最多保留
+    S3_UPLOAD_CONCURRENCY + 1 个分片；读取过程中同步计算 SHA-256 并校验大小上限。
+    启用去重时，内容相同的文件复用已有对象（记录在 uploaded_files 集合）。
+
+    环境变量:
+        - S3_ENDPOINT / S3_ACCESS_KEY / S3_SECRET_KEY / S3_BUCKET: 必填
+        - S3_REGION / S3_KEY_PREFIX / S3_ACL / S3_PUBLIC_BASE_URL: 可选
+        - S3_PART_SIZE: 分片大小（字节），默认 8MB，最小 5MB
+        - S3_UPLOAD_CONCURRENCY: 单个文件并发上传的分片数，默认 4
+        - S3_MAX_POOL_CONNECTIONS: boto3 连接池大小，默认 20
+        - UPLOAD_DEDUP: 是否按内容哈希去重，默认 true
+    """
+
+    def __init__(self):
+        self.endpoint = os.getenv("S3_ENDPOINT")
+        self.access_key = os.getenv("S3_ACCESS_KEY")
+        self.secret_key = os.getenv("S3_SECRET_KEY")
+        self.bucket = os.getenv("S3_BUCKET")
+        self.region = os.getenv("S3_REGION")
+        self.key_prefix = os.getenv("S3_KEY_PREFIX", "uploads")
+        self.acl = os.getenv("S3_ACL")
+        self.public_base_url = os.getenv("S3_PUBLIC_BASE_URL")
+        self.part_size = max(int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024))), _MIN_PART_SIZE)
+        self.concurrency = max(int(os.getenv("S3_UPLOAD_CONCURRENCY", "4")), 1)
+        self.max_pool_connections = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20"))
+        self.dedup = os.getenv("UPLOAD_DEDUP", "true").lower() in ("1", "true", "yes")
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return all([self.endpoint, self.access_key, self.secret_key, self.bucket])
+
+    @property
+    def client(self):
+        """共享 boto3 客户端（惰性创建）"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    if not self.configured:
+                        raise ValueError("Missing S3 configs. Please set S3_ENDPOINT,S3_ACCESS_KEY,S3_SECRET_KEY,S3_BUCKET")
+                    # 延迟导入 boto3，避免未使用文件上传功能时强依赖
+                    try:
+                        import boto3  # type: ignore
+                        from botocore.config import Config  # type: ignore
+                    except ImportError as e:
+                        raise ImportError("boto3 未安装。请运行: pip install boto3 或将其加入 requirements.txt") from e
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint,
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        region_name=self.region if self.region else None,
+                        config=Config(max_pool_connections=self.max_pool_connections),
+                    )
+        return self._client
+
+    def new_object_key(self, filename: str) -> str:
+        ext = os.path.splitext(filename)[1]
+        return f"{self.key_prefix}/{datetime.now().strftime('%Y/%m/%d')}/{uuid.uuid4().hex}{ext}"
+
+    def extra_args(self, mime_type: str) -> Dict[str, str]:
+        extra = {"ContentType": mime_type}
+        if self.acl:
+            extra["ACL"] = self.acl
+        return extra
+
+    def public_url(self, object_key: str) -> Optional[str]:
+        """生成可访问 URL：优先使用 S3_PUBLIC_BASE_URL，其次使用预签名 URL"""
+        if self.public_base_url:
+            base = self.public_base_url.rstrip('/')
+            try:
+                # 支持 {bucket} 占位符、虚拟主机式(bucket.example.com) 与路径式(/bucket/...)
+                parsed = urlparse(base)
+                host_has_bucket = parsed.netloc.startswith(f"{self.bucket}.") if parsed.netloc else False
+                path = (parsed.path or '').strip('/')
+                path_has_bucket = (path == self.bucket) or path.startswith(f"{self.bucket}/")
+
+                if '{bucket}' in base:
+                    return f"{base.replace('{bucket}', self.bucket)}/{object_key}"
+                if host_has_bucket or path_has_bucket:
+                    return f"{base}/{object_key}"
+                return f"{base}/{self.bucket}/{object_key}"
+            except Exception:
+                return f"{base}/{self.bucket}/{object_key}"
+        try:
+            return self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': object_key},
+                ExpiresIn=3600
+            )
+        except Exception:
+            return None
+
+    async def upload_stream(
+        self,
+        read: Callable[[int], Awaitable[bytes]],
+        filename: str,
+        content_type: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ) -> StoredObject:
+        """
+        从异步读取函数（如 UploadFile.read）流式上传到对象存储。
+
+        参数:
+            read: 异步读取函数，参数为最多读取的字节数，返回空字节表示结束
+            filename: 原始文件名（用于扩展名与 MIME 推断）
+            content_type: 客户端声明的 MIME，为空或通用类型时按文件名推断
+            max_bytes: 大小上限，超过时中止上传并抛出 UploadTooLargeError
+
+        返回:
+            StoredObject: 对象键、大小、SHA-256 与访问 URL
+        """
+        if not content_type or content_type == "application/octet-stream":
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        object_key = self.new_object_key(filename)
+        client = self.client
+        hasher = hashlib.sha256()
+        size = 0
+
+        async def next_part() -> bytes:
+            nonlocal size
+            buf = bytearray()
+            while len(buf) < self.part_size:
+                data = await read(self.part_size - len(buf))
+                if not data:
+                    break
+                buf += data
+                if max_bytes and size + len(buf) > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+            size += len(buf)
+            hasher.update(buf)
+            return bytes(buf)
+
+        first = await next_part()
+        if len(first) < self.part_size:
+            await asyncio.to_thread(
+                client.put_object, Bucket=self.bucket, Key=object_key, Body=first, **self.extra_args(content_type)
+            )
+        else:
+            await self._multipart_upload(client, object_key, content_type, first, next_part)
+
+        stored = StoredObject(
+            object_key=object_key,
+            size=size,
+            sha256=hasher.hexdigest(),
+            mime_type=content_type,
+            url=None,
+        )
+        if self.dedup:
+            stored = await self._deduplicate(stored)
+        stored.url = await asyncio.to_thread(self.public_url, stored.object_key)
+        return stored
+
+    async def _multipart_upload(self, client, object_key: str, content_type: str,
+                                first: bytes, next_part: Callable[[], Awaitable[bytes]]) -> None:
+        mpu = await asyncio.to_thread(
+            client.create_multipart_upload, Bucket=self.bucket, Key=object_key, **self.extra_args(content_type)
+        )
+        upload_id = mpu["UploadId"]
+        # 控制同时在内存/传输中的分片数
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: List[asyncio.Task] = []
+
+        async def put_part(number: int, body: bytes) -> Dict[str, Any]:
+            try:
+                resp = await asyncio.to_thread(
+                    client.upload_part,
+                    Bucket=self.bucket, Key=object_key, UploadId=upload_id, PartNumber=number, Body=body
+                )
+                return {"PartNumber": number, "ETag": resp["ETag"]}
+            finally:
+                slots.release()
+
+        try:
+            number, body = 1, first
+            while body:
+                await slots.acquire()
+                # 已有分片失败时尽早中止
+                for task in tasks:
+                    if task.done() and task.exception() is not None:
+                        raise task.exception()
+                tasks.append(asyncio.create_task(put_part(number, body)))
+                number += 1
+                body = await next_part()
+            parts = await asyncio.gather(*tasks)
+            await asyncio.to_thread(
+                client.complete_multipart_upload,
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id, MultipartUpload={"Parts": list(parts)}
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await asyncio.to_thread(
+                    client.abort_multipart_upload, Bucket=self.bucket, Key=object_key, UploadId=upload_id
+                )
+            except Exception as e:
+                logger.error(f"中止分片上传失败 ({object_key}): {str(e)}")
+            raise
+
+    async def _deduplicate(self, stored: StoredObject) -> StoredObject:
+        """内容已存在时删除刚上传的对象并复用已有对象"""
+        collection = get_database().uploaded_files
+        try:
+            existing = await collection.find_one({"_id": stored.sha256})
+            if existing is None:
+                await collection.insert_one({
+                    "_id": stored.sha256,
+                    "object_key": stored.object_key,
+                    "size": stored.size,
+                    "mime_type": stored.mime_type,
+                    "created_at": datetime.now(),
+                })
+                return stored
+        except Exception as e:
+            # 并发写入同一哈希（唯一键冲突）时以已有记录为准，其他错误不影响上传结果
+            existing = await self._find_existing(collection, stored.sha256)
+            if existing is None:
+                logger.error(f"记录文件哈希失败: {str(e)}")
+                return stored
+
+        try:
+            await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=stored.object_key)
+        except Exception as e:
+            logger.error(f"删除重复对象失败 ({stored.object_key}): {str(e)}")
+        stored.object_key = existing["object_key"]
+        stored.deduplicated = True
+        return stored
+
+    @staticmethod
+    async def _find_existing(collection, sha256: str) -> Optional[dict]:
+        try:
+            return await collection.find_one({"_id": sha256})
+        except Exception:
+            return None
+
+
+# 全局对象存储实例
+object_storage = ObjectStorage()
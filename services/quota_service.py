@@ -0,0 +1,487 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from database.connection import get_database
+from models.user import APIKeyResponse, APIKeyUsage
+
+logger = logging.getLogger(__name__)
+
+# 配额检查需要的用户字段
+_USER_QUOTA_PROJECTION = {
+    "api_calls_count": 1,
+    "max_api_calls": 1,
+    "api_calls_today": 1,
+    "api_calls_this_month": 1,
+    "api_calls_reset_date": 1,
+    "api_calls_reset_month": 1,
+}
+
+
+class SlidingWindowCounter:
+    """
+    滑动窗口计数（双桶近似）：按上一窗口的剩余比例加权，O(1) 内存与计算。
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        now = time.monotonic()
+        self.start = now - (now % window)
+        self.current = 0
+        self.previous = 0
+
+    def _roll(self, now: float) -> None:
+        elapsed = int((now - self.start) // self.window)
+        if elapsed >= 1:
+            self.previous = self.current if elapsed == 1 else 0
+            self.current = 0
+            self.start += elapsed * self.window
+
+    def count(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._roll(now)
+        weight = 1 - (now - self.start) / self.window
+        return self.previous * weight + self.current
+
+    def add(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._roll(now)
+        self.current += 1
+
+
+@dataclass
+class _UserQuota:
+    count: int
+    limit: int
+    calls_today: int
+    calls_this_month: int
+    reset_date: str
+    reset_month: str
+    pending: int = 0
+    pending_today: int = 0
+    pending_month: int = 0
+    window: SlidingWindowCounter = field(default_factory=SlidingWindowCounter)
+    touched: float = field(default_factory=time.monotonic)
+    # 上限最近一次从数据库读取的时间；stale 为 True 时下次调用前重新读取
+    loaded_at: float = field(default_factory=time.monotonic)
+    stale: bool = False
+
+
+@dataclass
+class _KeyQuota:
+    owner: str
+    total_calls: int
+    calls_today: int
+    calls_this_month: int
+    reset_date: str
+    reset_month: str
+    last_used_at: Optional[datetime] = None
+    pending_total: int = 0
+    pending_today: int = 0
+    pending_month: int = 0
+    window: SlidingWindowCounter = field(default_factory=SlidingWindowCounter)
+    touched: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class QuotaDecision:
+    """配额检查结果"""
+    allowed: bool
+    reason: str = ""
+    retry_after: Optional[int] = None
+
+
+class QuotaService:
+    """
+    API 调用配额服务
+
+    用户与 API Key 的总调用次数、日/月调用次数与每分钟滑动窗口速率均在内存中原子地
+    “检查并扣减”（单事件循环内无 await 间隙），再由后台任务定期把增量原子地写回
+    Mongo，并用 find_one_and_update 的返回值与其他进程的计数对齐。
+
+    环境变量（0 表示不限制）:
+        - QUOTA_USER_RPM: 每个用户每分钟调用上限，默认 0
+        - QUOTA_USER_DAILY_LIMIT: 每个用户每日调用上限，默认 0
+        - QUOTA_USER_MONTHLY_LIMIT: 每个用户每月调用上限，默认 0
+        - QUOTA_KEY_RPM: 每个 API Key 每分钟调用上限，默认 0（可被 Key 的 rate_limit_per_minute 覆盖）
+        - QUOTA_KEY_DAILY_LIMIT: 每个 API Key 每日调用上限，默认 0（可被 Key 的 daily_limit 覆盖）
+        - QUOTA_KEY_MONTHLY_LIMIT: 每个 API Key 每月调用上限，默认 0（可被 Key 的 monthly_limit 覆盖）
+        - QUOTA_FLUSH_INTERVAL: 计数写回间隔（秒），默认 5
+        - QUOTA_IDLE_EVICT_SECONDS: 空闲计数从内存移除的时间（秒），默认 3600
+        - QUOTA_LIMIT_REFRESH_SECONDS: 用户超出总调用上限后，重新读取上限的最短间隔（秒），默认 30
+    """
+
+    def __init__(self):
+        self.user_rpm = int(os.getenv("QUOTA_USER_RPM", "0"))
+        self.user_daily_limit = int(os.getenv("QUOTA_USER_DAILY_LIMIT", "0"))
+        self.user_monthly_limit = int(os.getenv("QUOTA_USER_MONTHLY_LIMIT", "0"))
+        self.key_rpm = int(os.getenv("QUOTA_KEY_RPM", "0"))
+        self.key_daily_limit = int(os.getenv("QUOTA_KEY_DAILY_LIMIT", "0"))
+        self.key_monthly_limit = int(os.getenv("QUOTA_KEY_MONTHLY_LIMIT", "0"))
+        self.flush_interval = float(os.getenv("QUOTA_FLUSH_INTERVAL", "5"))
+        self.idle_evict_seconds = float(os.getenv("QUOTA_IDLE_EVICT_SECONDS", "3600"))
+        self.limit_refresh_seconds = float(os.getenv("QUOTA_LIMIT_REFRESH_SECONDS", "30"))
+
+        self._users: Dict[str, _UserQuota] = {}
+        self._keys: Dict[str, _KeyQuota] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.rejections: Dict[str, int] = {}
+
+    @property
+    def users_collection(self):
+        return get_database().users
+
+    @property
+    def api_key_usage_collection(self):
+        return get_database().api_key_usage
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    async def start(self):
+        """启动后台写回任务（应用启动时调用）"""
+        if not self.running:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并写回剩余计数（应用关闭时调用）"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def acquire(self, user_id: str, api_key: Optional[APIKeyResponse] = None) -> QuotaDecision:
+        """
+        检查并扣减一次调用配额。
+
+        参数:
+            user_id (str): 调用用户 ID
+            api_key (Optional[APIKeyResponse]): 本次使用的 API Key（JWT 调用时为空）
+
+        返回:
+            QuotaDecision: allowed=False 时包含拒绝原因与建议重试秒数
+        """
+        user = self._users.get(user_id)
+        if user is None:
+            user = await self._load_user(user_id)
+        elif user.stale or (
+            user.count >= user.limit
+            and time.monotonic() - user.loaded_at >= self.limit_refresh_seconds
+        ):
+            # 用户信息已更新，或已超出上限（上限可能已被调高），重新读取
+            user = await self._refresh_user(user_id, user)
+        if user is None:
+            return self._reject("user_not_found")
+        key = None
+        if api_key is not None:
+            key = self._keys.get(api_key.id) or await self._load_key(api_key.id, api_key.created_by)
+
+        # 以下检查与扣减之间没有 await，在事件循环内是原子的
+        now = time.monotonic()
+        self._roll_periods(user)
+        if user.count >= user.limit:
+            return self._reject("user_total")
+        if self.user_rpm and user.window.count(now) >= self.user_rpm:
+            return self._reject("user_rate", retry_after=int(user.window.window))
+        if self.user_daily_limit and user.calls_today >= self.user_daily_limit:
+            return self._reject("user_daily", retry_after=self._seconds_until_tomorrow())
+        if self.user_monthly_limit and user.calls_this_month >= self.user_monthly_limit:
+            return self._reject("user_monthly")
+
+        if key is not None:
+            self._roll_periods(key)
+            key_rpm = api_key.rate_limit_per_minute or self.key_rpm
+            daily_limit = api_key.daily_limit or self.key_daily_limit
+            monthly_limit = api_key.monthly_limit or self.key_monthly_limit
+            if key_rpm and key.window.count(now) >= key_rpm:
+                return self._reject("key_rate", retry_after=int(key.window.window))
+            if daily_limit and key.calls_today >= daily_limit:
+                return self._reject("key_daily", retry_after=self._seconds_until_tomorrow())
+            if monthly_limit and key.calls_this_month >= monthly_limit:
+                return self._reject("key_monthly")
+
+        user.count += 1
+        user.calls_today += 1
+        user.calls_this_month += 1
+        user.pending += 1
+        user.pending_today += 1
+        user.pending_month += 1
+        user.window.add(now)
+        user.touched = now
+        if key is not None:
+            key.total_calls += 1
+            key.calls_today += 1
+            key.calls_this_month += 1
+            key.pending_total += 1
+            key.pending_today += 1
+            key.pending_month += 1
+            key.last_used_at = datetime.now()
+            key.window.add(now)
+            key.touched = now
+
+        if not self.running:
+            # 后台任务未启动（如脚本调用）时直接写回
+            await self.flush()
+        return QuotaDecision(allowed=True)
+
+    async def get_key_usage(self, api_key_id: str) -> Optional[APIKeyUsage]:
+        """
+        读取 API Key 使用统计（优先内存计数，已包含未写回的增量）
+
+        只读查询不把 Key 加入内存计数；没有使用记录时返回 None
+        """
+        key = self._keys.get(api_key_id)
+        if key is None:
+            doc = await self.api_key_usage_collection.find_one({"api_key_id": api_key_id})
+            if not doc:
+                return None
+            key = self._key_from_doc(doc, "")
+        self._roll_periods(key)
+        return APIKeyUsage(
+            total_calls=key.total_calls,
+            last_used_at=key.last_used_at,
+            calls_today=key.calls_today,
+            calls_this_month=key.calls_this_month,
+            calls_last_minute=int(key.window.count()),
+        )
+
+    def get_key_owner(self, api_key_id: str) -> Optional[str]:
+        """返回内存中记录的 API Key 创建者（未知时为空）"""
+        key = self._keys.get(api_key_id)
+        return key.owner if key is not None and key.owner else None
+
+    def invalidate_user(self, user_id: str) -> None:
+        """用户信息更新后调用：下次调用前重新读取调用上限"""
+        user = self._users.get(user_id)
+        if user is not None:
+            user.stale = True
+
+    def forget_key(self, api_key_id: str) -> None:
+        """丢弃 API Key 的内存计数（删除 Key 时调用）"""
+        self._keys.pop(api_key_id, None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tracked_users": len(self._users),
+            "tracked_keys": len(self._keys),
+            "rejections": dict(self.rejections),
+        }
+
+    def _reject(self, reason: str, retry_after: Optional[int] = None) -> QuotaDecision:
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        return QuotaDecision(allowed=False, reason=reason, retry_after=retry_after)
+
+    @staticmethod
+    def _seconds_until_tomorrow() -> int:
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return max(1, 86400 - int((now - midnight).total_seconds()))
+
+    @staticmethod
+    def _roll_periods(quota) -> None:
+        """跨日/跨月时重置本地计数（用户与 API Key 通用）"""
+        now = datetime.now()
+        today = now.date().isoformat()
+        this_month = now.strftime("%Y-%m")
+        if quota.reset_date != today:
+            quota.reset_date = today
+            quota.calls_today = 0
+            quota.pending_today = 0
+        if quota.reset_month != this_month:
+            quota.reset_month = this_month
+            quota.calls_this_month = 0
+            quota.pending_month = 0
+
+    @staticmethod
+    def _user_period_counts(doc: dict) -> Dict[str, object]:
+        """用户文档中的日/月计数，记录的日期不是今天（本月）时视为 0"""
+        now = datetime.now()
+        today = now.date().isoformat()
+        this_month = now.strftime("%Y-%m")
+        return {
+            "calls_today": doc.get("api_calls_today", 0)
+            if doc.get("api_calls_reset_date") == today else 0,
+            "calls_this_month": doc.get("api_calls_this_month", 0)
+            if doc.get("api_calls_reset_month") == this_month else 0,
+            "reset_date": today,
+            "reset_month": this_month,
+        }
+
+    async def _load_user(self, user_id: str) -> Optional[_UserQuota]:
+        doc = await self.users_collection.find_one(
+            {"_id": ObjectId(user_id)}, _USER_QUOTA_PROJECTION
+        )
+        if not doc:
+            return None
+        # await 期间可能已有并发请求完成加载，以先到者为准
+        return self._users.setdefault(user_id, _UserQuota(
+            count=doc.get("api_calls_count", 0),
+            limit=doc.get("max_api_calls", 1000),
+            **self._user_period_counts(doc),
+        ))
+
+    async def _refresh_user(self, user_id: str, user: _UserQuota) -> Optional[_UserQuota]:
+        """重新读取调用上限与计数，保留尚未写回的增量"""
+        user.stale = False
+        user.loaded_at = time.monotonic()
+        doc = await self.users_collection.find_one(
+            {"_id": ObjectId(user_id)}, _USER_QUOTA_PROJECTION
+        )
+        if not doc:
+            if not user.pending:
+                self._users.pop(user_id, None)
+            return None
+        self._roll_periods(user)
+        periods = self._user_period_counts(doc)
+        user.count = doc.get("api_calls_count", 0) + user.pending
+        user.calls_today = periods["calls_today"] + user.pending_today
+        user.calls_this_month = periods["calls_this_month"] + user.pending_month
+        user.limit = doc.get("max_api_calls", user.limit)
+        return user
+
+    @staticmethod
+    def _key_from_doc(doc: dict, owner: str) -> _KeyQuota:
+        now = datetime.now()
+        return _KeyQuota(
+            owner=owner,
+            total_calls=doc.get("total_calls", 0),
+            calls_today=doc.get("calls_today", 0),
+            calls_this_month=doc.get("calls_this_month", 0),
+            reset_date=doc.get("last_reset_date") or now.date().isoformat(),
+            reset_month=doc.get("last_reset_month") or now.strftime("%Y-%m"),
+            last_used_at=doc.get("last_used_at"),
+        )
+
+    async def _load_key(self, api_key_id: str, owner: str) -> _KeyQuota:
+        """加载已通过认证的 API Key 的计数（没有使用记录时从零开始）"""
+        doc = await self.api_key_usage_collection.find_one({"api_key_id": api_key_id}) or {}
+        key = self._keys.setdefault(api_key_id, self._key_from_doc(doc, owner))
+        if owner and not key.owner:
+            key.owner = owner
+        return key
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            self._evict_idle()
+
+    async def flush(self):
+        """将内存增量写回 Mongo，并以返回的最新文档对齐本地计数"""
+        for user_id, user in list(self._users.items()):
+            if user.pending:
+                await self._flush_user(user_id, user)
+        for api_key_id, key in list(self._keys.items()):
+            if key.pending_total:
+                await self._flush_key(api_key_id, key)
+
+    async def _flush_user(self, user_id: str, user: _UserQuota):
+        self._roll_periods(user)
+        delta, d_today, d_month = user.pending, user.pending_today, user.pending_month
+        user.pending -= delta
+        user.pending_today -= d_today
+        user.pending_month -= d_month
+        today, this_month = user.reset_date, user.reset_month
+        try:
+            doc = await self.users_collection.find_one_and_update(
+                {"_id": ObjectId(user_id)},
+                [{"$set": {
+                    "api_calls_count": {"$add": [{"$ifNull": ["$api_calls_count", 0]}, delta]},
+                    "api_calls_today": {"$cond": [
+                        {"$eq": ["$api_calls_reset_date", today]},
+                        {"$add": [{"$ifNull": ["$api_calls_today", 0]}, d_today]},
+                        d_today
+                    ]},
+                    "api_calls_this_month": {"$cond": [
+                        {"$eq": ["$api_calls_reset_month", this_month]},
+                        {"$add": [{"$ifNull": ["$api_calls_this_month", 0]}, d_month]},
+                        d_month
+                    ]},
+                    "api_calls_reset_date": today,
+                    "api_calls_reset_month": this_month,
+                }}],
+                projection=_USER_QUOTA_PROJECTION,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            user.pending += delta
+            user.pending_today += d_today
+            user.pending_month += d_month
+            logger.error(f"❌ 写回用户调用次数失败: {str(e)}")
+            return
+        if doc is None:
+            self._users.pop(user_id, None)
+            return
+        # 以数据库值（含其他进程的调用）为准，再叠加写回期间的新增量
+        user.count = doc.get("api_calls_count", 0) + user.pending
+        if user.reset_date == today:
+            user.calls_today = doc.get("api_calls_today", 0) + user.pending_today
+        if user.reset_month == this_month:
+            user.calls_this_month = doc.get("api_calls_this_month", 0) + user.pending_month
+        user.limit = doc.get("max_api_calls", user.limit)
+        user.loaded_at = time.monotonic()
+
+    async def _flush_key(self, api_key_id: str, key: _KeyQuota):
+        self._roll_periods(key)
+        d_total, d_today, d_month = key.pending_total, key.pending_today, key.pending_month
+        key.pending_total -= d_total
+        key.pending_today -= d_today
+        key.pending_month -= d_month
+        today, this_month = key.reset_date, key.reset_month
+        try:
+            doc = await self.api_key_usage_collection.find_one_and_update(
+                {"api_key_id": api_key_id},
+                [{"$set": {
+                    "api_key_id": api_key_id,
+                    "total_calls": {"$add": [{"$ifNull": ["$total_calls", 0]}, d_total]},
+                    "calls_today": {"$cond": [
+                        {"$eq": ["$last_reset_date", today]},
+                        {"$add": [{"$ifNull": ["$calls_today", 0]}, d_today]},
+                        d_today
+                    ]},
+                    "calls_this_month": {"$cond": [
+                        {"$eq": ["$last_reset_month", this_month]},
+                        {"$add": [{"$ifNull": ["$calls_this_month", 0]}, d_month]},
+                        d_month
+                    ]},
+                    "last_reset_date": today,
+                    "last_reset_month": this_month,
+                    "last_used_at": key.last_used_at,
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            key.pending_total += d_total
+            key.pending_today += d_today
+            key.pending_month += d_month
+            logger.error(f"❌ 写回API Key使用统计失败: {str(e)}")
+            return
+        key.total_calls = doc.get("total_calls", 0) + key.pending_total
+        if key.reset_date == today:
+            key.calls_today = doc.get("calls_today", 0) + key.pending_today
+        if key.reset_month == this_month:
+            key.calls_this_month = doc.get("calls_this_month", 0) + key.pending_month
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_evict_seconds
+        for user_id in [k for k, v in self._users.items() if not v.pending and v.touched < cutoff]:
+            del self._users[user_id]
+        for api_key_id in [k for k, v in self._keys.items() if not v.pending_total and v.touched < cutoff]:
+            del self._keys[api_key_id]
+
+
+# 全局配额服务实例
+quota_service = QuotaService()
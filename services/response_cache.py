@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from database.connection import get_database
+from services.cache import TTLCache
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_REQUESTS = metrics.counter(
+    "gateway_response_cache_requests_total", "智能体响应缓存查询次数", ("agent", "status"))
+
+# 缓存状态（写入 X-Cache 响应头）
+HIT = "HIT"
+MISS = "MISS"
+BYPASS = "BYPASS"
+# 与进行中的相同请求合并，等待其上游调用的结果（未命中缓存）
+COALESCED = "COALESCED"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class ResponseCache:
+    """
+    非流式智能体响应缓存（默认关闭）
+
+    仅缓存无会话上下文（chat_id / conversation_id）、无文件的非流式请求，
+    键为 agent + app_id + 归一化 query + variables（+ detail）。
+    内存 LRU 为一级缓存，可选 MongoDB 二级缓存（TTL 索引自动过期）；
+    相同键的并发未命中只向上游发起一次请求。
+
+    环境变量:
+        - RESPONSE_CACHE_ENABLED: 是否启用，默认 false
+        - RESPONSE_CACHE_TTL: 默认缓存秒数，默认 3600；{AGENT}_RESPONSE_CACHE_TTL 按智能体覆盖，0 表示不缓存
+        - RESPONSE_CACHE_MAXSIZE: 内存缓存条目上限，默认 1000
+        - RESPONSE_CACHE_MONGO: 是否启用 MongoDB 二级缓存，默认 false
+        - RESPONSE_CACHE_PER_USER: 键是否包含 user/uid（FastGPT 以其作为工作流变量），默认 true；
+          设为 false 时不同用户的相同问题共享缓存
+    """
+
+    collection_name = "response_cache"
+
+    def __init__(self):
+        self.enabled = _env_flag("RESPONSE_CACHE_ENABLED")
+        self.default_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.use_mongo = _env_flag("RESPONSE_CACHE_MONGO")
+        self.per_user = _env_flag("RESPONSE_CACHE_PER_USER", "true")
+        self._memory = TTLCache(
+            maxsize=int(os.getenv("RESPONSE_CACHE_MAXSIZE", "1000")),
+            ttl=self.default_ttl,
+            name="response",
+        )
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def ttl_for(self, agent_name: str) -> float:
+        value = os.getenv(f"{agent_name.upper()}_RESPONSE_CACHE_TTL")
+        return float(value) if value else self.default_ttl
+
+    def is_cacheable(self, agent_name: str, request_data: Dict[str, Any]) -> bool:
+        """是否可缓存：已启用、非流式、无会话上下文、无文件"""
+        return (
+            self.enabled
+            and self.ttl_for(agent_name) > 0
+            and not request_data.get("stream")
+            and not request_data.get("chat_id")
+            and not request_data.get("conversation_id")
+            and not request_data.get("files")
+        )
+
+    def build_key(self, agent_name: str, request_data: Dict[str, Any]) -> str:
+        query = _WHITESPACE.sub(" ", str(request_data.get("query", ""))).strip().casefold()
+        variables = dict(request_data.get("variables") or {})
+        if self.per_user:
+            for field in ("uid", "user"):
+                if request_data.get(field):
+                    variables.setdefault(field, request_data[field])
+        raw = json.dumps({
+            "agent": agent_name,
+            "app_id": request_data.get("app_id"),
+            "query": query,
+            "variables": variables,
+            "detail": bool(request_data.get("detail")),
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def fetch(
+        self,
+        agent_name: str,
+        request_data: Dict[str, Any],
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, str]:
+        """
+        读取缓存，未命中时调用 loader 获取响应并写入缓存。
+
+        返回:
+            Tuple[Any, str]: 原始响应数据与缓存状态（HIT / MISS / COALESCED / BYPASS）
+        """
+        if not self.is_cacheable(agent_name, request_data):
+            RESPONSE_CACHE_REQUESTS.inc(agent_name, BYPASS)
+            return await loader(), BYPASS
+
+        key = self.build_key(agent_name, request_data)
+        cached = self._memory.get(key)
+        if cached is None and self.use_mongo:
+            cached = await self._mongo_get(key)
+            if cached is not None:
+                self._memory.set(key, cached, ttl=self.ttl_for(agent_name))
+        if cached is not None:
+            RESPONSE_CACHE_REQUESTS.inc(agent_name, HIT)
+            return cached, HIT
+
+        # 合并相同键的并发请求：上游调用在独立任务中执行，所有请求方通过 shield 等待，
+        # 发起请求的客户端断开（请求被取消）时不会取消共享调用，其余等待方照常拿到结果
+        task = self._inflight.get(key)
+        if task is not None:
+            status = COALESCED
+        else:
+            status = MISS
+            task = asyncio.ensure_future(self._load(key, agent_name, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_load_done(k, t))
+        RESPONSE_CACHE_REQUESTS.inc(agent_name, status)
+        return await asyncio.shield(task), status
+
+    async def _load(self, key: str, agent_name: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """调用上游并在成功时写入缓存（在共享任务中执行）"""
+        response_data = await loader()
+        if self._is_success(response_data):
+            ttl = self.ttl_for(agent_name)
+            self._memory.set(key, response_data, ttl=ttl)
+            if self.use_mongo:
+                await self._mongo_set(key, agent_name, response_data, ttl)
+        return response_data
+
+    def _on_load_done(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待方均已断开时，避免出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._memory.stats()
+
+    @staticmethod
+    def _is_success(response_data: Any) -> bool:
+        # 各智能体失败时返回带 error 字段的字典，不缓存
+        return isinstance(response_data, dict) and not response_data.get("error")
+
+    async def _mongo_get(self, key: str) -> Optional[Any]:
+        try:
+            doc = await get_database()[self.collection_name].find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.now()}},
+                {"response": 1}
+            )
+            return doc["response"] if doc else None
+        except Exception as e:
+            logger.error(f"读取响应缓存失败: {str(e)}")
+            return None
+
+    async def _mongo_set(self, key: str, agent_name: str, response_data: Any, ttl: float) -> None:
+        now = datetime.now()
+        try:
+            await get_database()[self.collection_name].replace_one(
+                {"_id": key},
+                {
+                    "agent": agent_name,
+                    "response": response_data,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl),
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"写入响应缓存失败: {str(e)}")
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
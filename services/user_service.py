@@ -7,6 +7,8 @@ import logging
 import os
 
 from database.connection import get_database
+from services.cache import TTLCache
+from services.quota_service import quota_service
 from models.user import (
     UserCreate, UserUpdate, UserInDB, UserResponse, 
     UserRole, UserStatus, TokenData
@@ -52,8 +54,27 @@ class UserService:
     """用户管理服务"""
     
     def __init__(self):
-        self.db = get_database()
-        self.users_collection = self.db.users
+        # 认证缓存："id:<user_id>" / "name:<username>" -> UserResponse
+        self._user_cache = TTLCache(
+            maxsize=int(os.getenv("AUTH_CACHE_MAXSIZE", "10000")),
+            ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+            name="user",
+        )
+
+    @property
+    def users_collection(self):
+        return get_database().users
+
+    def _cache_user(self, user: UserResponse) -> None:
+        self._user_cache.set(f"id:{user.id}", user)
+        self._user_cache.set(f"name:{user.username}", user)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """使指定用户的认证缓存失效（按 ID 与用户名两种键）"""
+        self._user_cache.invalidate_where(lambda _, v: v.id == user_id)
+
+    def cache_stats(self) -> dict:
+        return self._user_cache.stats()
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """验证密码"""
@@ -106,11 +127,11 @@ class UserService:
         """创建新用户"""
         try:
             # 检查用户名是否已存在
-            if self.users_collection.find_one({"username": user_create.username}):
+            if await self.users_collection.find_one({"username": user_create.username}):
                 raise ValueError("用户名已存在")
             
             # 检查邮箱是否已存在
-            if self.users_collection.find_one({"email": user_create.email}):
+            if await self.users_collection.find_one({"email": user_create.email}):
                 raise ValueError("邮箱已存在")
             
             # 创建用户文档
@@ -130,7 +151,7 @@ class UserService:
             }
             
             # 插入用户
-            result = self.users_collection.insert_one(user_doc)
+            result = await self.users_collection.insert_one(user_doc)
             user_doc["_id"] = str(result.inserted_id)
             user_doc["id"] = user_doc["_id"]  # 确保id字段存在
             
@@ -145,7 +166,7 @@ class UserService:
         """用户认证"""
         try:
             # 查找用户
-            user_doc = self.users_collection.find_one({"username": username})
+            user_doc = await self.users_collection.find_one({"username": username})
             if not user_doc:
                 return None
             
@@ -159,12 +180,13 @@ class UserService:
                 return None
             
             # 更新最后登录时间
-            self.users_collection.update_one(
+            await self.users_collection.update_one(
                 {"_id": user_doc["_id"]},
                 {"$set": {"last_login": datetime.now()}}
             )
             
             user_doc["_id"] = str(user_doc["_id"])
+            self.invalidate_user(user_doc["_id"])
             user_doc["id"] = user_doc["_id"]
             logger.info(f"✅ 用户认证成功: {username}")
             return UserResponse(**user_doc)
@@ -173,14 +195,20 @@ class UserService:
             logger.error(f"❌ 用户认证失败: {str(e)}")
             return None
     
-    async def get_user_by_id(self, user_id: str) -> Optional[UserResponse]:
+    async def get_user_by_id(self, user_id: str, use_cache: bool = True) -> Optional[UserResponse]:
         """根据ID获取用户"""
         try:
-            user_doc = self.users_collection.find_one({"_id": ObjectId(user_id)})
+            if use_cache:
+                cached = self._user_cache.get(f"id:{user_id}")
+                if cached is not None:
+                    return cached
+            user_doc = await self.users_collection.find_one({"_id": ObjectId(user_id)})
             if user_doc:
                 user_doc["_id"] = str(user_doc["_id"])
                 user_doc["id"] = user_doc["_id"]
-                return UserResponse(**user_doc)
+                user = UserResponse(**user_doc)
+                self._cache_user(user)
+                return user
             return None
         except Exception as e:
             logger.error(f"❌ 获取用户失败: {str(e)}")
@@ -189,11 +217,16 @@ class UserService:
     async def get_user_by_username(self, username: str) -> Optional[UserResponse]:
         """根据用户名获取用户"""
         try:
-            user_doc = self.users_collection.find_one({"username": username})
+            cached = self._user_cache.get(f"name:{username}")
+            if cached is not None:
+                return cached
+            user_doc = await self.users_collection.find_one({"username": username})
             if user_doc:
                 user_doc["_id"] = str(user_doc["_id"])
                 user_doc["id"] = user_doc["_id"]
-                return UserResponse(**user_doc)
+                user = UserResponse(**user_doc)
+                self._cache_user(user)
+                return user
             return None
         except Exception as e:
             logger.error(f"❌ 获取用户失败: {str(e)}")
@@ -207,7 +240,7 @@ class UserService:
             # 构建更新数据
             if user_update.username is not None:
                 # 检查用户名是否已被其他用户使用
-                existing_user = self.users_collection.find_one({
+                existing_user = await self.users_collection.find_one({
                     "username": user_update.username,
                     "_id": {"$ne": ObjectId(user_id)}
                 })
@@ -217,7 +250,7 @@ class UserService:
             
             if user_update.email is not None:
                 # 检查邮箱是否已被其他用户使用
-                existing_user = self.users_collection.find_one({
+                existing_user = await self.users_collection.find_one({
                     "email": user_update.email,
                     "_id": {"$ne": ObjectId(user_id)}
                 })
@@ -240,10 +273,12 @@ class UserService:
             if update_data:
                 update_data["updated_at"] = datetime.now()
                 
-                result = self.users_collection.update_one(
+                result = await self.users_collection.update_one(
                     {"_id": ObjectId(user_id)},
                     {"$set": update_data}
                 )
+                self.invalidate_user(user_id)
+                quota_service.invalidate_user(user_id)
                 
                 if result.modified_count > 0:
                     logger.info(f"✅ 用户更新成功: {user_id}")
@@ -258,7 +293,8 @@ class UserService:
     async def delete_user(self, user_id: str) -> bool:
         """删除用户"""
         try:
-            result = self.users_collection.delete_one({"_id": ObjectId(user_id)})
+            result = await self.users_collection.delete_one({"_id": ObjectId(user_id)})
+            self.invalidate_user(user_id)
             if result.deleted_count > 0:
                 logger.info(f"✅ 用户删除成功: {user_id}")
                 return True
@@ -277,7 +313,7 @@ class UserService:
             cursor = self.users_collection.find(filter_query).skip(skip).limit(limit)
             users = []
             
-            for user_doc in cursor:
+            async for user_doc in cursor:
                 user_doc["_id"] = str(user_doc["_id"])
                 user_doc["id"] = user_doc["_id"]
                 users.append(UserResponse(**user_doc))
@@ -291,10 +327,10 @@ class UserService:
     async def get_user_stats(self) -> dict:
         """获取用户统计信息"""
         try:
-            total_users = self.users_collection.count_documents({})
-            active_users = self.users_collection.count_documents({"status": UserStatus.ACTIVE})
-            admin_users = self.users_collection.count_documents({"role": UserRole.ADMIN})
-            premium_users = self.users_collection.count_documents({"role": UserRole.PREMIUM})
+            total_users = await self.users_collection.count_documents({})
+            active_users = await self.users_collection.count_documents({"status": UserStatus.ACTIVE})
+            admin_users = await self.users_collection.count_documents({"role": UserRole.ADMIN})
+            premium_users = await self.users_collection.count_documents({"role": UserRole.PREMIUM})
             
             return {
                 "total_users": total_users,
@@ -311,29 +347,6 @@ class UserService:
                 "admin_users": 0,
                 "premium_users": 0
             }
-    
-    async def increment_api_calls(self, user_id: str) -> bool:
-        """增加用户API调用次数"""
-        try:
-            result = self.users_collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$inc": {"api_calls_count": 1}}
-            )
-            return result.modified_count > 0
-        except Exception as e:
-            logger.error(f"❌ 增加API调用次数失败: {str(e)}")
-            return False
-    
-    async def check_api_limit(self, user_id: str) -> bool:
-        """检查用户API调用限制"""
-        try:
-            user = await self.get_user_by_id(user_id)
-            if user:
-                return user.api_calls_count < user.max_api_calls
-            return False
-        except Exception as e:
-            logger.error(f"❌ 检查API限制失败: {str(e)}")
-            return False
 
 
 # 全局用户服务实例